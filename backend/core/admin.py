@@ -1,6 +1,6 @@
 from django.contrib import admin
 
-from .models import Transaction, TransactionImage
+from .models import AnalyticsReport, Transaction, TransactionArchive, RecurringSeries, Budget, SpendingAnomaly, SpendingForecast, TransactionImage, LLMCall
 
 # Register your models here.
 
@@ -12,11 +12,59 @@ class TransactionAdmin(admin.ModelAdmin):
     search_fields = ('description',)
     ordering = ('-date',)
 
+@admin.register(TransactionArchive)
+class TransactionArchiveAdmin(admin.ModelAdmin):
+    list_display = ('user', 'month', 'row_count', 'total_income', 'total_expenses', 'archived_at')
+    search_fields = ('user__username',)
+    exclude = ('payload',)
+    ordering = ('-month',)
+
+@admin.register(RecurringSeries)
+class RecurringSeriesAdmin(admin.ModelAdmin):
+    list_display = ('user', 'description', 'period', 'amount', 'next_date', 'occurrences', 'confidence')
+    list_filter = ('period', 'category')
+    search_fields = ('user__username', 'description')
+    ordering = ('next_date',)
+
+@admin.register(Budget)
+class BudgetAdmin(admin.ModelAdmin):
+    list_display = ('user', 'category', 'period', 'limit', 'spent', 'state', 'period_start')
+    list_filter = ('period', 'state', 'category')
+    search_fields = ('user__username',)
+    readonly_fields = ('period_start', 'spent', 'state', 'state_changed_at')
+
+@admin.register(SpendingAnomaly)
+class SpendingAnomalyAdmin(admin.ModelAdmin):
+    list_display = ('user', 'kind', 'category', 'date', 'amount', 'baseline', 'score')
+    list_filter = ('kind', 'category')
+    search_fields = ('user__username', 'description')
+    ordering = ('-date',)
+
+@admin.register(SpendingForecast)
+class SpendingForecastAdmin(admin.ModelAdmin):
+    list_display = ('user', 'month', 'as_of', 'projected_income', 'projected_expenses', 'computed_at')
+    search_fields = ('user__username',)
+    ordering = ('-month',)
+
 @admin.register(TransactionImage)
 class TransactionImageAdmin(admin.ModelAdmin):
-    list_display = ('id', 'image')
-    search_fields = ('image',)
-    ordering = ('-id',)
+    list_display = ('id', 'user', 'content_type', 'size', 'width', 'height', 'created_at')
+    search_fields = ('user__username', 'sha256')
+    # Receipts are stored through the API (core.receipts), which names them by content
+    readonly_fields = ('image', 'sha256', 'content_type', 'size', 'width', 'height', 'thumbnails')
+    ordering = ('-created_at',)
 
 
+@admin.register(LLMCall)
+class LLMCallAdmin(admin.ModelAdmin):
+    list_display = ('started_at', 'endpoint', 'user', 'outcome', 'latency_ms', 'prompt_tokens', 'response_tokens')
+    list_filter = ('endpoint', 'outcome', 'model')
+    search_fields = ('user__username', 'error')
+    ordering = ('-started_at',)
 
+@admin.register(AnalyticsReport)
+class AnalyticsReportAdmin(admin.ModelAdmin):
+    list_display = ('created_at', 'months', 'status', 'requested_by', 'finished_at')
+    list_filter = ('status', 'months')
+    exclude = ('result',)
+    ordering = ('-created_at',)
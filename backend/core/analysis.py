@@ -1,31 +1,30 @@
-from google import genai
+import json
 
+from .gemini import GEMINI_MODEL, get_client
+from .telemetry import track_llm_call
 
-def transaction_analysis(api_key, current_transactions, previous_transactions=None):
+
+class AnalysisError(Exception):
+    """The Gemini call failed or its answer could not be used."""
+
+
+def build_analysis_prompt(current_transactions, previous_transactions=None):
     """
-    Analyzes transactions and provides realistic financial insights with month-over-month comparisons.
-    
+    Builds the Gemini prompt for a month of transactions.
+
     Args:
         current_transactions (list): Current month's transaction dictionaries
         previous_transactions (list, optional): Previous month's transactions for comparison
-        user_income (float, optional): User's monthly income for percentage calculations
-        api_key (str): API key for Gemini AI
-        
+
     Returns:
-        dict: Comprehensive financial analysis with actionable insights
+        str: The prompt text
     """
-    
     # Prepare comparison context
     comparison_context = ""
     if previous_transactions:
         comparison_context = f"PREVIOUS MONTH TRANSACTIONS FOR COMPARISON: {previous_transactions}"
-    
-    
-    try:
-        client = genai.Client(api_key=api_key)
-        response = client.models.generate_content(
-            model="gemini-2.5-flash", 
-            contents=f'''
+
+    return f'''
             You are a simple financial advisor. Analyze these transactions and give easy-to-understand advice.
             
             Rules:
@@ -67,36 +66,212 @@ def transaction_analysis(api_key, current_transactions, previous_transactions=No
             now if the current transactions analysis is not for the actual current month, make sure to give the analysis in past tense.
 
             '''
-        )
+
+
+def parse_analysis_text(response_text):
+    """
+    Parses the model output into the analysis dictionary, stripping markdown code fences.
+
+    Returns:
+        dict: The analysis, or the raw text with an error if it is not valid JSON
+    """
+    response_text = response_text.strip()
+
+    # Try to extract JSON from the response
+    if response_text.startswith('```json'):
+        response_text = response_text[7:-3]  # Remove ```json and ```
+    elif response_text.startswith('```'):
+        response_text = response_text[3:-3]  # Remove ``` and ```
+
+    try:
+        return json.loads(response_text)
+    except json.JSONDecodeError:
+        # If parsing fails, return the raw text
+        return {"analysis": response_text, "error": "Could not parse as JSON"}
+
+
+def transaction_analysis(api_key, current_transactions, previous_transactions=None, user=None):
+    """
+    Analyzes transactions and provides realistic financial insights with month-over-month comparisons.
+    
+    Args:
+        current_transactions (list): Current month's transaction dictionaries
+        previous_transactions (list, optional): Previous month's transactions for comparison
+        api_key (str): API key for Gemini AI
+        user (User, optional): User the analysis is for, recorded in the call telemetry
         
-        # Parse the response and return as JSON
-        import json
+    Returns:
+        dict: Comprehensive financial analysis with actionable insights
+
+    Raises:
+        AnalysisError: If the call fails or the answer is not valid JSON, failures are never
+            returned as a result so single flight does not hand them to coalesced callers
+    """
+    client = get_client(api_key)
+    prompt = build_analysis_prompt(current_transactions, previous_transactions)
+    with track_llm_call('analysis', GEMINI_MODEL, len(prompt), user=user) as call:
         try:
-            # Handle different response formats from Gemini API
-            if hasattr(response, 'text'):
-                if isinstance(response.text, list):
-                    # If response.text is a list, join it or take the first element
-                    response_text = ' '.join(response.text) if response.text else ""
-                else:
-                    response_text = str(response.text)
+            response = client.models.generate_content(
+                model=GEMINI_MODEL,
+                contents=prompt,
+            )
+        except Exception as e:
+            raise AnalysisError(f"Analysis failed: {str(e)}") from e
+        call.record_usage(response)
+
+        # Handle different response formats from Gemini API
+        if hasattr(response, 'text'):
+            if isinstance(response.text, list):
+                # If response.text is a list, join it or take the first element
+                response_text = ' '.join(response.text) if response.text else ""
             else:
-                response_text = str(response)
-            
-            response_text = response_text.strip()
-            
-            # Try to extract JSON from the response
-            if response_text.startswith('```json'):
-                response_text = response_text[7:-3]  # Remove ```json and ```
-            elif response_text.startswith('```'):
-                response_text = response_text[3:-3]  # Remove ``` and ```
-            
-            return json.loads(response_text)
+                response_text = str(response.text)
+        else:
+            response_text = str(response)
+
+        result = parse_analysis_text(response_text)
+        if result.get('error'):
+            call.outcome = 'parse_error'
+            raise AnalysisError(f"Analysis failed: {result['error']}")
+        return result
+
+
+class AnalysisStreamParser:
+    """
+    Incremental parser for the analysis JSON object while it is still being generated.
+
+    feed() takes the next piece of model output and returns the (key, value) pairs of
+    every top level member that became complete. Anything before the opening brace
+    (such as a ```json fence) is skipped.
+    """
+
+    def __init__(self):
+        self.buffer = ''
+        self.pos = 0
+        self.depth = 0
+        self.in_string = False
+        self.escape = False
+        self.expect = 'key'
+        self.key = None
+        self.token_start = None
+        self.finished = False
+
+    def feed(self, text):
+        self.buffer += text
+        completed = []
+        buffer = self.buffer
+
+        while self.pos < len(buffer) and not self.finished:
+            index = self.pos
+            char = buffer[index]
+            self.pos += 1
+
+            if self.in_string:
+                if self.escape:
+                    self.escape = False
+                elif char == '\\':
+                    self.escape = True
+                elif char == '"':
+                    self.in_string = False
+                    if self.depth == 1 and self.expect == 'key_string':
+                        self.key = json.loads(buffer[self.token_start:index + 1])
+                        self.expect = 'colon'
+                    elif self.depth == 1 and self.expect == 'value':
+                        self._complete(buffer[self.token_start:index + 1], completed)
+                continue
+
+            if self.depth == 0:
+                if char == '{':
+                    self.depth = 1
+                continue
+
+            if char == '"':
+                self.in_string = True
+                if self.depth == 1 and self.expect == 'key':
+                    self.token_start = index
+                    self.expect = 'key_string'
+                elif self.depth == 1 and self.expect == 'colon_done':
+                    self.token_start = index
+                    self.expect = 'value'
+            elif char in '{[':
+                if self.depth == 1 and self.expect == 'colon_done':
+                    self.token_start = index
+                    self.expect = 'value'
+                self.depth += 1
+            elif char in '}]':
+                self.depth -= 1
+                if self.depth == 1 and self.expect == 'value':
+                    self._complete(buffer[self.token_start:index + 1], completed)
+                elif self.depth == 0:
+                    if self.expect == 'scalar':
+                        self._complete(buffer[self.token_start:index], completed)
+                    self.finished = True
+            elif self.depth == 1:
+                if char == ':' and self.expect == 'colon':
+                    self.expect = 'colon_done'
+                elif char == ',':
+                    if self.expect == 'scalar':
+                        self._complete(buffer[self.token_start:index], completed)
+                    self.expect = 'key'
+                elif not char.isspace() and self.expect == 'colon_done':
+                    # Number, true, false or null
+                    self.token_start = index
+                    self.expect = 'scalar'
+
+        return completed
+
+    def _complete(self, value_text, completed):
+        try:
+            completed.append((self.key, json.loads(value_text)))
         except json.JSONDecodeError:
-            # If parsing fails, return the raw text
-            return {"analysis": response_text, "error": "Could not parse as JSON"}
-            
-    except Exception as e:
-        return {"error": f"Analysis failed: {str(e)}"}
+            pass
+        self.key = None
+        self.expect = 'done'
+
+
+def stream_transaction_analysis(api_key, current_transactions, previous_transactions=None, user=None):
+    """
+    Streams the analysis, yielding each top level section as soon as the model has finished it.
+
+    Yields:
+        tuple: (section name, value) for every completed section, then ("done", full analysis).
+            ("error", {"error": ...}) is yielded instead of "done" if the call fails.
+    """
+    parser = AnalysisStreamParser()
+    received = []
+    sections = {}
+    prompt = build_analysis_prompt(current_transactions, previous_transactions)
+    with track_llm_call('analysis_stream', GEMINI_MODEL, len(prompt), user=user) as call:
+        try:
+            client = get_client(api_key)
+            stream = client.models.generate_content_stream(model=GEMINI_MODEL, contents=prompt)
+            for chunk in stream:
+                # Token usage arrives with the last chunks
+                call.record_usage(chunk)
+                text = chunk.text or ''
+                received.append(text)
+                for key, value in parser.feed(text):
+                    sections[key] = value
+                    yield key, value
+        except Exception as e:
+            call.outcome, call.error = 'error', str(e)[:255]
+            yield 'error', {"error": f"Analysis failed: {str(e)}"}
+            return
+
+        if parser.finished:
+            yield 'done', sections
+            return
+
+        # The object never closed (truncated or not JSON), fall back to parsing the whole text
+        result = parse_analysis_text(''.join(received))
+        if 'error' in result:
+            call.outcome = 'parse_error'
+            yield 'error', result
+            return
+        for key, value in result.items():
+            if key not in sections:
+                yield key, value
+        yield 'done', result
 
 
 def test():
@@ -0,0 +1,211 @@
+from datetime import date
+from decimal import Decimal
+
+from django.conf import settings
+from django.db import transaction as db_transaction
+from django.db.models import Max
+from django.dispatch import receiver
+
+from .models import AnomalyScan, SpendingAnomaly, Transaction
+from .signals import transactions_changed
+
+# Scales a median absolute deviation to the standard deviation of normally distributed data
+MAD_SCALE = 1.4826
+# Scales a mean absolute deviation the same way, used when more than half the values are equal
+MEAN_AD_SCALE = 1.2533
+# Charges a category needs before its own ones are judged
+MIN_CATEGORY_ROWS = 8
+# Months of history before monthly totals are judged, and the trailing window they are judged against
+MIN_HISTORY_MONTHS = 6
+TRAILING_MONTHS = 12
+# A spike must also be this share above the baseline, so flat categories do not flag small changes
+MIN_SPIKE_SHARE = 0.1
+
+
+def _numpy():
+    # Imported lazily, only the detection command and its workers need NumPy
+    import numpy
+    return numpy
+
+
+def _robust_spread(values, median):
+    np = _numpy()
+    spread = np.median(np.abs(values - median), axis=-1) * MAD_SCALE
+    fallback = np.mean(np.abs(values - median), axis=-1) * MEAN_AD_SCALE
+    return np.where(spread > 0, spread, fallback)
+
+
+def _money(value):
+    return Decimal(str(round(float(value), 2)))
+
+
+def load_history(user_id):
+    """
+    Reads a user's spending (everything but income) as columnar arrays.
+
+    Returns:
+        dict: ids, months (year * 12 + month - 1) and amounts as arrays, categories as an
+            array of names and codes indexing it, plus the rows' dates and descriptions
+    """
+    np = _numpy()
+    rows = list(
+        Transaction.objects.filter(user_id=user_id).exclude(category='income').order_by()
+        .values_list('id', 'date', 'amount', 'category', 'description')
+    )
+    count = len(rows)
+    categories, codes = np.unique(np.array([row[3] for row in rows], dtype=object), return_inverse=True)
+    return {
+        'ids': np.fromiter((row[0] for row in rows), dtype=np.int64, count=count),
+        'months': np.fromiter((row[1].year * 12 + row[1].month - 1 for row in rows), dtype=np.int64, count=count),
+        'amounts': np.fromiter((float(row[2]) for row in rows), dtype=np.float64, count=count),
+        'categories': categories,
+        'codes': codes.reshape(-1),
+        'dates': [row[1] for row in rows],
+        'descriptions': [row[4] for row in rows],
+    }
+
+
+def unusual_transactions(history, new, threshold):
+    """Flags new charges far above their category's median, measured in scaled MADs."""
+    np = _numpy()
+    amounts, codes = history['amounts'], history['codes']
+    found = []
+    for code, category in enumerate(history['categories']):
+        in_category = np.flatnonzero(codes == code)
+        if len(in_category) < MIN_CATEGORY_ROWS:
+            continue
+        values = amounts[in_category]
+        median = np.median(values)
+        spread = _robust_spread(values, median)
+        if not spread:
+            continue
+        scores = (values - median) / spread
+        for position in np.flatnonzero((scores > threshold) & new[in_category]):
+            index = in_category[position]
+            found.append(SpendingAnomaly(
+                kind='transaction',
+                transaction_id=int(history['ids'][index]),
+                category=category,
+                date=history['dates'][index],
+                description=history['descriptions'][index][:255],
+                amount=_money(values[position]),
+                baseline=_money(median),
+                score=round(float(scores[position]), 2),
+            ))
+    return found
+
+
+def category_spikes(history, months, threshold):
+    """
+    Flags monthly category totals far above their baseline.
+
+    The baseline of a month is the median of the trailing twelve months, or of the same
+    month in earlier years where that is higher, so seasonal spending does not count as a
+    spike. All categories are judged at once, as rows of a categories x months matrix.
+    """
+    np = _numpy()
+    first = int(history['months'].min())
+    span = int(history['months'].max()) - first + 1
+    totals = np.zeros((len(history['categories']), span))
+    np.add.at(totals, (history['codes'], history['months'] - first), history['amounts'])
+
+    found = []
+    for month in sorted(months):
+        m = month - first
+        if m < MIN_HISTORY_MONTHS:
+            continue
+        window = totals[:, max(0, m - TRAILING_MONTHS):m]
+        baseline = np.median(window, axis=1)
+        spread = _robust_spread(window, baseline[:, None])
+        if m >= 12:
+            baseline = np.maximum(baseline, np.median(totals[:, m - 12::-12], axis=1))
+        spread = np.maximum(spread, baseline * MIN_SPIKE_SHARE)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            scores = (totals[:, m] - baseline) / spread
+        for code in np.flatnonzero((baseline > 0) & (scores > threshold)):
+            found.append(SpendingAnomaly(
+                kind='category_spike',
+                category=history['categories'][code],
+                date=date(month // 12, month % 12 + 1, 1),
+                amount=_money(totals[code, m]),
+                baseline=_money(baseline[code]),
+                score=round(float(scores[code]), 2),
+            ))
+    return found
+
+
+def detect_user(user_id, since_id=0, threshold=None):
+    """
+    Flags a user's unusual transactions and category spikes.
+
+    The statistics always cover the whole history, but only transactions with an id above
+    since_id and the months they fall in are judged, so a run after a previous one only
+    looks at what was added in between.
+
+    Returns:
+        tuple: (rows read, list of unsaved SpendingAnomaly, judged months, highest transaction id)
+    """
+    np = _numpy()
+    threshold = settings.ANOMALY_THRESHOLD if threshold is None else threshold
+    history = load_history(user_id)
+    if not len(history['ids']):
+        return 0, [], set(), since_id
+
+    new = history['ids'] > since_id
+    months = {int(month) for month in np.unique(history['months'][new])}
+    anomalies = unusual_transactions(history, new, threshold) + category_spikes(history, months, threshold)
+    for anomaly in anomalies:
+        anomaly.user_id = user_id
+    return len(history['ids']), anomalies, months, int(history['ids'].max())
+
+
+def scan_users(user_ids, incremental=False):
+    """
+    Runs detection for the given users and stores the flags.
+
+    Returns:
+        tuple: (rows read, anomalies stored)
+    """
+    marks = dict(AnomalyScan.objects.filter(user_id__in=user_ids).values_list('user_id', 'last_transaction_id'))
+    scanned = stored = 0
+    for user_id in user_ids:
+        since_id = marks.get(user_id, 0) if incremental else 0
+        rows, anomalies, months, last_id = detect_user(user_id, since_id)
+        with db_transaction.atomic():
+            existing = SpendingAnomaly.objects.filter(user_id=user_id)
+            if since_id:
+                # Spikes of the judged months are judged again, earlier flags are kept
+                existing = existing.filter(
+                    kind='category_spike', date__in=[date(m // 12, m % 12 + 1, 1) for m in months]
+                )
+            existing.delete()
+            SpendingAnomaly.objects.bulk_create(anomalies, ignore_conflicts=True)
+            AnomalyScan.objects.update_or_create(user_id=user_id, defaults={'last_transaction_id': last_id})
+        scanned += rows
+        stored += len(anomalies)
+    return scanned, stored
+
+
+def users_to_scan(incremental=False):
+    """Ids of the users with spending, or only of those with transactions added since their last scan."""
+    if not incremental:
+        return sorted(Transaction.objects.order_by().values_list('user_id', flat=True).distinct())
+    marks = dict(AnomalyScan.objects.values_list('user_id', 'last_transaction_id'))
+    newest = Transaction.objects.filter(id__gt=min(marks.values(), default=0)).order_by().values('user_id')
+    users = {
+        row['user_id'] for row in newest.annotate(last_id=Max('id'))
+        if row['last_id'] > marks.get(row['user_id'], 0)
+    }
+    # Users who were never scanned may only have rows below every other user's mark
+    users.update(
+        Transaction.objects.exclude(user_id__in=AnomalyScan.objects.values('user_id'))
+        .order_by().values_list('user_id', flat=True).distinct()
+    )
+    return sorted(users)
+
+
+@receiver(transactions_changed)
+def drop_deleted_flags(sender, changes, **kwargs):
+    deleted = [change.id for change in changes if change.new is None]
+    if deleted:
+        SpendingAnomaly.objects.filter(kind='transaction', transaction_id__in=deleted).delete()
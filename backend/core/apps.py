@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class CoreConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'core'
+
+    def ready(self):
+        # Connects the transactions_changed receivers
+        from . import anomalies, autocomplete, budgets, category_memo, forecast, live, recurring  # noqa: F401
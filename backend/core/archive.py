@@ -0,0 +1,443 @@
+import bisect
+import heapq
+import itertools
+import zlib
+from calendar import monthrange
+from collections import defaultdict
+from datetime import date, datetime
+from decimal import Decimal
+
+import orjson
+from django.contrib.auth.models import User
+from django.db import models, transaction as db_transaction
+from django.db.models import Q
+
+from .models import Transaction, TransactionArchive, TransactionTombstone
+
+# Column order of a row inside an archive payload
+ROW_FIELDS = ('id', 'date', 'description', 'amount', 'category', 'is_recurring', 'updated_at')
+
+
+def month_start(day):
+    return day.replace(day=1)
+
+
+def month_end(day):
+    return day.replace(day=monthrange(day.year, day.month)[1])
+
+
+def pack_rows(transactions):
+    """Compresses Transaction instances into an archive payload."""
+    rows = [
+        [t.id, t.date.isoformat(), t.description, str(t.amount), t.category, t.is_recurring, t.updated_at.isoformat()]
+        for t in transactions
+    ]
+    return zlib.compress(orjson.dumps(rows), 9)
+
+
+def unpack_rows(payload, user_id):
+    """Turns an archive payload back into unsaved Transaction instances."""
+    transactions = []
+    for row in orjson.loads(zlib.decompress(payload)):
+        values = dict(zip(ROW_FIELDS, row))
+        values['date'] = date.fromisoformat(values['date'])
+        values['amount'] = Decimal(values['amount'])
+        values['updated_at'] = datetime.fromisoformat(values['updated_at'])
+        transactions.append(Transaction(user_id=user_id, **values))
+    return transactions
+
+
+def summarize(transactions):
+    """Pre-aggregated totals stored next to an archive payload."""
+    income = expenses = Decimal(0)
+    categories = defaultdict(lambda: [Decimal(0), 0])
+    for t in transactions:
+        if t.category == 'income':
+            income += t.amount
+        else:
+            expenses += t.amount
+        categories[t.category][0] += t.amount
+        categories[t.category][1] += 1
+    return {
+        'row_count': len(transactions),
+        'total_income': income,
+        'total_expenses': expenses,
+        'category_totals': {
+            category: {'amount': str(amount), 'count': count}
+            for category, (amount, count) in sorted(categories.items())
+        },
+    }
+
+
+def archive_before(cutoff, users=None, dry_run=False):
+    """
+    Moves transactions dated before cutoff from core_transaction into TransactionArchive.
+
+    Every user's rows are moved in their own database transaction and grouped into one
+    archive row per month. Rows of a month that is already archived are merged into it.
+
+    Args:
+        cutoff (date): Rows dated before this day are archived
+        users (iterable, optional): Only archive these users' rows
+        dry_run (bool): Count what would be archived without writing anything
+
+    Returns:
+        tuple: (archived transactions, archive months written, compressed payload bytes)
+    """
+    old = Transaction.objects.filter(date__lt=cutoff)
+    if users is not None:
+        old = old.filter(user__in=users)
+    if dry_run:
+        months = old.order_by().values('user_id', 'date__year', 'date__month').distinct().count()
+        return old.count(), months, 0
+
+    archived = months = size = 0
+    for user_id in list(old.order_by().values_list('user_id', flat=True).distinct()):
+        with db_transaction.atomic():
+            rows = list(old.filter(user_id=user_id).select_for_update().order_by('date', 'id'))
+            by_month = defaultdict(list)
+            for row in rows:
+                by_month[month_start(row.date)].append(row)
+
+            existing = {
+                archive.month: archive
+                for archive in TransactionArchive.objects.select_for_update().filter(
+                    user_id=user_id, month__in=list(by_month)
+                )
+            }
+            for month, month_rows in by_month.items():
+                archive = existing.get(month)
+                if archive is None:
+                    archive = TransactionArchive(user_id=user_id, month=month)
+                else:
+                    ids = {row.id for row in month_rows}
+                    month_rows = sorted(
+                        [row for row in unpack_rows(archive.payload, user_id) if row.id not in ids] + month_rows,
+                        key=lambda row: (row.date, row.id),
+                    )
+                for field, value in summarize(month_rows).items():
+                    setattr(archive, field, value)
+                archive.payload = pack_rows(month_rows)
+                archive.save()
+                size += len(archive.payload)
+
+            # Not Transaction's delete: archived rows still exist for the user, no change is
+            # reported. Delta sync (core.sync) only covers core_transaction, so they leave a
+            # tombstone there
+            models.QuerySet.delete(Transaction.objects.filter(id__in=[row.id for row in rows]))
+            removed = {row.id: row.user_id for row in rows}
+            Transaction.release_duplicates(removed)
+            TransactionTombstone.bury(removed)
+            archived += len(rows)
+            months += len(by_month)
+    return archived, months, size
+
+
+def archives_for(user):
+    if user.is_staff:
+        return TransactionArchive.objects.all()
+    return TransactionArchive.objects.filter(user=user)
+
+
+def _as_date(value):
+    return value.date() if isinstance(value, datetime) else value
+
+
+class ArchivedTransactions:
+    """
+    The archived rows that match a list request's filters.
+
+    Totals come from the month summaries whenever the filters allow it (no search, no
+    amount bounds, whole months), rows are only decompressed once a page reaches them.
+
+    Args:
+        archives (QuerySet): TransactionArchive rows visible to the user
+        filters (dict): Cleaned TransactionFilters data (date, category, amount__gte, amount__lte)
+        search_terms (list): Terms that must all appear in the description
+    """
+
+    def __init__(self, archives, filters, search_terms=()):
+        self.filters = filters
+        self.search_terms = [term.lower() for term in search_terms]
+        span = filters.get('date')
+        self.start = _as_date(span.start) if span else None
+        self.stop = _as_date(span.stop) if span else None
+        if self.start:
+            archives = archives.filter(month__gte=month_start(self.start))
+        if self.stop:
+            archives = archives.filter(month__lte=self.stop)
+        self.months = list(archives.defer('payload').order_by('month'))
+        self._rows = None
+        self._totals = None
+
+    def __bool__(self):
+        return bool(self.months)
+
+    def summaries_suffice(self):
+        return (
+            not self.search_terms
+            and self.filters.get('amount__gte') is None
+            and self.filters.get('amount__lte') is None
+            and (self.start is None or self.start.day == 1)
+            and (self.stop is None or self.stop == month_end(self.stop))
+        )
+
+    def newest_date(self):
+        newest = month_end(self.months[-1].month)
+        return min(newest, self.stop) if self.stop else newest
+
+    def oldest_date(self):
+        oldest = self.months[0].month
+        return max(oldest, self.start) if self.start else oldest
+
+    def totals(self):
+        if self._totals is not None:
+            return self._totals
+        income = expenses = Decimal(0)
+        count = 0
+        if self.summaries_suffice():
+            for archive in self.months:
+                archive_income, archive_expenses, archive_count = self._summary(archive)
+                income += archive_income
+                expenses += archive_expenses
+                count += archive_count
+        else:
+            for row in self.rows():
+                if row.category == 'income':
+                    income += row.amount
+                else:
+                    expenses += row.amount
+                count += 1
+        self._totals = {
+            'total_income': income,
+            'total_expenses': expenses,
+            'total_amount': income + expenses,
+            'transaction_count': count,
+        }
+        return self._totals
+
+    def _summary(self, archive):
+        """(income, expenses, row count) of the matching rows of one month, see summaries_suffice."""
+        category = self.filters.get('category')
+        if not category:
+            return archive.total_income, archive.total_expenses, archive.row_count
+        entry = archive.category_totals.get(category, {'amount': '0', 'count': 0})
+        amount = Decimal(entry['amount'])
+        if category == 'income':
+            return amount, Decimal(0), entry['count']
+        return Decimal(0), amount, entry['count']
+
+    def count(self):
+        return self.totals()['transaction_count']
+
+    def rows(self):
+        """Decompresses the matching months and returns the rows that pass the filters."""
+        if self._rows is None:
+            self._rows = self._unpack(self.months)
+        return self._rows
+
+    def ordered(self, ordering):
+        """The matching rows sorted like queryset.order_by(*ordering), see OrderedArchive."""
+        return OrderedArchive(self, ordering)
+
+    def _unpack(self, archives):
+        users = User.objects.in_bulk({archive.user_id for archive in archives})
+        payloads = TransactionArchive.objects.filter(
+            pk__in=[archive.pk for archive in archives]
+        ).values_list('user_id', 'payload')
+        rows = []
+        for user_id, payload in payloads:
+            for row in unpack_rows(payload, user_id):
+                if self._matches(row):
+                    row.user = users[user_id]
+                    rows.append(row)
+        return rows
+
+    def _matches(self, row):
+        filters = self.filters
+        if self.start and row.date < self.start:
+            return False
+        if self.stop and row.date > self.stop:
+            return False
+        if filters.get('category') and row.category != filters['category']:
+            return False
+        if filters.get('amount__gte') is not None and row.amount < filters['amount__gte']:
+            return False
+        if filters.get('amount__lte') is not None and row.amount > filters['amount__lte']:
+            return False
+        description = row.description.lower()
+        return all(term in description for term in self.search_terms)
+
+
+def ordering_key(ordering):
+    """Sort key that orders Transaction instances like queryset.order_by(*ordering)."""
+    def key(row):
+        values = []
+        for field in ordering:
+            value = getattr(row, field.lstrip('-'))
+            if isinstance(value, date):
+                value = value.toordinal()
+            values.append(-value if field.startswith('-') else value)
+        return tuple(values)
+    return key
+
+
+def keyset_ordering(ordering):
+    """The ordering with the id as the last field, so that every row has exactly one position."""
+    ordering = list(ordering)
+    if not ordering or ordering[-1].lstrip('-') not in ('id', 'pk'):
+        direction = '-' if ordering and ordering[0].startswith('-') else ''
+        ordering.append(direction + 'id')
+    return ordering
+
+
+def keyset_filter(ordering, row, after=False):
+    """Q matching the rows that come before (or after) row in a keyset_ordering."""
+    condition = Q()
+    equal = Q()
+    for field in ordering:
+        name = field.lstrip('-')
+        lookup = 'lt' if field.startswith('-') == after else 'gt'
+        value = getattr(row, name)
+        condition |= equal & Q(**{f'{name}__{lookup}': value})
+        equal &= Q(**{name: value})
+    return condition
+
+
+class OrderedArchive:
+    """
+    ArchivedTransactions sorted by a keyset_ordering, indexed like a list.
+
+    Ordered by date with the month summaries sufficing, a month is only decompressed once an
+    index falls into it, the summaries give every month's position. Otherwise all matching
+    rows are decompressed and sorted on first access.
+
+    Args:
+        archived (ArchivedTransactions): The matching cold rows
+        ordering (list): A keyset_ordering, e.g. ['-date', '-id']
+    """
+
+    def __init__(self, archived, ordering):
+        self.archived = archived
+        self.key = ordering_key(ordering)
+        self._sorted = None
+        self._month_rows = {}
+        self.months = []
+        self.offsets = []
+        if ordering[0].lstrip('-') == 'date' and archived.summaries_suffice():
+            by_month = defaultdict(list)
+            for archive in archived.months:
+                by_month[archive.month].append(archive)
+            offset = 0
+            for month in sorted(by_month, reverse=ordering[0].startswith('-')):
+                self.months.append(by_month[month])
+                self.offsets.append(offset)
+                offset += sum(archived._summary(archive)[2] for archive in by_month[month])
+            self.length = offset
+        else:
+            self.length = archived.count()
+
+    def __len__(self):
+        return self.length
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            start, stop, _ = index.indices(self.length)
+            return [self[position] for position in range(start, stop)]
+        if not 0 <= index < self.length:
+            raise IndexError(index)
+        if not self.months:
+            if self._sorted is None:
+                self._sorted = sorted(self.archived.rows(), key=self.key)
+            return self._sorted[index]
+        month = bisect.bisect_right(self.offsets, index) - 1
+        if month not in self._month_rows:
+            self._month_rows[month] = sorted(self.archived._unpack(self.months[month]), key=self.key)
+        return self._month_rows[month][index - self.offsets[month]]
+
+
+class HotColdRows:
+    """
+    A filtered Transaction queryset followed by the matching archived rows, as one sequence
+    in the requested order, so Django's Paginator can page across hot and cold storage.
+
+    A page only loads its own rows from each side. Its cold rows are found with a binary search
+    over the archived rows: the i-th one sits at i plus the number of hot rows before it
+    (a COUNT with a keyset filter on the ordering and the id). Its hot rows are read starting
+    right after the last cold row before the page.
+
+    Args:
+        queryset (QuerySet): Filtered and ordered hot rows
+        archived (ArchivedTransactions): Matching cold rows
+        ordering (list): The queryset's ordering, e.g. ['-date']
+    """
+
+    def __init__(self, queryset, archived, ordering):
+        self.ordering = keyset_ordering(ordering)
+        self.queryset = queryset.order_by(*self.ordering)
+        self.archived = archived
+        self.cold = archived.ordered(self.ordering)
+        self._hot_before = {}
+
+    def count(self):
+        return self.queryset.count() + self.archived.count()
+
+    def __len__(self):
+        return self.count()
+
+    def __getitem__(self, index):
+        if not isinstance(index, slice):
+            return self[index:index + 1][0]
+        start, stop = index.start or 0, index.stop
+        if stop is None:
+            stop = self.count()
+        size = stop - start
+        if size <= 0:
+            return []
+
+        # Ordered by date and the page ends before the first archived day: no need to decompress
+        if self.ordering[0].lstrip('-') == 'date':
+            if self.ordering[0].startswith('-'):
+                ahead = self.queryset.filter(date__gt=self.archived.newest_date())
+            else:
+                ahead = self.queryset.filter(date__lt=self.archived.oldest_date())
+            if ahead.count() >= stop:
+                return list(self.queryset[start:stop])
+
+        # Cold rows before the page: the first cold row whose merged position reaches start
+        low, high = 0, min(start, len(self.cold))
+        while low < high:
+            middle = (low + high) // 2
+            if middle + self.hot_before(middle) < start:
+                low = middle + 1
+            else:
+                high = middle
+        cold_skipped = low
+        hot_skipped = start - cold_skipped
+
+        hot = self.queryset
+        if cold_skipped:
+            hot = hot.filter(keyset_filter(self.ordering, self.cold[cold_skipped - 1], after=True))
+            hot_skipped -= self.hot_before(cold_skipped - 1)
+        hot = list(hot[hot_skipped:hot_skipped + size])
+        cold = self.cold[cold_skipped:cold_skipped + size]
+        return list(itertools.islice(heapq.merge(hot, cold, key=self.cold.key), size))
+
+    def hot_before(self, position):
+        """Number of hot rows ordered before the cold row at position."""
+        if position not in self._hot_before:
+            self._hot_before[position] = self.queryset.filter(
+                keyset_filter(self.ordering, self.cold[position])
+            ).count()
+        return self._hot_before[position]
+
+
+def archived_month(user, year, month):
+    """Rows of one archived month of a user as (date, description, amount, category) dicts."""
+    archive = TransactionArchive.objects.filter(user=user, month=date(year, month, 1)).first()
+    if archive is None:
+        return []
+    return [
+        {'date': row.date, 'description': row.description, 'amount': row.amount, 'category': row.category}
+        for row in unpack_rows(archive.payload, user.pk)
+    ]
@@ -0,0 +1,162 @@
+from asgiref.sync import sync_to_async
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.db.models import QuerySet
+from django.http import Http404, HttpResponse
+from django.views import View
+from django.views.decorators.csrf import csrf_exempt
+from rest_framework import status
+from rest_framework.response import Response
+
+from .models import Transaction
+from .serializers import UserViewSerializer
+from .views import TRANSACTION_TOTALS, TransactionViewSet, totals_envelope
+
+# Same method -> action mapping DefaultRouter gives TransactionViewSet
+LIST_ACTIONS = {'get': 'list', 'post': 'create'}
+DETAIL_ACTIONS = {'get': 'retrieve', 'put': 'update', 'patch': 'partial_update', 'delete': 'destroy'}
+
+_sync_list = TransactionViewSet.as_view(LIST_ACTIONS)
+_sync_detail = TransactionViewSet.as_view(DETAIL_ACTIONS)
+
+
+class AsyncTransactionView(View):
+    """
+    Native async list, retrieve, create, partial update and delete of /api/transactions/.
+
+    Routed instead of the TransactionViewSet routes when settings.ASYNC_TRANSACTION_VIEWS
+    is on, which only pays off under ASGI. Everything but the database work is the
+    viewset's own: authentication, permissions, content negotiation, filters, search,
+    ordering, sparse fields, pagination, serializers and error responses. Queries are
+    awaited through the async ORM, so requests waiting on the database no longer queue
+    behind each other on the one thread sync views share under ASGI.
+
+    Parts that have no async ORM equivalent (authentication, category suggestions,
+    duplicate detection, reading archived months) run through sync_to_async.
+    """
+    detail = False
+
+    @classmethod
+    def as_view(cls, **initkwargs):
+        # Like DRF's APIView, authentication classes do their own CSRF checks
+        return csrf_exempt(super().as_view(**initkwargs))
+
+    # Async method handlers make Django run the view as a coroutine, dispatch() routes the requests
+    async def get(self, request, *args, **kwargs):
+        return await self.handle(request, **kwargs)
+
+    post = patch = delete = get
+
+    async def dispatch(self, request, *args, **kwargs):
+        method = request.method.lower()
+        actions = DETAIL_ACTIONS if self.detail else LIST_ACTIONS
+        if method not in ('get', 'post', 'patch', 'delete') or method not in actions:
+            # OPTIONS and methods the viewset refuses are answered by the viewset itself
+            sync_view = _sync_detail if self.detail else _sync_list
+            return await sync_to_async(sync_view)(request, *args, **kwargs)
+        return await self.handle(request, **kwargs)
+
+    async def handle(self, request, **kwargs):
+        actions = DETAIL_ACTIONS if self.detail else LIST_ACTIONS
+        action = actions[request.method.lower()]
+        # Set up like ViewSetMixin.as_view and APIView.dispatch would, minus calling the handler
+        viewset = TransactionViewSet(action=action, action_map=actions, args=(), kwargs=kwargs, format_kwarg=None)
+        for method, name in actions.items():
+            setattr(viewset, method, getattr(viewset, name))
+        drf_request = viewset.initialize_request(request, **kwargs)
+        viewset.request = drf_request
+        viewset.headers = viewset.default_response_headers
+        try:
+            # Loads the user of the JWT
+            await sync_to_async(viewset.initial)(drf_request, **kwargs)
+            response = await getattr(self, action)(viewset, drf_request, **kwargs)
+        except Exception as exc:
+            response = viewset.handle_exception(exc)
+        response = viewset.finalize_response(drf_request, response, **kwargs)
+        return await self.render(response)
+
+    async def render(self, response):
+        if response.accepted_renderer.format == 'api':
+            # The browsable API renders forms from querysets
+            return await sync_to_async(response.render)()
+        # A plain HttpResponse, a TemplateResponse would be rendered on a worker thread again
+        response.render()
+        plain = HttpResponse(response.content, status=response.status_code)
+        for name, value in response.items():
+            plain[name] = value
+        return plain
+
+    async def get_object(self, viewset, request, pk):
+        queryset = viewset.filter_queryset(viewset.get_queryset())
+        try:
+            instance = await queryset.aget(pk=pk)
+        except (Transaction.DoesNotExist, TypeError, ValueError, DjangoValidationError):
+            raise Http404(f"No {Transaction._meta.object_name} matches the given query.")
+        viewset.check_object_permissions(request, instance)
+        return instance
+
+    async def list(self, viewset, request, **kwargs):
+        queryset = viewset.filter_queryset(viewset.get_queryset())
+        if await sync_to_async(viewset.get_archived)(queryset):
+            # Archived months are merged in Python by HotColdRows, leave that to the sync list
+            return await sync_to_async(viewset.list)(request, **kwargs)
+
+        totals = await queryset.aaggregate(**TRANSACTION_TOTALS)
+        page = await viewset.paginator.apaginate_queryset(
+            queryset, request, viewset, count=totals['transaction_count']
+        )
+        if page is None:
+            rows = [row async for row in queryset.aiterator()]
+            return Response(viewset.get_serializer(rows, many=True).data)
+
+        response = viewset.get_paginated_response(viewset.get_serializer(page, many=True).data)
+        response.data['totals'] = totals_envelope(totals)
+        if viewset.sends_page_users():
+            users = viewset.get_page_users(page)
+            if isinstance(users, QuerySet):
+                users = [user async for user in users]
+            response.data['users'] = UserViewSerializer(users, many=True).data
+        return response
+
+    async def retrieve(self, viewset, request, pk, **kwargs):
+        instance = await self.get_object(viewset, request, pk)
+        return Response(viewset.get_serializer(instance).data)
+
+    async def create(self, viewset, request, **kwargs):
+        is_many = isinstance(request.data, list)
+        mode = viewset.get_duplicates_mode()
+        serializer = viewset.get_serializer(
+            data=request.data, many=is_many, context={'request': request, 'duplicates': mode}
+        )
+        # Validation may look up category suggestions in the database
+        await sync_to_async(serializer.is_valid)(raise_exception=True)
+
+        if not is_many:
+            serializer.instance = await Transaction.objects.acreate(user=request.user, **serializer.validated_data)
+        elif mode == 'allow':
+            serializer.instance = await Transaction.objects.abulk_create(
+                [Transaction(user=request.user, **item) for item in serializer.validated_data]
+            )
+            serializer.duplicates = []
+        else:
+            # Duplicate detection reads and writes in one database transaction
+            await sync_to_async(serializer.save)()
+
+        response = Response(serializer.data, status=status.HTTP_201_CREATED)
+        if is_many:
+            response['X-Duplicate-Count'] = len(serializer.duplicates)
+        return response
+
+    async def partial_update(self, viewset, request, pk, **kwargs):
+        instance = await self.get_object(viewset, request, pk)
+        serializer = viewset.get_serializer(instance, data=request.data, partial=True)
+        # TransactionUpdateSerializer validates without queries
+        serializer.is_valid(raise_exception=True)
+        for field, value in serializer.validated_data.items():
+            setattr(instance, field, value)
+        await instance.asave()
+        return Response(serializer.data)
+
+    async def destroy(self, viewset, request, pk, **kwargs):
+        instance = await self.get_object(viewset, request, pk)
+        await instance.adelete()
+        return Response(status=status.HTTP_204_NO_CONTENT)
@@ -0,0 +1,240 @@
+import bisect
+import heapq
+import itertools
+import math
+import statistics
+import threading
+from collections import Counter, deque
+from datetime import date
+
+from django.conf import settings
+from django.db import transaction as db_transaction
+from django.dispatch import receiver
+
+from .fingerprints import normalize_description
+from .lru import BoundedLRU
+from .models import Transaction
+from .signals import transactions_changed
+
+# Amounts remembered per description for its typical amount
+RECENT_AMOUNTS = 20
+# A use this many days ago counts half as much as one today
+RECENCY_HALF_LIFE_DAYS = 90
+# Answers kept per index between writes
+MAX_CACHED_RESULTS = 256
+# Prefixes matching more keys than this walk the ranked descriptions instead of their matches
+BROAD_PREFIX_KEYS = 1000
+
+
+class _Entry:
+    __slots__ = ('description', 'count', 'last_used', 'amounts', 'categories')
+
+    def __init__(self, description):
+        self.description = description
+        self.count = 0
+        self.last_used = None
+        self.amounts = deque(maxlen=RECENT_AMOUNTS)
+        self.categories = Counter()
+
+    def score(self, today):
+        age = max((today - self.last_used).days, 0)
+        return self.count * 0.5 ** (age / RECENCY_HALF_LIFE_DAYS)
+
+    def weight(self):
+        # log2(score) plus a constant of the day for any day after the last use: entries rank the
+        # same by it on every later day, it does not change until they are used again
+        return math.log2(self.count) + self.last_used.toordinal() / RECENCY_HALF_LIFE_DAYS
+
+    def as_dict(self):
+        return {
+            'description': self.description,
+            'count': self.count,
+            'last_used': self.last_used,
+            'typical_amount': statistics.median(self.amounts) if self.amounts else None,
+            'category': self.categories.most_common(1)[0][0] if self.categories else None,
+        }
+
+
+class PrefixIndex:
+    """
+    One user's distinct descriptions, searchable by the start of any of their words.
+
+    Keys are the normalized description and every word suffix of it ("house rent dhanmondi",
+    "rent dhanmondi", "dhanmondi"), kept in a sorted list, so a prefix lookup is a bisect
+    followed by a scan of the matching range. Short prefixes match much of the index, they
+    walk the descriptions from the best ranked one instead and stop at the limit.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries = {}
+        self._keys = []
+        # (rank, description, normalized) of every entry, best first
+        self._ranked = []
+        self._results = {}
+
+    @staticmethod
+    def _suffixes(normalized):
+        words = normalized.split()
+        return [' '.join(words[index:]) for index in range(len(words))]
+
+    def _rank_key(self, normalized):
+        entry = self._entries[normalized]
+        return -entry.weight(), entry.description, normalized
+
+    def _unrank(self, normalized):
+        if normalized in self._entries:
+            key = self._rank_key(normalized)
+            position = bisect.bisect_left(self._ranked, key)
+            if position < len(self._ranked) and self._ranked[position] == key:
+                del self._ranked[position]
+
+    def add(self, description, day, amount, category):
+        normalized = normalize_description(description)
+        if not normalized:
+            return
+        with self._lock:
+            self._results.clear()
+            self._unrank(normalized)
+            if self._record(normalized, description, day, amount, category):
+                for key in self._suffixes(normalized):
+                    bisect.insort(self._keys, (key, normalized))
+            bisect.insort(self._ranked, self._rank_key(normalized))
+
+    def extend(self, rows):
+        """Adds (description, day, amount, category) rows, oldest first, sorting once at the end."""
+        with self._lock:
+            self._results.clear()
+            for description, day, amount, category in rows:
+                normalized = normalize_description(description)
+                if normalized and self._record(normalized, description, day, amount, category):
+                    self._keys.extend((key, normalized) for key in self._suffixes(normalized))
+            self._keys.sort()
+            self._ranked = sorted(self._rank_key(normalized) for normalized in self._entries)
+
+    def _record(self, normalized, description, day, amount, category):
+        """Counts one use of a description, returns True if it is new to the index."""
+        entry = self._entries.get(normalized)
+        is_new = entry is None
+        if is_new:
+            entry = self._entries[normalized] = _Entry(description)
+        entry.count += 1
+        if entry.last_used is None or day >= entry.last_used:
+            # The latest spelling is the one shown
+            entry.last_used = day
+            entry.description = description
+        entry.amounts.append(amount)
+        entry.categories[category] += 1
+        return is_new
+
+    def remove(self, description, amount, category):
+        normalized = normalize_description(description)
+        with self._lock:
+            self._results.clear()
+            entry = self._entries.get(normalized)
+            if entry is None:
+                return
+            self._unrank(normalized)
+            entry.count -= 1
+            if amount in entry.amounts:
+                entry.amounts.remove(amount)
+            entry.categories[category] -= 1
+            if entry.categories[category] <= 0:
+                del entry.categories[category]
+            if entry.count > 0:
+                bisect.insort(self._ranked, self._rank_key(normalized))
+                return
+            del self._entries[normalized]
+            for key in self._suffixes(normalized):
+                position = bisect.bisect_left(self._keys, (key, normalized))
+                if position < len(self._keys) and self._keys[position] == (key, normalized):
+                    del self._keys[position]
+
+    def search(self, prefix, limit=8, today=None):
+        """Returns up to limit suggestions whose words start with prefix, most used and most recent first."""
+        prefix = normalize_description(prefix)
+        if not prefix:
+            return []
+        today = today or date.today()
+        with self._lock:
+            # Answers are kept until the next write
+            cache_key = (prefix, limit, today)
+            cached = self._results.get(cache_key)
+            if cached is not None:
+                return cached
+
+            start = bisect.bisect_left(self._keys, (prefix,))
+            end = bisect.bisect_left(self._keys, (prefix + '\uffff',), start)
+            if end - start > BROAD_PREFIX_KEYS:
+                # Every word start in a normalized description follows a single space
+                spaced = ' ' + prefix
+                ranked = itertools.islice(
+                    (key for key in self._ranked if key[2].startswith(prefix) or spaced in key[2]), limit
+                )
+            else:
+                matches = {normalized for _, normalized in self._keys[start:end]}
+                ranked = heapq.nsmallest(limit, (self._rank_key(normalized) for normalized in matches))
+            entries = [self._entries[normalized] for _, _, normalized in ranked]
+
+            if any(entry.last_used > today for entry in entries):
+                # Rows dated after today make the rank overrate their description, score exactly
+                matches = {normalized for _, normalized in self._keys[start:end]}
+                entries = heapq.nsmallest(
+                    limit,
+                    (self._entries[normalized] for normalized in matches),
+                    key=lambda entry: (-entry.score(today), entry.description),
+                )
+            result = [entry.as_dict() for entry in entries]
+            if len(self._results) >= MAX_CACHED_RESULTS:
+                self._results.clear()
+            self._results[cache_key] = result
+            return result
+
+    def __len__(self):
+        return len(self._entries)
+
+
+def _build(user_id):
+    index = PrefixIndex()
+    rows = (
+        Transaction.objects.filter(user_id=user_id)
+        .order_by('date', 'id')
+        .values_list('description', 'date', 'amount', 'category')
+    )
+    index.extend(rows.iterator(chunk_size=2000))
+    return index
+
+
+_indexes = None
+_indexes_lock = threading.Lock()
+
+
+def _cache():
+    global _indexes
+    with _indexes_lock:
+        if _indexes is None:
+            config = settings.AUTOCOMPLETE
+            _indexes = BoundedLRU(config['MAX_USERS'], ttl=config['TTL'])
+        return _indexes
+
+
+def user_index(user_id):
+    """The user's PrefixIndex, built from their history on first use."""
+    return _cache().get_or_build(user_id, lambda: _build(user_id))
+
+
+@receiver(transactions_changed)
+def index_changes(sender, changes, **kwargs):
+    # Indexes that were not built by this worker yet are built from the database when needed
+    def apply():
+        cache = _cache()
+        for change in changes:
+            index = cache.peek(change.user_id)
+            if index is None:
+                continue
+            old, new = change.old, change.new
+            if old:
+                index.remove(old['description'], old['amount'], old['category'])
+            if new:
+                index.add(new['description'], new['date'], new['amount'], new['category'])
+    db_transaction.on_commit(apply)
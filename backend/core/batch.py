@@ -0,0 +1,114 @@
+from django.db import transaction as db_transaction
+from rest_framework import status
+
+from .duplicates import bulk_create_checked
+from .models import Transaction
+from .serializers import (
+    TransactionCreateSerializer,
+    TransactionUpdateSerializer,
+    TransactionViewSerializer,
+)
+
+
+def apply_batch_operations(queryset, request, operations, atomic=True, duplicates=None):
+    """
+    Applies a list of mixed create/update/delete operations in a single database transaction.
+
+    All creates go through one bulk_create, all updates through one bulk_update and all
+    deletes through one ``id__in`` DELETE, regardless of how many operations are sent.
+
+    Args:
+        queryset (QuerySet): Transactions the requesting user is allowed to modify
+        request (Request): The current request, used as the owner of created rows
+        operations (list): Operation dictionaries ({"op": ..., "id": ..., "data": ...})
+        atomic (bool): If True, nothing is written unless every operation is valid.
+            If False, valid operations are applied and invalid ones are reported.
+        duplicates (str, optional): Duplicate handling of the creates, see core.duplicates.bulk_create_checked
+
+    Returns:
+        tuple: (list of per-operation results, bool telling whether anything was written)
+    """
+    results = [None] * len(operations)
+    target_ids = {op['id'] for op in operations if op['op'] in ('update', 'delete')}
+
+    with db_transaction.atomic():
+        # One query for every row touched by an update or delete
+        existing = queryset.select_related('user').select_for_update(of=('self',)).in_bulk(target_ids)
+
+        to_create, to_update, to_delete = [], [], []
+        update_fields = set()
+        seen_ids = set()
+
+        for index, op in enumerate(operations):
+            kind = op['op']
+            result = {'index': index, 'op': kind}
+            results[index] = result
+
+            if kind == 'create':
+                serializer = TransactionCreateSerializer(data=op.get('data') or {}, context={'request': request})
+                if not serializer.is_valid():
+                    result.update(status=status.HTTP_400_BAD_REQUEST, errors=serializer.errors)
+                    continue
+                to_create.append((result, Transaction(user=request.user, **serializer.validated_data)))
+                continue
+
+            result['id'] = op['id']
+            instance = existing.get(op['id'])
+            if instance is None:
+                result.update(status=status.HTTP_404_NOT_FOUND, errors={'detail': 'Not found.'})
+                continue
+            if op['id'] in seen_ids:
+                result.update(
+                    status=status.HTTP_400_BAD_REQUEST,
+                    errors={'detail': 'Transaction is already modified by another operation in this batch.'},
+                )
+                continue
+            seen_ids.add(op['id'])
+
+            if kind == 'delete':
+                to_delete.append((result, instance))
+                continue
+
+            serializer = TransactionUpdateSerializer(instance, data=op.get('data') or {}, partial=True)
+            if not serializer.is_valid():
+                result.update(status=status.HTTP_400_BAD_REQUEST, errors=serializer.errors)
+                continue
+            for field, value in serializer.validated_data.items():
+                setattr(instance, field, value)
+            update_fields.update(serializer.validated_data)
+            to_update.append((result, instance))
+
+        has_errors = any('errors' in result for result in results)
+        if atomic and has_errors:
+            # Valid operations were not applied because another one failed
+            for result in results:
+                result.setdefault('status', status.HTTP_424_FAILED_DEPENDENCY)
+            return results, False
+
+        if to_create:
+            created, reports = bulk_create_checked([instance for _, instance in to_create], mode=duplicates)
+            reports = {report.pop('index'): report for report in reports}
+            for index, ((result, _), instance) in enumerate(zip(to_create, created)):
+                report = reports.get(index)
+                if report is not None:
+                    result['duplicate'] = report
+                if instance is None:
+                    # Skipped as a duplicate of an existing transaction
+                    result.update(status=status.HTTP_200_OK, id=report['duplicate_of'])
+                    continue
+                merged = report is not None and report['action'] == 'merged'
+                result.update(status=status.HTTP_200_OK if merged else status.HTTP_201_CREATED, id=instance.pk)
+                result['data'] = TransactionViewSerializer(instance).data
+
+        if to_update:
+            if update_fields:
+                Transaction.objects.bulk_update([instance for _, instance in to_update], sorted(update_fields))
+            for result, instance in to_update:
+                result.update(status=status.HTTP_200_OK, data=TransactionViewSerializer(instance).data)
+
+        if to_delete:
+            queryset.filter(id__in=[instance.pk for _, instance in to_delete]).delete()
+            for result, _ in to_delete:
+                result['status'] = status.HTTP_204_NO_CONTENT
+
+    return results, bool(to_create or to_update or to_delete)
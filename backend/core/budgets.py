@@ -0,0 +1,184 @@
+import logging
+from collections import defaultdict
+from datetime import date, timedelta
+from decimal import Decimal
+from functools import reduce
+from operator import or_
+
+from django.db import transaction as db_transaction
+from django.db.models import F, Q, Sum
+from django.dispatch import receiver
+from django.utils import timezone
+
+from .models import Budget, Transaction
+from .signals import budget_state_changed, transactions_changed
+
+logger = logging.getLogger(__name__)
+
+
+def period_bounds(day, period):
+    """Returns (first day, first day of the next period) of the weekly, monthly or yearly period containing day."""
+    if period == 'weekly':
+        start = day - timedelta(days=day.weekday())
+        return start, start + timedelta(days=7)
+    if period == 'yearly':
+        return date(day.year, 1, 1), date(day.year + 1, 1, 1)
+    start = day.replace(day=1)
+    return start, date(day.year + day.month // 12, day.month % 12 + 1, 1)
+
+
+def evaluate_state(spent, limit, warning_percent):
+    if spent >= limit:
+        return 'exceeded'
+    if spent * 100 >= limit * warning_percent:
+        return 'warning'
+    return 'ok'
+
+
+def period_spent(user_id, category, start, end):
+    """Sums the category's transactions of a period, only needed when a budget starts a new period."""
+    total = Transaction.objects.filter(
+        user_id=user_id, category=category, date__gte=start, date__lt=end
+    ).aggregate(total=Sum('amount'))['total']
+    return total or Decimal(0)
+
+
+def open_period(budget, today=None):
+    """Points a new or edited budget at the current period and counts what was already spent in it."""
+    budget.period_start, end = period_bounds(today or timezone.localdate(), budget.period)
+    budget.spent = period_spent(budget.user_id, budget.category, budget.period_start, end)
+    state = evaluate_state(budget.spent, budget.limit, budget.warning_percent)
+    if state != budget.state:
+        budget.state = state
+        budget.state_changed_at = timezone.now()
+
+
+def current_status(budget, today=None):
+    """
+    The budget's state in the current period, answered from its counter.
+
+    A counter whose period is over has not been moved yet in the new one, nothing was spent then.
+    """
+    start, end = period_bounds(today or timezone.localdate(), budget.period)
+    spent, state = (budget.spent, budget.state) if budget.period_start == start else (Decimal(0), 'ok')
+    return {
+        'id': budget.pk,
+        'category': budget.category,
+        'period': budget.period,
+        'period_start': start,
+        'period_end': end - timedelta(days=1),
+        'limit': budget.limit,
+        'spent': spent,
+        'remaining': budget.limit - spent,
+        'percent_used': round(float(spent / budget.limit * 100), 1) if budget.limit else None,
+        'state': state,
+    }
+
+
+def _as_date(value):
+    return date.fromisoformat(value[:10]) if isinstance(value, str) else value
+
+
+def _amounts(changes, earliest):
+    """{(user_id, category): [(date, signed amount)]} of the changes dated on or after earliest."""
+    amounts = defaultdict(list)
+    for change in changes:
+        for values, sign in ((change.old, -1), (change.new, 1)):
+            if not values or values['category'] == 'income':
+                continue
+            day = _as_date(values['date'])
+            if day >= earliest:
+                amount = Decimal(str(values['amount'])) * sign
+                amounts[(change.user_id, values['category'])].append((day, amount))
+    return amounts
+
+
+@receiver(transactions_changed)
+def apply_changes(sender, changes, **kwargs):
+    """
+    Moves the counters of the budgets a write touched, inside the writing transaction.
+
+    Only changes dated in a current period matter, older edits cost no query at all. The
+    touched budgets are read and locked in one query, then each one gets a single
+    UPDATE spent = spent + delta. The new total is known from the locked row, so
+    threshold crossings are detected without summing anything.
+    """
+    today = timezone.localdate()
+    earliest = min(period_bounds(today, period)[0] for period, _ in Budget.PERIOD_CHOICES)
+    amounts = _amounts(changes, earliest)
+    if not amounts:
+        return
+
+    budgets = Budget.objects.select_for_update().filter(reduce(or_, (
+        Q(user_id=user_id, category=category) for user_id, category in amounts
+    )))
+    crossings = []
+    for budget in budgets:
+        start, end = period_bounds(today, budget.period)
+        delta = sum(
+            (amount for day, amount in amounts[(budget.user_id, budget.category)] if start <= day < end),
+            Decimal(0),
+        )
+        if budget.period_start != start:
+            # First write of a new period, the old counter is dropped and the period counted
+            # once. The write is already in the table, so it is part of the sum.
+            old_state = budget.state
+            open_period(budget, today)
+            Budget.objects.filter(pk=budget.pk).update(
+                period_start=budget.period_start, spent=budget.spent,
+                state=budget.state, state_changed_at=budget.state_changed_at,
+            )
+        elif delta:
+            old_state = budget.state
+            budget.spent += delta
+            budget.state = evaluate_state(budget.spent, budget.limit, budget.warning_percent)
+            update = {'spent': F('spent') + delta}
+            if budget.state != old_state:
+                budget.state_changed_at = timezone.now()
+                update.update(state=budget.state, state_changed_at=budget.state_changed_at)
+            Budget.objects.filter(pk=budget.pk).update(**update)
+        else:
+            continue
+        if budget.state != old_state:
+            crossings.append((budget, old_state))
+
+    if crossings:
+        db_transaction.on_commit(lambda: _announce(crossings))
+
+
+def _announce(crossings):
+    for budget, old_state in crossings:
+        logger.info(
+            "Budget %s of user %s went from %s to %s (%s of %s)",
+            budget.pk, budget.user_id, old_state, budget.state, budget.spent, budget.limit,
+        )
+        budget_state_changed.send(sender=Budget, budget=budget, old_state=old_state, new_state=budget.state)
+
+
+def reconcile(users=None, dry_run=False):
+    """
+    Recounts every budget's current period from the transactions and repairs drifted counters.
+
+    Returns:
+        tuple: (budgets checked, list of (budget, counted spent, actual spent) that drifted)
+    """
+    today = timezone.localdate()
+    budgets = Budget.objects.all()
+    if users:
+        budgets = budgets.filter(user_id__in=users)
+    checked, drifted = 0, []
+    for budget in budgets.iterator():
+        checked += 1
+        start, end = period_bounds(today, budget.period)
+        counted = budget.spent if budget.period_start == start else Decimal(0)
+        with db_transaction.atomic():
+            actual = period_spent(budget.user_id, budget.category, start, end)
+            if actual == counted and budget.period_start == start:
+                continue
+            if actual != counted:
+                drifted.append((budget, counted, actual))
+            if not dry_run:
+                locked = Budget.objects.select_for_update().get(pk=budget.pk)
+                open_period(locked, today)
+                locked.save(update_fields=['period_start', 'spent', 'state', 'state_changed_at'])
+    return checked, drifted
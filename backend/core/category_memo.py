@@ -0,0 +1,240 @@
+import threading
+from collections import Counter, defaultdict
+
+from django.conf import settings
+from django.db import transaction as db_transaction
+from django.db.models import Count
+from django.dispatch import receiver
+
+from .constants import catagory_choices
+from .fingerprints import normalize_description
+from .lru import BoundedLRU
+from .models import CategoryFeature, Transaction
+from .signals import transactions_changed
+
+CATEGORIES = {value for value, _ in catagory_choices}
+
+# How much each kind of feature counts towards a suggestion
+FEATURE_WEIGHTS = {'description': 4, 'merchant': 2, 'word': 1}
+
+GLOBAL = 'global'
+
+
+def description_features(description):
+    """
+    Features a category is learned from: the whole normalized description, the merchant
+    (the part before " - ", or the first two words) and every word.
+    """
+    words = [word for word in normalize_description(description).split() if len(word) > 1 and not word.isdigit()]
+    if not words:
+        return []
+    if ' - ' in (description or ''):
+        merchant_words = [
+            word for word in normalize_description(description.split(' - ', 1)[0]).split() if not word.isdigit()
+        ]
+    else:
+        merchant_words = words[:2]
+    features = [('description', ' '.join(words))]
+    if merchant_words:
+        features.append(('merchant', ' '.join(merchant_words)))
+    features += [('word', word) for word in dict.fromkeys(words)]
+    return features
+
+
+class Suggestion:
+    def __init__(self, category, confidence, source, scores):
+        self.category = category
+        self.confidence = confidence
+        self.source = source
+        self.scores = scores
+
+    def as_dict(self):
+        return {
+            'category': self.category,
+            'confidence': round(self.confidence, 3),
+            'source': self.source,
+            'alternatives': [
+                {'category': category, 'score': round(score, 3)}
+                for category, score in self.scores.most_common(3)
+            ],
+        }
+
+
+class CategoryMemo:
+    """Counts of categories per description feature, for one user or for everyone."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._features = defaultdict(Counter)
+
+    def add(self, description, category, count=1):
+        """Learns (count > 0) or unlearns (count < 0) that a description has a category."""
+        for feature in description_features(description):
+            self.add_feature(feature, category, count)
+
+    def add_feature(self, feature, category, count=1):
+        with self._lock:
+            counts = self._features[feature]
+            counts[category] += count
+            if counts[category] <= 0:
+                del counts[category]
+                if not counts:
+                    del self._features[feature]
+
+    def scores(self, description):
+        """Returns a Counter of category scores, every matched feature votes with its weight."""
+        scores = Counter()
+        with self._lock:
+            for feature in description_features(description):
+                counts = self._features.get(feature)
+                if not counts:
+                    continue
+                total = sum(counts.values())
+                weight = FEATURE_WEIGHTS[feature[0]]
+                for category, count in counts.items():
+                    scores[category] += weight * count / total
+        return scores
+
+    def __len__(self):
+        return len(self._features)
+
+
+def _build(queryset):
+    memo = CategoryMemo()
+    for description, category, count in queryset.values_list('description', 'category').annotate(count=Count('id')):
+        memo.add(description, category, count)
+    return memo
+
+
+_memos = None
+_global_memo = None
+_memos_lock = threading.Lock()
+
+
+def _cache():
+    global _memos
+    with _memos_lock:
+        if _memos is None:
+            config = settings.CATEGORY_MEMO
+            _memos = BoundedLRU(config['MAX_USERS'], ttl=config['TTL'])
+        return _memos
+
+
+def _global_cache():
+    # Kept apart from the users' memos, MAX_USERS users in a row must not evict the shared index
+    global _global_memo
+    with _memos_lock:
+        if _global_memo is None:
+            _global_memo = BoundedLRU(1, ttl=settings.CATEGORY_MEMO['TTL'])
+        return _global_memo
+
+
+def user_memo(user_id):
+    return _cache().get_or_build(
+        user_id, lambda: _build(Transaction.objects.filter(user_id=user_id).order_by())
+    )
+
+
+def global_memo():
+    """The index shared by all users, read from the CategoryFeature table build_global_features wrote."""
+    def build():
+        memo = CategoryMemo()
+        for kind, value, category, users in CategoryFeature.objects.values_list('kind', 'value', 'category', 'users'):
+            memo.add_feature((kind, value), category, users)
+        return memo
+    return _global_cache().get_or_build(GLOBAL, build)
+
+
+def build_global_features(min_users=None, limit=None):
+    """
+    Rebuilds the CategoryFeature table from every user's transactions, run offline by build_category_memo.
+
+    A feature is counted once per user and kept only when at least min_users users filed
+    it under the same category, so the shared index holds common merchants and words
+    rather than anyone's own descriptions.
+
+    Args:
+        min_users (int, optional): settings.CATEGORY_MEMO['GLOBAL_MIN_USERS'] by default
+        limit (int, optional): Features kept, the most widely shared first, settings.CATEGORY_MEMO['GLOBAL_LIMIT'] by default
+
+    Returns:
+        tuple: (users read, features stored)
+    """
+    config = settings.CATEGORY_MEMO
+    min_users = config['GLOBAL_MIN_USERS'] if min_users is None else min_users
+    limit = config['GLOBAL_LIMIT'] if limit is None else limit
+
+    shared = Counter()
+    users, current_user, seen = 0, None, set()
+    pairs = Transaction.objects.order_by('user_id').values_list('user_id', 'description', 'category').distinct()
+    for user_id, description, category in pairs.iterator(chunk_size=5000):
+        if user_id != current_user:
+            shared.update(seen)
+            users, current_user, seen = users + 1, user_id, set()
+        seen.update((feature, category) for feature in description_features(description))
+    shared.update(seen)
+
+    features = [
+        CategoryFeature(kind=kind, value=value[:255], category=category, users=count)
+        for ((kind, value), category), count in shared.most_common(limit)
+        if count >= min_users
+    ]
+    with db_transaction.atomic():
+        CategoryFeature.objects.all().delete()
+        CategoryFeature.objects.bulk_create(features, batch_size=1000)
+    _global_cache().discard(GLOBAL)
+    return users, len(features)
+
+
+def suggest_category(user_id, description):
+    """
+    Suggests a category for a description from the user's own history, falling back to
+    what many users filed the same merchant or words under (see build_global_features).
+
+    Returns:
+        Suggestion: category is None when nothing in the history matches
+    """
+    for source, memo in (('user', user_memo(user_id)), (GLOBAL, global_memo())):
+        scores = memo.scores(description)
+        if scores:
+            category, best = scores.most_common(1)[0]
+            return Suggestion(category, best / sum(scores.values()), source, scores)
+    return Suggestion(None, 0.0, None, Counter())
+
+
+def correct_category(user_id, description, category):
+    """
+    Picks the category of an LLM extracted row: the memo wins when it is confident and
+    learned from the user's own history, and fills in missing or unknown categories.
+    """
+    category = (category or '').strip().lower()
+    if category not in CATEGORIES:
+        category = None
+    suggestion = suggest_category(user_id, description)
+    confident = suggestion.category is not None and suggestion.confidence >= settings.CATEGORY_MEMO['MIN_CONFIDENCE']
+    if confident and (suggestion.source == 'user' or category is None):
+        return suggestion.category
+    return category or suggestion.category or 'miscellaneous'
+
+
+@receiver(transactions_changed)
+def learn_from_changes(sender, changes, **kwargs):
+    # Only memos this worker has already built are updated, the others are built from the database.
+    # The shared index only changes when build_category_memo rebuilds it.
+    def apply():
+        cache = _cache()
+        for scope in {change.user_id for change in changes}:
+            memo = cache.peek(scope)
+            if memo is None:
+                continue
+            for change in changes:
+                if change.user_id != scope:
+                    continue
+                old, new = change.old, change.new
+                if old and new and (old['description'], old['category']) == (new['description'], new['category']):
+                    continue
+                if old:
+                    memo.add(old['description'], old['category'], -1)
+                if new:
+                    memo.add(new['description'], new['category'])
+    db_transaction.on_commit(apply)
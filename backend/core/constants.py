@@ -12,4 +12,7 @@ catagory_choices = [
         ('investment', 'Investment'),
         ('miscellaneous', 'Miscellaneous'),
         ('tax','Tax'),
-    ]
\ No newline at end of file
+    ]
+
+# Upper bound on the number of operations accepted by /transactions/batch/
+MAX_BATCH_OPERATIONS = 500
@@ -0,0 +1,243 @@
+from datetime import date, timedelta
+from decimal import Decimal
+from difflib import SequenceMatcher
+from functools import reduce
+from operator import or_
+
+from django.conf import settings
+from django.db import transaction as db_transaction
+from django.db.models import Q
+
+from .fingerprints import normalize_description
+from .models import Transaction
+
+MODES = ('allow', 'skip', 'flag', 'merge')
+
+# Near duplicate candidates are fetched for this many incoming rows per query
+NEAR_LOOKUP_CHUNK = 200
+
+
+class Duplicate:
+    """
+    An incoming transaction that duplicates an existing one or an earlier row of the same batch.
+
+    Attributes:
+        match (str): "exact" (same fingerprint) or "near" (same amount, close date, similar description)
+        transaction_id (int): Id of the existing transaction, None for a duplicate within the batch
+        batch_index (int): Index of the earlier row of the batch it repeats, None otherwise
+        matched_id (int): Id of the row that matched, differs from transaction_id when that
+            row is itself a flagged duplicate
+    """
+
+    def __init__(self, match, transaction_id=None, batch_index=None, matched_id=None):
+        self.match = match
+        self.transaction_id = transaction_id
+        self.batch_index = batch_index
+        self.matched_id = transaction_id if matched_id is None else matched_id
+
+
+def similar_descriptions(first, second, threshold):
+    """True if two normalized descriptions are close, or one contains all words of the other."""
+    if first == second:
+        return True
+    first_words, second_words = set(first.split()), set(second.split())
+    if first_words and second_words and (first_words <= second_words or second_words <= first_words):
+        return True
+    return SequenceMatcher(None, first, second).ratio() >= threshold
+
+
+def find_duplicates(transactions, window_days=None, threshold=None):
+    """
+    Looks up which unsaved transactions repeat an existing row, with indexed queries only.
+
+    Exact duplicates are found with one (user, fingerprint) lookup for the whole batch. The
+    rest is checked for near duplicates: rows of the same user and amount dated within
+    ±window_days whose description is similar, fetched through the (user, amount, date)
+    index. The work grows with the batch, never with the user's history.
+
+    Args:
+        transactions (list): Unsaved Transaction instances with user_id set
+        window_days (int, optional): Date tolerance of near duplicates, settings.DUPLICATE_WINDOW_DAYS by default
+        threshold (float, optional): Minimum description similarity (0-1), settings.DUPLICATE_SIMILARITY by default
+
+    Returns:
+        list: A Duplicate or None for every transaction, in order
+    """
+    window = timedelta(days=settings.DUPLICATE_WINDOW_DAYS if window_days is None else window_days)
+    threshold = settings.DUPLICATE_SIMILARITY if threshold is None else threshold
+    results = [None] * len(transactions)
+
+    for transaction in transactions:
+        # Rows built from JSON or LLM output may carry strings and floats
+        if isinstance(transaction.date, str):
+            transaction.date = date.fromisoformat(transaction.date)
+        transaction.amount = Decimal(str(transaction.amount)).quantize(Decimal('0.01'))
+        transaction.refresh_fingerprint()
+    # Newest first, so the oldest matching row wins. A match that is itself a flagged
+    # duplicate stands for the row it repeats.
+    existing = {
+        (user_id, fingerprint): (duplicate_of or transaction_id, transaction_id)
+        for transaction_id, user_id, fingerprint, duplicate_of in Transaction.objects.filter(
+            user_id__in={t.user_id for t in transactions},
+            fingerprint__in={t.fingerprint for t in transactions},
+        ).order_by('-id').values_list('id', 'user_id', 'fingerprint', 'duplicate_of')
+    }
+
+    first_in_batch = {}
+    remaining = []
+    for index, transaction in enumerate(transactions):
+        key = (transaction.user_id, transaction.fingerprint)
+        if key in existing:
+            original, matched = existing[key]
+            results[index] = Duplicate('exact', transaction_id=original, matched_id=matched)
+        elif key in first_in_batch:
+            results[index] = Duplicate('exact', batch_index=first_in_batch[key])
+        else:
+            first_in_batch[key] = index
+            remaining.append(index)
+
+    if window.days >= 0:
+        _find_near_duplicates(transactions, remaining, results, window, threshold)
+
+    # A repeat of a batch row that itself duplicates an existing row points at that row
+    for index, duplicate in enumerate(results):
+        if duplicate is not None and duplicate.batch_index is not None:
+            first = results[duplicate.batch_index]
+            if first is not None:
+                results[index] = Duplicate(duplicate.match, transaction_id=first.transaction_id, matched_id=first.matched_id)
+
+    # duplicate_of may still name a row deleted or archived since, the matched row stands in for it then
+    pointed = {d.transaction_id for d in results if d is not None and d.transaction_id != d.matched_id}
+    if pointed:
+        gone = pointed - set(Transaction.objects.filter(id__in=pointed).values_list('id', flat=True))
+        for duplicate in results:
+            if duplicate is not None and duplicate.transaction_id in gone:
+                duplicate.transaction_id = duplicate.matched_id
+    return results
+
+
+def _find_near_duplicates(transactions, remaining, results, window, threshold):
+    for start in range(0, len(remaining), NEAR_LOOKUP_CHUNK):
+        chunk = remaining[start:start + NEAR_LOOKUP_CHUNK]
+        lookups = {
+            (transactions[index].user_id, transactions[index].amount, transactions[index].date)
+            for index in chunk
+        }
+        candidates = Transaction.objects.filter(reduce(or_, (
+            Q(user_id=user_id, amount=amount, date__gte=day - window, date__lte=day + window)
+            for user_id, amount, day in lookups
+        ))).values_list('id', 'user_id', 'amount', 'date', 'description', 'duplicate_of')
+
+        by_key = {}
+        for candidate in candidates:
+            by_key.setdefault((candidate[1], candidate[2]), []).append(candidate)
+        for index in chunk:
+            transaction = transactions[index]
+            description = normalize_description(transaction.description)
+            best = None
+            for transaction_id, _, _, day, other, duplicate_of in by_key.get((transaction.user_id, transaction.amount), ()):
+                distance = abs((day - transaction.date).days)
+                if distance > window.days or not similar_descriptions(description, normalize_description(other), threshold):
+                    continue
+                # Closest date first, rows that are not duplicates themselves before flagged ones
+                rank = (distance, duplicate_of is not None, transaction_id)
+                if best is None or rank < best[0]:
+                    best = (rank, duplicate_of or transaction_id, transaction_id)
+            if best is not None:
+                results[index] = Duplicate('near', transaction_id=best[1], matched_id=best[2])
+
+
+def merge_into(existing, incoming):
+    """Copies what the incoming row knows better into the existing one, returns the changed fields."""
+    changed = []
+    if incoming.is_recurring and not existing.is_recurring:
+        existing.is_recurring = True
+        changed.append('is_recurring')
+    if existing.category == 'miscellaneous' and incoming.category != 'miscellaneous':
+        existing.category = incoming.category
+        changed.append('category')
+    if len(incoming.description) > len(existing.description):
+        existing.description = incoming.description
+        changed.append('description')
+    return changed
+
+
+def bulk_create_checked(transactions, mode=None):
+    """
+    bulk_create that first resolves duplicates according to mode.
+
+    - allow: insert everything
+    - skip: leave duplicates out
+    - flag: insert duplicates with duplicate_of pointing at the row they repeat
+    - merge: fold duplicates into the row they repeat instead of inserting them
+
+    Args:
+        transactions (list): Unsaved Transaction instances with user_id set
+        mode (str, optional): One of MODES, settings.DUPLICATE_TRANSACTION_MODE by default
+
+    Returns:
+        tuple: (list with the created, merged-into or None (skipped) row for every input,
+            list of {"index", "match", "duplicate_of", "action"} reports)
+    """
+    mode = mode or settings.DUPLICATE_TRANSACTION_MODE
+    if mode == 'allow':
+        return Transaction.objects.bulk_create(transactions), []
+
+    with db_transaction.atomic():
+        duplicates = find_duplicates(transactions)
+        targets = {}
+        if mode == 'merge':
+            targets = Transaction.objects.in_bulk(
+                {d.transaction_id for d in duplicates if d is not None and d.transaction_id is not None}
+            )
+            changed_fields, merged = set(), {}
+            for index, (transaction, duplicate) in enumerate(zip(transactions, duplicates)):
+                if duplicate is None:
+                    continue
+                if duplicate.batch_index is not None:
+                    # Not inserted yet, the merged values go in with the insert
+                    merge_into(transactions[duplicate.batch_index], transaction)
+                    continue
+                target = targets.get(duplicate.transaction_id)
+                if target is None:
+                    # Deleted since it was matched, there is nothing left to merge into
+                    duplicates[index] = None
+                    continue
+                changed = merge_into(target, transaction)
+                if changed:
+                    changed_fields.update(changed)
+                    merged[target.pk] = target
+            if merged:
+                Transaction.objects.bulk_update(list(merged.values()), sorted(changed_fields))
+
+        for transaction, duplicate in zip(transactions, duplicates):
+            if mode == 'flag' and duplicate is not None:
+                transaction.duplicate_of = duplicate.transaction_id
+        Transaction.objects.bulk_create(
+            [t for t, duplicate in zip(transactions, duplicates) if duplicate is None or mode == 'flag']
+        )
+
+        results, reports, batch_flags = [], [], []
+        for index, (transaction, duplicate) in enumerate(zip(transactions, duplicates)):
+            if duplicate is None:
+                results.append(transaction)
+                continue
+            first = transactions[duplicate.batch_index] if duplicate.batch_index is not None else None
+            duplicate_of = duplicate.transaction_id if first is None else first.pk
+            if mode == 'flag':
+                if first is not None:
+                    transaction.duplicate_of = duplicate_of
+                    batch_flags.append(transaction)
+                results.append(transaction)
+                action = 'flagged'
+            elif mode == 'merge':
+                results.append(first or targets[duplicate.transaction_id])
+                action = 'merged'
+            else:
+                results.append(None)
+                action = 'skipped'
+            reports.append({'index': index, 'match': duplicate.match, 'duplicate_of': duplicate_of, 'action': action})
+        if batch_flags:
+            # Rows repeating an earlier row of the batch only know its id after the insert
+            Transaction.objects.bulk_update(batch_flags, ['duplicate_of'])
+    return results, reports
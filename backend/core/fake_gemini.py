@@ -0,0 +1,213 @@
+import json
+import random
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit
+
+# Canned answers in the shape the prompts in analysis.py and image_to_transaction.py ask for
+FAKE_ANALYSIS = {
+    "overview": "You spent less than you earned this month, mostly on food and rent.",
+    "financial_score": {"score": 72, "status": "Good"},
+    "quick_tips": [
+        "Save BDT2,000 this month",
+        "Cut eating out by BDT800",
+        "Set aside BDT500 for emergencies",
+    ],
+    "warnings": ["Food spending is up compared to last month"],
+    "good_habits": ["Rent and bills were paid on time"],
+}
+
+FAKE_RECEIPT = [
+    {"date": "2025-01-15", "description": "Shwapno - Rice 5kg", "amount": 450, "category": "food"},
+    {"date": "2025-01-15", "description": "Shwapno - Cooking oil", "amount": 320, "category": "food"},
+]
+
+
+def canned_answer(receipt):
+    payload = FAKE_RECEIPT if receipt else FAKE_ANALYSIS
+    return "```json\n" + json.dumps(payload, indent=2) + "\n```"
+
+
+class FakePart:
+    """Stands in for google.genai.types.Part, see core.gemini.image_part."""
+
+    def __init__(self, data, mime_type):
+        self.data = data
+        self.mime_type = mime_type
+
+    def __repr__(self):
+        return f"FakePart({self.mime_type}, {len(self.data)} bytes)"
+
+
+class FakeUsage:
+    def __init__(self, contents, text):
+        # Roughly four characters per token, like the real tokenizer on English text
+        self.prompt_token_count = len(str(contents)) // 4
+        self.candidates_token_count = len(text) // 4
+        self.total_token_count = self.prompt_token_count + self.candidates_token_count
+
+
+class FakeResponse:
+    def __init__(self, text, usage_metadata=None):
+        self.text = text
+        self.usage_metadata = usage_metadata
+
+
+class FakeModels:
+    def __init__(self, client):
+        self.client = client
+
+    def _answer(self, contents):
+        # Receipt extraction sends a list with the image part, analysis sends one prompt string
+        return canned_answer(isinstance(contents, list))
+
+    def generate_content(self, model, contents, **kwargs):
+        self.client.calls.append((model, contents))
+        time.sleep(self.client.latency)
+        text = self.client.response_text or self._answer(contents)
+        return FakeResponse(text, FakeUsage(contents, text))
+
+    def generate_content_stream(self, model, contents, **kwargs):
+        self.client.calls.append((model, contents))
+        text = self.client.response_text or self._answer(contents)
+        size = self.client.chunk_size
+        for start in range(0, len(text), size):
+            time.sleep(self.client.latency / max(1, len(text) // size))
+            last = start + size >= len(text)
+            # Like the real API, usage is only reported with the final chunk
+            yield FakeResponse(text[start:start + size], FakeUsage(contents, text) if last else None)
+
+
+class FakeGeminiClient:
+    """
+    Stand-in for google.genai.Client that answers locally without network access.
+
+    Args:
+        response_text (str, optional): Raw model output to return instead of the canned answers
+        chunk_size (int): Characters per chunk for generate_content_stream
+        latency (float): Seconds a whole answer takes, spread over the chunks when streaming
+    """
+
+    def __init__(self, response_text=None, chunk_size=16, latency=0.0):
+        self.response_text = response_text
+        self.chunk_size = chunk_size
+        self.latency = latency
+        self.calls = []
+        self.models = FakeModels(self)
+
+
+class _FakeGeminiHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+    def send_json(self, status, payload):
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        server = self.server
+        request = json.loads(self.rfile.read(int(self.headers.get('Content-Length') or 0)) or b'{}')
+        # /v1beta/models/<model>:generateContent or :streamGenerateContent?alt=sse
+        model, _, method = urlsplit(self.path).path.rsplit('/', 1)[-1].partition(':')
+        if method not in ('generateContent', 'streamGenerateContent'):
+            server.count('not_found')
+            self.send_json(404, {'error': {'code': 404, 'message': f"Unknown method {method}", 'status': 'NOT_FOUND'}})
+            return
+        if server.fails():
+            server.count('errors')
+            self.send_json(503, {'error': {
+                'code': 503, 'message': 'The model is overloaded. Please try again later.', 'status': 'UNAVAILABLE',
+            }})
+            return
+
+        contents = request.get('contents', [])
+        receipt = any(
+            'inlineData' in part or 'inline_data' in part
+            for content in contents for part in content.get('parts', [])
+        )
+        server.count('receipts' if receipt else 'analyses')
+        text = canned_answer(receipt)
+        usage = FakeUsage(contents, text)
+        usage_metadata = {
+            'promptTokenCount': usage.prompt_token_count,
+            'candidatesTokenCount': usage.candidates_token_count,
+            'totalTokenCount': usage.total_token_count,
+        }
+
+        if method == 'generateContent':
+            time.sleep(server.latency)
+            self.send_json(200, self.answer(model, text, usage_metadata))
+            return
+
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        # No length is known up front, the end of the stream is the end of the connection
+        self.send_header('Connection', 'close')
+        self.end_headers()
+        self.close_connection = True
+        size = server.chunk_size
+        for start in range(0, len(text), size):
+            time.sleep(server.latency / max(1, len(text) // size))
+            last = start + size >= len(text)
+            chunk = self.answer(model, text[start:start + size], usage_metadata if last else None)
+            self.wfile.write(f"data: {json.dumps(chunk)}\r\n\r\n".encode())
+            self.wfile.flush()
+
+    def answer(self, model, text, usage_metadata):
+        answer = {
+            'candidates': [{'content': {'parts': [{'text': text}], 'role': 'model'}, 'index': 0}],
+            'modelVersion': model,
+        }
+        if usage_metadata is not None:
+            answer['candidates'][0]['finishReason'] = 'STOP'
+            answer['usageMetadata'] = usage_metadata
+        return answer
+
+
+class FakeGeminiServer(ThreadingHTTPServer):
+    """
+    The canned answers over HTTP, shaped like the Gemini REST API, for load tests of a
+    running deployment. Point the "google" backend at url with GEMINI_BASE_URL.
+
+    Args:
+        address (tuple): (host, port) to listen on, port 0 picks a free one
+        latency (float): Seconds a whole answer takes, spread over the chunks when streaming
+        error_rate (float): Share of calls (0-1) answered with 503 UNAVAILABLE
+        chunk_size (int): Characters per streamed chunk
+        seed (int): Random seed of the injected errors
+    """
+    daemon_threads = True
+
+    def __init__(self, address=('127.0.0.1', 0), latency=0.0, error_rate=0.0, chunk_size=16, seed=0):
+        super().__init__(address, _FakeGeminiHandler)
+        self.latency = latency
+        self.error_rate = error_rate
+        self.chunk_size = chunk_size
+        self.stats = Counter()
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    @property
+    def url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}/"
+
+    def fails(self):
+        with self._lock:
+            return self._random.random() < self.error_rate
+
+    def count(self, name):
+        with self._lock:
+            self.stats[name] += 1
+
+    def start(self):
+        threading.Thread(target=self.serve_forever, name='fake-gemini', daemon=True).start()
+        return self
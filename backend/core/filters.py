@@ -1,6 +1,6 @@
 from django_filters.rest_framework import FilterSet
 from django_filters import DateFromToRangeFilter
-from .models import Transaction
+from .models import SpendingAnomaly, Transaction
 
 
 class TransactionFilters(FilterSet):
@@ -12,3 +12,14 @@ class TransactionFilters(FilterSet):
             'amount': ['gte', 'lte'],
         }
 
+
+
+class SpendingAnomalyFilters(FilterSet):
+    date = DateFromToRangeFilter()
+    class Meta:
+        model = SpendingAnomaly
+        fields = {
+            'kind': ['exact'],
+            'category': ['exact'],
+            'score': ['gte'],
+        }
@@ -0,0 +1,32 @@
+import hashlib
+import re
+from decimal import Decimal
+
+# Fields a fingerprint is built from, changing one of them changes the fingerprint
+FINGERPRINT_FIELDS = ('description', 'date', 'amount', 'category')
+
+_NON_WORD = re.compile(r'[\W_]+')
+_DIGITS = re.compile(r'\d')
+
+
+def normalize_description(description):
+    """Lowercases a description and reduces punctuation and runs of whitespace to single spaces."""
+    return _NON_WORD.sub(' ', (description or '').lower()).strip()
+
+
+def series_key(description):
+    """Normalized description without words containing digits, e.g. invoice numbers and dates."""
+    words = normalize_description(description).split()
+    return ' '.join(word for word in words if not _DIGITS.search(word)) or ' '.join(words)
+
+
+def transaction_fingerprint(description, date, amount, category):
+    """
+    Identifies transactions that describe the same purchase.
+
+    "Coffee, Starbucks" on 2025-01-05 for 250 and "coffee starbucks" on the same day for
+    250.00 get the same fingerprint. Dates may be date objects or ISO strings.
+    """
+    amount = Decimal(str(amount)).quantize(Decimal('0.01'))
+    key = '|'.join([normalize_description(description), str(date)[:10], str(amount), category or ''])
+    return hashlib.sha1(key.encode()).hexdigest()
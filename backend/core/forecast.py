@@ -0,0 +1,166 @@
+from calendar import monthrange
+from collections import defaultdict
+from datetime import date
+from decimal import Decimal
+
+from django.conf import settings
+from django.dispatch import receiver
+from django.utils import timezone
+
+from .models import RecurringSeries, SpendingForecast, Transaction
+from .recurring import add_period, series_key
+from .signals import transactions_changed
+
+
+def _money(value):
+    return Decimal(str(round(float(value), 2))).quantize(Decimal('0.01'))
+
+
+def months_before(month, count):
+    index = month.year * 12 + month.month - 1 - count
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def upcoming_recurring(user_id, today, month_end):
+    """
+    Sums the occurrences of the user's recurring series expected after today until month_end.
+
+    Returns:
+        tuple: ({category: amount}, set of the series keys)
+    """
+    upcoming = defaultdict(Decimal)
+    keys = set()
+    for series in RecurringSeries.objects.filter(user_id=user_id):
+        keys.add(series.key)
+        # A series that missed two occurrences has probably ended
+        if (today - series.last_date).days > 2 * series.interval_days + 7:
+            continue
+        day = series.next_date
+        while day <= month_end:
+            if day > today:
+                upcoming[series.category] += series.amount
+            day = add_period(day, series.period, series.first_date.day)
+    return upcoming, keys
+
+
+def compute_forecast(user_id, today=None):
+    """
+    Projects the current month's totals per category.
+
+    A category ends the month at its month-to-date total, plus the recurring series still
+    due this month, plus the usual spending of the rest of the month. The latter comes from
+    the user's past months: the share of a category's (non recurring) monthly total that is
+    usually spent by this day of the month gives its spending curve. The rest of the month
+    is then expected at this month's pace and at the past months' average, weighted by how
+    much of the month is usually behind.
+
+    Returns:
+        SpendingForecast: Unsaved
+    """
+    # Imported here, NumPy is only needed once a forecast is recomputed
+    import numpy as np
+
+    today = today or timezone.localdate()
+    month = today.replace(day=1)
+    length = monthrange(today.year, today.month)[1]
+    month_end = month.replace(day=length)
+    history_start = months_before(month, settings.FORECAST_HISTORY_MONTHS)
+
+    rows = list(
+        Transaction.objects.filter(user_id=user_id, date__gte=history_start, date__lte=today).order_by()
+        .values_list('date', 'amount', 'category', 'description')
+    )
+    upcoming, keys = upcoming_recurring(user_id, today, month_end)
+    categories = sorted({row[2] for row in rows} | set(upcoming))
+    codes_by_name = {category: code for code, category in enumerate(categories)}
+    days_in = {}
+    for row in rows:
+        days_in.setdefault((row[0].year, row[0].month), monthrange(row[0].year, row[0].month)[1])
+
+    count, size = len(rows), len(categories)
+    codes = np.fromiter((codes_by_name[row[2]] for row in rows), dtype=np.int64, count=count)
+    amounts = np.fromiter((float(row[1]) for row in rows), dtype=np.float64, count=count)
+    months = np.fromiter((row[0].year * 12 + row[0].month - 1 for row in rows), dtype=np.int64, count=count)
+    fractions = np.fromiter(
+        (row[0].day / days_in[(row[0].year, row[0].month)] for row in rows), dtype=np.float64, count=count
+    )
+    recurring = np.fromiter((series_key(row[3]) in keys for row in rows), dtype=bool, count=count)
+
+    def by_category(mask):
+        return np.bincount(codes[mask], weights=amounts[mask], minlength=size)
+
+    current = months == month.year * 12 + month.month - 1
+    past = ~current & ~recurring
+    history_months = 0
+    if not current.all():
+        history_months = month.year * 12 + month.month - 1 - int(months[~current].min())
+
+    fraction_now = today.day / length
+    to_date = by_category(current)
+    pace_to_date = by_category(current & ~recurring)
+    past_total = by_category(past)
+    past_by_now = by_category(past & (fractions <= fraction_now))
+    with np.errstate(divide='ignore', invalid='ignore'):
+        share = np.where(past_total > 0, past_by_now / past_total, fraction_now)
+        pace = np.where(share > 0, pace_to_date / share, pace_to_date)
+    average = past_total / history_months if history_months else pace
+    remaining = (1 - share) * (share * pace + (1 - share) * average)
+    upcoming_amounts = np.array([float(upcoming.get(category, 0)) for category in categories])
+    projected = to_date + remaining + upcoming_amounts
+
+    totals = {}
+    for code, category in enumerate(categories):
+        totals[category] = {
+            'to_date': str(_money(to_date[code])),
+            'recurring': str(_money(upcoming_amounts[code])),
+            'projected': str(_money(projected[code])),
+        }
+    income = codes_by_name.get('income')
+    expenses = np.ones(size, dtype=bool)
+    if income is not None:
+        expenses[income] = False
+    return SpendingForecast(
+        user_id=user_id,
+        month=month,
+        as_of=today,
+        categories=totals,
+        income_to_date=_money(to_date[income]) if income is not None else Decimal(0),
+        expenses_to_date=_money(to_date[expenses].sum()),
+        projected_income=_money(projected[income]) if income is not None else Decimal(0),
+        projected_expenses=_money(projected[expenses].sum()),
+        history_months=history_months,
+    )
+
+
+def refresh_forecast(user_id, today=None):
+    """Recomputes and stores a user's forecast of the current month."""
+    forecast = compute_forecast(user_id, today)
+    values = {
+        field.name: getattr(forecast, field.name)
+        for field in SpendingForecast._meta.concrete_fields
+        if field.name not in ('id', 'user', 'month', 'computed_at')
+    }
+    stored, _ = SpendingForecast.objects.update_or_create(user_id=user_id, month=forecast.month, defaults=values)
+    return stored
+
+
+def forecast_for(user_id, today=None):
+    """The stored forecast of the current month, computed now if it is missing or from an earlier day."""
+    today = today or timezone.localdate()
+    forecast = SpendingForecast.objects.filter(user_id=user_id, month=today.replace(day=1), as_of=today).first()
+    return forecast or refresh_forecast(user_id, today)
+
+
+@receiver(transactions_changed)
+def drop_changed_forecasts(sender, changes, **kwargs):
+    month = timezone.localdate().replace(day=1)
+    users = set()
+    for change in changes:
+        for values in (change.old, change.new):
+            day = values and values['date']
+            if isinstance(day, str):
+                day = date.fromisoformat(day[:10])
+            if day and day >= month:
+                users.add(change.user_id)
+    if users:
+        SpendingForecast.objects.filter(user_id__in=users, month=month).delete()
@@ -0,0 +1,32 @@
+from django.conf import settings
+
+GEMINI_MODEL = "gemini-2.5-flash"
+
+
+def get_client(api_key):
+    """
+    Returns the Gemini client selected by settings.GEMINI_BACKEND.
+
+    "google" is the real google.genai client, "fake" is the local canned backend
+    from core.fake_gemini (used for tests and local development without an API key).
+    """
+    if settings.GEMINI_BACKEND == "fake":
+        from .fake_gemini import FakeGeminiClient
+        return FakeGeminiClient()
+
+    # Imported here, google.genai (pydantic, httpx, google-auth) is slow to import
+    from google import genai
+    if settings.GEMINI_BASE_URL:
+        from google.genai import types
+        return genai.Client(api_key=api_key, http_options=types.HttpOptions(base_url=settings.GEMINI_BASE_URL))
+    return genai.Client(api_key=api_key)
+
+
+def image_part(data, mime_type):
+    """An image for the contents of a prompt, in the type the client of get_client takes."""
+    if settings.GEMINI_BACKEND == "fake":
+        from .fake_gemini import FakePart
+        return FakePart(data, mime_type)
+
+    from google.genai import types
+    return types.Part.from_bytes(data=data, mime_type=mime_type)
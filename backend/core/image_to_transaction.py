@@ -1,18 +1,13 @@
-from google import genai
 import json
 
 from .constants import catagory_choices
+from .gemini import GEMINI_MODEL, get_client, image_part
+from .telemetry import track_llm_call
 
-def image_to_transaction(image_bytes, api_key):
-    client = genai.Client(api_key=api_key)
+def image_to_transaction(image_bytes, api_key, user=None):
+    client = get_client(api_key)
 
-    response = client.models.generate_content(
-        model='gemini-2.5-flash',
-        contents=[
-        genai.types.Part.from_bytes(
-            data=image_bytes,
-            mime_type='image/jpeg',
-        ),
+    prompt = [
         'Make a transaction list from this receipt.',
         '''Output Format:[
             {"date": "YYYY-MM-DD", "description": "Burger King - Burger", "amount": 32, "category": "Food"},
@@ -22,20 +17,34 @@ def image_to_transaction(image_bytes, api_key):
         'Categories: ['
         + ', '.join([f'"{category}"' for category in catagory_choices])
         + ']'
-        ]
-    )
+    ]
+    prompt_size = len(image_bytes) + sum(len(part) for part in prompt)
 
-    # Parse the response - remove markdown formatting
-    response_text = response.text.strip()
-    
-    # Remove markdown code block formatting if present
-    if response_text.startswith('```json'):
-        response_text = response_text[7:]  # Remove '```json'
-    if response_text.endswith('```'):
-        response_text = response_text[:-3]  # Remove '```'
-    
-    # Clean any extra whitespace
-    response_text = response_text.strip()
-    
-    transactions = json.loads(response_text)
-    return transactions
+    with track_llm_call('image_to_transaction', GEMINI_MODEL, prompt_size, user=user) as call:
+        response = client.models.generate_content(
+            model=GEMINI_MODEL,
+            contents=[
+            image_part(image_bytes, 'image/jpeg'),
+            *prompt
+            ]
+        )
+        call.record_usage(response)
+
+        # Parse the response - remove markdown formatting
+        response_text = response.text.strip()
+        
+        # Remove markdown code block formatting if present
+        if response_text.startswith('```json'):
+            response_text = response_text[7:]  # Remove '```json'
+        if response_text.endswith('```'):
+            response_text = response_text[:-3]  # Remove '```'
+        
+        # Clean any extra whitespace
+        response_text = response_text.strip()
+        
+        try:
+            transactions = json.loads(response_text)
+        except json.JSONDecodeError:
+            call.outcome = 'parse_error'
+            raise
+        return transactions
@@ -0,0 +1,399 @@
+import asyncio
+import json
+import logging
+import queue
+import select
+import threading
+import time
+from collections import defaultdict
+from urllib.parse import parse_qs
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core import signing
+from django.db import DEFAULT_DB_ALIAS, DatabaseError, close_old_connections, connections, transaction as db_transaction
+from django.dispatch import receiver
+from rest_framework.authentication import BaseAuthentication
+from rest_framework.exceptions import AuthenticationFailed
+
+from .models import Transaction, TransactionArchive
+from .signals import transactions_changed
+
+logger = logging.getLogger(__name__)
+
+# NOTIFY payloads must stay below 8000 bytes
+MAX_NOTIFY_BYTES = 7900
+TICKET_SALT = 'core.live'
+
+
+def make_ticket(user):
+    """
+    Signs a ticket that opens the user's live stream, for clients that can not send headers.
+
+    A ticket sits in the stream's URL, where web servers and proxies log it, so it only
+    opens /api/transactions/live/ and only for LIVE_UPDATES['TICKET_MAX_AGE'] seconds.
+
+    Returns:
+        str: The ticket, passed as ?ticket=
+    """
+    return signing.dumps({'user': user.pk}, salt=TICKET_SALT)
+
+
+def ticket_user(ticket):
+    """The active user a valid ticket was issued to, None if the ticket is invalid or expired."""
+    try:
+        data = signing.loads(ticket, salt=TICKET_SALT, max_age=settings.LIVE_UPDATES['TICKET_MAX_AGE'])
+    except signing.BadSignature:
+        return None
+    return User.objects.filter(pk=data['user'], is_active=True).first()
+
+
+class LiveTicketAuthentication(BaseAuthentication):
+    """
+    Authenticates the live stream by ?ticket= (make_ticket), for EventSource clients.
+
+    Access tokens are refused in the query string: they would be logged with the URL.
+    """
+
+    def authenticate(self, request):
+        if 'access_token' in request.query_params:
+            raise AuthenticationFailed("Access tokens are not accepted in the URL, request a stream ticket.")
+        ticket = request.query_params.get('ticket')
+        if not ticket:
+            return None
+        user = ticket_user(ticket)
+        if user is None:
+            raise AuthenticationFailed("Invalid or expired stream ticket.")
+        return user, None
+
+
+def user_totals(user_id):
+    """
+    The unfiltered totals of the user's transaction list, archived months included.
+
+    Read from the primary: events follow a commit there, a replica may not have it yet.
+    """
+    # Imported here, the views import this module
+    from .archive import ArchivedTransactions
+    from .views import TRANSACTION_TOTALS, totals_envelope
+
+    totals = Transaction.objects.using(DEFAULT_DB_ALIAS).filter(user_id=user_id).aggregate(**TRANSACTION_TOTALS)
+    archived = ArchivedTransactions(TransactionArchive.objects.using(DEFAULT_DB_ALIAS).filter(user_id=user_id), {})
+    if archived:
+        for name, value in archived.totals().items():
+            totals[name] = (totals[name] or 0) + value
+    return totals_envelope(totals)
+
+
+def build_event(message):
+    """
+    Turns a published message into the (event, data) clients receive.
+
+    "changes" carries the changed rows as the list serializes them, the deleted ids and
+    the new totals. "reset" only carries the totals, clients reload what they show. Rows
+    and totals are read from the primary, like in user_totals.
+    """
+    from .serializers import TransactionViewSerializer
+
+    user_id = message['user']
+    if message.get('reset'):
+        return 'reset', {'totals': user_totals(user_id)}
+    rows = (
+        Transaction.objects.using(DEFAULT_DB_ALIAS).filter(user_id=user_id, id__in=message['changed'])
+        .select_related('user')
+    )
+    return 'changes', {
+        'changed': TransactionViewSerializer(rows, many=True).data,
+        'deleted': message['deleted'],
+        'totals': user_totals(user_id),
+    }
+
+
+class Subscription:
+    """
+    The events waiting for one connected client.
+
+    A client that falls QUEUE_SIZE events behind loses its backlog and gets a single
+    "reset" event instead.
+
+    Args:
+        broker (Broker): Broker the subscription is registered with
+        user_id (int): User whose changes are received
+        loop (AbstractEventLoop, optional): Loop of an async consumer, None for a sync one
+    """
+
+    def __init__(self, broker, user_id, loop=None):
+        self.broker = broker
+        self.user_id = user_id
+        self.loop = loop
+        size = settings.LIVE_UPDATES['QUEUE_SIZE']
+        self.queue = asyncio.Queue(size) if loop is not None else queue.Queue(size)
+
+    def put(self, event):
+        # Called on the publishing thread, asyncio queues are only touched on their loop
+        if self.loop is not None:
+            self.loop.call_soon_threadsafe(self._put, event)
+        else:
+            self._put(event)
+
+    def _put(self, event):
+        try:
+            self.queue.put_nowait(event)
+        except (queue.Full, asyncio.QueueFull):
+            while not self.queue.empty():
+                self.queue.get_nowait()
+            self.queue.put_nowait(('reset', {'totals': event[1]['totals']}))
+
+    def get(self, timeout):
+        """The next event, None if there was none for timeout seconds."""
+        try:
+            return self.queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    async def aget(self, timeout):
+        try:
+            return await asyncio.wait_for(self.queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+    def close(self):
+        self.broker.unsubscribe(self)
+
+
+class Broker:
+    """
+    In-process pub/sub of transaction changes per user.
+
+    Messages published by a worker reach the clients connected to the same worker, which
+    is enough for a single process (runserver, one uvicorn worker). Events are built once
+    per message for all of a user's clients, and not at all when nobody listens.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscribers = defaultdict(set)
+
+    def subscribe(self, user_id, loop=None):
+        subscription = Subscription(self, user_id, loop)
+        with self._lock:
+            self._subscribers[user_id].add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            subscribers = self._subscribers.get(subscription.user_id)
+            if subscribers is not None:
+                subscribers.discard(subscription)
+                if not subscribers:
+                    del self._subscribers[subscription.user_id]
+
+    def listening(self, user_id):
+        with self._lock:
+            return bool(self._subscribers.get(user_id))
+
+    def publish(self, message):
+        """Sends {'user', 'changed', 'deleted'} or {'user', 'reset': True}, after the write commits."""
+        if self.listening(message['user']):
+            db_transaction.on_commit(lambda: self.deliver(message), robust=True)
+
+    def deliver(self, message):
+        with self._lock:
+            subscribers = list(self._subscribers.get(message['user'], ()))
+        if not subscribers:
+            return
+        event = build_event(message)
+        for subscription in subscribers:
+            subscription.put(event)
+
+
+class PostgresBroker(Broker):
+    """
+    Pub/sub across workers and hosts through PostgreSQL LISTEN/NOTIFY.
+
+    Messages are sent with pg_notify() inside the writing transaction, so PostgreSQL
+    delivers them on commit and drops them on rollback. Every worker with connected clients
+    runs one listener thread on its own connection and delivers to its local subscribers.
+    """
+
+    def __init__(self, channel):
+        super().__init__()
+        self.channel = channel
+        self._listener = None
+
+    def subscribe(self, user_id, loop=None):
+        with self._lock:
+            if self._listener is None:
+                self._listener = threading.Thread(target=self.listen, name='live-updates-listener', daemon=True)
+                self._listener.start()
+        return super().subscribe(user_id, loop)
+
+    def publish(self, message):
+        payload = json.dumps(message, separators=(',', ':'))
+        if len(payload) > MAX_NOTIFY_BYTES:
+            payload = json.dumps({'user': message['user'], 'reset': True})
+        with connections['default'].cursor() as cursor:
+            cursor.execute('SELECT pg_notify(%s, %s)', [self.channel, payload])
+
+    def listen(self):
+        from django.db.backends.postgresql.psycopg_any import is_psycopg3
+
+        default = connections['default']
+        while True:
+            raw = None
+            try:
+                raw = default.get_new_connection(default.get_connection_params())
+                raw.autocommit = True
+                with raw.cursor() as cursor:
+                    cursor.execute(f'LISTEN "{self.channel}"')
+                while True:
+                    if is_psycopg3:
+                        notifies = list(raw.notifies(timeout=settings.LIVE_UPDATES['HEARTBEAT'], stop_after=100))
+                    else:
+                        select.select([raw], [], [], settings.LIVE_UPDATES['HEARTBEAT'])
+                        raw.poll()
+                        notifies, raw.notifies[:] = list(raw.notifies), []
+                    for notify in notifies:
+                        self.deliver_safely(json.loads(notify.payload))
+            except Exception:
+                logger.exception("Live updates listener lost its connection, reconnecting")
+                if raw is not None:
+                    try:
+                        raw.close()
+                    except Exception:
+                        pass
+                time.sleep(1)
+
+    def deliver_safely(self, message):
+        try:
+            self.deliver(message)
+        except DatabaseError:
+            logger.exception("Could not deliver live update for user %s", message.get('user'))
+        finally:
+            # This thread's Django connection, the listener's own stays open
+            close_old_connections()
+
+
+_broker = None
+_broker_lock = threading.Lock()
+
+
+def get_broker():
+    """Returns the process wide broker selected by settings.LIVE_UPDATES['BACKEND']."""
+    global _broker
+    with _broker_lock:
+        if _broker is None:
+            config = settings.LIVE_UPDATES
+            if config['BACKEND'] == 'postgres':
+                _broker = PostgresBroker(config['CHANNEL'])
+            else:
+                _broker = Broker()
+        return _broker
+
+
+@receiver(transactions_changed)
+def publish_changes(sender, changes, **kwargs):
+    by_user = defaultdict(lambda: ([], []))
+    for change in changes:
+        changed, deleted = by_user[change.user_id]
+        (deleted if change.new is None else changed).append(change.id)
+    broker = get_broker()
+    for user_id, (changed, deleted) in by_user.items():
+        if len(changed) + len(deleted) > settings.LIVE_UPDATES['MAX_ROWS']:
+            # Big imports and archive runs, clients reload instead of receiving every row
+            broker.publish({'user': user_id, 'reset': True})
+        else:
+            broker.publish({'user': user_id, 'changed': changed, 'deleted': deleted})
+
+
+def stream_events(user_id):
+    """SSE messages for a sync (WSGI) response: the current totals, then every change."""
+    from .renderers import sse_event
+
+    config = settings.LIVE_UPDATES
+    subscription = get_broker().subscribe(user_id)
+    try:
+        yield b'retry: 3000\n' + sse_event('ready', {'totals': user_totals(user_id)})
+        stop_at = time.monotonic() + config['MAX_SECONDS']
+        while time.monotonic() < stop_at:
+            event = subscription.get(config['HEARTBEAT'])
+            # A comment keeps proxies from closing an idle connection
+            yield sse_event(*event) if event is not None else b': keepalive\n\n'
+    finally:
+        subscription.close()
+
+
+async def astream_events(user_id):
+    """stream_events for ASGI, waiting for events without holding a thread."""
+    from .renderers import sse_event
+
+    config = settings.LIVE_UPDATES
+    subscription = get_broker().subscribe(user_id, asyncio.get_running_loop())
+    try:
+        totals = await sync_to_async(user_totals)(user_id)
+        yield b'retry: 3000\n' + sse_event('ready', {'totals': totals})
+        stop_at = time.monotonic() + config['MAX_SECONDS']
+        while time.monotonic() < stop_at:
+            event = await subscription.aget(config['HEARTBEAT'])
+            yield sse_event(*event) if event is not None else b': keepalive\n\n'
+    finally:
+        subscription.close()
+
+
+def _websocket_user(query_string):
+    ticket = parse_qs(query_string.decode()).get('ticket', [''])[0]
+    if not ticket:
+        return None
+    try:
+        return ticket_user(ticket)
+    finally:
+        close_old_connections()
+
+
+async def websocket_application(scope, receive, send):
+    """
+    ASGI app for WebSocket clients of /api/transactions/live/?ticket=<stream ticket>.
+
+    Sends the same events as the SSE stream as {"event": ..., "data": ...} text frames.
+    Other paths and invalid or expired tickets are closed with 4404 and 4401.
+    """
+    from .renderers import _default
+
+    if (await receive())['type'] != 'websocket.connect':
+        return
+    if scope['path'] != '/api/transactions/live/':
+        await send({'type': 'websocket.close', 'code': 4404})
+        return
+    user = await sync_to_async(_websocket_user)(scope.get('query_string', b''))
+    if user is None or not user.is_active:
+        await send({'type': 'websocket.close', 'code': 4401})
+        return
+    await send({'type': 'websocket.accept'})
+
+    async def send_event(event, data):
+        await send({'type': 'websocket.send', 'text': json.dumps({'event': event, 'data': data}, default=_default)})
+
+    subscription = get_broker().subscribe(user.pk, asyncio.get_running_loop())
+    disconnected = asyncio.ensure_future(receive())
+    try:
+        await send_event('ready', {'totals': await sync_to_async(user_totals)(user.pk)})
+        while True:
+            waiting = asyncio.ensure_future(subscription.aget(settings.LIVE_UPDATES['HEARTBEAT']))
+            done, _ = await asyncio.wait({waiting, disconnected}, return_when=asyncio.FIRST_COMPLETED)
+            if disconnected in done:
+                message = disconnected.result()
+                if message['type'] == 'websocket.disconnect':
+                    waiting.cancel()
+                    return
+                # Anything the client sends is ignored
+                disconnected = asyncio.ensure_future(receive())
+            if waiting in done:
+                event = waiting.result()
+                if event is not None:
+                    await send_event(*event)
+            else:
+                waiting.cancel()
+    finally:
+        disconnected.cancel()
+        subscription.close()
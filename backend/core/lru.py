@@ -0,0 +1,57 @@
+import threading
+import time
+from collections import OrderedDict
+
+
+class BoundedLRU:
+    """
+    Thread-safe cache of at most max_entries values, evicting the least recently used one.
+
+    Entries older than ttl seconds are rebuilt on their next use, which bounds how long a
+    worker can serve a value that another worker's writes made stale.
+
+    Args:
+        max_entries (int): Number of entries kept
+        ttl (float, optional): Seconds an entry stays valid, None keeps it until evicted
+    """
+
+    def __init__(self, max_entries, ttl=None):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+
+    def get_or_build(self, key, build):
+        """Returns the cached value for key, calling build() to create it when missing or expired."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and (self.ttl is None or time.monotonic() - entry[0] < self.ttl):
+                self._entries.move_to_end(key)
+                return entry[1]
+
+        # Built outside the lock, a slow build must not block lookups of other keys
+        value = build()
+        with self._lock:
+            self._entries[key] = (time.monotonic(), value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return value
+
+    def peek(self, key):
+        """Returns the cached value without building it or marking it as used, None if absent."""
+        with self._lock:
+            entry = self._entries.get(key)
+            return entry[1] if entry is not None else None
+
+    def discard(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        with self._lock:
+            return len(self._entries)
@@ -0,0 +1,54 @@
+from datetime import date
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from core import partitioning
+from core.archive import archive_before, month_start
+
+
+class Command(BaseCommand):
+    help = (
+        "Move transactions older than N years into the compressed TransactionArchive table. "
+        "Lists, totals and PDF exports keep reading them from there."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--years",
+            type=int,
+            default=settings.TRANSACTION_ARCHIVE_AFTER_YEARS,
+            help=f"Archive months older than this many years (default: {settings.TRANSACTION_ARCHIVE_AFTER_YEARS})",
+        )
+        parser.add_argument(
+            "--user",
+            type=int,
+            action="append",
+            help="Only archive this user id (can be repeated)",
+        )
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            help="Only report what would be archived",
+        )
+
+    def handle(self, *args, **options):
+        today = date.today()
+        # Whole months only, so every archive row covers a complete month
+        cutoff = month_start(today).replace(year=today.year - options["years"])
+
+        archived, months, size = archive_before(cutoff, users=options["user"], dry_run=options["dry_run"])
+        if options["dry_run"]:
+            self.stdout.write(f"Would archive {archived} transactions ({months} user months) before {cutoff}")
+            return
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Archived {archived} transactions before {cutoff} into {months} user months "
+            f"({size / 1024:.1f} KiB compressed)"
+        ))
+
+        if partitioning.is_supported(connection) and partitioning.is_partitioned(connection):
+            dropped = partitioning.drop_empty_partitions(connection, cutoff)
+            if dropped:
+                self.stdout.write(self.style.SUCCESS(f"Dropped empty partitions: {', '.join(dropped)}"))
@@ -0,0 +1,195 @@
+import asyncio
+import importlib
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import httpx
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.asgi import get_asgi_application
+from django.core.management.base import BaseCommand, CommandError
+from django.core.wsgi import get_wsgi_application
+from django.db.models import Count
+from django.test.utils import override_settings
+from django.urls import clear_url_caches
+from rest_framework_simplejwt.tokens import AccessToken
+
+MODES = ('wsgi', 'asgi-sync', 'asgi-async')
+
+
+def percentile(values, percent):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(percent / 100 * (len(ordered) - 1))))]
+
+
+def reload_urls():
+    # ASYNC_TRANSACTION_VIEWS is read when the URLconf is imported
+    clear_url_caches()
+    importlib.reload(importlib.import_module('core.urls'))
+    importlib.reload(importlib.import_module(settings.ROOT_URLCONF))
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare requests/s and latency percentiles of /api/transactions/ served as sync WSGI, "
+        "as the sync viewset under ASGI and as the native async views under ASGI. Requests go "
+        "through the full middleware stack in this process, without a network or server in between."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--iterations",
+            type=int,
+            default=500,
+            help="Iterations per mode, one request each in the list scenario and six in mixed (default: 500)",
+        )
+        parser.add_argument("--concurrency", type=int, default=20, help="Requests in flight (default: 20)")
+        parser.add_argument(
+            "--user",
+            help="Username to send the requests as (default: the user with the most transactions)",
+        )
+        parser.add_argument(
+            "--scenario",
+            choices=["list", "mixed"],
+            default="list",
+            help="list: filtered, searched and paginated lists. mixed: also retrieve, patch, create "
+                 "and delete (every created row is found and deleted again, so the dataset stays the same)",
+        )
+        parser.add_argument(
+            "--mode",
+            choices=MODES,
+            action="append",
+            help="Only run this mode (can be repeated)",
+        )
+
+    def handle(self, *args, **options):
+        if options["user"]:
+            user = User.objects.filter(username=options["user"]).first()
+        else:
+            user = User.objects.annotate(rows=Count("transactions")).order_by("-rows").first()
+        if user is None:
+            raise CommandError("No user to benchmark with, create one or load sample transactions first.")
+        ids = list(user.transactions.order_by("-date").values_list("id", flat=True)[:100])
+        if not ids:
+            raise CommandError(f"{user.username} has no transactions, load sample transactions first.")
+
+        self.headers = {"Authorization": f"JWT {AccessToken.for_user(user)}"}
+        self.host = next(
+            (host for host in settings.ALLOWED_HOSTS if host != "*" and not host.startswith(".")), "localhost"
+        )
+        self.ids = ids
+        # Only pages that exist, with the list's page size of 20
+        self.pages = min(5, (user.transactions.count() + 19) // 20)
+        self.scenario = options["scenario"]
+        count, concurrency = max(1, options["iterations"]), max(1, options["concurrency"])
+
+        self.stdout.write(
+            f"{count} {self.scenario} iterations per mode as {user.username} "
+            f"({user.transactions.count()} transactions), {concurrency} in flight"
+        )
+        self.stdout.write(f"{'mode':<12}{'req/s':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'errors':>8}")
+        for mode in options["mode"] or MODES:
+            with override_settings(ASYNC_TRANSACTION_VIEWS=mode == "asgi-async"):
+                reload_urls()
+                if mode == "wsgi":
+                    elapsed, latencies, errors = self.run_wsgi(count, concurrency)
+                else:
+                    elapsed, latencies, errors = asyncio.run(self.run_asgi(count, concurrency))
+            reload_urls()
+            self.stdout.write(
+                f"{mode:<12}{len(latencies) / elapsed:>10.1f}{percentile(latencies, 50):>10.1f}"
+                f"{percentile(latencies, 95):>10.1f}{percentile(latencies, 99):>10.1f}{errors:>8}"
+            )
+        self.stdout.write(self.style.SUCCESS("Done"))
+
+    def plan(self, number):
+        """The (method, path, body) requests of one iteration, the same for every mode."""
+        id_ = self.ids[number % len(self.ids)]
+        lists = [
+            ("GET", f"/api/transactions/?page={number % self.pages + 1}", None),
+            ("GET", "/api/transactions/?category=food&ordering=-amount", None),
+            ("GET", "/api/transactions/?search=a&compact=1&fields=id,date,amount,user", None),
+        ]
+        if self.scenario == "list":
+            return [lists[number % len(lists)]]
+        return [
+            lists[number % len(lists)],
+            ("GET", f"/api/transactions/{id_}/", None),
+            ("PATCH", f"/api/transactions/{id_}/", {"is_recurring": number % 2 == 0}),
+            ("POST", "/api/transactions/", {
+                "date": "2020-01-01", "description": f"benchmark-{number}-row", "amount": "1.00", "category": "food",
+            }),
+        ]
+
+    def run_wsgi(self, count, concurrency):
+        client = httpx.Client(
+            transport=httpx.WSGITransport(app=get_wsgi_application()),
+            base_url=f"http://{self.host}", headers=self.headers,
+        )
+
+        def one(number):
+            latencies, errors = [], 0
+
+            def send(method, path, body=None):
+                nonlocal errors
+                started = time.perf_counter()
+                response = client.request(method, path, json=body)
+                latencies.append((time.perf_counter() - started) * 1000)
+                errors += response.status_code >= 400
+                return response
+
+            for method, path, body in self.plan(number):
+                response = send(method, path, body)
+                if method == "POST" and response.status_code == 201:
+                    # The create response has no id, find the row and delete it again
+                    found = send("GET", self.search_path(body)).json()["results"]
+                    if found:
+                        send("DELETE", f"/api/transactions/{found[0]['id']}/")
+            return latencies, errors
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            results = list(pool.map(one, range(count)))
+        client.close()
+        return self.collect(started, results)
+
+    async def run_asgi(self, count, concurrency):
+        client = httpx.AsyncClient(
+            transport=httpx.ASGITransport(app=get_asgi_application()),
+            base_url=f"http://{self.host}", headers=self.headers,
+        )
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def one(number):
+            latencies, errors = [], 0
+
+            async def send(method, path, body=None):
+                nonlocal errors
+                started = time.perf_counter()
+                response = await client.request(method, path, json=body)
+                latencies.append((time.perf_counter() - started) * 1000)
+                errors += response.status_code >= 400
+                return response
+
+            async with semaphore:
+                for method, path, body in self.plan(number):
+                    response = await send(method, path, body)
+                    if method == "POST" and response.status_code == 201:
+                        found = (await send("GET", self.search_path(body))).json()["results"]
+                        if found:
+                            await send("DELETE", f"/api/transactions/{found[0]['id']}/")
+            return latencies, errors
+
+        started = time.perf_counter()
+        results = await asyncio.gather(*(one(number) for number in range(count)))
+        await client.aclose()
+        return self.collect(started, results)
+
+    def search_path(self, body):
+        return f"/api/transactions/?search={body['description']}&fields=id"
+
+    def collect(self, started, results):
+        elapsed = time.perf_counter() - started
+        latencies = [latency for batch, _ in results for latency in batch]
+        errors = sum(errors for _, errors in results)
+        return elapsed, latencies, errors
@@ -0,0 +1,56 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from core.middleware import BrotliEncoder, GzipEncoder, ZstdEncoder, brotli, zstandard
+from core.renderers import ORJSONRenderer
+from core.sample_data import build_sample_page
+
+
+class Command(BaseCommand):
+    help = (
+        "Report bytes saved against CPU time for every available response encoding "
+        "on typical transaction list pages. No database access is needed."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--rows",
+            type=int,
+            nargs="+",
+            default=[20, 100, 1000],
+            help="Page sizes to measure (default: 20 100 1000)",
+        )
+        parser.add_argument("--repeat", type=int, default=20, help="Timed runs per encoder (default: 20)")
+
+    def handle(self, *args, **options):
+        config = settings.RESPONSE_COMPRESSION
+        encoders = [
+            ("gzip", level, GzipEncoder(level)) for level in sorted({1, config["GZIP_LEVEL"], 9})
+        ]
+        if brotli is not None:
+            encoders += [("br", level, BrotliEncoder(level)) for level in sorted({1, config["BROTLI_QUALITY"], 11})]
+        else:
+            self.stdout.write(self.style.WARNING("brotli is not installed, skipping br"))
+        if zstandard is not None:
+            encoders += [("zstd", level, ZstdEncoder(level)) for level in sorted({1, config["ZSTD_LEVEL"], 19})]
+        else:
+            self.stdout.write(self.style.WARNING("zstandard is not installed, skipping zstd"))
+
+        for rows in options["rows"]:
+            body = ORJSONRenderer().render(build_sample_page(rows))
+            self.stdout.write(f"\nPage of {rows} rows: {len(body):,} bytes uncompressed")
+            self.stdout.write(f"{'encoding':>10} {'level':>5} {'bytes':>10} {'saved':>7} {'ms':>8} {'MB/s':>8}")
+            for name, level, encoder in encoders:
+                timings = []
+                for _ in range(options["repeat"]):
+                    started = time.perf_counter()
+                    compressed = encoder.compress(body)
+                    timings.append(time.perf_counter() - started)
+                best = min(timings)
+                self.stdout.write(
+                    f"{name:>10} {level:>5} {len(compressed):>10,} "
+                    f"{1 - len(compressed) / len(body):>7.1%} {best * 1000:>8.3f} "
+                    f"{len(body) / best / 1e6:>8.1f}"
+                )
@@ -0,0 +1,52 @@
+import io
+import timeit
+
+from django.core.management.base import BaseCommand
+from rest_framework.parsers import JSONParser
+from rest_framework.renderers import JSONRenderer
+
+from core.parsers import ORJSONParser
+from core.renderers import ORJSONRenderer
+from core.sample_data import build_sample_page
+
+
+class Command(BaseCommand):
+    help = (
+        "Micro-benchmark the stdlib based DRF JSON renderer/parser against the orjson "
+        "ones on paginated transaction list pages. No database access is needed."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--rows", type=int, default=1000, help="Rows per page (default: 1000)")
+        parser.add_argument("--repeat", type=int, default=20, help="Timed runs per renderer (default: 20)")
+
+    def handle(self, *args, **options):
+        rows, repeat = options["rows"], options["repeat"]
+        page = build_sample_page(rows)
+
+        stdlib_body = JSONRenderer().render(page)
+        orjson_body = ORJSONRenderer().render(page)
+        if stdlib_body != orjson_body:
+            self.stdout.write(self.style.WARNING("Rendered output differs from JSONRenderer"))
+
+        self.stdout.write(f"Page of {rows} rows, {len(stdlib_body):,} bytes, best of {repeat} runs")
+        self._compare(
+            "render",
+            lambda: JSONRenderer().render(page),
+            lambda: ORJSONRenderer().render(page),
+            repeat,
+        )
+        self._compare(
+            "parse",
+            lambda: JSONParser().parse(io.BytesIO(stdlib_body)),
+            lambda: ORJSONParser().parse(io.BytesIO(stdlib_body)),
+            repeat,
+        )
+
+    def _compare(self, label, stdlib_fn, orjson_fn, repeat):
+        stdlib_time = min(timeit.repeat(stdlib_fn, number=1, repeat=repeat))
+        orjson_time = min(timeit.repeat(orjson_fn, number=1, repeat=repeat))
+        self.stdout.write(
+            f"{label:>6}: stdlib {stdlib_time * 1000:.2f} ms, orjson {orjson_time * 1000:.2f} ms "
+            f"({stdlib_time / orjson_time:.1f}x faster)"
+        )
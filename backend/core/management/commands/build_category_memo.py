@@ -0,0 +1,31 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from core.category_memo import build_global_features
+
+
+class Command(BaseCommand):
+    help = (
+        "Rebuild the category index shared by all users from the merchants and words that several "
+        "users file under the same category, e.g. nightly. Workers pick it up within CATEGORY_MEMO['TTL']."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--min-users",
+            type=int,
+            help="Users who must share a feature before it is kept (default: CATEGORY_MEMO['GLOBAL_MIN_USERS'])",
+        )
+        parser.add_argument(
+            "--limit",
+            type=int,
+            help="Features kept, the most widely shared first (default: CATEGORY_MEMO['GLOBAL_LIMIT'])",
+        )
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        users, features = build_global_features(min_users=options["min_users"], limit=options["limit"])
+        self.stdout.write(self.style.SUCCESS(
+            f"Stored {features} shared features from {users} users in {time.perf_counter() - started:.2f}s."
+        ))
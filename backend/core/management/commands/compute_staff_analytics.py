@@ -0,0 +1,46 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from core.models import AnalyticsReport
+from core.staff_analytics import MAX_MONTHS, claimable_reports, run_report
+
+
+class Command(BaseCommand):
+    help = (
+        "Compute the exact staff analytics over every transaction, e.g. nightly for the ops "
+        "dashboard. The report is stored like the ones queued through /api/stats/analytics/exact/."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--months",
+            type=int,
+            default=12,
+            help=f"Months covered, up to and including the current one (1 to {MAX_MONTHS}, default: 12)",
+        )
+        parser.add_argument(
+            "--queued",
+            action="store_true",
+            help="Instead run the reports still queued, and those left running, by a web worker that went away",
+        )
+
+    def handle(self, *args, **options):
+        if options["queued"]:
+            report_ids = list(claimable_reports().order_by("created_at").values_list("id", flat=True))
+        else:
+            if not 1 <= options["months"] <= MAX_MONTHS:
+                raise CommandError(f"--months must be from 1 to {MAX_MONTHS}")
+            report_ids = [AnalyticsReport.objects.create(months=options["months"]).id]
+
+        for report_id in report_ids:
+            report = run_report(report_id)
+            if report is None:
+                # Claimed by another runner in the meantime
+                continue
+            if report.status == "failed":
+                self.stderr.write(f"Report {report.id} failed: {report.error}")
+                continue
+            self.stdout.write(self.style.SUCCESS(
+                f"Report {report.id}: {report.months} months, "
+                f"{report.result['totals']['transactions']['value']:,.0f} transactions "
+                f"in {report.result['duration_ms'] / 1000:.2f}s"
+            ))
@@ -0,0 +1,78 @@
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from functools import partial
+
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from core.anomalies import scan_users, users_to_scan
+
+
+class Command(BaseCommand):
+    help = (
+        "Flag unusual transactions and category spikes of every user as SpendingAnomaly rows. "
+        "Users are split into shards that run on a process pool."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=os.cpu_count() or 1,
+            help="Worker processes, 1 runs in this process (default: CPU count)",
+        )
+        parser.add_argument(
+            "--chunk-size",
+            type=int,
+            default=50,
+            help="Users per shard handed to a worker (default: 50)",
+        )
+        parser.add_argument(
+            "--incremental",
+            action="store_true",
+            help="Only judge transactions added since each user's last scan",
+        )
+        parser.add_argument(
+            "--user",
+            type=int,
+            action="append",
+            help="Only scan this user id (can be repeated)",
+        )
+
+    def handle(self, *args, **options):
+        incremental = options["incremental"]
+        user_ids = users_to_scan(incremental)
+        if options["user"]:
+            user_ids = [user_id for user_id in user_ids if user_id in set(options["user"])]
+        size = max(1, options["chunk_size"])
+        shards = [user_ids[i:i + size] for i in range(0, len(user_ids), size)]
+
+        started = time.perf_counter()
+        scanned = flagged = 0
+        workers = min(options["workers"], len(shards))
+        if workers <= 1:
+            for shard in shards:
+                rows, anomalies = scan_users(shard, incremental)
+                scanned += rows
+                flagged += anomalies
+        else:
+            # Forked children must not inherit the parent's open connections
+            connections.close_all()
+            context = multiprocessing.get_context("fork")
+            with ProcessPoolExecutor(max_workers=workers, mp_context=context) as pool:
+                futures = [pool.submit(partial(scan_users, incremental=incremental), shard) for shard in shards]
+                for future in as_completed(futures):
+                    rows, anomalies = future.result()
+                    scanned += rows
+                    flagged += anomalies
+        elapsed = time.perf_counter() - started
+
+        mode = "incremental" if incremental else "full"
+        users_rate = len(user_ids) / elapsed if elapsed else 0
+        rows_rate = scanned / elapsed if elapsed else 0
+        self.stdout.write(self.style.SUCCESS(
+            f"Flagged {flagged} anomalies in {scanned} transactions of {len(user_ids)} users ({mode}) "
+            f"in {elapsed:.2f}s: {users_rate:,.1f} users/s, {rows_rate:,.0f} rows/s, {max(workers, 1)} workers"
+        ))
@@ -0,0 +1,75 @@
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from core.models import Transaction
+from core.recurring import detect_for_users
+
+
+def _detect_chunk(user_ids):
+    # Runs in a forked worker, which opens its own database connection on first use
+    return detect_for_users(user_ids)
+
+
+class Command(BaseCommand):
+    help = (
+        "Detect weekly, monthly and yearly recurring transactions of every user and store them as "
+        "RecurringSeries. Users are split into chunks that run on a process pool."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=os.cpu_count() or 1,
+            help="Worker processes, 1 runs in this process (default: CPU count)",
+        )
+        parser.add_argument(
+            "--chunk-size",
+            type=int,
+            default=50,
+            help="Users handed to a worker at a time (default: 50)",
+        )
+        parser.add_argument(
+            "--user",
+            type=int,
+            action="append",
+            help="Only detect series of this user id (can be repeated)",
+        )
+
+    def handle(self, *args, **options):
+        users = Transaction.objects.order_by().values_list("user_id", flat=True).distinct()
+        if options["user"]:
+            users = users.filter(user_id__in=options["user"])
+        user_ids = sorted(users)
+        size = max(1, options["chunk_size"])
+        chunks = [user_ids[i:i + size] for i in range(0, len(user_ids), size)]
+
+        started = time.perf_counter()
+        scanned = found = 0
+        workers = min(options["workers"], len(chunks))
+        if workers <= 1:
+            for chunk in chunks:
+                rows, series = detect_for_users(chunk)
+                scanned += rows
+                found += series
+        else:
+            # Forked children must not inherit the parent's open connections
+            connections.close_all()
+            context = multiprocessing.get_context("fork")
+            with ProcessPoolExecutor(max_workers=workers, mp_context=context) as pool:
+                for future in as_completed([pool.submit(_detect_chunk, chunk) for chunk in chunks]):
+                    rows, series = future.result()
+                    scanned += rows
+                    found += series
+        elapsed = time.perf_counter() - started
+
+        rate = scanned / elapsed if elapsed else 0
+        self.stdout.write(self.style.SUCCESS(
+            f"Found {found} recurring series in {scanned} transactions of {len(user_ids)} users "
+            f"in {elapsed:.2f}s ({rate:,.0f} rows/s, {max(workers, 1)} workers)"
+        ))
@@ -5,6 +5,7 @@ from django.conf import settings
 from django.contrib.auth.models import User
 from django.core.management.base import BaseCommand, CommandError
 
+from core.duplicates import MODES as DUPLICATE_MODES, bulk_create_checked
 from core.models import Transaction
 
 DEFAULT_DATA_PATH = settings.BASE_DIR / "data" / "transactions.json"
@@ -36,6 +37,13 @@ class Command(BaseCommand):
             action="store_true",
             help="Clear the user's existing transactions before loading",
         )
+        parser.add_argument(
+            "--duplicates",
+            choices=DUPLICATE_MODES,
+            default=settings.DUPLICATE_TRANSACTION_MODE,
+            help="What to do with transactions the user already has "
+                 f"(default: {settings.DUPLICATE_TRANSACTION_MODE})",
+        )
 
     def handle(self, *args, **options):
         username = options["user"]
@@ -72,7 +80,7 @@ class Command(BaseCommand):
             for record in records
         ]
 
-        Transaction.objects.bulk_create(transactions)
+        _, duplicates = bulk_create_checked(transactions, mode=options["duplicates"])
 
         self.stdout.write(
             self.style.SUCCESS(
@@ -80,6 +88,10 @@ class Command(BaseCommand):
                 f"from {file_path}"
             )
         )
+        if duplicates:
+            self.stdout.write(
+                f"{len(duplicates)} of them were duplicates and were {duplicates[0]['action']}"
+            )
         self.stdout.write(
             f"Total transactions for {username}: "
             f"{Transaction.objects.filter(user=user).count()}"
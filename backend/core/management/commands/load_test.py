@@ -0,0 +1,308 @@
+import asyncio
+import io
+import json
+import os
+import random
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from collections import Counter, defaultdict
+from datetime import datetime, timezone
+from pathlib import Path
+
+import httpx
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from core.fake_gemini import FakeGeminiServer
+
+# Runs in a fresh interpreter against the load test database
+SEED_SCRIPT = """
+import django
+django.setup()
+from django.contrib.auth.models import User
+from core.models import Transaction
+from core.sample_data import build_sample_transactions
+for number in range({users}):
+    user = User.objects.create_user("load-{{}}".format(number), "load-{{}}@example.com", "{password}")
+    rows = build_sample_transactions({rows}, user=user, seed=number)
+    for row in rows:
+        row.id = None
+    Transaction.objects.bulk_create(rows, batch_size=1000)
+"""
+
+SERVERS = {
+    "gunicorn": ["-m", "gunicorn", "autofinance.wsgi", "--bind", "127.0.0.1:{port}", "--workers", "{workers}",
+                 "--threads", "{threads}", "--log-level", "warning"],
+    "uvicorn": ["-m", "uvicorn", "autofinance.asgi:application", "--host", "127.0.0.1", "--port", "{port}",
+                "--workers", "{workers}", "--log-level", "warning", "--no-access-log"],
+}
+
+ENDPOINTS = ("list", "search", "create", "receipt", "analysis", "pdf")
+DEFAULT_MIX = "list=40,search=20,create=15,receipt=5,analysis=10,pdf=10"
+PASSWORD = "load-test-password"
+SEARCH_TERMS = ["grocery", "rent", "ride", "bill", "recharge", "salary", "dinner", "checkup", "shopping"]
+CATEGORIES = ["food", "transport", "utilities", "entertainment", "health", "clothing"]
+# Distinct receipt photos sent by the "receipt" endpoint, repeats are deduplicated per user
+RECEIPT_COUNT = 16
+
+
+def receipt_images(count, size=(900, 1200)):
+    """Real JPEGs of different content, uploads are decoded and checked before Gemini sees them."""
+    # Imported here like in core.receipts, Pillow is not needed by the rest of the command
+    from PIL import Image, ImageDraw
+
+    images = []
+    for number in range(count):
+        image = Image.new("RGB", size, (255, 255 - number * 8, 240))
+        draw = ImageDraw.Draw(image)
+        for line in range(12):
+            draw.text((60, 80 + line * 80), f"Item {number}-{line} ..... {(number + 1) * (line + 3) * 7}.00", fill="black")
+        buffer = io.BytesIO()
+        image.save(buffer, "JPEG", quality=85)
+        images.append(buffer.getvalue())
+    return images
+
+
+def percentile(values, percent):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(percent / 100 * (len(ordered) - 1))))]
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def parse_mix(value):
+    mix = {}
+    for part in value.split(","):
+        name, _, weight = part.partition("=")
+        if name.strip() not in ENDPOINTS or not weight.strip().isdigit():
+            raise CommandError(f"Invalid --mix entry {part!r}, expected e.g. {DEFAULT_MIX}")
+        mix[name.strip()] = int(weight)
+    return mix
+
+
+def summarize(latencies, statuses, elapsed):
+    requests = len(latencies)
+    errors = sum(count for status, count in statuses.items() if status == "exception" or int(status) >= 400)
+    summary = {
+        "requests": requests,
+        "errors": errors,
+        "error_rate": round(errors / requests, 4) if requests else 0,
+        "throughput_rps": round(requests / elapsed, 2) if elapsed else 0,
+        "statuses": dict(sorted(statuses.items())),
+    }
+    if latencies:
+        summary.update({
+            "p50_ms": round(percentile(latencies, 50), 1),
+            "p95_ms": round(percentile(latencies, 95), 1),
+            "p99_ms": round(percentile(latencies, 99), 1),
+            "max_ms": round(max(latencies), 1),
+        })
+    return summary
+
+
+class Command(BaseCommand):
+    help = (
+        "Load test a gunicorn or uvicorn deployment end to end. Seeds a fresh database, starts a "
+        "local fake Gemini HTTP server and the app server, then drives mixed traffic (dashboard "
+        "list, search, create, receipt upload, analysis, PDF) and writes throughput, latency "
+        "percentiles and error rates per endpoint as JSON."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--server", choices=sorted(SERVERS), default="gunicorn", help="App server (default: gunicorn)")
+        parser.add_argument("--workers", type=int, default=2, help="Server worker processes (default: 2)")
+        parser.add_argument("--threads", type=int, default=4, help="Threads per gunicorn worker (default: 4)")
+        parser.add_argument("--concurrency", type=int, default=20, help="Simulated users sending requests (default: 20)")
+        parser.add_argument("--duration", type=float, default=30, help="Seconds of measured traffic (default: 30)")
+        parser.add_argument("--warmup", type=float, default=5, help="Seconds of unmeasured traffic first (default: 5)")
+        parser.add_argument("--users", type=int, default=20, help="Seeded user accounts (default: 20)")
+        parser.add_argument("--rows", type=int, default=2000, help="Seeded transactions per user (default: 2000)")
+        parser.add_argument(
+            "--database-url",
+            help="Empty database to migrate and seed, e.g. a throwaway PostgreSQL database "
+                 "(default: a temporary SQLite file)",
+        )
+        parser.add_argument("--gemini-latency", type=float, default=1.0, help="Seconds per Gemini answer (default: 1.0)")
+        parser.add_argument(
+            "--gemini-error-rate", type=float, default=0.0, help="Share of Gemini calls failing with 503 (default: 0)"
+        )
+        parser.add_argument("--mix", default=DEFAULT_MIX, help=f"Request weights (default: {DEFAULT_MIX})")
+        parser.add_argument("--seed", type=int, default=0, help="Random seed of the traffic (default: 0)")
+        parser.add_argument("--output", help="Write the JSON report to this file instead of stdout")
+
+    def handle(self, *args, **options):
+        mix = parse_mix(options["mix"])
+        workdir = Path(tempfile.mkdtemp(prefix="autofinance-load-"))
+        database_url = options["database_url"] or f"sqlite:///{workdir / 'load.sqlite3'}"
+        gemini = FakeGeminiServer(
+            latency=options["gemini_latency"], error_rate=options["gemini_error_rate"], seed=options["seed"]
+        ).start()
+        port = free_port()
+        env = {
+            **os.environ,
+            "DJANGO_SETTINGS_MODULE": os.environ.get("DJANGO_SETTINGS_MODULE", "autofinance.settings"),
+            "DATABASE_URL": database_url,
+            "DEBUG": "False",
+            "ALLOWED_HOSTS": "127.0.0.1,localhost",
+            "GEMINI_BACKEND": "google",
+            "GEMINI_API_KEY": "load-test",
+            "GEMINI_BASE_URL": gemini.url,
+            "LLM_DAILY_TOKEN_BUDGET": "0",
+            "SINGLE_FLIGHT_LOCK_DIR": str(workdir / "singleflight"),
+            "PROFILING_DIR": str(workdir / "profiles"),
+        }
+
+        self.stderr.write(f"Seeding {options['users']} users x {options['rows']} transactions into {database_url}")
+        self.run_python(["manage.py", "migrate", "--noinput"], env)
+        self.run_python(
+            ["-c", SEED_SCRIPT.format(users=options["users"], rows=options["rows"], password=PASSWORD)], env
+        )
+
+        command = [sys.executable] + [
+            part.format(port=port, workers=options["workers"], threads=options["threads"])
+            for part in SERVERS[options["server"]]
+        ]
+        self.stderr.write(f"Starting {options['server']} with {options['workers']} workers on port {port}")
+        log_path = workdir / "server.log"
+        with log_path.open("w") as log:
+            server = subprocess.Popen(command, cwd=settings.BASE_DIR, env=env, stdout=log, stderr=subprocess.STDOUT)
+        try:
+            base_url = f"http://127.0.0.1:{port}"
+            self.wait_for(server, base_url, log_path)
+            report = asyncio.run(self.drive(base_url, mix, options))
+        finally:
+            server.terminate()
+            try:
+                server.wait(timeout=15)
+            except subprocess.TimeoutExpired:
+                server.kill()
+            gemini.shutdown()
+            shutil.rmtree(workdir, ignore_errors=True)
+
+        report["config"] = {
+            key: options[key] for key in (
+                "server", "workers", "threads", "concurrency", "duration", "warmup", "users", "rows",
+                "gemini_latency", "gemini_error_rate", "seed",
+            )
+        }
+        report["config"]["mix"] = mix
+        report["config"]["database"] = database_url.split(":", 1)[0]
+        report["gemini"] = dict(gemini.stats)
+        report["commit"] = self.commit()
+        report["finished_at"] = datetime.now(timezone.utc).isoformat()
+        output = json.dumps(report, indent=2)
+        if options["output"]:
+            Path(options["output"]).write_text(output + "\n")
+        else:
+            self.stdout.write(output)
+
+        self.stderr.write(f"{'endpoint':<10}{'req/s':>9}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'errors':>8}")
+        for name, row in [*report["endpoints"].items(), ("total", report["total"])]:
+            self.stderr.write(
+                f"{name:<10}{row['throughput_rps']:>9.1f}{row.get('p50_ms', 0):>9.1f}{row.get('p95_ms', 0):>9.1f}"
+                f"{row.get('p99_ms', 0):>9.1f}{row['error_rate']:>8.1%}"
+            )
+        self.stderr.write(self.style.SUCCESS(
+            f"{report['total']['requests']} requests in {options['duration']:.0f}s"
+            + (f", report written to {options['output']}" if options["output"] else "")
+        ))
+
+    def run_python(self, args, env):
+        result = subprocess.run([sys.executable, *args], cwd=settings.BASE_DIR, env=env, capture_output=True, text=True)
+        if result.returncode != 0:
+            raise CommandError(f"{' '.join(args[:2])} failed:\n{result.stderr[-2000:]}")
+
+    def wait_for(self, server, base_url, log_path, timeout=60):
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if server.poll() is not None:
+                raise CommandError(f"The server exited with {server.returncode}:\n{log_path.read_text()[-2000:]}")
+            try:
+                httpx.get(f"{base_url}/api/", timeout=1)
+                return
+            except httpx.TransportError:
+                time.sleep(0.2)
+        raise CommandError(f"The server did not answer within {timeout}s")
+
+    def commit(self):
+        result = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=settings.BASE_DIR, capture_output=True, text=True
+        )
+        return result.stdout.strip() or None
+
+    async def drive(self, base_url, mix, options):
+        limits = httpx.Limits(max_connections=options["concurrency"])
+        async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=120) as client:
+            tokens = []
+            for number in range(options["users"]):
+                response = await client.post(
+                    "/auth/jwt/create/", json={"username": f"load-{number}", "password": PASSWORD}
+                )
+                if response.status_code != 200:
+                    raise CommandError(f"Could not log in as load-{number}: {response.status_code} {response.text[:200]}")
+                tokens.append(response.json()["access"])
+
+            self.receipts = receipt_images(RECEIPT_COUNT) if "receipt" in mix else []
+            names, weights = list(mix), list(mix.values())
+            latencies, statuses = defaultdict(list), defaultdict(Counter)
+            started = time.monotonic()
+            measure_from = started + options["warmup"]
+            stop_at = measure_from + options["duration"]
+
+            async def simulated_user(number):
+                rng = random.Random(options["seed"] * 1000 + number)
+                headers = {"Authorization": f"JWT {tokens[number % len(tokens)]}"}
+                while time.monotonic() < stop_at:
+                    name = rng.choices(names, weights)[0]
+                    sent = time.monotonic()
+                    try:
+                        response = await self.send(client, name, headers, rng)
+                        status = str(response.status_code)
+                    except httpx.HTTPError:
+                        status = "exception"
+                    if sent >= measure_from and time.monotonic() <= stop_at:
+                        latencies[name].append((time.monotonic() - sent) * 1000)
+                        statuses[name][status] += 1
+
+            await asyncio.gather(*(simulated_user(number) for number in range(options["concurrency"])))
+
+        elapsed = options["duration"]
+        endpoints = {name: summarize(latencies[name], statuses[name], elapsed) for name in names if latencies[name]}
+        total = summarize(
+            [latency for name in names for latency in latencies[name]],
+            sum(statuses.values(), Counter()),
+            elapsed,
+        )
+        return {"total": total, "endpoints": endpoints}
+
+    async def send(self, client, name, headers, rng):
+        # Seeded transactions are dated 2025, see core.sample_data
+        month = rng.randint(1, 12)
+        if name == "list":
+            # The dashboard: the first pages with totals
+            return await client.get(f"/api/transactions/?page={rng.randint(1, 3)}", headers=headers)
+        if name == "search":
+            term = rng.choice(SEARCH_TERMS)
+            return await client.get(f"/api/transactions/?search={term}&ordering=-date", headers=headers)
+        if name == "create":
+            return await client.post("/api/transactions/", headers=headers, json={
+                "date": f"2025-{month:02d}-{rng.randint(1, 28):02d}",
+                "description": f"Load test purchase {rng.randint(1, 10 ** 6)}",
+                "amount": f"{rng.randint(100, 500000) / 100:.2f}",
+                "category": rng.choice(CATEGORIES),
+            })
+        if name == "receipt":
+            return await client.post(
+                "/api/image-to-trasaction/", headers=headers, files={"image": ("receipt.jpg", rng.choice(self.receipts), "image/jpeg")}
+            )
+        if name == "analysis":
+            return await client.get(f"/api/analysis/?year=2025&month={month}", headers=headers)
+        return await client.get(f"/api/transactions/pdf/download/?year=2025&month={month}", headers=headers)
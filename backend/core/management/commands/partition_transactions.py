@@ -0,0 +1,67 @@
+from datetime import date
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from core import partitioning
+
+
+class Command(BaseCommand):
+    help = (
+        "Convert core_transaction into a PostgreSQL table partitioned by date, or, once it is "
+        "partitioned, create the partitions for the upcoming periods (run it from cron). "
+        "Other databases keep the single table and the command does nothing."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--interval",
+            choices=partitioning.INTERVALS,
+            default=settings.TRANSACTION_PARTITION_INTERVAL,
+            help=f"One partition per year or month (default: {settings.TRANSACTION_PARTITION_INTERVAL})",
+        )
+        parser.add_argument(
+            "--ahead",
+            type=int,
+            default=2,
+            help="Periods to create after the current one (default: 2)",
+        )
+        parser.add_argument(
+            "--keep-old",
+            action="store_true",
+            help="Keep the original table as core_transaction_unpartitioned after converting",
+        )
+
+    def handle(self, *args, **options):
+        if not partitioning.is_supported(connection):
+            self.stdout.write(self.style.WARNING(
+                f"Partitioning needs PostgreSQL, {connection.vendor} keeps the single core_transaction table"
+            ))
+            return
+
+        interval = options["interval"]
+        if not partitioning.is_partitioned(connection):
+            try:
+                created = partitioning.convert_to_partitioned(
+                    connection, interval, ahead=options["ahead"], keep_old=options["keep_old"]
+                )
+            except partitioning.PartitioningError as e:
+                raise CommandError(str(e))
+            self.stdout.write(self.style.SUCCESS(
+                f"Partitioned core_transaction {interval} into {len(created)} partitions"
+            ))
+            return
+
+        existing_interval = partitioning.current_interval(connection) or interval
+        if existing_interval != interval:
+            self.stdout.write(self.style.WARNING(
+                f"core_transaction is partitioned {existing_interval}, keeping that interval"
+            ))
+        last = date.today()
+        for _ in range(options["ahead"]):
+            last = partitioning.period(last, existing_interval)[2]
+        created = partitioning.ensure_partitions(connection, existing_interval, date.today(), last)
+        self.stdout.write(self.style.SUCCESS(
+            f"Created {len(created)} partitions" + (f": {', '.join(created)}" if created else "")
+        ))
@@ -0,0 +1,77 @@
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connections
+from django.utils import timezone
+
+from core.forecast import months_before, refresh_forecast
+from core.models import Transaction
+
+
+def _refresh_chunk(user_ids, today):
+    for user_id in user_ids:
+        refresh_forecast(user_id, today)
+    return len(user_ids)
+
+
+class Command(BaseCommand):
+    help = (
+        "Precompute every user's end-of-month forecast, meant to run nightly. Users are split "
+        "into chunks that run on a process pool."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=os.cpu_count() or 1,
+            help="Worker processes, 1 runs in this process (default: CPU count)",
+        )
+        parser.add_argument(
+            "--chunk-size",
+            type=int,
+            default=50,
+            help="Users handed to a worker at a time (default: 50)",
+        )
+        parser.add_argument(
+            "--user",
+            type=int,
+            action="append",
+            help="Only precompute this user id (can be repeated)",
+        )
+
+    def handle(self, *args, **options):
+        today = timezone.localdate()
+        # Users without transactions in the learned window get their (empty) forecast on request instead
+        since = months_before(today.replace(day=1), settings.FORECAST_HISTORY_MONTHS)
+        users = Transaction.objects.filter(date__gte=since).order_by().values_list("user_id", flat=True).distinct()
+        if options["user"]:
+            users = users.filter(user_id__in=options["user"])
+        user_ids = sorted(users)
+        size = max(1, options["chunk_size"])
+        chunks = [user_ids[i:i + size] for i in range(0, len(user_ids), size)]
+
+        started = time.perf_counter()
+        done = 0
+        workers = min(options["workers"], len(chunks))
+        if workers <= 1:
+            for chunk in chunks:
+                done += _refresh_chunk(chunk, today)
+        else:
+            # Forked children must not inherit the parent's open connections
+            connections.close_all()
+            context = multiprocessing.get_context("fork")
+            with ProcessPoolExecutor(max_workers=workers, mp_context=context) as pool:
+                for future in as_completed([pool.submit(_refresh_chunk, chunk, today) for chunk in chunks]):
+                    done += future.result()
+        elapsed = time.perf_counter() - started
+
+        rate = done / elapsed if elapsed else 0
+        self.stdout.write(self.style.SUCCESS(
+            f"Precomputed {done} forecasts for {today:%Y-%m} in {elapsed:.2f}s "
+            f"({rate:,.1f} users/s, {max(workers, 1)} workers)"
+        ))
@@ -0,0 +1,18 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from core.profiling import make_token
+
+
+class Command(BaseCommand):
+    help = (
+        "Print a signed X-Profile-Token. Requests sending it together with an X-Profile header "
+        "are profiled whoever makes them, e.g. to capture a slow request in a user's own session."
+    )
+
+    def handle(self, *args, **options):
+        self.stdout.write(make_token())
+        self.stderr.write(self.style.SUCCESS(
+            f"Valid for {settings.PROFILING['TOKEN_MAX_AGE']} seconds, send it as X-Profile-Token "
+            f"with X-Profile: cprofile or X-Profile: sample"
+        ))
@@ -0,0 +1,46 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import transaction as db_transaction
+from django.db.models import Max
+from django.utils import timezone
+
+from core.models import SyncSequence, TransactionTombstone
+
+
+class Command(BaseCommand):
+    help = (
+        "Delete transaction tombstones older than the sync retention window. "
+        "Clients holding an older sync token are asked to do a full resync."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--days",
+            type=int,
+            default=settings.TRANSACTION_TOMBSTONE_RETENTION_DAYS,
+            help="Keep tombstones newer than this many days "
+                 f"(default: {settings.TRANSACTION_TOMBSTONE_RETENTION_DAYS})",
+        )
+
+    def handle(self, *args, **options):
+        cutoff = timezone.now() - timedelta(days=options["days"])
+        old = TransactionTombstone.objects.filter(deleted_at__lt=cutoff)
+        with db_transaction.atomic():
+            # Remembered per user, sync tokens up to the last pruned tombstone are refused
+            pruned = old.order_by().values("user_id").annotate(last=Max("sync_seq"))
+            counters = {counter.user_id: counter for counter in SyncSequence.objects.filter(
+                user_id__in=[row["user_id"] for row in pruned]
+            )}
+            for row in pruned:
+                counter = counters.get(row["user_id"]) or SyncSequence(user_id=row["user_id"])
+                counter.pruned = max(counter.pruned, row["last"])
+                counters[row["user_id"]] = counter
+            SyncSequence.objects.bulk_create(
+                counters.values(), update_conflicts=True, unique_fields=["user"], update_fields=["pruned"]
+            )
+            deleted_count, _ = old.delete()
+        self.stdout.write(
+            self.style.SUCCESS(f"Pruned {deleted_count} tombstones older than {cutoff:%Y-%m-%d}")
+        )
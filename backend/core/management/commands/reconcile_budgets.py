@@ -0,0 +1,33 @@
+from django.core.management.base import BaseCommand
+
+from core.budgets import reconcile
+
+
+class Command(BaseCommand):
+    help = (
+        "Recount every budget's current period from the transactions and repair counters that "
+        "drifted, e.g. after rows were changed with raw SQL."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--user",
+            type=int,
+            action="append",
+            help="Only reconcile budgets of this user id (can be repeated)",
+        )
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            help="Only report drifted counters",
+        )
+
+    def handle(self, *args, **options):
+        checked, drifted = reconcile(users=options["user"], dry_run=options["dry_run"])
+        for budget, counted, actual in drifted:
+            self.stdout.write(
+                f"Budget {budget.pk} ({budget.user_id}, {budget.category}, {budget.period}): "
+                f"counted {counted}, actual {actual}"
+            )
+        verb = "Would repair" if options["dry_run"] else "Repaired"
+        self.stdout.write(self.style.SUCCESS(f"Checked {checked} budgets. {verb} {len(drifted)}."))
@@ -0,0 +1,90 @@
+import json
+import os
+import subprocess
+import sys
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+# Runs in a fresh interpreter, the same work a gunicorn worker does before its first request
+BOOT_SCRIPT = """
+import json, resource, time
+started = time.perf_counter()
+import django
+django.setup()
+import {wsgi}, {urlconf}
+elapsed = time.perf_counter() - started
+print(json.dumps({{"boot_ms": elapsed * 1000, "maxrss_kb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss}}))
+"""
+
+# SDKs that must only be imported by the code paths that use them
+DEFAULT_FORBIDDEN = ["google.genai", "fpdf", "numpy", "PIL"]
+
+
+class Command(BaseCommand):
+    help = (
+        "Profile worker startup (django.setup() plus the WSGI app and URLconf) with "
+        "python -X importtime. Fails if the import time exceeds the budget or if a "
+        "heavy SDK is imported at startup."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--budget-ms",
+            type=float,
+            default=1000,
+            help="Maximum total import time in milliseconds (default: 1000)",
+        )
+        parser.add_argument(
+            "--forbid",
+            nargs="*",
+            default=DEFAULT_FORBIDDEN,
+            help=f"Modules that must not be imported at startup (default: {' '.join(DEFAULT_FORBIDDEN)})",
+        )
+        parser.add_argument("--top", type=int, default=10, help="Number of slowest imports to list (default: 10)")
+
+    def handle(self, *args, **options):
+        script = BOOT_SCRIPT.format(
+            wsgi=settings.WSGI_APPLICATION.rsplit(".", 1)[0],
+            urlconf=settings.ROOT_URLCONF,
+        )
+        env = {**os.environ, "DJANGO_SETTINGS_MODULE": os.environ.get("DJANGO_SETTINGS_MODULE", "autofinance.settings")}
+        result = subprocess.run(
+            [sys.executable, "-X", "importtime", "-c", script],
+            capture_output=True,
+            text=True,
+            env=env,
+            cwd=settings.BASE_DIR,
+        )
+        if result.returncode != 0:
+            raise CommandError(f"Startup failed:\n{result.stderr[-2000:]}")
+
+        imports = []
+        for line in result.stderr.splitlines():
+            if not line.startswith("import time:") or "cumulative" in line:
+                continue
+            # "import time:      self [us] | cumulative | imported package", nesting is shown by indentation
+            self_us, cumulative_us, name = line[len("import time:"):].split("|", 2)
+            depth = (len(name) - len(name.lstrip()) - 1) // 2
+            imports.append((name.strip(), int(self_us), int(cumulative_us), depth))
+
+        total_ms = sum(self_us for _, self_us, _, _ in imports) / 1000
+        stats = json.loads(result.stdout.strip().splitlines()[-1])
+
+        self.stdout.write(f"Boot time: {stats['boot_ms']:.0f} ms, max RSS: {stats['maxrss_kb'] / 1024:.1f} MB")
+        self.stdout.write(f"Import time: {total_ms:.0f} ms across {len(imports)} modules (budget {options['budget_ms']:.0f} ms)")
+        self.stdout.write("Slowest top-level imports (cumulative):")
+        top_level = sorted((entry for entry in imports if entry[3] == 0), key=lambda entry: -entry[2])
+        for name, _, cumulative_us, _ in top_level[:options["top"]]:
+            self.stdout.write(f"  {cumulative_us / 1000:>8.1f} ms  {name}")
+
+        imported = {name for name, _, _, _ in imports}
+        forbidden = sorted(
+            module for module in options["forbid"]
+            if any(name == module or name.startswith(module + ".") for name in imported)
+        )
+        if forbidden:
+            raise CommandError(f"Imported at startup but should load lazily: {', '.join(forbidden)}")
+        if total_ms > options["budget_ms"]:
+            raise CommandError(f"Startup import time {total_ms:.0f} ms exceeds the {options['budget_ms']:.0f} ms budget")
+        self.stdout.write(self.style.SUCCESS("Startup is within budget"))
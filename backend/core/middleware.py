@@ -0,0 +1,325 @@
+import zlib
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import MiddlewareNotUsed
+from django.utils.cache import patch_vary_headers
+from django.utils.deprecation import MiddlewareMixin
+
+from .routers import finish_request, pin_key, replica_aliases, start_request
+
+# brotli and zstandard are optional, gzip is always available
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+
+class GzipEncoder:
+    name = 'gzip'
+
+    def __init__(self, level):
+        self.level = level
+
+    def compress(self, data):
+        return zlib.compress(data, self.level, wbits=31)
+
+    def start(self):
+        # wbits=31 writes a gzip header and trailer
+        compressor = zlib.compressobj(self.level, zlib.DEFLATED, 31)
+        return _StreamCompressor(
+            # Sync flush so every chunk reaches the client as soon as it is produced
+            lambda chunk: compressor.compress(chunk) + compressor.flush(zlib.Z_SYNC_FLUSH),
+            compressor.flush,
+        )
+
+
+class BrotliEncoder:
+    name = 'br'
+
+    def __init__(self, level):
+        self.level = level
+
+    def compress(self, data):
+        return brotli.compress(data, quality=self.level)
+
+    def start(self):
+        compressor = brotli.Compressor(quality=self.level)
+        return _StreamCompressor(
+            lambda chunk: compressor.process(chunk) + compressor.flush(),
+            compressor.finish,
+        )
+
+
+class ZstdEncoder:
+    name = 'zstd'
+
+    def __init__(self, level):
+        self.level = level
+
+    # A ZstdCompressor holds the state of one frame, it is never shared between requests or threads
+    def compress(self, data):
+        return zstandard.ZstdCompressor(level=self.level).compress(data)
+
+    def start(self):
+        compressor = zstandard.ZstdCompressor(level=self.level).compressobj()
+        return _StreamCompressor(
+            lambda chunk: compressor.compress(chunk) + compressor.flush(zstandard.COMPRESSOBJ_FLUSH_BLOCK),
+            compressor.flush,
+        )
+
+
+class _StreamCompressor:
+    def __init__(self, compress_chunk, finish):
+        self.compress_chunk = compress_chunk
+        self.finish = finish
+
+
+def available_encoders(config=None):
+    """
+    Returns the encoders enabled in settings.RESPONSE_COMPRESSION, in order of preference.
+
+    Encodings whose optional library is not installed are left out.
+    """
+    config = config or settings.RESPONSE_COMPRESSION
+    encoders = []
+    for name in config['ENCODINGS']:
+        if name == 'gzip':
+            encoders.append(GzipEncoder(config['GZIP_LEVEL']))
+        elif name == 'br' and brotli is not None:
+            encoders.append(BrotliEncoder(config['BROTLI_QUALITY']))
+        elif name == 'zstd' and zstandard is not None:
+            encoders.append(ZstdEncoder(config['ZSTD_LEVEL']))
+    return encoders
+
+
+def parse_accept_encoding(header):
+    """Returns {coding: q} for an Accept-Encoding header value."""
+    accepted = {}
+    for part in header.split(','):
+        coding, _, params = part.partition(';')
+        coding = coding.strip().lower()
+        if not coding:
+            continue
+        q = 1.0
+        params = params.strip()
+        if params.startswith('q='):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        accepted[coding] = q
+    return accepted
+
+
+def compress_stream(encoder, chunks):
+    compressor = encoder.start()
+    for chunk in chunks:
+        data = compressor.compress_chunk(chunk)
+        if data:
+            yield data
+    yield compressor.finish()
+
+
+async def acompress_stream(encoder, chunks):
+    compressor = encoder.start()
+    async for chunk in chunks:
+        data = compressor.compress_chunk(chunk)
+        if data:
+            yield data
+    yield compressor.finish()
+
+
+class CompressionMiddleware(MiddlewareMixin):
+    """
+    Compresses responses with zstd, brotli or gzip, picking the encoding with the highest
+    Accept-Encoding q-value and falling back to the order of RESPONSE_COMPRESSION['ENCODINGS'].
+
+    Bodies below MIN_SIZE and content types that are already compressed (PDFs, images)
+    are passed through untouched. Streaming responses are compressed chunk by chunk.
+    """
+
+    def __init__(self, get_response):
+        super().__init__(get_response)
+        config = settings.RESPONSE_COMPRESSION
+        self.min_size = config['MIN_SIZE']
+        self.excluded_content_types = tuple(config['EXCLUDED_CONTENT_TYPES'])
+        self.encoders = available_encoders(config)
+
+    def select_encoder(self, request):
+        accepted = parse_accept_encoding(request.META.get('HTTP_ACCEPT_ENCODING', ''))
+        wildcard = accepted.get('*', 0)
+        # Highest q-value wins, ties go to the server's order of preference
+        best, best_q = None, 0
+        for encoder in self.encoders:
+            q = accepted.get(encoder.name, wildcard)
+            if q > best_q:
+                best, best_q = encoder, q
+        return best
+
+    def process_response(self, request, response):
+        if response.has_header('Content-Encoding'):
+            return response
+        if response.get('Content-Type', '').startswith(self.excluded_content_types):
+            return response
+
+        if response.streaming:
+            content_length = response.get('Content-Length', '')
+            if content_length.isdigit() and int(content_length) < self.min_size:
+                return response
+        elif len(response.content) < self.min_size:
+            return response
+
+        patch_vary_headers(response, ('Accept-Encoding',))
+        encoder = self.select_encoder(request)
+        if encoder is None:
+            return response
+
+        if response.streaming:
+            if response.is_async:
+                response.streaming_content = acompress_stream(encoder, response.streaming_content)
+            else:
+                response.streaming_content = compress_stream(encoder, response.streaming_content)
+            # The compressed size is not known until the stream is consumed
+            del response.headers['Content-Length']
+        else:
+            compressed = encoder.compress(response.content)
+            if len(compressed) >= len(response.content):
+                return response
+            response.content = compressed
+            response.headers['Content-Length'] = str(len(compressed))
+
+        # A strong ETag no longer matches the encoded bytes
+        etag = response.get('ETag')
+        if etag and etag.startswith('"'):
+            response.headers['ETag'] = 'W/' + etag
+        response.headers['Content-Encoding'] = encoder.name
+        return response
+
+
+class ReplicaPinningMiddleware:
+    """
+    Tells core.routers.ReplicaRouter which requests have to read from the primary database.
+
+    Writing requests are pinned to the primary, and a user who wrote something stays pinned
+    for DATABASE_REPLICA_STICKY_SECONDS through a cache entry. Configure a shared cache
+    (CACHE_URL) when running several workers. Without replicas the middleware is skipped.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not replica_aliases():
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        key = pin_key(request)
+        start_request(key, request.method, key is not None and bool(cache.get(key)))
+        try:
+            return self.get_response(request)
+        finally:
+            key = finish_request()
+            if key is not None:
+                cache.set(key, True, settings.DATABASE_REPLICA_STICKY_SECONDS)
+
+    async def __acall__(self, request):
+        # Reading a session hits the database
+        key = await sync_to_async(pin_key)(request)
+        start_request(key, request.method, key is not None and bool(await cache.aget(key)))
+        try:
+            return await self.get_response(request)
+        finally:
+            key = finish_request()
+            if key is not None:
+                await cache.aset(key, True, settings.DATABASE_REPLICA_STICKY_SECONDS)
+
+
+class ProfilingMiddleware:
+    """
+    Profiles single requests that ask for it with an X-Profile header ("cprofile" or
+    "sample"), see core.profiling.
+
+    Only staff users and requests with a valid X-Profile-Token are profiled, others are
+    served as if the header was not there. The profile and the request's SQL queries are
+    stored as a zip in the PROFILING['DIR'] ring and named in the X-Profile-Id response
+    header. Requests without the header only pay for one header lookup, and with
+    PROFILING['ENABLED'] off the middleware is skipped.
+
+    Under ASGI the profile covers the request's sync work (ORM calls, sync views and
+    serializers), which Django runs on one thread per request.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not settings.PROFILING['ENABLED']:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        mode = request.META.get('HTTP_X_PROFILE')
+        if mode is None:
+            return self.get_response(request)
+
+        # Imported when a request asks to be profiled
+        from .profiling import Capture, allowed
+        if not allowed(request):
+            return self.get_response(request)
+        capture = Capture(mode, request)
+        capture.start()
+        try:
+            response = self.get_response(request)
+        except BaseException:
+            capture.stop()
+            raise
+        response.headers['X-Profile-Id'] = capture.name
+        if response.streaming and not response.is_async:
+            # Analysis streams and file downloads do their work while they are sent
+            response.streaming_content = self.profile_stream(capture, request, response)
+        else:
+            capture.stop()
+            capture.save(response.status_code, request.user)
+        return response
+
+    def profile_stream(self, capture, request, response):
+        try:
+            yield from response.streaming_content
+        finally:
+            capture.stop()
+            capture.save(response.status_code, request.user)
+
+    async def __acall__(self, request):
+        mode = request.META.get('HTTP_X_PROFILE')
+        if mode is None:
+            return await self.get_response(request)
+
+        from .profiling import Capture, allowed
+        if not await sync_to_async(allowed)(request):
+            return await self.get_response(request)
+        capture = Capture(mode, request)
+        # Started and stopped on the thread the request's sync work runs on
+        await sync_to_async(capture.start)()
+        try:
+            response = await self.get_response(request)
+        finally:
+            await sync_to_async(capture.stop)()
+        await sync_to_async(capture.save)(response.status_code, request.user)
+        response.headers['X-Profile-Id'] = capture.name
+        return response
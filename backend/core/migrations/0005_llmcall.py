@@ -0,0 +1,38 @@
+# Generated by Django 5.2.18 on 2026-10-19 02:22
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0004_transaction_change_tracking'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LLMCall',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('endpoint', models.CharField(max_length=50)),
+                ('model', models.CharField(max_length=50)),
+                ('started_at', models.DateTimeField(db_index=True, default=django.utils.timezone.now)),
+                ('latency_ms', models.PositiveIntegerField()),
+                ('prompt_size', models.PositiveIntegerField(help_text='Characters of text plus bytes of images sent')),
+                ('prompt_tokens', models.PositiveIntegerField(blank=True, null=True)),
+                ('response_tokens', models.PositiveIntegerField(blank=True, null=True)),
+                ('total_tokens', models.PositiveIntegerField(blank=True, null=True)),
+                ('outcome', models.CharField(choices=[('ok', 'OK'), ('parse_error', 'Parse error'), ('error', 'Error'), ('cancelled', 'Cancelled')], max_length=20)),
+                ('error', models.CharField(blank=True, max_length=255)),
+                ('user', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='llm_calls', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['-started_at'],
+                'indexes': [models.Index(fields=['user', 'started_at'], name='core_llm_user_started_idx'), models.Index(fields=['endpoint', 'started_at'], name='core_llm_endpoint_started_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,48 @@
+# Generated by Django 5.2.18 on 2026-10-19 02:31
+
+from django.conf import settings
+from django.db import migrations, models
+
+from core.fingerprints import transaction_fingerprint
+
+
+def fill_fingerprints(apps, schema_editor):
+    Transaction = apps.get_model('core', 'Transaction')
+    batch = []
+    for row in Transaction.objects.only('id', 'description', 'date', 'amount', 'category').iterator(chunk_size=2000):
+        row.fingerprint = transaction_fingerprint(row.description, row.date, row.amount, row.category)
+        batch.append(row)
+        if len(batch) == 2000:
+            Transaction.objects.bulk_update(batch, ['fingerprint'])
+            batch = []
+    Transaction.objects.bulk_update(batch, ['fingerprint'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0006_transaction_archive'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='transaction',
+            name='duplicate_of',
+            field=models.BigIntegerField(blank=True, help_text='Existing transaction this one probably duplicates', null=True),
+        ),
+        migrations.AddField(
+            model_name='transaction',
+            name='fingerprint',
+            field=models.CharField(blank=True, editable=False, max_length=40),
+        ),
+        migrations.AddIndex(
+            model_name='transaction',
+            index=models.Index(fields=['user', 'fingerprint'], name='core_txn_user_fprint_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='transaction',
+            index=models.Index(fields=['user', 'amount', 'date'], name='core_txn_user_amount_date_idx'),
+        ),
+        migrations.RunPython(fill_fingerprints, migrations.RunPython.noop),
+    ]
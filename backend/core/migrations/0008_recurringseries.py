@@ -0,0 +1,41 @@
+# Generated by Django 5.2.18 on 2026-10-19 02:37
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0007_transaction_fingerprint'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RecurringSeries',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.CharField(max_length=255)),
+                ('description', models.CharField(max_length=255)),
+                ('category', models.CharField(choices=[('income', 'Income'), ('food', 'Food'), ('transport', 'Transport'), ('utilities', 'Utilities'), ('entertainment', 'Entertainment'), ('health', 'Health'), ('education', 'Education'), ('clothing', 'Clothing'), ('housing', 'Housing'), ('savings', 'Savings'), ('investment', 'Investment'), ('miscellaneous', 'Miscellaneous'), ('tax', 'Tax')], max_length=50)),
+                ('period', models.CharField(choices=[('weekly', 'Weekly'), ('monthly', 'Monthly'), ('yearly', 'Yearly')], max_length=10)),
+                ('interval_days', models.FloatField(help_text='Median days between occurrences')),
+                ('amount', models.DecimalField(decimal_places=2, help_text='Median amount', max_digits=10)),
+                ('amount_variation', models.FloatField(help_text='Coefficient of variation of the amounts')),
+                ('occurrences', models.PositiveIntegerField()),
+                ('first_date', models.DateField()),
+                ('last_date', models.DateField()),
+                ('next_date', models.DateField(help_text='When the next occurrence is expected')),
+                ('confidence', models.FloatField()),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='recurring_series', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['next_date'],
+                'indexes': [models.Index(fields=['user', 'next_date'], name='core_series_user_next_idx')],
+                'constraints': [models.UniqueConstraint(fields=('user', 'key'), name='core_series_user_key_uniq')],
+            },
+        ),
+    ]
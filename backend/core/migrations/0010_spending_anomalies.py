@@ -0,0 +1,46 @@
+# Generated by Django 5.2.18 on 2026-10-19 02:42
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auth', '0012_alter_user_first_name_max_length'),
+        ('core', '0009_budget'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AnomalyScan',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='anomaly_scan', serialize=False, to=settings.AUTH_USER_MODEL)),
+                ('last_transaction_id', models.BigIntegerField(default=0)),
+                ('scanned_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='SpendingAnomaly',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('transaction', 'Unusual transaction'), ('category_spike', 'Category spike')], max_length=20)),
+                ('transaction_id', models.BigIntegerField(blank=True, null=True)),
+                ('category', models.CharField(choices=[('income', 'Income'), ('food', 'Food'), ('transport', 'Transport'), ('utilities', 'Utilities'), ('entertainment', 'Entertainment'), ('health', 'Health'), ('education', 'Education'), ('clothing', 'Clothing'), ('housing', 'Housing'), ('savings', 'Savings'), ('investment', 'Investment'), ('miscellaneous', 'Miscellaneous'), ('tax', 'Tax')], max_length=50)),
+                ('date', models.DateField(help_text='Transaction date, or the first day of the spiking month')),
+                ('description', models.CharField(blank=True, max_length=255)),
+                ('amount', models.DecimalField(decimal_places=2, max_digits=14)),
+                ('baseline', models.DecimalField(decimal_places=2, max_digits=14)),
+                ('score', models.FloatField()),
+                ('detected_at', models.DateTimeField(auto_now_add=True)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='spending_anomalies', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['-date', '-score'],
+                'indexes': [models.Index(fields=['user', 'date'], name='core_anomaly_user_date_idx')],
+                'constraints': [models.UniqueConstraint(condition=models.Q(('kind', 'transaction')), fields=('user', 'transaction_id'), name='core_anomaly_user_txn_uniq'), models.UniqueConstraint(condition=models.Q(('kind', 'category_spike')), fields=('user', 'category', 'date'), name='core_anomaly_user_spike_uniq')],
+            },
+        ),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 5.2.18 on 2026-10-19 02:44
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0010_spending_anomalies'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SpendingForecast',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('month', models.DateField(help_text='First day of the forecast month')),
+                ('as_of', models.DateField(help_text='Day whose month-to-date totals the forecast starts from')),
+                ('categories', models.JSONField(default=dict)),
+                ('income_to_date', models.DecimalField(decimal_places=2, max_digits=14)),
+                ('expenses_to_date', models.DecimalField(decimal_places=2, max_digits=14)),
+                ('projected_income', models.DecimalField(decimal_places=2, max_digits=14)),
+                ('projected_expenses', models.DecimalField(decimal_places=2, max_digits=14)),
+                ('history_months', models.PositiveSmallIntegerField(help_text='Past months the spending curves were learned from')),
+                ('computed_at', models.DateTimeField(auto_now=True)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='spending_forecasts', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('user', 'month'), name='core_forecast_user_month_uniq')],
+            },
+        ),
+    ]
@@ -0,0 +1,71 @@
+# Generated by Django 5.2.18 on 2026-10-19 03:13
+
+import core.storage
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0012_analyticsreport'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name='transactionimage',
+            options={'ordering': ['-created_at']},
+        ),
+        migrations.AddField(
+            model_name='transactionimage',
+            name='content_type',
+            field=models.CharField(blank=True, max_length=50),
+        ),
+        migrations.AddField(
+            model_name='transactionimage',
+            name='created_at',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+        migrations.AddField(
+            model_name='transactionimage',
+            name='height',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='transactionimage',
+            name='sha256',
+            field=models.CharField(blank=True, max_length=64),
+        ),
+        migrations.AddField(
+            model_name='transactionimage',
+            name='size',
+            field=models.PositiveIntegerField(default=0, help_text='Bytes of the original image'),
+        ),
+        migrations.AddField(
+            model_name='transactionimage',
+            name='thumbnails',
+            field=models.JSONField(blank=True, default=dict),
+        ),
+        migrations.AddField(
+            model_name='transactionimage',
+            name='user',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='receipt_images', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddField(
+            model_name='transactionimage',
+            name='width',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+        migrations.AlterField(
+            model_name='transactionimage',
+            name='image',
+            field=models.ImageField(max_length=255, storage=core.storage.receipt_storage, upload_to=core.storage.receipt_path),
+        ),
+        migrations.AddConstraint(
+            model_name='transactionimage',
+            constraint=models.UniqueConstraint(fields=('user', 'sha256'), name='core_receipt_user_sha256_uniq'),
+        ),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 5.2.18 on 2026-10-19 03:28
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+def clear_stale_duplicates(apps, schema_editor):
+    # Rows deleted or archived before their duplicates were repointed on removal
+    Transaction = apps.get_model('core', 'Transaction')
+    Transaction.objects.filter(duplicate_of__isnull=False).exclude(
+        duplicate_of__in=Transaction.objects.values('id')
+    ).update(duplicate_of=None)
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0013_receipt_storage'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='transaction',
+            index=models.Index(condition=models.Q(('duplicate_of__isnull', False)), fields=['user', 'duplicate_of'], name='core_txn_user_duplicate_idx'),
+        ),
+        migrations.RunPython(clear_stale_duplicates, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,39 @@
+# Generated by Django 5.2.18 on 2026-10-19 03:41
+
+from django.conf import settings
+from django.db import migrations, models
+
+from core.fingerprints import series_key
+
+
+def fill_series_keys(apps, schema_editor):
+    Transaction = apps.get_model('core', 'Transaction')
+    batch = []
+    for row in Transaction.objects.only('id', 'description').iterator(chunk_size=2000):
+        row.series_key = series_key(row.description)
+        batch.append(row)
+        if len(batch) == 2000:
+            Transaction.objects.bulk_update(batch, ['series_key'])
+            batch = []
+    Transaction.objects.bulk_update(batch, ['series_key'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0015_category_feature'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='transaction',
+            name='series_key',
+            field=models.CharField(blank=True, editable=False, max_length=255),
+        ),
+        migrations.RunPython(fill_series_keys, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='transaction',
+            index=models.Index(fields=['user', 'series_key'], name='core_txn_user_series_idx'),
+        ),
+    ]
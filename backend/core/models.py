@@ -1,11 +1,130 @@
-from django.db import models
+from collections import defaultdict
+
+from django.db import models, transaction as db_transaction
 from django.contrib.auth.models import User
+from django.utils import timezone
 
 from .constants import catagory_choices
+from .fingerprints import FINGERPRINT_FIELDS, series_key, transaction_fingerprint
+from .signals import TRACKED_FIELDS, TransactionChange, transactions_changed
+from .storage import receipt_path, receipt_storage
 
 # Create your models here.
 
 
+def _tracked_values(obj):
+    return {field: getattr(obj, field) for field in TRACKED_FIELDS}
+
+
+def _send_changes(changes):
+    if changes:
+        transactions_changed.send(sender=Transaction, changes=changes)
+
+
+# Columns computed in Python from FINGERPRINT_FIELDS, see Transaction.refresh_fingerprint
+DERIVED_FIELDS = ('fingerprint', 'series_key')
+
+
+class TransactionQuerySet(models.QuerySet):
+    # Bulk paths skip save(), so change tracking is kept up to date here as well
+
+    def update(self, **kwargs):
+        kwargs.setdefault('updated_at', timezone.now())
+        with db_transaction.atomic():
+            old_rows = {row['id']: row for row in self.select_for_update().values('id', 'user_id', *TRACKED_FIELDS)}
+            sequences = SyncSequence.next_values(row['user_id'] for row in old_rows.values())
+            kwargs['sync_seq'] = models.Case(
+                *[models.When(user_id=user_id, then=models.Value(seq)) for user_id, seq in sequences.items()],
+                default=models.F('sync_seq'), output_field=models.BigIntegerField(),
+            )
+            result = super().update(**kwargs)
+            rows = list(self.model.objects.filter(id__in=old_rows).only('id', 'user_id', *TRACKED_FIELDS))
+            if set(kwargs) & set(FINGERPRINT_FIELDS):
+                # Fingerprints are computed in Python, rebuild them for the updated rows
+                for row in rows:
+                    row.refresh_fingerprint()
+                super(TransactionQuerySet, self.model.objects.all()).bulk_update(rows, list(DERIVED_FIELDS))
+            _send_changes([
+                TransactionChange(row.id, row.user_id, _tracked_values_of(old_rows[row.id]), _tracked_values(row))
+                for row in rows
+            ])
+        return result
+
+    def bulk_create(self, objs, *args, **kwargs):
+        objs = list(objs)
+        for obj in objs:
+            obj.refresh_fingerprint()
+        with db_transaction.atomic():
+            sequences = SyncSequence.next_values(obj.user_id for obj in objs)
+            for obj in objs:
+                obj.sync_seq = sequences[obj.user_id]
+            created = super().bulk_create(objs, *args, **kwargs)
+            changes = []
+            for obj in created:
+                obj._loaded_values = _tracked_values(obj)
+                changes.append(TransactionChange(obj.pk, obj.user_id, None, obj._loaded_values))
+            _send_changes(changes)
+        return created
+
+    def bulk_update(self, objs, fields, batch_size=None):
+        # auto_now is not applied by bulk_update, stamp the change time explicitly
+        objs = list(objs)
+        now = timezone.now()
+        refresh = bool(set(fields) & set(FINGERPRINT_FIELDS))
+        for obj in objs:
+            obj.updated_at = now
+            if refresh:
+                obj.refresh_fingerprint()
+        fields = [*fields, 'updated_at'] if 'updated_at' not in fields else list(fields)
+        if refresh:
+            fields += [field for field in DERIVED_FIELDS if field not in fields]
+        if 'sync_seq' not in fields:
+            fields.append('sync_seq')
+        with db_transaction.atomic():
+            old_values = Transaction.old_values(objs)
+            sequences = SyncSequence.next_values(obj.user_id for obj in objs if obj.pk in old_values)
+            for obj in objs:
+                if obj.pk in old_values:
+                    obj.sync_seq = sequences[obj.user_id]
+            result = super().bulk_update(objs, fields, batch_size=batch_size)
+            changes = []
+            for obj in objs:
+                old = old_values.get(obj.pk)
+                if old is None:
+                    # Deleted in the meantime, nothing was written
+                    continue
+                obj._loaded_values = _written_values(obj, old, fields)
+                changes.append(TransactionChange(obj.pk, obj.user_id, old, obj._loaded_values))
+            _send_changes(changes)
+        return result
+
+    def delete(self):
+        # Leave a tombstone behind for every deleted row so sync clients can drop it.
+        # The rows are locked first, a concurrent delete of the same rows reports none of them
+        with db_transaction.atomic():
+            deleted_rows = list(self.select_for_update().values('id', 'user_id', *TRACKED_FIELDS))
+            result = super().delete()
+            removed = {row['id']: row['user_id'] for row in deleted_rows}
+            Transaction.release_duplicates(removed)
+            TransactionTombstone.bury(removed)
+            _send_changes([
+                TransactionChange(row['id'], row['user_id'], _tracked_values_of(row), None)
+                for row in deleted_rows
+            ])
+        return result
+
+
+def _tracked_values_of(row):
+    return {field: row[field] for field in TRACKED_FIELDS}
+
+
+def _written_values(obj, old, fields=None):
+    # Only the written fields changed, the others keep the values just read from the row
+    if fields is None:
+        return _tracked_values(obj)
+    return {field: getattr(obj, field) if field in fields else old[field] for field in TRACKED_FIELDS}
+
+
 class Transaction(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='transactions')
     category = models.CharField(max_length=50, choices=catagory_choices)
@@ -13,13 +132,487 @@ class Transaction(models.Model):
     description = models.CharField(max_length=255)
     amount = models.DecimalField(max_digits=10, decimal_places=2)
     is_recurring = models.BooleanField(default=False)
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
+    # Position in the user's change stream, the delta sync cursor (core.sync)
+    sync_seq = models.BigIntegerField(default=0, editable=False)
+    # Normalized description, date, amount and category, see core.fingerprints
+    fingerprint = models.CharField(max_length=40, blank=True, editable=False)
+    # Normalized description without numbers, the recurring series the row belongs to (core.recurring)
+    series_key = models.CharField(max_length=255, blank=True, editable=False)
+    # A plain id rather than a foreign key, core_transaction may be partitioned (core.partitioning)
+    duplicate_of = models.BigIntegerField(
+        null=True, blank=True, help_text="Existing transaction this one probably duplicates"
+    )
+
+    objects = TransactionQuerySet.as_manager()
     
     class Meta:
         ordering = ['-date']
+        indexes = [
+            models.Index(fields=['user', 'updated_at'], name='core_txn_user_updated_idx'),
+            models.Index(fields=['user', 'sync_seq', 'id'], name='core_txn_user_sync_idx'),
+            # Exact and near duplicate lookups (core.duplicates)
+            models.Index(fields=['user', 'fingerprint'], name='core_txn_user_fprint_idx'),
+            models.Index(fields=['user', 'amount', 'date'], name='core_txn_user_amount_date_idx'),
+            # Rows of the series a write touched (core.recurring.refresh_series)
+            models.Index(fields=['user', 'series_key'], name='core_txn_user_series_idx'),
+            # Flagged duplicates of deleted rows (Transaction.release_duplicates)
+            models.Index(
+                fields=['user', 'duplicate_of'], name='core_txn_user_duplicate_idx',
+                condition=models.Q(duplicate_of__isnull=False),
+            ),
+        ]
 
     def __str__(self):
         return f"{self.description} - {self.amount} BDT"
+
+    def refresh_fingerprint(self):
+        # Along with the series key, both are derived from FINGERPRINT_FIELDS
+        self.fingerprint = transaction_fingerprint(self.description, self.date, self.amount, self.category)
+        self.series_key = series_key(self.description)
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remembered so writes can report what changed (core.signals)
+        instance._loaded_values = {
+            name: value for name, value in zip(field_names, values) if name in TRACKED_FIELDS
+        }
+        return instance
+
+    @classmethod
+    def old_values(cls, objs):
+        """
+        Returns {pk: tracked values} of the rows of instances about to be written, read in one query.
+
+        The rows are locked (call it inside the writing transaction) and read rather than
+        taken from what the instances loaded, which may be stale: concurrent writers of a row
+        wait for each other and each reports its change from what the other committed.
+        Rows that no longer exist are left out.
+        """
+        pks = [obj.pk for obj in objs if obj.pk is not None]
+        if not pks:
+            return {}
+        return {
+            row['id']: _tracked_values_of(row)
+            for row in cls.objects.select_for_update().filter(pk__in=pks).values('id', *TRACKED_FIELDS)
+        }
+
+    @classmethod
+    def release_duplicates(cls, removed):
+        """
+        Repoints the flagged duplicates of rows leaving core_transaction (deleted or archived).
+
+        The oldest remaining duplicate of a removed row takes its place, it is no longer
+        flagged and the others are flagged as duplicates of it.
+
+        Args:
+            removed (dict): {id: user_id} of the removed rows
+        """
+        if not removed:
+            return
+        orphans = defaultdict(list)
+        for row in cls.objects.filter(
+            user_id__in=set(removed.values()), duplicate_of__in=list(removed)
+        ).exclude(id__in=list(removed)).only('id', 'user_id', 'duplicate_of').order_by('id'):
+            orphans[row.duplicate_of].append(row)
+        rows = []
+        for first, *rest in orphans.values():
+            first.duplicate_of = None
+            for row in rest:
+                row.duplicate_of = first.id
+            rows += [first, *rest]
+        if rows:
+            cls.objects.bulk_update(rows, ['duplicate_of'])
+
+    def save(self, *args, **kwargs):
+        self.refresh_fingerprint()
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and set(update_fields) & set(FINGERPRINT_FIELDS):
+            update_fields = {*update_fields, *DERIVED_FIELDS}
+        if update_fields is not None:
+            kwargs['update_fields'] = {*update_fields, 'sync_seq'}
+        with db_transaction.atomic():
+            old = None if self._state.adding else Transaction.old_values([self]).get(self.pk)
+            self.sync_seq = SyncSequence.next_values([self.user_id])[self.user_id]
+            result = super().save(*args, **kwargs)
+            self._loaded_values = _written_values(self, old, kwargs.get('update_fields')) if old else _tracked_values(self)
+            _send_changes([TransactionChange(self.pk, self.user_id, old, self._loaded_values)])
+        return result
+
+    def delete(self, *args, **kwargs):
+        with db_transaction.atomic():
+            old = Transaction.old_values([self]).get(self.pk)
+            if old is None:
+                # Already deleted by another request, which left the tombstone and reported it
+                return 0, {}
+            pk, user_id = self.pk, self.user_id
+            result = super().delete(*args, **kwargs)
+            # Repointed duplicates lock their rows before the sync sequence, like every other write
+            Transaction.release_duplicates({pk: user_id})
+            TransactionTombstone.bury({pk: user_id})
+            _send_changes([TransactionChange(pk, user_id, old, None)])
+            return result
+
+
+class TransactionTombstone(models.Model):
+    """Marks a deleted (or archived) Transaction so that delta sync clients can remove it locally."""
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='transaction_tombstones')
+    transaction_id = models.BigIntegerField()
+    deleted_at = models.DateTimeField(default=timezone.now, db_index=True)
+    # Position in the user's change stream, see Transaction.sync_seq
+    sync_seq = models.BigIntegerField(default=0)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', 'deleted_at'], name='core_tomb_user_deleted_idx'),
+            models.Index(fields=['user', 'sync_seq', 'id'], name='core_tomb_user_sync_idx'),
+        ]
+
+    def __str__(self):
+        return f"Deleted transaction {self.transaction_id}"
+
+    @classmethod
+    def bury(cls, removed):
+        """
+        Leaves a tombstone for every row that left core_transaction, in one insert.
+
+        Args:
+            removed (dict): {id: user_id} of the removed rows
+        """
+        if not removed:
+            return
+        sequences = SyncSequence.next_values(removed.values())
+        cls.objects.bulk_create([
+            cls(transaction_id=pk, user_id=user_id, sync_seq=sequences[user_id])
+            for pk, user_id in removed.items()
+        ])
+
+
+class SyncSequence(models.Model):
+    """
+    A user's delta sync counter (core.sync), the source of Transaction.sync_seq.
+
+    Every write of the user's transactions takes the next value and keeps this row locked
+    until it commits, so the user's writes become visible in the order of their numbers and
+    a sync cursor never passes a change that is still to commit.
+    """
+    user = models.OneToOneField(User, on_delete=models.CASCADE, primary_key=True, related_name='sync_sequence')
+    value = models.BigIntegerField(default=0)
+    # The highest number of a pruned tombstone, tokens before it have to do a full resync
+    pruned = models.BigIntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.user} at {self.value}"
+
+    @classmethod
+    def next_values(cls, user_ids):
+        """
+        Takes the next sequence number of each user, call it inside the writing transaction.
+
+        Users are locked in id order, so writes spanning several users can not deadlock.
+
+        Returns:
+            dict: {user_id: number}
+        """
+        values = {}
+        for user_id in sorted(set(user_ids)):
+            counter = cls.objects.filter(user_id=user_id)
+            if not counter.update(value=models.F('value') + 1):
+                # The user's first write, a concurrent one may create the row as well
+                cls.objects.bulk_create([cls(user_id=user_id)], ignore_conflicts=True)
+                counter.update(value=models.F('value') + 1)
+            values[user_id] = counter.values_list('value', flat=True).get()
+        return values
     
 
+class TransactionArchive(models.Model):
+    """
+    One user's transactions of one month, moved out of core_transaction by archive_transactions.
+
+    The rows are kept as zlib compressed JSON (see core.archive), next to the totals that
+    unfiltered and category filtered reads need, so those never have to decompress them.
+    """
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='transaction_archives')
+    month = models.DateField(help_text="First day of the archived month")
+    row_count = models.PositiveIntegerField()
+    total_income = models.DecimalField(max_digits=14, decimal_places=2)
+    total_expenses = models.DecimalField(max_digits=14, decimal_places=2)
+    # {category: {"amount": "12.50", "count": 3}}
+    category_totals = models.JSONField(default=dict)
+    payload = models.BinaryField()
+    archived_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ['-month']
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'month'], name='core_archive_user_month_uniq'),
+        ]
+
+    def __str__(self):
+        return f"{self.user} {self.month:%Y-%m} ({self.row_count} transactions)"
+
+
+class RecurringSeries(models.Model):
+    """A recurring payment or income detected in a user's history by core.recurring."""
+    PERIOD_CHOICES = [
+        ('weekly', 'Weekly'),
+        ('monthly', 'Monthly'),
+        ('yearly', 'Yearly'),
+    ]
+
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='recurring_series')
+    # Normalized description the transactions of the series share
+    key = models.CharField(max_length=255)
+    description = models.CharField(max_length=255)
+    category = models.CharField(max_length=50, choices=catagory_choices)
+    period = models.CharField(max_length=10, choices=PERIOD_CHOICES)
+    interval_days = models.FloatField(help_text="Median days between occurrences")
+    amount = models.DecimalField(max_digits=10, decimal_places=2, help_text="Median amount")
+    amount_variation = models.FloatField(help_text="Coefficient of variation of the amounts")
+    occurrences = models.PositiveIntegerField()
+    first_date = models.DateField()
+    last_date = models.DateField()
+    next_date = models.DateField(help_text="When the next occurrence is expected")
+    confidence = models.FloatField()
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ['next_date']
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'key'], name='core_series_user_key_uniq'),
+        ]
+        indexes = [
+            models.Index(fields=['user', 'next_date'], name='core_series_user_next_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.description} ({self.period}, next {self.next_date})"
+
+
+class Budget(models.Model):
+    """
+    A spending limit of one user for one category per week, month or year.
+
+    spent is a running total of the period starting at period_start, moved by F()
+    expressions whenever transactions are written (core.budgets), so reading it never
+    aggregates transactions.
+    """
+    PERIOD_CHOICES = RecurringSeries.PERIOD_CHOICES
+    STATE_CHOICES = [
+        ('ok', 'OK'),
+        ('warning', 'Warning'),
+        ('exceeded', 'Exceeded'),
+    ]
+
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='budgets')
+    category = models.CharField(max_length=50, choices=catagory_choices)
+    period = models.CharField(max_length=10, choices=PERIOD_CHOICES, default='monthly')
+    limit = models.DecimalField(max_digits=12, decimal_places=2)
+    warning_percent = models.PositiveSmallIntegerField(default=80, help_text="Share of the limit that raises a warning")
+    period_start = models.DateField()
+    spent = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    state = models.CharField(max_length=10, choices=STATE_CHOICES, default='ok')
+    state_changed_at = models.DateTimeField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['category', 'period']
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'category', 'period'], name='core_budget_user_cat_period_uniq'),
+        ]
+
+    def __str__(self):
+        return f"{self.user} {self.category} {self.period} {self.spent}/{self.limit}"
+
+
+class SpendingAnomaly(models.Model):
+    """
+    An unusual charge or monthly category total, flagged by detect_anomalies (core.anomalies).
+
+    score is a robust z-score: how many scaled median absolute deviations the amount lies
+    above the baseline (the category's median charge, or its seasonal monthly median).
+    """
+    KIND_CHOICES = [
+        ('transaction', 'Unusual transaction'),
+        ('category_spike', 'Category spike'),
+    ]
+
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='spending_anomalies')
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES)
+    # A plain id rather than a foreign key, core_transaction may be partitioned (core.partitioning)
+    transaction_id = models.BigIntegerField(null=True, blank=True)
+    category = models.CharField(max_length=50, choices=catagory_choices)
+    date = models.DateField(help_text="Transaction date, or the first day of the spiking month")
+    description = models.CharField(max_length=255, blank=True)
+    amount = models.DecimalField(max_digits=14, decimal_places=2)
+    baseline = models.DecimalField(max_digits=14, decimal_places=2)
+    score = models.FloatField()
+    detected_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['-date', '-score']
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'transaction_id'], condition=models.Q(kind='transaction'),
+                name='core_anomaly_user_txn_uniq',
+            ),
+            models.UniqueConstraint(
+                fields=['user', 'category', 'date'], condition=models.Q(kind='category_spike'),
+                name='core_anomaly_user_spike_uniq',
+            ),
+        ]
+        indexes = [
+            models.Index(fields=['user', 'date'], name='core_anomaly_user_date_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.kind} {self.category} {self.amount} (score {self.score:.1f})"
+
+
+class AnomalyScan(models.Model):
+    """Where detect_anomalies stopped for a user, incremental runs only flag newer transactions."""
+    user = models.OneToOneField(User, on_delete=models.CASCADE, primary_key=True, related_name='anomaly_scan')
+    last_transaction_id = models.BigIntegerField(default=0)
+    scanned_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.user} scanned up to {self.last_transaction_id}"
+
+
+class SpendingForecast(models.Model):
+    """
+    A user's projected end-of-month totals, computed by core.forecast.
+
+    Precomputed nightly by precompute_forecasts and dropped whenever a transaction of the
+    month is written, so /forecast/ reads one row by (user, month).
+    """
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='spending_forecasts')
+    month = models.DateField(help_text="First day of the forecast month")
+    as_of = models.DateField(help_text="Day whose month-to-date totals the forecast starts from")
+    # {category: {"to_date": "12.50", "recurring": "0.00", "projected": "40.00"}}
+    categories = models.JSONField(default=dict)
+    income_to_date = models.DecimalField(max_digits=14, decimal_places=2)
+    expenses_to_date = models.DecimalField(max_digits=14, decimal_places=2)
+    projected_income = models.DecimalField(max_digits=14, decimal_places=2)
+    projected_expenses = models.DecimalField(max_digits=14, decimal_places=2)
+    history_months = models.PositiveSmallIntegerField(help_text="Past months the spending curves were learned from")
+    computed_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'month'], name='core_forecast_user_month_uniq'),
+        ]
+
+    def __str__(self):
+        return f"{self.user} {self.month:%Y-%m} as of {self.as_of}"
+
+
+class CategoryFeature(models.Model):
+    """
+    A description feature (core.category_memo) and how many users filed it under a category.
+
+    The index shared by all users' category suggestions. It is built offline by
+    build_category_memo from features that several users have in common, so no single
+    user's descriptions are learned from and requests never aggregate core_transaction.
+    """
+    kind = models.CharField(max_length=12, help_text="description, merchant or word")
+    value = models.CharField(max_length=255)
+    category = models.CharField(max_length=50, choices=catagory_choices)
+    users = models.PositiveIntegerField(help_text="Users who filed the feature under the category")
+
+    def __str__(self):
+        return f"{self.kind} {self.value!r} -> {self.category} ({self.users} users)"
+
+
 class TransactionImage(models.Model):
-    image = models.ImageField(upload_to='transaction_images/')
+    """
+    A receipt image uploaded by a user, stored once per user and content (core.receipts).
+
+    The file is named by its SHA-256, so uploading the same receipt again reuses this row.
+    WebP thumbnails are made next to it on upload, {longest side: name} once they exist.
+    """
+    # Empty for images uploaded before receipts were kept per user, only staff sees those
+    user = models.ForeignKey(User, on_delete=models.CASCADE, null=True, blank=True, related_name='receipt_images')
+    image = models.ImageField(upload_to=receipt_path, storage=receipt_storage, max_length=255)
+    sha256 = models.CharField(max_length=64, blank=True)
+    content_type = models.CharField(max_length=50, blank=True)
+    size = models.PositiveIntegerField(default=0, help_text="Bytes of the original image")
+    width = models.PositiveIntegerField(null=True, blank=True)
+    height = models.PositiveIntegerField(null=True, blank=True)
+    thumbnails = models.JSONField(default=dict, blank=True)
+    created_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        ordering = ['-created_at']
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'sha256'], name='core_receipt_user_sha256_uniq'),
+        ]
+
+    def __str__(self):
+        return f"{self.user} {self.sha256[:12]} ({self.size} bytes)"
+
+
+class LLMCall(models.Model):
+    """One Gemini request, recorded by core.telemetry for latency, token and quota accounting."""
+    OUTCOME_CHOICES = [
+        ('ok', 'OK'),
+        ('parse_error', 'Parse error'),
+        ('error', 'Error'),
+        ('cancelled', 'Cancelled'),
+    ]
+
+    user = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, related_name='llm_calls')
+    endpoint = models.CharField(max_length=50)
+    model = models.CharField(max_length=50)
+    started_at = models.DateTimeField(default=timezone.now, db_index=True)
+    latency_ms = models.PositiveIntegerField()
+    prompt_size = models.PositiveIntegerField(help_text="Characters of text plus bytes of images sent")
+    prompt_tokens = models.PositiveIntegerField(null=True, blank=True)
+    response_tokens = models.PositiveIntegerField(null=True, blank=True)
+    total_tokens = models.PositiveIntegerField(null=True, blank=True)
+    outcome = models.CharField(max_length=20, choices=OUTCOME_CHOICES)
+    error = models.CharField(max_length=255, blank=True)
+
+    class Meta:
+        ordering = ['-started_at']
+        indexes = [
+            models.Index(fields=['user', 'started_at'], name='core_llm_user_started_idx'),
+            models.Index(fields=['endpoint', 'started_at'], name='core_llm_endpoint_started_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.endpoint} {self.outcome} {self.latency_ms} ms"
+
+
+class AnalyticsReport(models.Model):
+    """
+    An exact run of the staff analytics (core.staff_analytics) over every transaction.
+
+    Requested through /stats/analytics/exact/ or compute_staff_analytics and computed in the
+    background, dashboards read the stored result next to the approximate one.
+    """
+    STATUS_CHOICES = [
+        ('queued', 'Queued'),
+        ('running', 'Running'),
+        ('done', 'Done'),
+        ('failed', 'Failed'),
+    ]
+
+    months = models.PositiveSmallIntegerField(help_text="Months covered, up to and including the current one")
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='queued')
+    requested_by = models.ForeignKey(
+        User, on_delete=models.SET_NULL, null=True, blank=True, related_name='analytics_reports'
+    )
+    # The same shape as the approximate analytics, with zero margins
+    result = models.JSONField(default=dict, blank=True)
+    error = models.CharField(max_length=255, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['-created_at']
+
+    def __str__(self):
+        return f"{self.months} months analytics ({self.status})"
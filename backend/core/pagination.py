@@ -1,8 +1,32 @@
+from django.core.paginator import InvalidPage
+from rest_framework.exceptions import NotFound
 from rest_framework.pagination import PageNumberPagination
 from rest_framework.response import Response
 from collections import OrderedDict
 import math
 
+
+class _CountedQuerySet:
+    """A queryset whose row count is already known, so the paginator does not count again."""
+
+    def __init__(self, queryset, count):
+        self.queryset = queryset
+        self._count = count
+
+    @property
+    def ordered(self):
+        return self.queryset.ordered
+
+    def count(self):
+        return self._count
+
+    def __len__(self):
+        return self._count
+
+    def __getitem__(self, index):
+        return self.queryset[index]
+
+
 class DefaultPagination(PageNumberPagination):
     page_size = 20
     
@@ -17,4 +41,28 @@ class DefaultPagination(PageNumberPagination):
             ('next', self.get_next_link()),
             ('previous', self.get_previous_link()),
             ('results', data)
-        ]))
\ No newline at end of file
+        ]))
+
+    async def apaginate_queryset(self, queryset, request, view=None, count=None):
+        """
+        paginate_queryset for async views: the same pages and errors, with the rows fetched
+        through the async ORM. A count the caller already has saves the COUNT query.
+        """
+        page_size = self.get_page_size(request)
+        if not page_size:
+            return None
+        if count is None:
+            count = await queryset.acount()
+
+        paginator = self.django_paginator_class(_CountedQuerySet(queryset, count), page_size)
+        page_number = self.get_page_number(request, paginator)
+        try:
+            self.page = paginator.page(page_number)
+        except InvalidPage as exc:
+            msg = self.invalid_page_message.format(page_number=page_number, message=str(exc))
+            raise NotFound(msg)
+
+        if paginator.num_pages > 1 and self.template is not None:
+            self.display_page_controls = True
+        self.request = request
+        return [row async for row in self.page.object_list.aiterator()]
@@ -0,0 +1,201 @@
+import re
+from datetime import date
+
+from django.db import transaction as db_transaction
+
+TABLE = 'core_transaction'
+DEFAULT_PARTITION = f'{TABLE}_default'
+INTERVALS = ('yearly', 'monthly')
+
+_PARTITION_NAME = re.compile(rf'^{TABLE}_y(\d{{4}})(?:m(\d{{2}}))?$')
+
+
+class PartitioningError(Exception):
+    pass
+
+
+def is_supported(connection):
+    """Range partitioning is PostgreSQL only, other databases keep the single table."""
+    return connection.vendor == 'postgresql'
+
+
+def is_partitioned(connection):
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT 1 FROM pg_partitioned_table WHERE partrelid = to_regclass(%s)", [TABLE])
+        return cursor.fetchone() is not None
+
+
+def period(day, interval):
+    """Returns (partition name, first day, first day of the next period) for the period containing day."""
+    if interval == 'yearly':
+        return f'{TABLE}_y{day.year}', date(day.year, 1, 1), date(day.year + 1, 1, 1)
+    start = date(day.year, day.month, 1)
+    end = date(day.year + 1, 1, 1) if day.month == 12 else date(day.year, day.month + 1, 1)
+    return f'{TABLE}_y{day.year}m{day.month:02d}', start, end
+
+
+def partitions(connection):
+    """Returns {name: (first day, end day)} of the date range partitions of core_transaction."""
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid "
+            "WHERE i.inhparent = to_regclass(%s)",
+            [TABLE],
+        )
+        names = [row[0] for row in cursor.fetchall()]
+    result = {}
+    for name in names:
+        match = _PARTITION_NAME.match(name)
+        if match:
+            year, month = int(match.group(1)), match.group(2)
+            _, start, end = period(date(year, int(month or 1), 1), 'monthly' if month else 'yearly')
+            result[name] = (start, end)
+    return result
+
+
+def current_interval(connection):
+    """The interval the existing partitions were created with, None if there are none."""
+    names = partitions(connection)
+    if not names:
+        return None
+    return 'monthly' if any(_PARTITION_NAME.match(name).group(2) for name in names) else 'yearly'
+
+
+def ensure_partitions(connection, interval, first, last):
+    """
+    Creates the missing partitions for every period from first to last.
+
+    Rows of a new period that already landed in the default partition are moved into it,
+    so partitions can be created after the fact as well as ahead of time.
+
+    Returns:
+        list: Names of the created partitions
+    """
+    existing = partitions(connection)
+    created = []
+    day = first
+    with db_transaction.atomic(using=connection.alias), connection.cursor() as cursor:
+        while day <= last:
+            name, start, end = period(day, interval)
+            day = end
+            if name in existing:
+                continue
+            bounds = f"FROM ('{start.isoformat()}') TO ('{end.isoformat()}')"
+            cursor.execute(f'LOCK TABLE {DEFAULT_PARTITION} IN ACCESS EXCLUSIVE MODE')
+            cursor.execute(f'CREATE TABLE {name} (LIKE {TABLE} INCLUDING DEFAULTS INCLUDING CONSTRAINTS)')
+            cursor.execute(
+                f'WITH moved AS (DELETE FROM {DEFAULT_PARTITION} WHERE date >= %s AND date < %s RETURNING *) '
+                f'INSERT INTO {name} SELECT * FROM moved',
+                [start, end],
+            )
+            cursor.execute(f'ALTER TABLE {TABLE} ATTACH PARTITION {name} FOR VALUES {bounds}')
+            created.append(name)
+    return created
+
+
+def convert_to_partitioned(connection, interval, ahead=1, keep_old=False):
+    """
+    Rebuilds core_transaction as a table partitioned by RANGE (date), in one database transaction.
+
+    The rows are copied into the new table, indexes and foreign keys are recreated under
+    their old names and the id sequence continues where it left off. The primary key
+    becomes (id, date), because a partitioned table's unique constraints must contain the
+    partition key; that also means no other table can reference core_transaction.id with
+    a foreign key.
+
+    Args:
+        connection: A PostgreSQL connection
+        interval (str): "yearly" or "monthly"
+        ahead (int): Extra periods to create after the current one
+        keep_old (bool): Keep the original table as core_transaction_unpartitioned
+
+    Returns:
+        list: Names of the created partitions
+    """
+    old = f'{TABLE}_unpartitioned'
+    with db_transaction.atomic(using=connection.alias), connection.cursor() as cursor:
+        cursor.execute(f'LOCK TABLE {TABLE} IN ACCESS EXCLUSIVE MODE')
+        cursor.execute(
+            "SELECT conname, conrelid::regclass::text FROM pg_constraint "
+            "WHERE contype = 'f' AND confrelid = to_regclass(%s)",
+            [TABLE],
+        )
+        references = cursor.fetchall()
+        if references:
+            raise PartitioningError(
+                "Foreign keys reference core_transaction: "
+                + ", ".join(f"{name} on {table}" for name, table in references)
+            )
+
+        cursor.execute(
+            "SELECT i.relname, pg_get_indexdef(i.oid), x.indisprimary, x.indisunique "
+            "FROM pg_index x JOIN pg_class i ON i.oid = x.indexrelid WHERE x.indrelid = to_regclass(%s)",
+            [TABLE],
+        )
+        indexes = cursor.fetchall()
+        if any(unique and not primary for _, _, primary, unique in indexes):
+            raise PartitioningError("Unique indexes on core_transaction must include the date column.")
+        cursor.execute(
+            "SELECT conname, pg_get_constraintdef(oid) FROM pg_constraint "
+            "WHERE contype = 'f' AND conrelid = to_regclass(%s)",
+            [TABLE],
+        )
+        foreign_keys = cursor.fetchall()
+        cursor.execute(
+            "SELECT is_identity FROM information_schema.columns WHERE table_name = %s AND column_name = 'id'",
+            [TABLE],
+        )
+        identity = cursor.fetchone()[0] == 'YES'
+
+        # Free the table and index names for the partitioned table
+        cursor.execute(f'ALTER TABLE {TABLE} RENAME TO {old}')
+        for name, _, _, _ in indexes:
+            cursor.execute(f'ALTER INDEX {name} RENAME TO {name[:59]}_old')
+
+        cursor.execute(
+            f'CREATE TABLE {TABLE} (LIKE {old} INCLUDING DEFAULTS INCLUDING IDENTITY INCLUDING CONSTRAINTS) '
+            'PARTITION BY RANGE (date)'
+        )
+        cursor.execute(f'ALTER TABLE {TABLE} ADD CONSTRAINT {TABLE}_pkey PRIMARY KEY (id, date)')
+        for name, definition, primary, _ in indexes:
+            if not primary:
+                # pg_get_indexdef was read before the rename, so it names the original table
+                cursor.execute(re.sub(rf' ON (?:\S+\.)?{TABLE} ', f' ON {TABLE} ', definition, count=1))
+        for name, definition in foreign_keys:
+            cursor.execute(f'ALTER TABLE {TABLE} ADD CONSTRAINT {name} {definition}')
+        if not identity:
+            # A serial default still points at the old table's sequence, hand it over
+            cursor.execute(f"SELECT pg_get_serial_sequence('{old}', 'id')")
+            cursor.execute(f'ALTER SEQUENCE {cursor.fetchone()[0]} OWNED BY {TABLE}.id')
+
+        cursor.execute(f'CREATE TABLE {DEFAULT_PARTITION} PARTITION OF {TABLE} DEFAULT')
+        cursor.execute(f'SELECT MIN(date), MAX(date) FROM {old}')
+        first, last = cursor.fetchone()
+        today = date.today()
+        last = max(last or today, today)
+        for _ in range(ahead):
+            last = period(last, interval)[2]
+        created = ensure_partitions(connection, interval, first or today, last)
+
+        cursor.execute(f'INSERT INTO {TABLE} SELECT * FROM {old}')
+        if identity:
+            cursor.execute(
+                f"SELECT setval(pg_get_serial_sequence('{TABLE}', 'id'), COALESCE(MAX(id), 0) + 1, false) FROM {TABLE}"
+            )
+        if not keep_old:
+            cursor.execute(f'DROP TABLE {old}')
+    return created
+
+
+def drop_empty_partitions(connection, before):
+    """Drops partitions that end on or before the given day and hold no rows, e.g. after archiving."""
+    dropped = []
+    with db_transaction.atomic(using=connection.alias), connection.cursor() as cursor:
+        for name, (_, end) in sorted(partitions(connection).items()):
+            if end > before:
+                continue
+            cursor.execute(f'SELECT EXISTS (SELECT 1 FROM {name})')
+            if not cursor.fetchone()[0]:
+                cursor.execute(f'DROP TABLE {name}')
+                dropped.append(name)
+    return dropped
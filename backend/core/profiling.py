@@ -0,0 +1,263 @@
+import cProfile
+import io
+import json
+import logging
+import marshal
+import os
+import pstats
+import re
+import sys
+import threading
+import time
+import uuid
+import zipfile
+from collections import Counter
+from contextlib import ExitStack
+from datetime import datetime, timezone as dt_timezone
+from pathlib import Path
+
+from django.conf import settings
+from django.core import signing
+from django.db import connections
+
+logger = logging.getLogger(__name__)
+
+MODES = ('cprofile', 'sample')
+TOKEN_SALT = 'core.profiling'
+# Artifact names are generated here, anything else asked for by name is refused
+ARTIFACT_NAME = re.compile(r'^\d{8}T\d{6}-[0-9a-f]{12}$')
+# Functions listed in the text summary of a cProfile run
+SUMMARY_FUNCTIONS = 40
+
+# One cProfile run per process at a time: Python 3.12+ refuses to enable a second profiler
+# while another thread's is running
+_cprofile_lock = threading.Lock()
+
+
+def make_token():
+    """
+    Signs a token that lets any request be profiled through the X-Profile-Token header.
+
+    Returns:
+        str: The token, valid for PROFILING['TOKEN_MAX_AGE'] seconds
+    """
+    return signing.dumps({'issued': time.time()}, salt=TOKEN_SALT)
+
+
+def valid_token(value):
+    try:
+        signing.loads(value, salt=TOKEN_SALT, max_age=settings.PROFILING['TOKEN_MAX_AGE'])
+    except signing.BadSignature:
+        return False
+    return True
+
+
+class _Sampler:
+    """Records the stack of one thread every interval seconds, as collapsed stacks."""
+
+    def __init__(self, thread_id, interval):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = Counter()
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self.run, name='profiling-sampler', daemon=True)
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{code.co_name} ({code.co_filename}:{frame.f_lineno})")
+                frame = frame.f_back
+            if stack:
+                self.stacks[';'.join(reversed(stack))] += 1
+
+    def start(self):
+        self.thread.start()
+
+    def stop(self):
+        self.stopped.set()
+        self.thread.join()
+
+    def collapsed(self):
+        # The input format of flamegraph.pl and speedscope
+        return ''.join(f"{stack} {count}\n" for stack, count in self.stacks.most_common())
+
+
+class Capture:
+    """
+    Profiles the work one thread does for a request and records its SQL queries.
+
+    start() and stop() must run on the thread doing the work: cProfile and the query
+    wrappers only see the calling thread and its database connections. A cProfile capture
+    asked for while another request of the process is being profiled with cProfile is
+    sampled instead.
+
+    Args:
+        mode (str): "cprofile" for deterministic profiling, "sample" for stack sampling
+        request (HttpRequest): The profiled request, for the artifact's metadata
+    """
+
+    def __init__(self, mode, request):
+        self.mode = mode if mode in MODES else 'cprofile'
+        self.name = f"{datetime.now(dt_timezone.utc):%Y%m%dT%H%M%S}-{uuid.uuid4().hex[:12]}"
+        self.meta = {
+            'name': self.name,
+            'mode': self.mode,
+            'method': request.method,
+            'path': request.path,
+            'query_string': request.META.get('QUERY_STRING', ''),
+            'created_at': datetime.now(dt_timezone.utc).isoformat(),
+        }
+        self.queries = []
+        self.profiler = None
+        self.sampler = None
+        self.stack = ExitStack()
+
+    def record_query(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        error = None
+        try:
+            return execute(sql, params, many, context)
+        except Exception as exc:
+            error = repr(exc)
+            raise
+        finally:
+            self.queries.append({
+                'alias': context['connection'].alias,
+                'sql': sql,
+                'params': repr(params)[:1000],
+                'many': many,
+                'duration_ms': round((time.perf_counter() - started) * 1000, 3),
+                'error': error,
+            })
+
+    def start(self):
+        # Every alias of this thread, the wrappers stay on a connection that is (re)opened later
+        for connection in connections.all():
+            self.stack.enter_context(connection.execute_wrapper(self.record_query))
+        if self.mode == 'cprofile':
+            self.start_profiler()
+        if self.mode == 'sample':
+            self.sampler = _Sampler(threading.get_ident(), settings.PROFILING['SAMPLE_INTERVAL_MS'] / 1000)
+            self.sampler.start()
+        self.started = time.perf_counter()
+
+    def start_profiler(self):
+        if not _cprofile_lock.acquire(blocking=False):
+            self.fall_back("another request is being profiled with cProfile")
+            return
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+        except ValueError as exc:
+            # Another tool (a debugger, coverage) holds the interpreter's profiler slot
+            _cprofile_lock.release()
+            self.fall_back(str(exc))
+            return
+        self.profiler = profiler
+
+    def fall_back(self, reason):
+        self.mode = self.meta['mode'] = 'sample'
+        self.meta['fallback'] = f"cprofile unavailable: {reason}"
+
+    def stop(self):
+        duration = time.perf_counter() - self.started
+        if self.profiler is not None:
+            self.profiler.disable()
+            _cprofile_lock.release()
+        if self.sampler is not None:
+            self.sampler.stop()
+        self.stack.close()
+        self.meta['duration_ms'] = round(duration * 1000, 3)
+        self.meta['query_count'] = len(self.queries)
+        self.meta['query_ms'] = round(sum(query['duration_ms'] for query in self.queries), 3)
+
+    def save(self, status_code=None, user=None):
+        """Writes the artifact into the ring, dropping the oldest ones over PROFILING['MAX_ARTIFACTS']."""
+        self.meta['status'] = status_code
+        self.meta['user'] = getattr(user, 'username', None) or None
+        buffer = io.BytesIO()
+        with zipfile.ZipFile(buffer, 'w', zipfile.ZIP_DEFLATED) as archive:
+            archive.writestr('meta.json', json.dumps(self.meta, indent=2))
+            archive.writestr('sql.json', json.dumps(self.queries, indent=2))
+            if self.profiler is not None:
+                stats = pstats.Stats(self.profiler)
+                # The pstats dump format, load it with pstats.Stats or snakeviz
+                archive.writestr('profile.prof', marshal.dumps(stats.stats))
+                summary = io.StringIO()
+                pstats.Stats(self.profiler, stream=summary).sort_stats('cumulative').print_stats(SUMMARY_FUNCTIONS)
+                archive.writestr('profile.txt', summary.getvalue())
+            if self.sampler is not None:
+                archive.writestr('stacks.txt', self.sampler.collapsed())
+        try:
+            write_artifact(self.name, buffer.getvalue())
+        except OSError:
+            # Profiling must never break the request it measures
+            logger.exception("Could not store profile %s", self.name)
+
+
+def artifact_dir():
+    return Path(settings.PROFILING['DIR'])
+
+
+def write_artifact(name, data):
+    directory = artifact_dir()
+    directory.mkdir(parents=True, exist_ok=True)
+    # Written under a temporary name, a listing never sees half an archive
+    temporary = directory / f".{name}.tmp"
+    temporary.write_bytes(data)
+    os.replace(temporary, directory / f"{name}.zip")
+    # Names start with the UTC time, so sorting them sorts by age
+    stored = sorted(directory.glob('*.zip'))
+    for path in stored[:max(0, len(stored) - settings.PROFILING['MAX_ARTIFACTS'])]:
+        path.unlink(missing_ok=True)
+
+
+def artifact_path(name):
+    """The stored artifact called name, None if there is none or the name is not one of ours."""
+    if not ARTIFACT_NAME.match(name):
+        return None
+    path = artifact_dir() / f"{name}.zip"
+    return path if path.is_file() else None
+
+
+def list_artifacts():
+    """Metadata of the stored artifacts, newest first."""
+    artifacts = []
+    directory = artifact_dir()
+    if not directory.is_dir():
+        return artifacts
+    for path in sorted(directory.glob('*.zip'), reverse=True):
+        try:
+            with zipfile.ZipFile(path) as archive:
+                meta = json.loads(archive.read('meta.json'))
+        except (OSError, KeyError, ValueError, zipfile.BadZipFile):
+            # Dropped from the ring while it was read
+            continue
+        artifacts.append({**meta, 'size': path.stat().st_size})
+    return artifacts
+
+
+def allowed(request):
+    """
+    True if the request may be profiled: it carries a valid X-Profile-Token, or comes
+    from a staff user logged in through the session or a JWT.
+
+    Only called for requests that ask to be profiled, it may query the database.
+    """
+    token = request.META.get('HTTP_X_PROFILE_TOKEN')
+    if token:
+        return valid_token(token)
+    if request.user.is_staff:
+        return True
+    # Django's middleware runs before DRF authenticates the JWT
+    from rest_framework.exceptions import AuthenticationFailed
+    from rest_framework_simplejwt.authentication import JWTAuthentication
+    from rest_framework_simplejwt.exceptions import InvalidToken
+    try:
+        authenticated = JWTAuthentication().authenticate(request)
+    except (AuthenticationFailed, InvalidToken):
+        return False
+    return authenticated is not None and authenticated[0].is_staff
@@ -0,0 +1,290 @@
+import hashlib
+import io
+import logging
+import os
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import quote
+
+from django.conf import settings
+from django.core import signing
+from django.core.files.base import ContentFile
+from django.db import IntegrityError, close_old_connections, transaction as db_transaction
+from django.http import FileResponse, HttpResponse, HttpResponseNotModified, StreamingHttpResponse
+from django.urls import reverse
+from django.utils import timezone
+
+from .models import TransactionImage
+
+logger = logging.getLogger(__name__)
+
+# Formats Pillow may report for an upload, with the extension and type they are stored and served as
+FORMATS = {
+    'JPEG': ('.jpg', 'image/jpeg'),
+    'PNG': ('.png', 'image/png'),
+    'GIF': ('.gif', 'image/gif'),
+    'WEBP': ('.webp', 'image/webp'),
+}
+THUMBNAIL_TYPE = 'image/webp'
+URL_SALT = 'core.receipts'
+# Content addressed files never change, browsers may keep them as long as they like
+CACHE_CONTROL = 'private, max-age=31536000, immutable'
+CHUNK_SIZE = 64 * 1024
+
+_RANGE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+class InvalidReceipt(ValueError):
+    pass
+
+
+def inspect_image(data):
+    """
+    Identifies an uploaded image without decoding its pixels.
+
+    Returns:
+        tuple: (extension, content type, width, height)
+
+    Raises:
+        InvalidReceipt: If the bytes are not a JPEG, PNG, GIF or WebP image
+    """
+    # Imported here, Pillow is only needed by workers handling receipts
+    from PIL import Image, UnidentifiedImageError
+
+    try:
+        with Image.open(io.BytesIO(data)) as image:
+            image_format, (width, height) = image.format, image.size
+            image.verify()
+    except (UnidentifiedImageError, OSError, SyntaxError, Image.DecompressionBombError) as exc:
+        raise InvalidReceipt("Invalid image file.") from exc
+    if image_format not in FORMATS:
+        raise InvalidReceipt("Image must be a JPEG, PNG, GIF or WebP file.")
+    extension, content_type = FORMATS[image_format]
+    return extension, content_type, width, height
+
+
+def store_receipt(user, data):
+    """
+    Stores an uploaded receipt for user, once per distinct content.
+
+    Thumbnails are made on the thumbnail pool after the upload commits.
+
+    Returns:
+        tuple: (TransactionImage, True if it was stored now, False if the user had uploaded it before)
+
+    Raises:
+        InvalidReceipt: If data is not a supported image
+    """
+    extension, content_type, width, height = inspect_image(data)
+    digest = hashlib.sha256(data).hexdigest()
+    existing = TransactionImage.objects.filter(user=user, sha256=digest).first()
+    if existing is not None:
+        return existing, False
+
+    receipt = TransactionImage(
+        user=user, sha256=digest, content_type=content_type, size=len(data), width=width, height=height
+    )
+    # Writes nothing if the file exists already, see core.storage.ContentAddressedStorage
+    receipt.image.save(f"{digest}{extension}", ContentFile(data), save=False)
+    try:
+        with db_transaction.atomic():
+            receipt.save()
+    except IntegrityError:
+        # The same receipt uploaded twice at once, both requests stored the same file
+        return TransactionImage.objects.get(user=user, sha256=digest), False
+    db_transaction.on_commit(lambda: thumbnail_pool().submit(_make_thumbnails_in_background, receipt.id))
+    return receipt, True
+
+
+def thumbnail_name(name, size):
+    return f"{os.path.splitext(name)[0]}_{size}.webp"
+
+
+def make_thumbnails(receipt):
+    """
+    Writes the missing WebP thumbnails of receipt (RECEIPTS['THUMBNAIL_SIZES']) and records them.
+
+    Returns:
+        dict: {longest side: storage name}
+    """
+    from PIL import Image, ImageOps
+
+    sizes = sorted(settings.RECEIPTS['THUMBNAIL_SIZES'])
+    storage = receipt.image.storage
+    thumbnails = {}
+    with receipt.image.open('rb') as file, Image.open(file) as original:
+        # JPEGs are decoded at a reduced scale when the largest thumbnail allows it
+        original.draft('RGB', (sizes[-1], sizes[-1]))
+        # Phone photos are stored sideways with an orientation tag
+        image = ImageOps.exif_transpose(original)
+        if image.mode not in ('RGB', 'RGBA'):
+            image = image.convert('RGBA' if 'transparency' in image.info or image.mode in ('LA', 'PA') else 'RGB')
+        for size in sizes:
+            name = thumbnail_name(receipt.image.name, size)
+            if not storage.exists(name):
+                thumbnail = image.copy()
+                thumbnail.thumbnail((size, size), Image.Resampling.LANCZOS)
+                buffer = io.BytesIO()
+                thumbnail.save(buffer, 'WEBP', quality=80, method=4)
+                storage.save(name, ContentFile(buffer.getvalue()))
+            thumbnails[str(size)] = name
+    TransactionImage.objects.filter(id=receipt.id).update(thumbnails=thumbnails)
+    receipt.thumbnails = thumbnails
+    return thumbnails
+
+
+def _make_thumbnails_in_background(receipt_id):
+    try:
+        receipt = TransactionImage.objects.filter(id=receipt_id).first()
+        if receipt is not None:
+            make_thumbnails(receipt)
+    except Exception:
+        # The file view makes missing thumbnails on request
+        logger.exception("Could not make thumbnails of receipt %s", receipt_id)
+    finally:
+        close_old_connections()
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def thumbnail_pool():
+    """
+    The process wide pool making thumbnails.
+
+    Threads rather than processes: Pillow releases the GIL while it decodes, resizes and
+    encodes, and threads work the same under every server without forking.
+    """
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ThreadPoolExecutor(
+                max_workers=settings.RECEIPTS['THUMBNAIL_WORKERS'], thread_name_prefix='receipt-thumbnails'
+            )
+        return _pool
+
+
+def delete_files(receipt):
+    """Removes a deleted receipt's file and thumbnails, nothing else refers to them."""
+    storage = receipt.image.storage
+    names = [receipt.image.name, *receipt.thumbnails.values()]
+    for name in names:
+        if name:
+            storage.delete(name)
+
+
+def _signature_value(receipt_id, size, day):
+    return f"{receipt_id}:{size or 'original'}:{day}"
+
+
+def file_url(request, receipt, size=None):
+    """
+    A signed URL of the receipt's file (or its thumbnail), for <img> tags that can not send a JWT.
+
+    The signature carries the day it was made, so a URL stays the same and cached by the
+    browser for the day, and is accepted for RECEIPTS['URL_MAX_AGE_DAYS'] days.
+    """
+    day = timezone.localdate().toordinal()
+    signature = signing.Signer(salt=URL_SALT).sign(_signature_value(receipt.id, size, day)).rsplit(':', 1)[1]
+    query = f"day={day}&sig={signature}" + (f"&size={size}" if size else '')
+    path = f"{reverse('image-to-text-file', args=[receipt.id])}?{query}"
+    return request.build_absolute_uri(path) if request is not None else path
+
+
+def valid_signature(receipt_id, size, day, signature):
+    try:
+        day = int(day)
+    except (TypeError, ValueError):
+        return False
+    if not 0 <= timezone.localdate().toordinal() - day < settings.RECEIPTS['URL_MAX_AGE_DAYS']:
+        return False
+    try:
+        signing.Signer(salt=URL_SALT).unsign(f"{_signature_value(receipt_id, size, day)}:{signature}")
+    except signing.BadSignature:
+        return False
+    return True
+
+
+def _read_range(path, start, length):
+    with open(path, 'rb') as file:
+        file.seek(start)
+        while length > 0:
+            chunk = file.read(min(CHUNK_SIZE, length))
+            if not chunk:
+                break
+            length -= len(chunk)
+            yield chunk
+
+
+def _requested_range(request, etag, total):
+    """(start, end) of a single byte range asked for, None for the whole file, False if unsatisfiable."""
+    header = request.META.get('HTTP_RANGE', '')
+    match = _RANGE.match(header.strip())
+    # Several ranges, malformed ones and ranges of an older version get the whole file
+    if not match or not any(match.groups()):
+        return None
+    if_range = request.META.get('HTTP_IF_RANGE')
+    if if_range is not None and if_range != etag:
+        return None
+    first, last = match.groups()
+    if first:
+        start, end = int(first), min(int(last), total - 1) if last else total - 1
+    else:
+        start, end = max(0, total - int(last)), total - 1
+    if start >= total or start > end:
+        return False
+    return start, end
+
+
+def serve_file(request, receipt, size=None):
+    """
+    Responds with the receipt's file or one of its thumbnails.
+
+    With RECEIPTS['SENDFILE'] the web server sends the file (and answers ranges) after
+    Django has checked access. Otherwise Django streams it, answering a single byte
+    range with 206. Either way the response is cacheable for a year and revalidated by
+    its ETag, the name of content addressed bytes.
+    """
+    name = receipt.image.name
+    content_type = receipt.content_type or 'application/octet-stream'
+    if size:
+        name = receipt.thumbnails.get(str(size)) or make_thumbnails(receipt)[str(size)]
+        content_type = THUMBNAIL_TYPE
+    etag = f'"{receipt.sha256}-{size or "original"}"'
+    if etag in request.META.get('HTTP_IF_NONE_MATCH', ''):
+        response = HttpResponseNotModified()
+        response['ETag'] = etag
+        response['Cache-Control'] = CACHE_CONTROL
+        return response
+
+    storage = receipt.image.storage
+    mode = settings.RECEIPTS['SENDFILE']
+    if mode == 'x-accel-redirect':
+        response = HttpResponse(content_type=content_type)
+        response['X-Accel-Redirect'] = settings.RECEIPTS['ACCEL_PREFIX'] + quote(name)
+    elif mode == 'x-sendfile':
+        response = HttpResponse(content_type=content_type)
+        response['X-Sendfile'] = storage.path(name)
+    else:
+        path = storage.path(name)
+        total = os.path.getsize(path)
+        requested = _requested_range(request, etag, total)
+        if requested is False:
+            response = HttpResponse(status=416)
+            response['Content-Range'] = f"bytes */{total}"
+            return response
+        if requested is None:
+            response = FileResponse(open(path, 'rb'), content_type=content_type)
+        else:
+            start, end = requested
+            response = StreamingHttpResponse(
+                _read_range(path, start, end - start + 1), status=206, content_type=content_type
+            )
+            response['Content-Range'] = f"bytes {start}-{end}/{total}"
+            response['Content-Length'] = str(end - start + 1)
+    response['Accept-Ranges'] = 'bytes'
+    response['ETag'] = etag
+    response['Cache-Control'] = CACHE_CONTROL
+    return response
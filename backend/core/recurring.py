@@ -0,0 +1,174 @@
+import calendar
+from collections import defaultdict
+from datetime import date, timedelta
+from decimal import Decimal
+
+from django.conf import settings
+from django.db import transaction as db_transaction
+from django.dispatch import receiver
+
+from .fingerprints import series_key
+from .models import RecurringSeries, Transaction
+from .signals import transactions_changed
+
+# Expected days between occurrences, and how far off an interval may be to count as on schedule
+PERIODS = {
+    'weekly': (7.0, 1.5),
+    'monthly': (30.44, 3.5),
+    'yearly': (365.25, 7.0),
+}
+MIN_OCCURRENCES = 3
+
+UPDATE_FIELDS = [
+    'description', 'category', 'period', 'interval_days', 'amount', 'amount_variation',
+    'occurrences', 'first_date', 'last_date', 'next_date', 'confidence', 'updated_at',
+]
+
+
+def add_period(day, period, day_of_month=None):
+    """The next occurrence after day. Monthly and yearly series stay on day_of_month where the month has it."""
+    if period == 'weekly':
+        return day + timedelta(days=7)
+    month = day.month - 1 + (1 if period == 'monthly' else 12)
+    year, month = day.year + month // 12, month % 12 + 1
+    return date(year, month, min(day_of_month or day.day, calendar.monthrange(year, month)[1]))
+
+
+def detect_series(rows):
+    """
+    Finds weekly, monthly and yearly series in one user's transactions.
+
+    Rows are grouped by series_key. For every group with enough distinct days,
+    the gaps between occurrences and the amounts are summarized with NumPy: the median gap
+    picks the period, and the confidence combines the share of gaps on schedule, the
+    stability of the amounts and the number of occurrences.
+
+    Args:
+        rows (iterable): (description, date, amount, category) tuples
+
+    Returns:
+        list: Unsaved RecurringSeries without a user
+    """
+    # Imported here, NumPy is only needed by workers that run detection
+    import numpy as np
+
+    groups = defaultdict(list)
+    for description, day, amount, category in rows:
+        key = series_key(description)
+        if key:
+            groups[key].append((day.toordinal(), float(amount), description, category))
+
+    found = []
+    for key, items in groups.items():
+        if len(items) < MIN_OCCURRENCES:
+            continue
+        items.sort(key=lambda item: item[0])
+        days = np.fromiter((item[0] for item in items), dtype=np.int64, count=len(items))
+        amounts = np.fromiter((item[1] for item in items), dtype=np.float64, count=len(items))
+        # Rows on the same day are one occurrence
+        days, first = np.unique(days, return_index=True)
+        amounts = amounts[first]
+        if len(days) < MIN_OCCURRENCES:
+            continue
+
+        intervals = np.diff(days)
+        median_interval = float(np.median(intervals))
+        period = min(PERIODS, key=lambda name: abs(PERIODS[name][0] - median_interval))
+        expected, tolerance = PERIODS[period]
+        if abs(median_interval - expected) > tolerance:
+            continue
+
+        regularity = float(np.mean(np.abs(intervals - expected) <= tolerance))
+        mean = float(amounts.mean())
+        variation = float(amounts.std() / mean) if mean else 1.0
+        coverage = min(1.0, len(intervals) / 3)
+        confidence = regularity * (0.5 + 0.5 * max(0.0, 1.0 - variation)) * coverage
+        if confidence < settings.RECURRING_MIN_CONFIDENCE:
+            continue
+
+        last_date = date.fromordinal(int(days[-1]))
+        _, _, description, category = items[-1]
+        found.append(RecurringSeries(
+            key=key[:255],
+            description=description,
+            category=category,
+            period=period,
+            interval_days=round(median_interval, 2),
+            amount=Decimal(str(round(float(np.median(amounts)), 2))),
+            amount_variation=round(variation, 4),
+            occurrences=len(days),
+            first_date=date.fromordinal(int(days[0])),
+            last_date=last_date,
+            next_date=add_period(last_date, period, date.fromordinal(int(days[0])).day),
+            confidence=round(confidence, 3),
+        ))
+    return found
+
+
+def save_series(user_id, series, keys=None):
+    """
+    Stores a user's detected series.
+
+    Args:
+        user_id (int): Owner of the series
+        series (list): Output of detect_series
+        keys (iterable, optional): Only series with these keys were re-detected, None means all were
+    """
+    with db_transaction.atomic():
+        stale = RecurringSeries.objects.filter(user_id=user_id)
+        if keys is not None:
+            stale = stale.filter(key__in=list(keys))
+        stale.exclude(key__in=[item.key for item in series]).delete()
+        for item in series:
+            item.user_id = user_id
+        RecurringSeries.objects.bulk_create(
+            series, update_conflicts=True, unique_fields=['user', 'key'], update_fields=UPDATE_FIELDS
+        )
+
+
+def detect_for_users(user_ids):
+    """
+    Re-detects every series of the given users.
+
+    Returns:
+        tuple: (transactions scanned, series found)
+    """
+    scanned = found = 0
+    for user_id in user_ids:
+        rows = list(
+            Transaction.objects.filter(user_id=user_id).order_by()
+            .values_list('description', 'date', 'amount', 'category')
+        )
+        series = detect_series(rows)
+        save_series(user_id, series)
+        scanned += len(rows)
+        found += len(series)
+    return scanned, found
+
+
+def refresh_series(descriptions_by_user):
+    """Re-detects only the series the given descriptions belong to, {user_id: descriptions}."""
+    for user_id, descriptions in descriptions_by_user.items():
+        keys = {series_key(description) for description in descriptions} - {''}
+        if not keys:
+            continue
+        # Stored with every row, an equality lookup on the (user, series_key) index
+        rows = list(
+            Transaction.objects.filter(user_id=user_id, series_key__in=keys).order_by()
+            .values_list('description', 'date', 'amount', 'category')
+        )
+        save_series(user_id, detect_series(rows), keys=keys)
+
+
+@receiver(transactions_changed)
+def redetect_changed_series(sender, changes, **kwargs):
+    descriptions_by_user = defaultdict(set)
+    for change in changes:
+        old, new = change.old, change.new
+        if old and new and all(old[field] == new[field] for field in ('description', 'date', 'amount', 'category')):
+            continue
+        for values in (old, new):
+            if values:
+                descriptions_by_user[change.user_id].add(values['description'])
+    if descriptions_by_user:
+        db_transaction.on_commit(lambda: refresh_series(descriptions_by_user))
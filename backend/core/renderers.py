@@ -0,0 +1,90 @@
+import math
+from decimal import Decimal
+
+import orjson
+from rest_framework.renderers import BaseRenderer, JSONRenderer
+from rest_framework.utils.encoders import JSONEncoder
+
+_drf_encoder = JSONEncoder()
+
+# Output matches DRF's JSONRenderer with the default COMPACT_JSON/UNICODE_JSON settings:
+# compact separators, raw UTF-8, "Z" suffix for UTC datetimes and str() for non-string keys
+BASE_OPTIONS = orjson.OPT_UTC_Z | orjson.OPT_NON_STR_KEYS
+
+
+def _default(obj):
+    # Only called for types orjson can not encode itself
+    if isinstance(obj, Decimal):
+        # Same as DRF's encoder with COERCE_DECIMAL_TO_STRING = False
+        return float(obj)
+    return _drf_encoder.default(obj)
+
+
+def _has_non_finite(data):
+    """Whether data holds NaN or an infinity, which orjson writes as null."""
+    if isinstance(data, float):
+        return not math.isfinite(data)
+    if isinstance(data, Decimal):
+        return not data.is_finite()
+    if isinstance(data, dict):
+        return any(_has_non_finite(key) or _has_non_finite(value) for key, value in data.items())
+    if isinstance(data, (list, tuple)):
+        return any(_has_non_finite(item) for item in data)
+    return False
+
+
+class ORJSONRenderer(JSONRenderer):
+    """
+    Drop-in replacement for JSONRenderer that encodes with orjson.
+
+    date/datetime/UUID, dict and list subclasses (OrderedDict, ReturnDict, ReturnList)
+    are encoded in C, Decimal takes a single float() call and anything else falls
+    back to DRF's JSONEncoder.
+
+    NaN and infinities raise ValueError like JSONRenderer with STRICT_JSON, or are left to
+    JSONRenderer (which writes NaN and Infinity) without it.
+    """
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+
+        renderer_context = renderer_context or {}
+        options = BASE_OPTIONS
+        # orjson only pretty prints with two spaces, any requested indent maps to that
+        if self.get_indent(accepted_media_type, renderer_context):
+            options |= orjson.OPT_INDENT_2
+
+        ret = orjson.dumps(data, default=_default, option=options)
+        # orjson writes them as null, only output with a null can hold any
+        if b'null' in ret and _has_non_finite(data):
+            if self.strict:
+                raise ValueError("Out of range float values are not JSON compliant")
+            return super().render(data, accepted_media_type, renderer_context)
+
+        # Keep the output a strict javascript subset, like JSONRenderer does
+        if b'\xe2\x80\xa8' in ret or b'\xe2\x80\xa9' in ret:
+            ret = ret.replace(b'\xe2\x80\xa8', b'\\u2028').replace(b'\xe2\x80\xa9', b'\\u2029')
+        return ret
+
+
+def sse_event(event, data):
+    """Encodes one Server-Sent Events message with a JSON payload."""
+    return b'event: ' + event.encode() + b'\ndata: ' + orjson.dumps(data, default=_default) + b'\n\n'
+
+
+class EventStreamRenderer(BaseRenderer):
+    """
+    Lets views negotiate text/event-stream (Accept header or ?format=sse).
+
+    Streaming views return their own StreamingHttpResponse, anything rendered here
+    (such as authentication or validation errors) is sent as a single "error" event.
+    """
+    media_type = 'text/event-stream'
+    format = 'sse'
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        return sse_event('error', data)
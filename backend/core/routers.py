@@ -0,0 +1,95 @@
+import random
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.contrib.auth import SESSION_KEY
+from django.db import DEFAULT_DB_ALIAS, connections
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import InvalidToken, TokenError
+from rest_framework_simplejwt.settings import api_settings as jwt_settings
+
+REPLICA_PREFIX = 'replica_'
+
+# Routing state of the request being handled, set by ReplicaPinningMiddleware
+_request_state = ContextVar('replica_routing', default=None)
+
+
+class _RequestState:
+    def __init__(self, pin_key, pinned):
+        self.pin_key = pin_key
+        self.pinned = pinned
+        self.wrote = False
+
+
+def replica_aliases():
+    return [alias for alias in settings.DATABASES if alias.startswith(REPLICA_PREFIX)]
+
+
+class ReplicaRouter:
+    """
+    Sends the reads of requests to a random replica (the DATABASES entries named replica_*)
+    and writes to default.
+
+    Reads go to the primary instead while the request has written something, inside an
+    atomic block on the primary, and for a few seconds after the same user wrote in an
+    earlier request (settings.DATABASE_REPLICA_STICKY_SECONDS), so users always read their
+    own writes even if the replicas lag behind.
+
+    Code running outside a request (management commands, background jobs and pools) reads
+    from the primary: it acts on what it reads. Reads that may lag pass the stale_ok=True
+    hint to router.db_for_read to use a replica anyway.
+    """
+
+    def db_for_read(self, model, **hints):
+        replicas = replica_aliases()
+        if not replicas:
+            return None
+        state = _request_state.get()
+        if state is None and not hints.get('stale_ok'):
+            return DEFAULT_DB_ALIAS
+        if state is not None and state.pinned:
+            return DEFAULT_DB_ALIAS
+        if connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return DEFAULT_DB_ALIAS
+        return random.choice(replicas)
+
+    def db_for_write(self, model, **hints):
+        state = _request_state.get()
+        if state is not None:
+            state.pinned = state.wrote = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replicas hold the same data as the primary
+        return True
+
+
+def pin_key(request):
+    """Cache key of the requesting user's primary pin, None for anonymous requests."""
+    authentication = JWTAuthentication()
+    header = authentication.get_header(request)
+    raw_token = authentication.get_raw_token(header) if header else None
+    if raw_token is not None:
+        # Only the signature is checked here, the user is loaded by the view's authentication
+        try:
+            user_id = authentication.get_validated_token(raw_token)[jwt_settings.USER_ID_CLAIM]
+        except (InvalidToken, TokenError, KeyError):
+            return None
+    elif settings.SESSION_COOKIE_NAME in request.COOKIES and hasattr(request, 'session'):
+        user_id = request.session.get(SESSION_KEY)
+    else:
+        return None
+    return f"db-pin:{user_id}" if user_id is not None else None
+
+
+def start_request(key, method, recently_wrote):
+    """Starts routing a request: writes and requests of users who just wrote read from the primary."""
+    pinned = method not in ('GET', 'HEAD', 'OPTIONS') or recently_wrote
+    _request_state.set(_RequestState(key, pinned))
+
+
+def finish_request():
+    """Ends routing a request, returns the pin key to store if the request wrote anything."""
+    state = _request_state.get()
+    _request_state.set(None)
+    return state.pin_key if state is not None and state.wrote else None
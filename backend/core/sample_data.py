@@ -0,0 +1,61 @@
+import random
+from collections import OrderedDict
+from datetime import date, timedelta
+from decimal import Decimal
+
+from django.contrib.auth.models import User
+
+from .constants import catagory_choices
+from .models import Transaction
+from .serializers import TransactionViewSerializer
+
+SAMPLE_DESCRIPTIONS = [
+    'Shwapno grocery run', 'House rent - Dhanmondi flat', 'Pathao ride to office',
+    'DESCO electricity bill', 'Grameenphone recharge', 'Salary payment',
+    'Star Kabab dinner', 'Square Hospital checkup', 'Bashundhara City shopping',
+]
+
+
+def build_sample_transactions(rows, user=None, seed=0):
+    """
+    Builds unsaved, realistic looking Transaction instances for benchmarks.
+
+    Args:
+        rows (int): Number of transactions to build
+        user (User, optional): Owner of the transactions, an unsaved user is used if omitted
+        seed (int): Random seed, so runs are comparable
+
+    Returns:
+        list: Transaction instances (not saved to the database)
+    """
+    rng = random.Random(seed)
+    if user is None:
+        user = User(id=1, username='benchmark', email='benchmark@example.com', first_name='Bench', last_name='Mark')
+    categories = [choice for choice, _ in catagory_choices]
+    start = date(2025, 1, 1)
+    return [
+        Transaction(
+            id=index + 1,
+            user=user,
+            date=start + timedelta(days=index % 365),
+            description=f"{rng.choice(SAMPLE_DESCRIPTIONS)} #{index}",
+            amount=Decimal(rng.randint(100, 15000000)) / 100,
+            category=rng.choice(categories),
+            is_recurring=index % 10 == 0,
+        )
+        for index in range(rows)
+    ]
+
+
+def build_sample_page(rows):
+    """Builds the response data of a DefaultPagination list page with totals."""
+    return OrderedDict([
+        ('count', rows),
+        ('total_pages', 1),
+        ('current_page', 1),
+        ('page_size', rows),
+        ('next', None),
+        ('previous', None),
+        ('results', TransactionViewSerializer(build_sample_transactions(rows), many=True).data),
+        ('totals', {'total_income': 1.0, 'total_expenses': 2.0, 'net_amount': -1.0, 'total_transactions': rows}),
+    ])
@@ -1,8 +1,14 @@
 from rest_framework import serializers
-from .models import Transaction, TransactionImage
+from .models import AnalyticsReport, Budget, RecurringSeries, SpendingAnomaly, SpendingForecast, Transaction, TransactionImage
+from .constants import MAX_BATCH_OPERATIONS, catagory_choices
+from .budgets import open_period
+from .category_memo import suggest_category
+from .duplicates import bulk_create_checked
+from .receipts import file_url
 
 from djoser.serializers import UserCreateSerializer,PasswordSerializer
 
+from django.conf import settings
 from django.contrib.auth.models import User
 
 class CustomUserCreateSerializer(UserCreateSerializer):
@@ -51,34 +57,74 @@ class TransactionSerializer(serializers.ModelSerializer):
         model = Transaction
         fields = ['id', 'user', 'date', 'description', 'amount', 'category', 'is_recurring']
 
-class TransactionViewSerializer(serializers.ModelSerializer):
+class SparseFieldsMixin:
+    """Lets a serializer be limited to a subset of its fields with fields=[...] / omit=[...]."""
+
+    def __init__(self, *args, fields=None, omit=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        if fields is not None:
+            for field_name in set(self.fields) - set(fields):
+                self.fields.pop(field_name)
+        for field_name in omit or ():
+            self.fields.pop(field_name, None)
+
+
+class TransactionViewSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     user = UserViewSerializer(read_only=True)
     class Meta:
         model = Transaction
-        fields = ['id', 'user', 'date', 'description', 'amount', 'category', 'is_recurring']
+        fields = ['id', 'user', 'date', 'description', 'amount', 'category', 'is_recurring', 'duplicate_of']
+    
+
+class TransactionCompactViewSerializer(SparseFieldsMixin, serializers.ModelSerializer):
+    # Only the user id per row, the user objects are sent once in the list envelope
+    user = serializers.PrimaryKeyRelatedField(read_only=True)
+    class Meta:
+        model = Transaction
+        fields = TransactionViewSerializer.Meta.fields
     
 
+class TransactionSyncSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Transaction
+        fields = ['id', 'user', 'date', 'description', 'amount', 'category', 'is_recurring', 'duplicate_of', 'updated_at']
+    
+
+class TransactionListCreateSerializer(serializers.ListSerializer):
+    # One bulk insert for the whole list, with duplicate detection (core.duplicates)
+    def create(self, validated_data):
+        user = self.context['request'].user
+        rows, self.duplicates = bulk_create_checked(
+            [Transaction(user=user, **item) for item in validated_data],
+            mode=self.context.get('duplicates'),
+        )
+        return [row for row in rows if row is not None]
+
+
 class TransactionCreateSerializer(serializers.ModelSerializer):
     date = serializers.DateField()
+    # Filled in from the user's history when left out (core.category_memo)
+    category = serializers.ChoiceField(choices=catagory_choices, required=False)
     class Meta:
         model = Transaction
-        fields = ['date', 'description', 'amount', 'category', 'is_recurring']
+        fields = ['date', 'description', 'amount', 'category', 'is_recurring', 'duplicate_of']
+        read_only_fields = ['duplicate_of']
+        list_serializer_class = TransactionListCreateSerializer
     
     def validate_amount(self, value):
         if value <= 0:
             raise serializers.ValidationError("Amount must be greater than zero.")
         return value
 
+    def validate(self, attrs):
+        if not attrs.get('category'):
+            suggestion = suggest_category(self.context['request'].user.pk, attrs.get('description', ''))
+            attrs['category'] = suggestion.category or 'miscellaneous'
+        return attrs
+
     def create(self, validated_data):
-        
-        user = self.context['request'].user
-        if isinstance(validated_data, list):
-            for item in validated_data:
-                item['user'] = user
-            return Transaction.objects.bulk_create([Transaction(**item) for item in validated_data])
-        else:
-            validated_data['user'] = user
-            return super().create(validated_data)
+        validated_data['user'] = self.context['request'].user
+        return super().create(validated_data)
 
 class TransactionUpdateSerializer(serializers.ModelSerializer):
     date = serializers.DateField(required=False)
@@ -93,7 +139,125 @@ class TransactionUpdateSerializer(serializers.ModelSerializer):
         return value
     
 
+class RecurringSeriesSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = RecurringSeries
+        fields = [
+            'id', 'description', 'category', 'period', 'interval_days', 'amount', 'amount_variation',
+            'occurrences', 'first_date', 'last_date', 'next_date', 'confidence',
+        ]
+
+
+class BudgetSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Budget
+        fields = ['id', 'category', 'period', 'limit', 'warning_percent', 'period_start', 'spent', 'state', 'state_changed_at']
+        read_only_fields = ['period_start', 'spent', 'state', 'state_changed_at']
+
+    def validate_category(self, value):
+        if value == 'income':
+            raise serializers.ValidationError("Budgets limit spending, income cannot have one.")
+        return value
+
+    def validate_limit(self, value):
+        if value <= 0:
+            raise serializers.ValidationError("Limit must be greater than zero.")
+        return value
+
+    def validate_warning_percent(self, value):
+        if not 1 <= value <= 100:
+            raise serializers.ValidationError("Warning percent must be between 1 and 100.")
+        return value
+
+    def validate(self, attrs):
+        instance = self.instance
+        category = attrs.get('category', instance.category if instance else None)
+        period = attrs.get('period', instance.period if instance else 'monthly')
+        others = Budget.objects.filter(user=self.context['request'].user, category=category, period=period)
+        if instance is not None:
+            others = others.exclude(pk=instance.pk)
+        if others.exists():
+            raise serializers.ValidationError(f"There already is a {period} budget for {category}.")
+        return attrs
+
+    def create(self, validated_data):
+        budget = Budget(**validated_data)
+        open_period(budget)
+        budget.save()
+        return budget
+
+    def update(self, instance, validated_data):
+        for field, value in validated_data.items():
+            setattr(instance, field, value)
+        # Category, period or limit may have changed, count the period again once
+        open_period(instance)
+        instance.save()
+        return instance
+
+
+class SpendingAnomalySerializer(serializers.ModelSerializer):
+    class Meta:
+        model = SpendingAnomaly
+        fields = ['id', 'kind', 'transaction_id', 'category', 'date', 'description', 'amount', 'baseline', 'score', 'detected_at']
+
+
+class SpendingForecastSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = SpendingForecast
+        fields = [
+            'month', 'as_of', 'income_to_date', 'expenses_to_date', 'projected_income', 'projected_expenses',
+            'categories', 'history_months', 'computed_at',
+        ]
+
+
+class AnalyticsReportSerializer(serializers.ModelSerializer):
+    requested_by = serializers.SlugRelatedField(slug_field='username', read_only=True)
+
+    class Meta:
+        model = AnalyticsReport
+        fields = ['id', 'months', 'status', 'requested_by', 'error', 'created_at', 'started_at', 'finished_at']
+
+
+class AnalyticsReportDetailSerializer(AnalyticsReportSerializer):
+    class Meta(AnalyticsReportSerializer.Meta):
+        fields = [*AnalyticsReportSerializer.Meta.fields, 'result']
+
+
 class TransactionImageSerializer(serializers.ModelSerializer):
+    # Signed URLs, see core.receipts.file_url
+    url = serializers.SerializerMethodField()
+    thumbnails = serializers.SerializerMethodField()
+
     class Meta:
         model = TransactionImage
-        fields = ['id', 'image']
\ No newline at end of file
+        fields = ['id', 'sha256', 'content_type', 'size', 'width', 'height', 'created_at', 'url', 'thumbnails']
+
+    def get_url(self, obj):
+        return file_url(self.context.get('request'), obj)
+
+    def get_thumbnails(self, obj):
+        # Every size, thumbnails that are not made yet are made when first requested
+        request = self.context.get('request')
+        return {str(size): file_url(request, obj, size) for size in settings.RECEIPTS['THUMBNAIL_SIZES']}
+
+class TransactionBatchOperationSerializer(serializers.Serializer):
+    op = serializers.ChoiceField(choices=['create', 'update', 'delete'])
+    id = serializers.IntegerField(required=False)
+    data = serializers.DictField(required=False)
+
+    def validate(self, attrs):
+        if attrs['op'] in ('update', 'delete') and attrs.get('id') is None:
+            raise serializers.ValidationError({'id': f"This field is required for '{attrs['op']}' operations."})
+        if attrs['op'] in ('create', 'update') and not attrs.get('data'):
+            raise serializers.ValidationError({'data': f"This field is required for '{attrs['op']}' operations."})
+        return attrs
+
+
+class TransactionBatchSerializer(serializers.Serializer):
+    operations = TransactionBatchOperationSerializer(many=True, allow_empty=False)
+    atomic = serializers.BooleanField(default=True)
+
+    def validate_operations(self, value):
+        if len(value) > MAX_BATCH_OPERATIONS:
+            raise serializers.ValidationError(f"A batch can contain at most {MAX_BATCH_OPERATIONS} operations.")
+        return value
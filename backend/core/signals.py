@@ -0,0 +1,30 @@
+from typing import NamedTuple, Optional
+
+from django.dispatch import Signal
+
+# Transaction fields whose old and new values are reported to receivers
+TRACKED_FIELDS = ('date', 'description', 'amount', 'category', 'is_recurring')
+
+
+class TransactionChange(NamedTuple):
+    """
+    One written Transaction row.
+
+    old and new map TRACKED_FIELDS to values, old is None for created rows and new is
+    None for deleted ones.
+    """
+    id: int
+    user_id: int
+    old: Optional[dict]
+    new: Optional[dict]
+
+
+# Sent with changes=[TransactionChange, ...] after Transaction rows were written by save(),
+# delete() or any of the bulk QuerySet paths (bulk_create, bulk_update, update, delete).
+# It is sent inside the writing database transaction, receivers that keep state outside
+# the database should apply it with transaction.on_commit.
+transactions_changed = Signal()
+
+# Sent with budget, old_state and new_state after a write moved a Budget between the
+# ok, warning and exceeded states (core.budgets), once the write is committed.
+budget_state_changed = Signal()
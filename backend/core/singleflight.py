@@ -0,0 +1,226 @@
+import hashlib
+import json
+import logging
+import os
+import stat
+import tempfile
+import threading
+import time
+from collections import Counter
+from pathlib import Path
+
+import orjson
+from django.conf import settings
+
+from .renderers import BASE_OPTIONS, _default
+
+# File locks are only available on POSIX, elsewhere coalescing stays within the process
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+# Stored results start with the type they hold, only JSON values and bytes are shared across processes
+_JSON = b'j'
+_BYTES = b'b'
+
+
+def coalescing_key(user_id, operation, params, *data):
+    """
+    Builds the single-flight key for an expensive computation.
+
+    The data the computation runs on is part of the key, so any change to the user's
+    transactions (the data version) starts a new computation instead of sharing a stale one.
+    """
+    payload = json.dumps([user_id, operation, params, data], sort_keys=True, default=str)
+    return f"{operation}-{hashlib.sha256(payload.encode()).hexdigest()}"
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """
+    Runs one computation per key at a time and hands its result to every concurrent caller.
+
+    Within a process, callers with the same key wait for the thread that started the
+    computation. Across processes, the first caller holds an exclusive file lock for the
+    key and stores the result next to it for result_ttl seconds, so callers that were
+    blocked on the lock in other workers read the stored result instead of recomputing it.
+
+    Stored results are JSON (or raw bytes), never pickles. lock_dir must be a private
+    directory of the user running the workers, one that is a symlink, owned by another
+    user or accessible to group or others is refused and coalescing stays in-process.
+    Exceptions are not stored, a failed computation is retried by the next caller.
+
+    Args:
+        lock_dir (str, optional): Directory for lock and result files, None keeps coalescing in-process
+        result_ttl (float): How long a stored result can be picked up by other processes
+    """
+
+    def __init__(self, lock_dir=None, result_ttl=5.0):
+        self.lock_dir = _private_directory(Path(lock_dir)) if lock_dir and fcntl is not None else None
+        self.result_ttl = result_ttl
+        self._lock = threading.Lock()
+        self._calls = {}
+        self._stats = Counter()
+        self._last_sweep = 0.0
+
+    def do(self, key, fn):
+        """
+        Returns fn()'s result, computing it at most once for concurrent callers with the same key.
+
+        Returns:
+            tuple: (result, True if the result was computed by another caller)
+        """
+        operation = key.split('-', 1)[0]
+        with self._lock:
+            self._stats[(operation, 'requests')] += 1
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+
+        if not leader:
+            call.done.wait()
+            with self._lock:
+                self._stats[(operation, 'coalesced_in_process')] += 1
+            if call.error is not None:
+                raise call.error
+            return call.result, True
+
+        try:
+            call.result, shared = self._run_across_processes(key, operation, fn)
+            return call.result, shared
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            call.done.set()
+            with self._lock:
+                del self._calls[key]
+
+    def _run_across_processes(self, key, operation, fn):
+        if self.lock_dir is None:
+            return self._execute(operation, fn), False
+
+        lock_path = self.lock_dir / f"{key}.lock"
+        result_path = self.lock_dir / f"{key}.result"
+        with open(lock_path, 'a') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            # Keeps the lock file from being swept while it is in use
+            os.utime(lock_path)
+            try:
+                result = self._read_result(result_path)
+                if result is not None:
+                    with self._lock:
+                        self._stats[(operation, 'coalesced_across_processes')] += 1
+                    return result[0], True
+
+                value = self._execute(operation, fn)
+                self._write_result(result_path, value)
+                return value, False
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+                self._sweep()
+
+    def _sweep(self):
+        # Drop expired results, and lock files that have not been used for an hour
+        now = time.time()
+        if now - self._last_sweep < 60:
+            return
+        self._last_sweep = now
+        for entry in os.scandir(self.lock_dir):
+            max_age = self.result_ttl if entry.name.endswith('.result') else 3600
+            try:
+                if now - entry.stat().st_mtime > max_age:
+                    os.unlink(entry.path)
+            except FileNotFoundError:
+                pass
+
+    def _execute(self, operation, fn):
+        with self._lock:
+            self._stats[(operation, 'executed')] += 1
+        return fn()
+
+    def _read_result(self, path):
+        try:
+            if time.time() - path.stat().st_mtime > self.result_ttl:
+                path.unlink(missing_ok=True)
+                return None
+            with open(path, 'rb') as result_file:
+                data = result_file.read()
+            if data[:1] == _BYTES:
+                return (data[1:],)
+            if data[:1] == _JSON:
+                return (orjson.loads(data[1:]),)
+            raise ValueError("unknown result type")
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError):
+            # orjson.JSONDecodeError is a ValueError
+            logger.warning("Discarding unreadable single-flight result %s", path)
+            return None
+
+    def _write_result(self, path, value):
+        try:
+            data = _BYTES + value if isinstance(value, bytes) else _JSON + orjson.dumps(value, default=_default, option=BASE_OPTIONS)
+        except TypeError:
+            # Other processes compute it themselves
+            logger.warning("Single-flight result %s is not JSON serializable, not storing it", path)
+            return
+        try:
+            with tempfile.NamedTemporaryFile(dir=self.lock_dir, delete=False) as tmp:
+                tmp.write(data)
+            os.replace(tmp.name, path)
+        except OSError:
+            logger.warning("Could not store single-flight result %s", path, exc_info=True)
+
+    def stats(self):
+        """Per-operation counters of this process since it started."""
+        with self._lock:
+            report = {}
+            for (operation, counter), value in self._stats.items():
+                report.setdefault(operation, {})[counter] = value
+            return report
+
+
+def _private_directory(path):
+    """
+    Creates path with mode 0700 if it is missing.
+
+    Returns:
+        Path: path, or None if it is not a directory only the current user can write to
+    """
+    try:
+        path.mkdir(mode=0o700, parents=True, exist_ok=True)
+        info = os.lstat(path)
+    except OSError:
+        logger.warning("Could not create single-flight directory %s, coalescing per process", path, exc_info=True)
+        return None
+    if not stat.S_ISDIR(info.st_mode) or info.st_uid != os.geteuid() or info.st_mode & 0o077:
+        logger.warning(
+            "Single-flight directory %s is not a private directory of this user, coalescing per process", path
+        )
+        return None
+    return path
+
+
+_single_flight = None
+_single_flight_lock = threading.Lock()
+
+
+def get_single_flight():
+    """Returns the process wide SingleFlight configured by settings.SINGLE_FLIGHT."""
+    global _single_flight
+    with _single_flight_lock:
+        if _single_flight is None:
+            config = settings.SINGLE_FLIGHT
+            _single_flight = SingleFlight(config['LOCK_DIR'], config['RESULT_TTL'])
+        return _single_flight
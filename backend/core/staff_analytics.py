@@ -0,0 +1,405 @@
+import logging
+import math
+import threading
+import time
+from collections import defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db import close_old_connections, connections, router, transaction as db_transaction
+from django.db.models import Count, FloatField, Q, Sum
+from django.db.models.expressions import RawSQL
+from django.db.models.functions import Cast, TruncMonth
+from django.utils import timezone
+
+from .forecast import months_before
+from .models import AnalyticsReport, Transaction
+
+logger = logging.getLogger(__name__)
+
+MAX_MONTHS = 36
+QUANTILES = (0.5, 0.9, 0.99)
+# Spacing of the quantile grid PostgreSQL computes for a sample, QUANTILES are points of it
+QUANTILE_STEP = 0.005
+# Margins and quantile ranges are 95% confidence intervals
+Z_95 = 1.96
+# Knuth's multiplicative hash, samples users where TABLESAMPLE is not available. The seed
+# moves the sampled window by a multiple of a second odd constant, so every seed draws other users
+HASH_MULTIPLIER = 2654435761
+SEED_MULTIPLIER = 2246822519
+HASH_RANGE = 2 ** 32
+
+
+def window(months, today=None):
+    """The first and last day covered: the last months months, the current one included."""
+    today = today or timezone.localdate()
+    return months_before(today.replace(day=1), months - 1), today
+
+
+def month_keys(start, end):
+    keys = []
+    month = start
+    while month <= end:
+        keys.append(f"{month:%Y-%m}")
+        month = month.replace(year=month.year + month.month // 12, month=month.month % 12 + 1)
+    return keys
+
+
+def estimated_rows(connection):
+    """Rows of core_transaction, from the planner's statistics on PostgreSQL and counted elsewhere."""
+    table = Transaction._meta.db_table
+    if connection.vendor != 'postgresql':
+        return Transaction.objects.using(connection.alias).count()
+    with connection.cursor() as cursor:
+        # A partitioned table has no statistics of its own, its partitions do (core.partitioning)
+        cursor.execute(
+            "SELECT COALESCE(SUM(GREATEST(reltuples, 0)), 0) FROM pg_class WHERE oid = to_regclass(%s) "
+            "OR oid IN (SELECT inhrelid FROM pg_inherits WHERE inhparent = to_regclass(%s))",
+            [table, table],
+        )
+        return int(cursor.fetchone()[0])
+
+
+def sampled_users(connection, fraction, seed):
+    """
+    SQL selecting each user's id independently with probability fraction.
+
+    Returns:
+        RawSQL: For a user_id__in filter
+    """
+    table = User._meta.db_table
+    if connection.vendor == 'postgresql':
+        # BERNOULLI samples rows rather than pages, the user table is small next to the transactions
+        return RawSQL(f"SELECT id FROM {table} TABLESAMPLE BERNOULLI (%s) REPEATABLE (%s)", [fraction * 100, seed])
+    return RawSQL(
+        f"SELECT id FROM {table} WHERE (id * {HASH_MULTIPLIER} + %s) %% {HASH_RANGE} < %s",
+        [seed * SEED_MULTIPLIER % HASH_RANGE, int(fraction * HASH_RANGE)],
+    )
+
+
+def _interval(value, margin=0.0):
+    return {'value': round(value, 2), 'margin': round(margin, 2)}
+
+
+class _Estimates:
+    """
+    Totals estimated from a sample of users, with their 95% margin.
+
+    Users are sampled independently with probability fraction, so the Horvitz-Thompson
+    estimate of a total is the sampled users' sum / fraction, with a variance of
+    (1 - fraction) / fraction² times the sum of every sampled user's squared contribution.
+    A user's transactions stay together, which keeps the margins honest for users with
+    many similar rows. They still rely on a normal approximation: when a few users account
+    for much of a total, small samples cover the true value less often than 95%. With
+    fraction 1 every margin is 0.
+    """
+
+    def __init__(self, fraction):
+        self.fraction = fraction
+        self.contributions = defaultdict(lambda: defaultdict(float))
+
+    def add(self, key, user_id, value):
+        self.contributions[key][user_id] += value
+
+    def mark(self, key, user_id):
+        # Counts the user once, however many rows they have
+        self.contributions[key][user_id] = 1.0
+
+    def get(self, key):
+        values = self.contributions.get(key, {}).values()
+        squares = sum(value * value for value in values)
+        fraction = self.fraction
+        return _interval(sum(values) / fraction, Z_95 * math.sqrt((1 - fraction) * squares) / fraction)
+
+
+def _quantiles(amounts, units=None):
+    """
+    p50, p90 and p99 of amounts as {"value", "low", "high"}.
+
+    units is the number of independent sampled users behind the amounts, the ranges widen
+    by the rank error of a sample of that size. None means the amounts are complete.
+    """
+    # Imported here, NumPy is only needed once analytics are computed
+    import numpy as np
+
+    values = np.asarray(amounts, dtype=np.float64)
+    result = {}
+    for quantile in QUANTILES:
+        name = f"p{round(quantile * 100)}"
+        if not len(values):
+            result[name] = None
+            continue
+        error = Z_95 * math.sqrt(quantile * (1 - quantile) / units) if units else 0
+        low, value, high = np.quantile(values, [max(0.0, quantile - error), quantile, min(1.0, quantile + error)])
+        result[name] = {'value': round(float(value), 2), 'low': round(float(low), 2), 'high': round(float(high), 2)}
+    return result
+
+
+def _report(mode, start, end, estimates, distribution, new_users, **extra):
+    months = month_keys(start, end)
+    categories = sorted({key[1] for key in estimates.contributions if key[0] == 'category'})
+    return {
+        'mode': mode,
+        'from': start.isoformat(),
+        'to': end.isoformat(),
+        **extra,
+        'totals': {name: estimates.get((name,)) for name in ('transactions', 'income', 'expenses', 'active_users')},
+        'categories': [
+            {
+                'category': category,
+                'transactions': estimates.get(('category', category, 'transactions')),
+                'amount': estimates.get(('category', category, 'amount')),
+            }
+            for category in categories
+        ],
+        'distribution': distribution,
+        'growth': [
+            {
+                'month': month,
+                'active_users': estimates.get(('month', month, 'active_users')),
+                'new_users': new_users.get(month, 0),
+                'transactions': estimates.get(('month', month, 'transactions')),
+                'income': estimates.get(('month', month, 'income')),
+                'expenses': estimates.get(('month', month, 'expenses')),
+            }
+            for month in months
+        ],
+        'computed_at': timezone.now().isoformat(),
+    }
+
+
+def _new_users(alias, start):
+    # Sign-ups are counted exactly, the user table is small next to the transactions
+    joined = (
+        User.objects.using(alias).filter(date_joined__date__gte=start)
+        .annotate(month=TruncMonth('date_joined')).values('month').annotate(users=Count('id')).order_by()
+    )
+    return {f"{row['month']:%Y-%m}": row['users'] for row in joined}
+
+
+def _sampled_quantiles(connection, rows, units):
+    """
+    _quantiles of the sampled rows' amounts per category and for all expenses.
+
+    PostgreSQL ranks the amounts itself: percentile_cont returns a grid of quantiles every
+    QUANTILE_STEP, and the ranges are read from the grid points just outside them, so
+    they are never narrower than the rank error. Elsewhere the amounts are fetched.
+    """
+    if connection.vendor != 'postgresql':
+        groups = defaultdict(list)
+        # Read as floats, Decimal conversion would cost more than the ranking
+        for category, amount in rows.values_list('category', Cast('amount', FloatField())).iterator(10000):
+            groups[category].append(amount)
+            if category != 'income':
+                groups['expenses'].append(amount)
+        return {group: _quantiles(values, units[group]) for group, values in sorted(groups.items())}
+
+    steps = round(1 / QUANTILE_STEP)
+    grid = [step / steps for step in range(steps + 1)]
+    sql, params = rows.values('category', 'amount').query.sql_with_params()
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"WITH sampled AS ({sql}) "
+            "SELECT category, percentile_cont(%s::float8[]) WITHIN GROUP (ORDER BY amount) FROM sampled GROUP BY category "
+            "UNION ALL SELECT 'expenses', percentile_cont(%s::float8[]) WITHIN GROUP (ORDER BY amount) FROM sampled "
+            "WHERE category <> 'income'",
+            [*params, grid, grid],
+        )
+        result = {}
+        for group, values in cursor.fetchall():
+            if values is None or values[0] is None:
+                result[group] = {f"p{round(quantile * 100)}": None for quantile in QUANTILES}
+                continue
+            result[group] = {}
+            for quantile in QUANTILES:
+                error = Z_95 * math.sqrt(quantile * (1 - quantile) / units[group]) if units[group] else 0
+                low = values[max(0, math.floor((quantile - error) * steps))]
+                high = values[min(steps, math.ceil((quantile + error) * steps))]
+                value = values[round(quantile * steps)]
+                result[group][f"p{round(quantile * 100)}"] = {
+                    'value': round(value, 2), 'low': round(low, 2), 'high': round(high, 2)
+                }
+    return dict(sorted(result.items()))
+
+
+def approximate_analytics(months, seed=None, today=None):
+    """
+    Staff analytics of the last months months from a sample of users.
+
+    Users are sampled (TABLESAMPLE BERNOULLI on PostgreSQL, a hash of the id elsewhere) so
+    that about STAFF_ANALYTICS['SAMPLE_ROWS'] transactions are read, and all of a sampled
+    user's transactions in the window are aggregated. The database sums them per user,
+    month and category, and the estimates are built from those sums. Totals come with a
+    95% margin, quantiles with a 95% range; active users are counted exactly within the
+    sample, so no distinct-count sketch is needed.
+
+    Args:
+        months (int): Months covered, up to and including the current one
+        seed (int, optional): Sample seed, the same seed draws the same users (default: today)
+        today (date, optional): Last day covered
+
+    Returns:
+        dict: See _report, with the sample's fraction, users and rows
+    """
+    started = time.perf_counter()
+    today = today or timezone.localdate()
+    start, end = window(months, today)
+    # Estimates of the last months, a lagging replica is fine
+    alias = router.db_for_read(Transaction, stale_ok=True)
+    connection = connections[alias]
+    total_rows = estimated_rows(connection)
+    fraction = min(1.0, settings.STAFF_ANALYTICS['SAMPLE_ROWS'] / total_rows) if total_rows else 1.0
+    seed = today.toordinal() if seed is None else seed
+
+    rows = Transaction.objects.using(alias).filter(date__gte=start, date__lte=end).order_by()
+    if fraction < 1:
+        rows = rows.filter(user_id__in=sampled_users(connection, fraction, seed))
+    estimates = _Estimates(fraction)
+    users = defaultdict(set)
+    count = 0
+    sums = (
+        rows.annotate(month=TruncMonth('date')).values('user_id', 'month', 'category')
+        .annotate(count=Count('id'), amount=Sum('amount'))
+    )
+    for row in sums:
+        user_id, category, transactions = row['user_id'], row['category'], row['count']
+        amount = float(row['amount'])
+        count += transactions
+        side = 'income' if category == 'income' else 'expenses'
+        for scope in ((), ('month', f"{row['month']:%Y-%m}")):
+            estimates.add((*scope, 'transactions'), user_id, transactions)
+            estimates.add((*scope, side), user_id, amount)
+            estimates.mark((*scope, 'active_users'), user_id)
+        estimates.add(('category', category, 'transactions'), user_id, transactions)
+        estimates.add(('category', category, 'amount'), user_id, amount)
+        for group in (category, 'expenses') if side == 'expenses' else (category,):
+            users[group].add(user_id)
+
+    exact = fraction >= 1
+    units = defaultdict(lambda: None) if exact else {group: len(members) for group, members in users.items()}
+    distribution = _sampled_quantiles(connection, rows, units) if count else {}
+    return _report(
+        'approximate', start, end, estimates, distribution, _new_users(alias, start),
+        sample={
+            'fraction': fraction,
+            'seed': seed,
+            'users': len(estimates.contributions.get(('active_users',), {})),
+            'rows': count,
+        },
+        duration_ms=round((time.perf_counter() - started) * 1000, 1),
+    )
+
+
+def _exact_quantiles(connection, rows, start, end):
+    groups = defaultdict(list)
+    if connection.vendor != 'postgresql':
+        for category, amount in rows.values_list('category', 'amount').iterator(10000):
+            groups[category].append(float(amount))
+            if category != 'income':
+                groups['expenses'].append(float(amount))
+        return {group: _quantiles(values) for group, values in sorted(groups.items())}
+
+    table = Transaction._meta.db_table
+    quantiles = list(QUANTILES)
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"SELECT category, percentile_cont(%s::float8[]) WITHIN GROUP (ORDER BY amount) FROM {table} "
+            "WHERE date >= %s AND date <= %s GROUP BY category "
+            f"UNION ALL SELECT 'expenses', percentile_cont(%s::float8[]) WITHIN GROUP (ORDER BY amount) FROM {table} "
+            "WHERE date >= %s AND date <= %s AND category <> 'income'",
+            [quantiles, start, end, quantiles, start, end],
+        )
+        result = {}
+        for group, values in cursor.fetchall():
+            result[group] = {
+                f"p{round(quantile * 100)}": None if value is None else {
+                    'value': round(value, 2), 'low': round(value, 2), 'high': round(value, 2)
+                }
+                for quantile, value in zip(QUANTILES, values or [None] * len(QUANTILES))
+            }
+    return dict(sorted(result.items()))
+
+
+def exact_analytics(months, today=None):
+    """
+    approximate_analytics over every transaction, with zero margins.
+
+    Aggregated and ranked by the database (percentile_cont on PostgreSQL), meant to run in
+    the background: see run_report.
+    """
+    started = time.perf_counter()
+    start, end = window(months, today)
+    # Run from a command or a background thread, still a report over the past
+    alias = router.db_for_read(Transaction, stale_ok=True)
+    rows = Transaction.objects.using(alias).filter(date__gte=start, date__lte=end).order_by()
+
+    estimates = _Estimates(1.0)
+    by_month = rows.annotate(month=TruncMonth('date'))
+    # Totals are added under a placeholder user, _Estimates only needs their sum
+    for row in by_month.values('month', 'category').annotate(count=Count('id'), amount=Sum('amount')):
+        month, category = f"{row['month']:%Y-%m}", row['category']
+        amount = float(row['amount'])
+        side = 'income' if category == 'income' else 'expenses'
+        for scope in ((), ('month', month)):
+            estimates.add((*scope, 'transactions'), 0, row['count'])
+            estimates.add((*scope, side), 0, amount)
+        estimates.add(('category', category, 'transactions'), 0, row['count'])
+        estimates.add(('category', category, 'amount'), 0, amount)
+    for row in by_month.values('month').annotate(users=Count('user_id', distinct=True)):
+        estimates.add(('month', f"{row['month']:%Y-%m}", 'active_users'), 0, row['users'])
+    estimates.add(('active_users',), 0, rows.aggregate(users=Count('user_id', distinct=True))['users'])
+
+    distribution = _exact_quantiles(connections[alias], rows, start, end)
+    return _report(
+        'exact', start, end, estimates, distribution, _new_users(alias, start),
+        duration_ms=round((time.perf_counter() - started) * 1000, 1),
+    )
+
+
+def claimable_reports():
+    """
+    Reports no runner is working on: queued ones, and running ones started more than
+    STAFF_ANALYTICS['RUNNING_TIMEOUT'] seconds ago, whose runner died with its worker.
+    """
+    stale = timezone.now() - timedelta(seconds=settings.STAFF_ANALYTICS['RUNNING_TIMEOUT'])
+    return AnalyticsReport.objects.filter(Q(status='queued') | Q(status='running', started_at__lt=stale))
+
+
+def run_report(report_id):
+    """Computes a queued (or abandoned, see claimable_reports) AnalyticsReport, recording the result or the error on it."""
+    # Claimed with a conditional update, a report is never run by two live runners
+    claimed = claimable_reports().filter(id=report_id).update(status='running', started_at=timezone.now())
+    if not claimed:
+        return None
+    report = AnalyticsReport.objects.get(id=report_id)
+    try:
+        report.result = exact_analytics(report.months, today=timezone.localdate(report.created_at))
+        report.status = 'done'
+    except Exception as exc:
+        logger.exception("Analytics report %s failed", report_id)
+        report.status, report.error = 'failed', repr(exc)[:255]
+    report.finished_at = timezone.now()
+    report.save(update_fields=['status', 'result', 'error', 'finished_at'])
+    return report
+
+
+def _run_in_background(report_id):
+    try:
+        run_report(report_id)
+    finally:
+        close_old_connections()
+
+
+def queue_report(months, user=None):
+    """
+    Queues an exact report and starts it on a background thread once the request commits.
+
+    A report left queued or running by a worker that went away is picked up by
+    compute_staff_analytics --queued.
+    """
+    report = AnalyticsReport.objects.create(months=months, requested_by=user)
+    db_transaction.on_commit(lambda: threading.Thread(
+        target=_run_in_background, args=(report.id,), name='staff-analytics', daemon=True
+    ).start())
+    return report
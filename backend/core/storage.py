@@ -0,0 +1,54 @@
+import os
+import tempfile
+
+from django.conf import settings
+from django.core.files.storage import FileSystemStorage
+
+
+class ContentAddressedStorage(FileSystemStorage):
+    """
+    Stores files under names derived from their content, so a name that exists already
+    holds the same bytes: saving it again writes nothing, and names are never altered.
+
+    Files are written to a temporary name and moved into place, a concurrent reader never
+    sees half a file.
+    """
+
+    def get_available_name(self, name, max_length=None):
+        return name
+
+    def _save(self, name, content):
+        full_path = self.path(name)
+        if os.path.exists(full_path):
+            return name
+        directory = os.path.dirname(full_path)
+        os.makedirs(directory, exist_ok=True)
+        with tempfile.NamedTemporaryFile(dir=directory, prefix='.upload-', delete=False) as temporary:
+            for chunk in content.chunks():
+                temporary.write(chunk)
+        os.chmod(temporary.name, self.file_permissions_mode or 0o644)
+        os.replace(temporary.name, full_path)
+        return name
+
+
+class ReceiptStorage(ContentAddressedStorage):
+    """Receipt images, outside MEDIA_ROOT so they are only reachable through the API's ownership checks."""
+
+    # Read on every use rather than once, like MEDIA_ROOT for the default storage
+    @property
+    def base_location(self):
+        return settings.RECEIPTS['ROOT']
+
+    @property
+    def location(self):
+        return os.path.abspath(self.base_location)
+
+
+def receipt_storage():
+    return ReceiptStorage()
+
+
+def receipt_path(instance, filename):
+    """<user id>/<first two hex digits>/<sha256>.<extension> in RECEIPTS['ROOT'], see core.receipts.store_receipt."""
+    extension = os.path.splitext(filename)[1].lower()
+    return f"{instance.user_id}/{instance.sha256[:2]}/{instance.sha256}{extension}"
@@ -0,0 +1,145 @@
+import base64
+
+from django.db.models import Q
+
+from .models import SyncSequence, TransactionTombstone
+
+# Kinds share one ordered stream: (sequence number, kind, id)
+UPSERT = 0
+DELETE = 1
+
+START = (0, UPSERT, 0)
+# Tokens carry their format, the older timestamp tokens are answered with a full resync
+TOKEN_VERSION = 2
+
+
+class InvalidSyncToken(ValueError):
+    pass
+
+
+class ExpiredSyncToken(InvalidSyncToken):
+    pass
+
+
+def encode_token(cursor, floor):
+    seq, kind, row_id = cursor
+    raw = f"{TOKEN_VERSION}:{seq}:{kind}:{row_id}:{floor}"
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_token(token):
+    """
+    Turns a token back into (cursor, floor), (START, None) without one.
+
+    The floor is the first sequence number whose tombstones the client must not miss: it
+    holds no row deleted before that.
+
+    Raises:
+        ExpiredSyncToken: For a token of an older format
+        InvalidSyncToken: If the token is malformed
+    """
+    if not token:
+        return START, None
+    try:
+        raw = base64.urlsafe_b64decode(token + '=' * (-len(token) % 4)).decode()
+        parts = [int(part) for part in raw.split(':')]
+    except (ValueError, UnicodeDecodeError):
+        raise InvalidSyncToken("Invalid sync token.")
+    if len(parts) == 3:
+        raise ExpiredSyncToken("Sync token expired, a full resync is required.")
+    if len(parts) != 5 or parts[0] != TOKEN_VERSION or parts[2] not in (UPSERT, DELETE) or min(parts) < 0:
+        raise InvalidSyncToken("Invalid sync token.")
+    return tuple(parts[1:4]), parts[4]
+
+
+def stream_position(user):
+    """
+    (last sequence number taken, last pruned one) of the user's change stream.
+
+    Read before the changes: every write numbered up to the first value has committed.
+    """
+    row = SyncSequence.objects.filter(user=user).values_list('value', 'pruned').first()
+    return row or (0, 0)
+
+
+def changes_since(user, transactions_qs, token, limit):
+    """
+    The user's changes after a sync token, see fetch_changes.
+
+    Returns:
+        tuple: (changed transactions, deleted transaction ids, next token, has_more)
+
+    Raises:
+        ExpiredSyncToken: If tombstones the client needs were pruned, it has to resync
+        InvalidSyncToken: If the token is malformed
+    """
+    cursor, floor = decode_token(token)
+    position, pruned = stream_position(user)
+    if floor is None:
+        # A full sync holds no row that was deleted before it started
+        floor = position + 1
+    if pruned >= floor:
+        raise ExpiredSyncToken("Sync token expired, a full resync is required.")
+    changed, deleted, next_cursor, has_more = fetch_changes(
+        transactions_qs, tombstones_for(user), cursor, limit, position
+    )
+    if not has_more:
+        # Caught up, from here on every deletion matters
+        floor = next_cursor[0]
+    return changed, deleted, encode_token(next_cursor, floor), has_more
+
+
+def fetch_changes(transactions_qs, tombstones_qs, cursor, limit, position=0):
+    """
+    Collects rows changed and deleted after a sync cursor, oldest change first.
+
+    The cursor is a position in the user's change stream (SyncSequence). A write holds the
+    user's counter until it commits, so every change that is still to commit gets a higher
+    number than any change visible now and the next token can not pass it.
+
+    Args:
+        transactions_qs (QuerySet): The user's transactions
+        tombstones_qs (QuerySet): The user's tombstones
+        cursor (tuple): (sequence number, kind, id) of the last change the client has seen
+        limit (int): Maximum number of changes to return
+        position (int): The last sequence number taken (stream_position), the cursor of a
+            client that caught up moves past it
+
+    Returns:
+        tuple: (changed transactions, deleted transaction ids, next cursor, has_more)
+    """
+    seq, kind, row_id = cursor
+
+    upsert_after = Q(sync_seq__gt=seq)
+    if kind == UPSERT:
+        upsert_after |= Q(sync_seq=seq, id__gt=row_id)
+    delete_after = Q(sync_seq__gt=seq)
+    if kind == DELETE:
+        delete_after |= Q(sync_seq=seq, id__gt=row_id)
+    else:
+        delete_after |= Q(sync_seq=seq)
+
+    upserts = list(transactions_qs.filter(upsert_after).order_by('sync_seq', 'id')[:limit + 1])
+    tombstones = list(
+        tombstones_qs.filter(delete_after)
+        .order_by('sync_seq', 'id')
+        .values_list('sync_seq', 'id', 'transaction_id')[:limit + 1]
+    )
+
+    events = [((row.sync_seq, UPSERT, row.id), row) for row in upserts]
+    events += [((sync_seq, DELETE, tombstone_id), transaction_id) for sync_seq, tombstone_id, transaction_id in tombstones]
+    events.sort(key=lambda event: event[0])
+
+    has_more = len(events) > limit
+    events = events[:limit]
+
+    changed = [payload for key, payload in events if key[1] == UPSERT]
+    deleted = [payload for key, payload in events if key[1] == DELETE]
+    next_cursor = events[-1][0] if events else cursor
+    if not has_more:
+        next_cursor = max(next_cursor, (position + 1, UPSERT, 0))
+    return changed, deleted, next_cursor, has_more
+
+
+def tombstones_for(user):
+    return TransactionTombstone.objects.filter(user=user)
@@ -0,0 +1,144 @@
+import logging
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import DatabaseError
+from django.db.models import Count, Q, Sum
+from django.utils import timezone
+
+from .models import LLMCall
+
+logger = logging.getLogger(__name__)
+
+# Bounds of llm_report's arguments, as accepted from the staff report endpoint
+MAX_REPORT_DAYS = 366
+MAX_REPORT_TOP = 100
+
+
+class track_llm_call:
+    """
+    Context manager that records one Gemini call as an LLMCall row.
+
+    Latency is measured around the with block. Token counts are taken from the response's
+    usage_metadata via record_usage(). Exceptions are recorded as "error" and re-raised,
+    a streaming generator closed before it finished is recorded as "cancelled". Set
+    outcome to "parse_error" when the answer could not be used.
+
+    Args:
+        endpoint (str): Feature making the call, such as "analysis" or "image_to_transaction"
+        model (str): Gemini model name
+        prompt_size (int): Characters of text plus bytes of images in the prompt
+        user (User, optional): User the call is made for
+    """
+
+    def __init__(self, endpoint, model, prompt_size, user=None):
+        self.endpoint = endpoint
+        self.model = model
+        self.prompt_size = prompt_size
+        self.user = user if user is not None and user.is_authenticated else None
+        self.outcome = 'ok'
+        self.error = ''
+        self.usage = None
+
+    def __enter__(self):
+        self.started_at = timezone.now()
+        self.started = time.perf_counter()
+        return self
+
+    def record_usage(self, response):
+        usage = getattr(response, 'usage_metadata', None)
+        if usage is not None:
+            self.usage = usage
+
+    def __exit__(self, exc_type, exc, tb):
+        latency_ms = int((time.perf_counter() - self.started) * 1000)
+        if exc_type is GeneratorExit:
+            self.outcome = 'cancelled'
+        elif exc_type is not None:
+            if self.outcome == 'ok':
+                self.outcome = 'error'
+            self.error = str(exc)[:255]
+        if self.outcome == 'parse_error':
+            logger.warning("Gemini %s answer could not be parsed as JSON", self.endpoint)
+
+        try:
+            LLMCall.objects.create(
+                user=self.user,
+                endpoint=self.endpoint,
+                model=self.model,
+                started_at=self.started_at,
+                latency_ms=latency_ms,
+                prompt_size=self.prompt_size,
+                prompt_tokens=getattr(self.usage, 'prompt_token_count', None),
+                response_tokens=getattr(self.usage, 'candidates_token_count', None),
+                total_tokens=getattr(self.usage, 'total_token_count', None),
+                outcome=self.outcome,
+                error=self.error,
+            )
+        except DatabaseError:
+            # Telemetry must never break the request it measures
+            logger.exception("Could not record Gemini call telemetry")
+        return False
+
+
+def _percentile(queryset, count, fraction):
+    # Nearest-rank percentile, read with one ordered OFFSET query
+    if not count:
+        return None
+    index = min(count - 1, max(0, int(round(fraction * count)) - 1))
+    return queryset.order_by('latency_ms').values_list('latency_ms', flat=True)[index]
+
+
+def llm_report(days=7, top=10):
+    """
+    Summarizes the recorded Gemini calls of the last `days` days.
+
+    Returns:
+        dict: Per endpoint call counts, outcomes, latency percentiles and token sums,
+            plus the users with the highest token usage
+    """
+    since = timezone.now() - timedelta(days=days)
+    calls = LLMCall.objects.filter(started_at__gte=since)
+
+    endpoints = {}
+    rows = calls.values('endpoint').annotate(
+        calls=Count('id'),
+        ok=Count('id', filter=Q(outcome='ok')),
+        parse_errors=Count('id', filter=Q(outcome='parse_error')),
+        errors=Count('id', filter=Q(outcome='error')),
+        cancelled=Count('id', filter=Q(outcome='cancelled')),
+        prompt_tokens=Sum('prompt_tokens'),
+        response_tokens=Sum('response_tokens'),
+        total_tokens=Sum('total_tokens'),
+    ).order_by('endpoint')
+    for row in rows:
+        endpoint = row.pop('endpoint')
+        endpoint_calls = calls.filter(endpoint=endpoint)
+        endpoints[endpoint] = {
+            **row,
+            'latency_ms': {
+                'p50': _percentile(endpoint_calls, row['calls'], 0.50),
+                'p95': _percentile(endpoint_calls, row['calls'], 0.95),
+                'p99': _percentile(endpoint_calls, row['calls'], 0.99),
+            },
+        }
+
+    top_users = list(
+        calls.filter(user__isnull=False)
+        .values('user_id', 'user__username')
+        .annotate(calls=Count('id'), total_tokens=Sum('total_tokens'))
+        .order_by('-total_tokens', '-calls')[:top]
+    )
+    return {'since': since, 'endpoints': endpoints, 'top_users': top_users}
+
+
+def over_token_budget(user):
+    """True if the user has used up settings.LLM_DAILY_TOKEN_BUDGET in the last 24 hours."""
+    budget = settings.LLM_DAILY_TOKEN_BUDGET
+    if not budget:
+        return False
+    used = LLMCall.objects.filter(
+        user=user, started_at__gte=timezone.now() - timedelta(days=1)
+    ).aggregate(used=Sum('total_tokens'))['used'] or 0
+    return used >= budget
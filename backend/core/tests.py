@@ -1,3 +1,2235 @@
-from django.test import TestCase
+import base64
+import gzip
+import importlib
+import io
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import unittest
+import uuid
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from datetime import date, datetime, time as dt_time, timedelta, timezone as dt_timezone
+from decimal import Decimal
+from types import ModuleType
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import async_to_sync
+from django.apps import apps
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core import signing
+from django.core.cache import cache
+from django.core.management import call_command
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection, connections, models, router, transaction as db_transaction
+from django.http import HttpResponse, QueryDict, StreamingHttpResponse
+from django.test import RequestFactory, SimpleTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import include, path, resolve
+from django.utils import timezone
+from django.utils.translation import gettext_lazy
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import JSONParser
+from rest_framework.renderers import JSONRenderer
+from rest_framework.utils.serializer_helpers import ReturnDict, ReturnList
+from rest_framework.test import APIClient, APITestCase
+from rest_framework_simplejwt.tokens import AccessToken
+
+from . import anomalies, archive, autocomplete, category_memo, live, partitioning, profiling, receipts
+from .analysis import stream_transaction_analysis, transaction_analysis
+from .archive import archive_before
+from .async_views import AsyncTransactionView
+from .budgets import open_period, period_bounds, period_spent
+from .category_memo import build_global_features, correct_category, global_memo, suggest_category
+from .duplicates import MODES as DUPLICATE_MODES
+from .fake_gemini import FAKE_ANALYSIS, FAKE_RECEIPT
+from .fingerprints import normalize_description, series_key
+from .forecast import compute_forecast, months_before, refresh_forecast
+from .image_to_transaction import image_to_transaction
+from .middleware import CompressionMiddleware, ZstdEncoder, brotli, compress_stream, zstandard
+from .models import (
+    AnalyticsReport, AnomalyScan, Budget, LLMCall, RecurringSeries, SpendingAnomaly, SpendingForecast, Transaction,
+    TransactionArchive, TransactionImage, TransactionTombstone,
+)
+from .parsers import ORJSONParser
+from .renderers import ORJSONRenderer
+from .routers import finish_request, start_request
+from .sample_data import build_sample_transactions
+from .singleflight import SingleFlight
+from .staff_analytics import exact_analytics, run_report
+
+# Raise on slow machines (e.g. LATENCY_BUDGET_SCALE=3 on shared CI runners)
+LATENCY_SCALE = float(os.environ.get('LATENCY_BUDGET_SCALE', 1))
+
+
+def seed_transactions(user, rows, seed=0):
+    """Saves rows sample transactions of 2025 for user, see core.sample_data."""
+    transactions = build_sample_transactions(rows, user=user, seed=seed)
+    for transaction in transactions:
+        transaction.id = None
+    Transaction.objects.bulk_create(transactions, batch_size=1000)
+
+
+def receipt_image(color='white', size=(1200, 1600), image_format='JPEG'):
+    from PIL import Image
+
+    buffer = io.BytesIO()
+    Image.new('RGB', size, color).save(buffer, image_format)
+    return buffer.getvalue()
+
+
+class DeferredPool:
+    """Stands in for the thumbnail pool: jobs are recorded, a test thread must not run them."""
+
+    def __init__(self):
+        self.jobs = []
+
+    def submit(self, function, *args):
+        self.jobs.append((function, args))
+
+
+def clear_worker_caches():
+    """Per worker caches would otherwise leak warm state from one test into the next."""
+    category_memo._cache().clear()
+    category_memo._global_cache().clear()
+    autocomplete._cache().clear()
+    cache.clear()
+
+
+def isolate_receipts(test):
+    """Stores the test's receipts in a temporary directory, returns the DeferredPool its thumbnails go to."""
+    receipts_root = tempfile.TemporaryDirectory()
+    test.addCleanup(receipts_root.cleanup)
+    receipts_settings = override_settings(RECEIPTS={**settings.RECEIPTS, 'ROOT': receipts_root.name})
+    receipts_settings.enable()
+    test.addCleanup(receipts_settings.disable)
+    thumbnail_pool = DeferredPool()
+    pool_patch = mock.patch.object(receipts, 'thumbnail_pool', return_value=thumbnail_pool)
+    pool_patch.start()
+    test.addCleanup(pool_patch.stop)
+    return thumbnail_pool
+
+
+def describe_queries(queries):
+    return '\n'.join(
+        f"{number}. ({query['time']}s) {query['sql']}" for number, query in enumerate(queries, 1)
+    )
+
+
+@override_settings(GEMINI_BACKEND='fake', LLM_DAILY_TOKEN_BUDGET=0)
+class QueryBudgetTestCase(APITestCase):
+    """
+    Base class for query-count and latency budgets, what a feature does is tested in its own class.
+
+    Requests authenticate with a JWT like the frontend does, so the user lookup is part of
+    every count. on_commit callbacks run inside the measured block, they are part of what
+    a request costs in production.
+    """
+
+    def setUp(self):
+        clear_worker_caches()
+        self.thumbnail_pool = isolate_receipts(self)
+
+    def login(self, user):
+        self.client.credentials(HTTP_AUTHORIZATION=f'JWT {AccessToken.for_user(user)}')
+
+    @contextmanager
+    def query_budget(self, ceiling):
+        """Fails if the block runs more than ceiling queries, listing every query it ran."""
+        with CaptureQueriesContext(connection) as context:
+            with self.captureOnCommitCallbacks(execute=True):
+                yield context
+        queries = context.captured_queries
+        if len(queries) > ceiling:
+            self.fail(f"{len(queries)} queries, the budget is {ceiling}:\n{describe_queries(queries)}")
+
+    @contextmanager
+    def latency_budget(self, milliseconds):
+        """Fails if the block takes longer than milliseconds (times LATENCY_SCALE), listing the slowest queries."""
+        budget = milliseconds * LATENCY_SCALE
+        with CaptureQueriesContext(connection) as context:
+            started = time.perf_counter()
+            yield context
+            elapsed = (time.perf_counter() - started) * 1000
+        if elapsed > budget:
+            slowest = sorted(context.captured_queries, key=lambda query: float(query['time']), reverse=True)
+            self.fail(
+                f"Took {elapsed:.0f}ms, the budget is {budget:.0f}ms. "
+                f"{len(context.captured_queries)} queries, slowest first:\n{describe_queries(slowest[:10])}"
+            )
+
+
+class TransactionQueryBudgetTests(QueryBudgetTestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('alice', 'alice@example.com', 'password')
+        cls.other = User.objects.create_user('bob', 'bob@example.com', 'password')
+        cls.staff = User.objects.create_user('staff', 'staff@example.com', 'password', is_staff=True)
+        seed_transactions(cls.user, 300, seed=1)
+        seed_transactions(cls.other, 300, seed=2)
+
+    def test_list(self):
+        self.login(self.user)
+        # user, totals, archived months, count, page
+        with self.query_budget(5):
+            response = self.client.get('/api/transactions/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['totals']['total_transactions'], 300)
+
+    def test_list_filtered_and_searched(self):
+        self.login(self.user)
+        with self.query_budget(5):
+            response = self.client.get('/api/transactions/?category=food&search=grocery&ordering=-amount')
+        self.assertEqual(response.status_code, 200)
+
+    def test_list_staff(self):
+        self.login(self.staff)
+        # The page's users are joined in, not loaded per row
+        with self.query_budget(5):
+            response = self.client.get('/api/transactions/?page=3')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['totals']['total_transactions'], 600)
+
+    def test_list_staff_compact(self):
+        self.login(self.staff)
+        # One more query loads the users of the page once
+        with self.query_budget(6):
+            response = self.client.get('/api/transactions/?compact=1')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data['users']), 2)
+
+    def test_retrieve(self):
+        self.login(self.user)
+        transaction = self.user.transactions.first()
+        with self.query_budget(2):
+            response = self.client.get(f'/api/transactions/{transaction.id}/')
+        self.assertEqual(response.status_code, 200)
+
+    def test_create(self):
+        self.login(self.user)
+        row = {'date': '2025-06-01', 'description': 'Pathao ride home', 'amount': '180.00', 'category': 'transport'}
+        # Includes the signal receivers (budgets, memo, recurring series) that run on commit and
+        # taking the user's sync sequence number
+        with self.query_budget(10):
+            response = self.client.post('/api/transactions/', row, format='json')
+        self.assertEqual(response.status_code, 201)
+
+    def test_create_bulk(self):
+        self.login(self.user)
+        rows = [
+            {'date': f'2026-02-{day:02d}', 'description': f'Market run {day}', 'amount': '250.00', 'category': 'food'}
+            for day in range(1, 26)
+        ]
+        # Independent of the number of rows: duplicates are looked up and rows inserted in bulk
+        with self.query_budget(15):
+            response = self.client.post('/api/transactions/', rows, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(len(response.data), 25)
+
+    def test_patch(self):
+        self.login(self.user)
+        transaction = self.user.transactions.first()
+        # Includes reading and locking the row, the change is computed from what is committed
+        with self.query_budget(12):
+            response = self.client.patch(
+                f'/api/transactions/{transaction.id}/', {'amount': '99.00'}, format='json'
+            )
+        self.assertEqual(response.status_code, 200)
+
+    def test_delete(self):
+        self.login(self.user)
+        transaction = self.user.transactions.first()
+        # Includes locking the row, the lookup of flagged duplicates to repoint and the tombstone's
+        # sync sequence number
+        with self.query_budget(15):
+            response = self.client.delete(f'/api/transactions/{transaction.id}/')
+        self.assertEqual(response.status_code, 204)
+
+    def test_suggest_category(self):
+        self.login(self.user)
+        # user, the user's own history and the CategoryFeature table, nothing aggregates other users' rows
+        with self.query_budget(3):
+            response = self.client.get('/api/transactions/suggest-category/', {'description': 'Foodpanda - order 7'})
+        self.assertEqual(response.status_code, 200)
+
+    def test_staff_analytics(self):
+        self.login(self.staff)
+        # user, row estimate, sums per user, month and category, the amounts ranked, sign-ups
+        with self.query_budget(5):
+            response = self.client.get('/api/stats/analytics/?months=36')
+        self.assertEqual(response.status_code, 200)
+
+    @override_settings(STAFF_ANALYTICS={**settings.STAFF_ANALYTICS, 'SAMPLE_ROWS': 200, 'CACHE_SECONDS': 60})
+    def test_staff_analytics_sample_cached(self):
+        self.login(self.staff)
+        self.client.get('/api/stats/analytics/?months=36&seed=3')
+        # user
+        with self.query_budget(1):
+            response = self.client.get('/api/stats/analytics/?months=36&seed=3')
+        self.assertEqual(response.status_code, 200)
+
+
+class SparseFieldsTests(APITestCase):
+    """?fields= and ?omit= narrow both the rows sent and the columns read."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('alice', 'alice@example.com', 'password', first_name='Alice')
+        cls.staff = User.objects.create_user('staff', 'staff@example.com', 'password', is_staff=True)
+        seed_transactions(cls.user, 30, seed=6)
+
+    def setUp(self):
+        self.client.force_authenticate(self.user)
+
+    def page(self, query):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(f'/api/transactions/?{query}')
+        self.assertEqual(response.status_code, 200, response.data)
+        rows = [
+            captured['sql'] for captured in context.captured_queries
+            if 'FROM "core_transaction"' in captured['sql'] and 'LIMIT' in captured['sql']
+        ]
+        self.assertEqual(len(rows), 1)
+        return response.data, rows[0]
+
+    def test_fields_and_omit(self):
+        everything = ['id', 'user', 'date', 'description', 'amount', 'category', 'is_recurring', 'duplicate_of']
+        cases = {
+            '': everything,
+            # In the serializer's order, whatever the order asked for
+            'fields=amount,id': ['id', 'amount'],
+            'fields= amount , id ,': ['id', 'amount'],
+            'omit=user,description': ['id', 'date', 'amount', 'category', 'is_recurring', 'duplicate_of'],
+            'fields=id,date,amount&omit=date': ['id', 'amount'],
+        }
+        for query, expected in cases.items():
+            with self.subTest(query):
+                data, _ = self.page(query)
+                self.assertEqual([list(row) for row in data['results']], [expected] * 20)
+                self.assertEqual(data['totals']['total_transactions'], 30)
+
+        transaction = self.user.transactions.first()
+        response = self.client.get(f'/api/transactions/{transaction.id}/?fields=amount,category')
+        self.assertEqual(response.data, {'amount': transaction.amount, 'category': transaction.category})
+
+    def test_unknown_fields(self):
+        for query in ('fields=id,bogus', 'omit=password', 'fields=user__email'):
+            with self.subTest(query):
+                response = self.client.get(f'/api/transactions/?{query}')
+                self.assertEqual(response.status_code, 400)
+                self.assertIn('Unknown fields', response.data['fields'])
+
+    def test_only_the_needed_columns_are_read(self):
+        _, sql = self.page('')
+        for column in ('description', 'category', 'is_recurring'):
+            self.assertIn(f'"core_transaction"."{column}"', sql)
+        self.assertIn('"auth_user"."email"', sql)
+
+        _, sql = self.page('fields=id,amount')
+        for column in ('description', 'category', 'is_recurring', 'duplicate_of', 'fingerprint'):
+            self.assertNotIn(f'"core_transaction"."{column}"', sql)
+        self.assertNotIn('auth_user', sql)
+        # Ordering across archived rows compares the date
+        self.assertIn('"core_transaction"."date"', sql)
+
+        _, sql = self.page('omit=user')
+        self.assertNotIn('auth_user', sql)
+        self.assertIn('"core_transaction"."description"', sql)
+
+    def test_compact(self):
+        data, sql = self.page('compact=1')
+        self.assertEqual({row['user'] for row in data['results']}, {self.user.id})
+        self.assertEqual(data['users'], [{
+            'id': self.user.id, 'username': 'alice', 'email': 'alice@example.com', 'first_name': 'Alice', 'last_name': '',
+        }])
+        # The user id is a column of the row, no join
+        self.assertNotIn('auth_user', sql)
+        self.assertIn('"core_transaction"."user_id"', sql)
+
+        data, _ = self.page('compact=1&fields=id,amount')
+        self.assertNotIn('users', data)
+        self.assertEqual(list(data['results'][0]), ['id', 'amount'])
+
+        other = User.objects.create_user('bob', 'bob@example.com', 'password')
+        seed_transactions(other, 30, seed=7)
+        self.client.force_authenticate(self.staff)
+        data, _ = self.page('compact=true&ordering=amount')
+        page_users = {row['user'] for row in data['results']}
+        self.assertEqual({user['id'] for user in data['users']}, page_users)
+
+
+class BatchTests(APITestCase):
+    """POST /api/transactions/batch/ applies all or nothing, or every valid operation, of the user's own rows."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('alice', 'alice@example.com', 'password')
+        cls.other = User.objects.create_user('bob', 'bob@example.com', 'password')
+        seed_transactions(cls.user, 30, seed=11)
+        seed_transactions(cls.other, 30, seed=12)
+
+    def setUp(self):
+        clear_worker_caches()
+        self.client.force_authenticate(self.user)
+        self.updated, self.deleted = self.user.transactions.order_by('id')[:2]
+
+    def operations(self, invalid):
+        return [
+            {'op': 'create', 'data': {
+                'date': '2025-07-01', 'description': 'Batch bus fare', 'amount': '40.00', 'category': 'transport',
+            }},
+            {'op': 'update', 'id': self.updated.id, 'data': {'amount': '123.45'}},
+            {'op': 'delete', 'id': self.deleted.id},
+            invalid,
+        ]
+
+    def batch(self, operations, atomic=True):
+        return self.client.post(
+            '/api/transactions/batch/', {'operations': operations, 'atomic': atomic}, format='json'
+        )
+
+    def test_atomic_rolls_back(self):
+        invalid = {'op': 'update', 'id': self.updated.id + 1, 'data': {'category': 'nope'}}
+        response = self.batch(self.operations(invalid))
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(response.data['applied'])
+        self.assertEqual([result['status'] for result in response.data['results']], [424, 424, 424, 400])
+        self.assertEqual(response.data['failed'], 1)
+        self.assertEqual(self.user.transactions.count(), 30)
+        self.assertFalse(self.user.transactions.filter(description='Batch bus fare').exists())
+        self.assertEqual(Transaction.objects.get(id=self.updated.id).amount, self.updated.amount)
+
+    def test_non_atomic_applies_valid_operations(self):
+        invalid = {'op': 'create', 'data': {'date': '2025-07-02', 'description': 'No amount', 'category': 'food'}}
+        response = self.batch(self.operations(invalid), atomic=False)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.data['applied'])
+        self.assertEqual([result['status'] for result in response.data['results']], [201, 200, 204, 400])
+        self.assertEqual((response.data['succeeded'], response.data['failed']), (3, 1))
+        self.assertIn('amount', response.data['results'][3]['errors'])
+        created = Transaction.objects.get(id=response.data['results'][0]['id'])
+        self.assertEqual((created.user_id, created.description), (self.user.id, 'Batch bus fare'))
+        self.assertEqual(Transaction.objects.get(id=self.updated.id).amount, Decimal('123.45'))
+        self.assertFalse(Transaction.objects.filter(id=self.deleted.id).exists())
+        self.assertEqual(self.user.transactions.count(), 30)
+
+    def test_other_users_transactions_are_not_found(self):
+        theirs = list(self.other.transactions.order_by('id')[:2])
+        before = {row.id: row.amount for row in theirs}
+        operations = [
+            {'op': 'update', 'id': theirs[0].id, 'data': {'amount': '1.00'}},
+            {'op': 'delete', 'id': theirs[1].id},
+            {'op': 'update', 'id': self.updated.id, 'data': {'amount': '123.45'}},
+        ]
+        for atomic, statuses in ((True, [404, 404, 424]), (False, [404, 404, 200])):
+            with self.subTest(atomic=atomic):
+                response = self.batch(operations, atomic=atomic)
+                self.assertEqual([result['status'] for result in response.data['results']], statuses)
+                self.assertEqual(
+                    {row.id: row.amount for row in Transaction.objects.filter(id__in=before)}, before
+                )
+        self.assertEqual(self.other.transactions.count(), 30)
+
+
+class SyncTests(APITestCase):
+    """/api/transactions/changes/ hands out every change once, in the order the user's writes committed."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('alice', 'alice@example.com', 'password')
+        cls.other = User.objects.create_user('bob', 'bob@example.com', 'password', is_staff=True)
+        seed_transactions(cls.user, 25, seed=13)
+        seed_transactions(cls.other, 5, seed=14)
+
+    def setUp(self):
+        self.client.force_authenticate(self.user)
+
+    def changes(self, token=None, limit=10):
+        query = f'?limit={limit}' + (f'&since={token}' if token else '')
+        return self.client.get(f'/api/transactions/changes/{query}')
+
+    def sync(self, token=None, limit=10):
+        """Follows next_token until has_more is false, returns (changed ids, deleted ids, token)."""
+        changed, deleted = [], []
+        while True:
+            response = self.changes(token, limit)
+            self.assertEqual(response.status_code, 200)
+            changed += [row['id'] for row in response.data['changed']]
+            deleted += response.data['deleted']
+            token = response.data['next_token']
+            if not response.data['has_more']:
+                return changed, deleted, token
+
+    def test_pages_through_everything_once(self):
+        response = self.changes(limit=10)
+        self.assertEqual(len(response.data['changed']), 10)
+        self.assertTrue(response.data['has_more'])
+        changed, deleted, token = self.sync(limit=10)
+        self.assertEqual(sorted(changed), sorted(self.user.transactions.values_list('id', flat=True)))
+        self.assertEqual(deleted, [])
+        # Caught up: nothing new, the token stays where it is
+        response = self.changes(token)
+        self.assertEqual((response.data['changed'], response.data['has_more']), ([], False))
+        self.assertEqual(response.data['next_token'], token)
+
+    def test_own_rows_only(self):
+        self.client.force_authenticate(self.other)
+        changed, _, _ = self.sync(limit=100)
+        self.assertEqual(sorted(changed), sorted(self.other.transactions.values_list('id', flat=True)))
+
+    def test_changes_in_commit_order(self):
+        *_, token = self.sync()
+        first, second, third = self.user.transactions.order_by('id')[:3]
+        first_id = first.id
+        first.delete()
+        second.amount = Decimal('12.34')
+        second.save()
+        # A worker whose clock is behind: the row is stamped long before the token was issued
+        with mock.patch('django.utils.timezone.now', return_value=timezone.now() - timedelta(days=1)):
+            third.description = 'Late clock'
+            third.save()
+        changed, deleted, token = self.sync(token, limit=1)
+        self.assertEqual((changed, deleted), ([second.id, third.id], [first_id]))
+        response = self.changes(token)
+        self.assertEqual((response.data['changed'], response.data['deleted']), ([], []))
+
+    def test_tombstone_order(self):
+        *_, token = self.sync()
+        rows = list(self.user.transactions.order_by('id')[:4])
+        ids = [row.id for row in rows]
+        rows[0].delete()
+        Transaction.objects.filter(id=ids[1]).update(amount=Decimal('5.00'))
+        Transaction.objects.filter(id__in=ids[2:]).delete()
+        response = self.changes(token, limit=100)
+        self.assertEqual(sorted(response.data['deleted']), sorted([ids[0], *ids[2:]]))
+        self.assertEqual(response.data['deleted'][0], ids[0])
+        # Paging one change at a time keeps the delete of rows[0] before the update of rows[1]
+        events = []
+        while True:
+            response = self.changes(token, limit=1)
+            events += [('changed', row['id']) for row in response.data['changed']]
+            events += [('deleted', row_id) for row_id in response.data['deleted']]
+            token = response.data['next_token']
+            if not response.data['has_more']:
+                break
+        self.assertEqual(events[:2], [('deleted', ids[0]), ('changed', ids[1])])
+        self.assertEqual(sorted(events[2:]), [('deleted', ids[2]), ('deleted', ids[3])])
+
+    def test_archived_rows_leave_a_tombstone(self):
+        *_, token = self.sync()
+        oldest = self.user.transactions.order_by('date', 'id').first()
+        archive_before(oldest.date + timedelta(days=1), users=[self.user])
+        _, deleted, _ = self.sync(token)
+        self.assertIn(oldest.id, deleted)
+
+    def test_pruned_tombstones_expire_tokens(self):
+        *_, token = self.sync()
+        self.user.transactions.first().delete()
+        call_command('prune_transaction_tombstones', '--days=0', stdout=io.StringIO())
+        response = self.changes(token)
+        self.assertEqual(response.status_code, 410)
+        self.assertTrue(response.data['reset'])
+        # A full resync starts over without a token, old pruned tombstones do not stop it
+        *_, token = self.sync(limit=5)
+        self.assertEqual(self.changes(token).status_code, 200)
+
+    def test_old_and_invalid_tokens(self):
+        legacy = base64.urlsafe_b64encode(b'1760000000000000:0:12').decode().rstrip('=')
+        self.assertEqual(self.changes(legacy).status_code, 410)
+        self.assertEqual(self.changes('not-a-token').status_code, 400)
+        self.assertEqual(self.client.get('/api/transactions/changes/?limit=0').status_code, 400)
+
+
+def async_transaction_urls():
+    """The project's URLs as they are with ASYNC_TRANSACTION_VIEWS on."""
+    from . import urls
+
+    with override_settings(ASYNC_TRANSACTION_VIEWS=True):
+        async_urls = importlib.reload(urls).urlpatterns
+    importlib.reload(urls)
+    urlconf = ModuleType('async_transaction_urls')
+    urlconf.urlpatterns = [path('api/', include(async_urls))]
+    return urlconf
+
+
+class AsyncTransactionParityTests(APITestCase):
+    """With ASYNC_TRANSACTION_VIEWS, /api/transactions/ answers exactly like TransactionViewSet."""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.async_urls = async_transaction_urls()
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('alice', 'alice@example.com', 'password')
+        cls.other = User.objects.create_user('bob', 'bob@example.com', 'password')
+        cls.staff = User.objects.create_user('staff', 'staff@example.com', 'password', is_staff=True)
+        seed_transactions(cls.user, 60, seed=15)
+        seed_transactions(cls.other, 20, seed=16)
+
+    def setUp(self):
+        self.login(self.user)
+
+    def login(self, user):
+        self.client.credentials(HTTP_AUTHORIZATION=f'JWT {AccessToken.for_user(user)}')
+
+    def request(self, method, url, data=None):
+        """(status, body, duplicate count) from the sync and the async views, each from the same database state."""
+        answers = []
+        for urlconf in (settings.ROOT_URLCONF, self.async_urls):
+            with override_settings(ROOT_URLCONF=urlconf), db_transaction.atomic():
+                if urlconf is self.async_urls:
+                    self.assertIs(resolve(url.split('?')[0]).func.view_class, AsyncTransactionView)
+                response = getattr(self.client, method)(url, data, format='json')
+                body = response.json() if response.content else None
+                answers.append((response.status_code, body, response.get('X-Duplicate-Count')))
+                # Ids handed out by a create are handed out again on the other side
+                db_transaction.set_rollback(True)
+        self.assertEqual(answers[0], answers[1])
+        return answers[0]
+
+    def test_list(self):
+        queries = [
+            '', '?page=2', '?page=99', '?search=grocery', '?compact=1', '?category=food',
+            '?date_after=2025-03-01&date_before=2025-05-31', '?amount__gte=100&amount__lte=500',
+            '?ordering=-amount', '?fields=id,amount&omit=amount', '?fields=nope', '?category=nope',
+        ]
+        for query in queries:
+            with self.subTest(query):
+                status_code, body, _ = self.request('get', f'/api/transactions/{query}')
+                if status_code == 200:
+                    self.assertIn('totals', body)
+        self.login(self.staff)
+        for query in ('?compact=1', '?compact=1&page=2', '?search=grocery'):
+            with self.subTest(query, staff=True):
+                _, body, _ = self.request('get', f'/api/transactions/{query}')
+                self.assertGreater(body['totals']['total_transactions'], 0)
+
+    def test_retrieve(self):
+        own = self.user.transactions.first()
+        theirs = self.other.transactions.first()
+        self.assertEqual(self.request('get', f'/api/transactions/{own.id}/')[0], 200)
+        self.request('get', f'/api/transactions/{own.id}/?fields=id,description')
+        self.assertEqual(self.request('get', f'/api/transactions/{theirs.id}/')[0], 404)
+        self.assertEqual(self.request('get', '/api/transactions/999999/')[0], 404)
+
+    def test_create(self):
+        row = {'date': '2025-06-01', 'description': 'Pathao ride home', 'amount': '180.00', 'category': 'transport'}
+        self.assertEqual(self.request('post', '/api/transactions/', row)[0], 201)
+        rows = [row, {**row, 'date': '2025-06-02'}]
+        for mode in ('allow', 'flag'):
+            with self.subTest(mode):
+                self.assertEqual(self.request('post', f'/api/transactions/?duplicates={mode}', rows)[0], 201)
+        self.assertEqual(self.request('post', '/api/transactions/', {**row, 'amount': 'ten'})[0], 400)
+        self.assertEqual(self.request('post', '/api/transactions/', [{**row, 'category': 'nope'}])[0], 400)
+        self.assertEqual(self.request('post', '/api/transactions/?duplicates=nope', rows)[0], 400)
+
+    def test_patch(self):
+        own = self.user.transactions.first()
+        theirs = self.other.transactions.first()
+        self.assertEqual(self.request('patch', f'/api/transactions/{own.id}/', {'amount': '99.00'})[0], 200)
+        self.assertEqual(self.request('patch', f'/api/transactions/{own.id}/', {'amount': 'ten'})[0], 400)
+        self.assertEqual(self.request('patch', f'/api/transactions/{theirs.id}/', {'amount': '1.00'})[0], 404)
+
+    def test_delete(self):
+        own = self.user.transactions.first()
+        theirs = self.other.transactions.first()
+        self.assertEqual(self.request('delete', f'/api/transactions/{own.id}/')[0], 204)
+        self.assertEqual(self.request('delete', f'/api/transactions/{theirs.id}/')[0], 404)
+        self.assertTrue(Transaction.objects.filter(id=theirs.id).exists())
+
+    def test_anonymous(self):
+        self.client.credentials()
+        own = self.user.transactions.first()
+        self.assertEqual(self.request('get', '/api/transactions/')[0], 401)
+        self.assertEqual(self.request('get', f'/api/transactions/{own.id}/')[0], 401)
+        self.assertEqual(self.request('post', '/api/transactions/', {})[0], 401)
+        self.assertEqual(self.request('delete', f'/api/transactions/{own.id}/')[0], 401)
+
+
+class AIEndpointQueryBudgetTests(QueryBudgetTestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('alice', 'alice@example.com', 'password')
+        seed_transactions(cls.user, 730, seed=3)
+
+    def test_analysis(self):
+        self.login(self.user)
+        # user, this and last month, the LLMCall row
+        with self.query_budget(4):
+            response = self.client.get('/api/analysis/?year=2025&month=3')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('financial_score', response.data)
+
+    def test_analysis_stream(self):
+        self.login(self.user)
+        with self.query_budget(4):
+            response = self.client.get('/api/analysis/?year=2025&month=4&format=sse')
+            b''.join(response.streaming_content)
+        self.assertEqual(response.status_code, 200)
+
+    def test_pdf(self):
+        self.login(self.user)
+        # user, the month, archived months
+        with self.query_budget(3):
+            response = self.client.get('/api/transactions/pdf/download/?year=2025&month=5')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'application/pdf')
+
+    def test_image_to_transaction(self):
+        self.login(self.user)
+        image = SimpleUploadedFile('receipt.jpg', receipt_image(), content_type='image/jpeg')
+        # user, the stored receipt lookup and insert (in a savepoint), the LLMCall row, the category
+        # memo and the duplicate lookup
+        with self.query_budget(10):
+            response = self.client.post('/api/image-to-trasaction/', {'image': image}, format='multipart')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data['transactions']), 2)
+
+
+@override_settings(GEMINI_BACKEND='fake', LLM_DAILY_TOKEN_BUDGET=0)
+class AIEndpointTests(APITestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('alice', 'alice@example.com', 'password')
+        seed_transactions(cls.user, 90, seed=3)
+
+    def setUp(self):
+        clear_worker_caches()
+        self.client.force_authenticate(self.user)
+
+    def test_analysis_failure_is_not_shared(self):
+        lock_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(lock_dir.cleanup)
+        # Results are kept for other workers, a failure must not be one of them
+        single_flight = SingleFlight(os.path.join(lock_dir.name, 'singleflight'), 60)
+        self.enterContext(mock.patch('core.views.get_single_flight', return_value=single_flight))
+        failing = mock.Mock()
+        failing.models.generate_content.side_effect = RuntimeError("quota exceeded")
+        with mock.patch('core.analysis.get_client', return_value=failing):
+            response = self.client.get('/api/analysis/?year=2025&month=2')
+        self.assertEqual(response.status_code, 502)
+        self.assertIn("quota exceeded", response.data['error'])
+        # The same request right after computes a fresh analysis instead of reading the failure
+        response = self.client.get('/api/analysis/?year=2025&month=2')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('financial_score', response.data)
+
+    def test_llm_usage_report(self):
+        for total_tokens in (900, 300):
+            LLMCall.objects.create(
+                user=self.user, endpoint='analysis', model='fake', latency_ms=120, prompt_size=2000,
+                total_tokens=total_tokens, outcome='ok',
+            )
+        self.client.force_authenticate(User.objects.create_user('staff', 'staff@example.com', 'password', is_staff=True))
+        response = self.client.get('/api/stats/llm/?days=1&top=1')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([row['user_id'] for row in response.data['top_users']], [self.user.id])
+        for query in ('top=-1', 'top=0', 'top=101', 'days=-1', 'days=0', 'days=100000000', 'top=many'):
+            with self.subTest(query):
+                self.assertEqual(self.client.get(f'/api/stats/llm/?{query}').status_code, 400)
+
+
+@override_settings(GEMINI_BACKEND='fake', LLM_DAILY_TOKEN_BUDGET=0)
+class FakeGeminiBackendTests(APITestCase):
+    """The fake backend answers without google.genai and without the network."""
+
+    def setUp(self):
+        # None in sys.modules makes any import of google.genai raise ImportError
+        self.enterContext(mock.patch.dict(sys.modules, {'google': None, 'google.genai': None, 'google.genai.types': None}))
+        self.enterContext(mock.patch('socket.socket.connect', side_effect=OSError("no network in this test")))
+
+    def test_image_to_transaction(self):
+        transactions = image_to_transaction(receipt_image(), None)
+        self.assertEqual([row['description'] for row in transactions], [row['description'] for row in FAKE_RECEIPT])
+
+    def test_analysis(self):
+        current = [{'date': '2025-03-02', 'description': 'Rent', 'amount': -15000, 'category': 'housing'}]
+        self.assertEqual(transaction_analysis(None, current).keys(), FAKE_ANALYSIS.keys())
+        sections = dict(stream_transaction_analysis(None, current))
+        self.assertEqual(sections['done'].keys(), FAKE_ANALYSIS.keys())
+
+
+class DuplicateTests(APITestCase):
+    """Flagged duplicates keep pointing at a row that still exists."""
+
+    ROW = {'date': '2025-03-03', 'description': 'Daraz order 4471', 'amount': '1250.00', 'category': 'clothing'}
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('alice', 'alice@example.com', 'password')
+
+    def setUp(self):
+        clear_worker_caches()
+        self.client.force_authenticate(self.user)
+
+    def create(self, mode, row=None):
+        response = self.client.post(f'/api/transactions/?duplicates={mode}', [row or self.ROW], format='json')
+        self.assertEqual(response.status_code, 201)
+        return response
+
+    def test_delete_repoints_duplicates(self):
+        for _ in range(3):
+            self.create('flag')
+        original, first, second = self.user.transactions.order_by('id')
+        self.assertEqual([first.duplicate_of, second.duplicate_of], [original.id, original.id])
+
+        response = self.client.delete(f'/api/transactions/{original.id}/')
+        self.assertEqual(response.status_code, 204)
+        first.refresh_from_db()
+        second.refresh_from_db()
+        self.assertIsNone(first.duplicate_of)
+        self.assertEqual(second.duplicate_of, first.id)
+
+        self.user.transactions.filter(id=first.id).delete()
+        second.refresh_from_db()
+        self.assertIsNone(second.duplicate_of)
+
+    def test_archive_repoints_duplicates(self):
+        self.create('flag', {**self.ROW, 'date': '2024-12-31'})
+        self.create('flag', {**self.ROW, 'date': '2025-01-01'})
+        original, duplicate = self.user.transactions.order_by('id')
+        self.assertEqual(duplicate.duplicate_of, original.id)
+
+        archive_before(date(2025, 1, 1))
+        duplicate.refresh_from_db()
+        self.assertIsNone(duplicate.duplicate_of)
+
+    def test_stale_duplicate_of(self):
+        for mode in DUPLICATE_MODES:
+            with self.subTest(mode=mode):
+                self.user.transactions.all().delete()
+                self.create('allow')
+                self.create('flag')
+                original, duplicate = self.user.transactions.order_by('id')
+                # Removed without repointing, as rows deleted before that was done were
+                models.QuerySet.delete(Transaction.objects.filter(id=original.id))
+
+                response = self.create(mode)
+                self.assertEqual(response['X-Duplicate-Count'], '0' if mode == 'allow' else '1')
+                rows = list(self.user.transactions.order_by('id'))
+                if mode in ('allow', 'flag'):
+                    self.assertEqual(len(rows), 2)
+                    expected = None if mode == 'allow' else duplicate.id
+                    self.assertEqual(rows[1].duplicate_of, expected)
+                else:
+                    # Skipped, or merged into the flagged row that is left
+                    self.assertEqual([row.id for row in rows], [duplicate.id])
+
+
+class HotColdRowsTests(APITestCase):
+    """Lists page across core_transaction and TransactionArchive as if it were one table."""
+
+    CUTOFF = date(2025, 5, 1)
+    QUERIES = [
+        '',
+        'ordering=date',
+        'ordering=-amount',
+        'ordering=amount&category=food',
+        'ordering=-date&search=grocery',
+        'ordering=date&date_after=2025-02-01&date_before=2025-06-30',
+        'ordering=-amount&amount__gte=50000&date_after=2025-03-10',
+    ]
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('alice', 'alice@example.com', 'password')
+        cls.other = User.objects.create_user('bob', 'bob@example.com', 'password')
+        # Two rows a day in the first weeks, so orderings by date have ties
+        seed_transactions(cls.user, 400, seed=3)
+        seed_transactions(cls.other, 100, seed=4)
+        archive_before(cls.CUTOFF, users=[cls.user])
+        # Written after archiving: hot rows between the cold ones
+        cls.user.transactions.bulk_create([
+            Transaction(
+                user=cls.user, date=date(2025, 2, 1) + timedelta(days=3 * day), description=f'Late entry {day}',
+                amount=Decimal(1000 + 37 * day), category=('food', 'income', 'transport')[day % 3],
+            )
+            for day in range(20)
+        ])
+        archived = archive.ArchivedTransactions(archive.archives_for(cls.user), {})
+        cls.rows = archived.rows() + list(cls.user.transactions.all())
+
+    def setUp(self):
+        self.client.force_authenticate(self.user)
+
+    def expected(self, query):
+        params = QueryDict(query)
+        ordering = archive.keyset_ordering([params.get('ordering', '-date')])
+        rows = [
+            row for row in self.rows
+            if (not params.get('category') or row.category == params['category'])
+            and params.get('search', '') in row.description.lower()
+            and (not params.get('date_after') or row.date >= date.fromisoformat(params['date_after']))
+            and (not params.get('date_before') or row.date <= date.fromisoformat(params['date_before']))
+            and (not params.get('amount__gte') or row.amount >= Decimal(params['amount__gte']))
+        ]
+        return sorted(rows, key=archive.ordering_key(ordering))
+
+    def pages(self, query):
+        ids, page, responses = [], 1, []
+        while True:
+            response = self.client.get(f'/api/transactions/?{query}&page={page}')
+            self.assertEqual(response.status_code, 200)
+            responses.append(response.data)
+            ids += [row['id'] for row in response.data['results']]
+            if not response.data['next']:
+                return ids, responses
+            page += 1
+
+    def test_pages_merge_hot_and_cold_rows(self):
+        self.assertTrue(TransactionArchive.objects.filter(user=self.user).exists())
+        for query in self.QUERIES:
+            with self.subTest(query):
+                expected = self.expected(query)
+                ids, responses = self.pages(query)
+                self.assertEqual(ids, [row.id for row in expected])
+                self.assertTrue({row.id for row in expected} & set(self.user.transactions.values_list('id', flat=True)))
+                for data in responses:
+                    self.assertEqual(data['count'], len(expected))
+
+    def test_totals(self):
+        for query in self.QUERIES:
+            with self.subTest(query):
+                expected = self.expected(query)
+                income = sum(row.amount for row in expected if row.category == 'income')
+                expenses = sum(row.amount for row in expected if row.category != 'income')
+                totals = self.client.get(f'/api/transactions/?{query}').data['totals']
+                self.assertEqual(totals['total_transactions'], len(expected))
+                self.assertAlmostEqual(totals['total_income'], float(income), places=2)
+                self.assertAlmostEqual(totals['total_expenses'], float(expenses), places=2)
+
+    def test_pages_only_load_their_rows(self):
+        for query, page in (('ordering=-amount', 12), ('ordering=date', 8), ('', 15)):
+            with self.subTest(query), CaptureQueriesContext(connection) as context:
+                response = self.client.get(f'/api/transactions/?{query}&page={page}')
+                self.assertEqual(len(response.data['results']), 20)
+            selects = [
+                query['sql'] for query in context.captured_queries
+                if query['sql'].startswith('SELECT') and 'FROM "core_transaction"' in query['sql']
+                and 'COUNT(' not in query['sql'] and 'SUM(' not in query['sql']
+            ]
+            self.assertEqual(len(selects), 1)
+            self.assertIn('LIMIT 20', selects[0])
+
+    def test_cold_months_are_decompressed_when_a_page_reaches_them(self):
+        with mock.patch('core.archive.unpack_rows', wraps=archive.unpack_rows) as unpack:
+            # Newest first, the first pages are all hot
+            self.client.get('/api/transactions/')
+            self.assertEqual(unpack.call_count, 0)
+            # Oldest first, one archived month at a time
+            self.client.get('/api/transactions/?ordering=date&page=2')
+            self.assertEqual(unpack.call_count, 1)
+
+
+class PartitioningTests(SimpleTestCase):
+
+    def test_period(self):
+        self.assertEqual(
+            partitioning.period(date(2025, 12, 31), 'monthly'),
+            ('core_transaction_y2025m12', date(2025, 12, 1), date(2026, 1, 1)),
+        )
+        self.assertEqual(
+            partitioning.period(date(2025, 3, 15), 'yearly'),
+            ('core_transaction_y2025', date(2025, 1, 1), date(2026, 1, 1)),
+        )
+
+    def test_sqlite_keeps_the_single_table(self):
+        self.assertFalse(partitioning.is_supported(connection))
+        out = io.StringIO()
+        call_command('partition_transactions', stdout=out)
+        self.assertIn('keeps the single core_transaction table', out.getvalue())
+
+
+class BudgetCounterTests(APITestCase):
+    """Budget counters are moved by every write and must always equal the period's sum."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('alice', 'alice@example.com', 'password')
+        for category in ('food', 'transport'):
+            budget = Budget(user=cls.user, category=category, limit=Decimal('5000.00'))
+            open_period(budget)
+            budget.save()
+
+    def setUp(self):
+        clear_worker_caches()
+        self.today = timezone.localdate().isoformat()
+        self.client.force_authenticate(self.user)
+
+    def assert_counters(self):
+        for budget in Budget.objects.filter(user=self.user):
+            start, end = period_bounds(timezone.localdate(), budget.period)
+            self.assertEqual(budget.spent, period_spent(self.user.id, budget.category, start, end), budget.category)
+
+    def row(self, description, amount, category='food'):
+        return {'date': self.today, 'description': description, 'amount': amount, 'category': category}
+
+    def test_api_writes(self):
+        response = self.client.post('/api/transactions/', self.row('Shwapno weekly', '850.00'), format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assert_counters()
+        transaction = self.user.transactions.get()
+
+        self.client.patch(f'/api/transactions/{transaction.id}/', {'amount': '900.00'}, format='json')
+        self.assert_counters()
+        self.client.patch(f'/api/transactions/{transaction.id}/', {'category': 'transport'}, format='json')
+        self.assert_counters()
+
+        rows = [self.row(f'Uber trip {number}', '320.00', 'transport') for number in range(5)]
+        response = self.client.post('/api/transactions/?duplicates=allow', rows, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assert_counters()
+
+        self.client.delete(f'/api/transactions/{transaction.id}/')
+        self.assert_counters()
+        self.assertEqual(Budget.objects.get(user=self.user, category='transport').spent, Decimal('1600.00'))
+
+    def test_stale_instances(self):
+        self.client.post('/api/transactions/', self.row('Chaldal order', '400.00'), format='json')
+        first, second = self.user.transactions.get(), self.user.transactions.get()
+
+        # Two requests editing the same row from what they loaded before either saved
+        first.amount = Decimal('450.00')
+        first.save()
+        second.amount = Decimal('600.00')
+        second.save()
+        self.assert_counters()
+        second.category = 'transport'
+        second.save(update_fields=['category'])
+        self.assert_counters()
+
+        # And deleting it twice
+        first.delete()
+        self.assertEqual(second.delete(), (0, {}))
+        self.user.transactions.filter(id=second.id).delete()
+        self.assert_counters()
+        self.assertEqual(TransactionTombstone.objects.filter(transaction_id=second.id).count(), 1)
+
+
+class CategoryMemoTests(APITestCase):
+    """Suggestions learn from the user's own rows and from features many users share."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.users = [User.objects.create_user(f'user{number}', f'user{number}@example.com', 'password') for number in range(4)]
+        cls.newcomer = User.objects.create_user('newcomer', 'newcomer@example.com', 'password')
+        for number, user in enumerate(cls.users):
+            Transaction.objects.create(
+                user=user, date=date(2025, 5, number + 1), description=f'Foodpanda - order {number}',
+                amount=Decimal('540.00'), category='food',
+            )
+        Transaction.objects.create(
+            user=cls.users[0], date=date(2025, 5, 9), description='Transfer to Nusrat Jahan',
+            amount=Decimal('2000.00'), category='housing',
+        )
+
+    def setUp(self):
+        clear_worker_caches()
+
+    def suggest(self, description):
+        self.client.force_authenticate(self.newcomer)
+        response = self.client.get('/api/transactions/suggest-category/', {'description': description})
+        self.assertEqual(response.status_code, 200)
+        return response.data
+
+    def test_shared_features_only(self):
+        self.assertEqual(build_global_features(min_users=3), (4, 4))
+        suggestion = self.suggest('Foodpanda - order 77')
+        self.assertEqual((suggestion['category'], suggestion['source']), ('food', 'global'))
+        # Known to one user only, never suggested to anyone else
+        self.assertIsNone(self.suggest('Transfer to Nusrat Jahan')['category'])
+
+    def test_writes_do_not_change_the_shared_index(self):
+        build_global_features(min_users=3)
+        self.assertEqual(self.suggest('Foodpanda - order 78')['category'], 'food')
+        self.client.force_authenticate(self.users[1])
+        for number in range(3):
+            self.client.post('/api/transactions/', {
+                'date': '2025-06-01', 'description': f'Foodpanda - order {number + 10}', 'amount': '300.00',
+                'category': 'entertainment',
+            }, format='json')
+        self.assertEqual(self.suggest('Foodpanda - order 79')['category'], 'food')
+
+    def own(self, description, category, times=1):
+        for _ in range(times):
+            Transaction.objects.create(
+                user=self.newcomer, date=date(2025, 6, 1), description=description, amount=Decimal('100.00'),
+                category=category,
+            )
+
+    def test_own_history_before_shared_features(self):
+        build_global_features(min_users=3)
+        self.own('Foodpanda - office lunch', 'entertainment')
+        suggestion = self.suggest('Foodpanda - order 77')
+        self.assertEqual((suggestion['category'], suggestion['source'], suggestion['confidence']), ('entertainment', 'user', 1.0))
+        self.assertEqual(suggestion['alternatives'], [{'category': 'entertainment', 'score': 3.0}])
+
+    def test_confidence_cutoff(self):
+        # Two thirds of every matched feature votes clothing
+        self.own('Daraz order', 'clothing', times=2)
+        self.own('Daraz order', 'education')
+        self.assertAlmostEqual(suggest_category(self.newcomer.id, 'Daraz order').confidence, 2 / 3)
+        for min_confidence, expected in ((0.6, 'clothing'), (0.7, 'food')):
+            with self.subTest(min_confidence=min_confidence):
+                with self.settings(CATEGORY_MEMO={**settings.CATEGORY_MEMO, 'MIN_CONFIDENCE': min_confidence}):
+                    self.assertEqual(correct_category(self.newcomer.id, 'Daraz order', 'Food'), expected)
+                    # A missing or unknown category is filled in below the cutoff too
+                    self.assertEqual(correct_category(self.newcomer.id, 'Daraz order', 'groceries'), 'clothing')
+
+    @override_settings(CATEGORY_MEMO={**settings.CATEGORY_MEMO, 'MIN_CONFIDENCE': 0.6})
+    def test_shared_features_only_fill_in(self):
+        build_global_features(min_users=3)
+        # Confident, but learned from other users: the category Gemini picked stays
+        self.assertEqual(correct_category(self.newcomer.id, 'Foodpanda - order 9', 'entertainment'), 'entertainment')
+        self.assertEqual(correct_category(self.newcomer.id, 'Foodpanda - order 9', None), 'food')
+        self.assertEqual(correct_category(self.newcomer.id, 'Bkash cash out', None), 'miscellaneous')
+
+    def test_user_memo_follows_writes(self):
+        self.assertIsNone(self.suggest('Pathao ride to office')['category'])
+        row = {'date': '2025-06-02', 'description': 'Pathao ride to office', 'amount': '180.00', 'category': 'transport'}
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post('/api/transactions/', row, format='json')
+        self.assertEqual(self.suggest('Pathao ride to office')['category'], 'transport')
+
+        transaction = self.newcomer.transactions.get()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.patch(f'/api/transactions/{transaction.id}/', {'category': 'entertainment'}, format='json')
+        self.assertEqual(self.suggest('Pathao ride to office')['category'], 'entertainment')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.delete(f'/api/transactions/{transaction.id}/')
+        self.assertIsNone(self.suggest('Pathao ride to office')['category'])
+
+    def test_rebuild_replaces_shared_index(self):
+        build_global_features(min_users=3)
+        self.assertEqual(self.suggest('Foodpanda - order 77')['category'], 'food')
+        # Four users share the feature, five are now required
+        self.assertEqual(build_global_features(min_users=5), (4, 0))
+        self.assertIsNone(self.suggest('Foodpanda - order 77')['category'])
+
+    def test_shared_index_survives_user_evictions(self):
+        self.enterContext(self.settings(CATEGORY_MEMO={**settings.CATEGORY_MEMO, 'MAX_USERS': 2}))
+        # Caches built with the setting above, the originals are put back afterwards
+        self.enterContext(mock.patch.object(category_memo, '_memos', None))
+        self.enterContext(mock.patch.object(category_memo, '_global_memo', None))
+        build_global_features(min_users=3)
+        shared = global_memo()
+        # More users' memos than are kept, as a worker's concurrent requests build them
+        for user in [*self.users, self.newcomer]:
+            category_memo.user_memo(user.id)
+        self.assertEqual(len(category_memo._cache()), 2)
+        self.assertIs(global_memo(), shared)
+
+
+
+class AutocompleteTests(APITestCase):
+    """Suggestions come from the user's PrefixIndex, which follows their writes."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('alice', 'alice@example.com', 'password')
+        cls.other = User.objects.create_user('bob', 'bob@example.com', 'password')
+        seed_transactions(cls.user, 50, seed=8)
+
+    def setUp(self):
+        autocomplete._cache().clear()
+        self.addCleanup(autocomplete._cache().clear)
+        self.client.force_authenticate(self.user)
+
+    def suggestions(self, query):
+        response = self.client.get('/api/transactions/autocomplete/', {'q': query})
+        self.assertEqual(response.status_code, 200)
+        return [suggestion['description'] for suggestion in response.data['results']]
+
+    def test_prefix_matching(self):
+        index = autocomplete.PrefixIndex()
+        index.extend([
+            ('House rent - Dhanmondi flat', date(2025, 5, 1), Decimal('25000'), 'housing'),
+            ('Shwapno grocery run', date(2025, 5, 2), Decimal('400'), 'food'),
+            ('Shwapno grocery run', date(2025, 5, 9), Decimal('500'), 'food'),
+            ('SHWAPNO  grocery run', date(2025, 5, 16), Decimal('450'), 'shopping'),
+            ('Shwapno grocery run', date(2025, 5, 23), Decimal('450'), 'food'),
+        ])
+        self.assertEqual(len(index), 2)
+
+        def found(prefix):
+            return [suggestion['description'] for suggestion in index.search(prefix)]
+
+        # Any word can start the match, not the middle of one
+        self.assertEqual(found('dhan'), ['House rent - Dhanmondi flat'])
+        self.assertEqual(found('Rent, dhanmondi'), ['House rent - Dhanmondi flat'])
+        self.assertEqual(found('ondi'), [])
+        self.assertEqual(found('  '), [])
+        suggestion, = index.search('grocery r')
+        self.assertEqual(suggestion, {
+            # The latest spelling
+            'description': 'Shwapno grocery run', 'count': 4, 'last_used': date(2025, 5, 23),
+            'typical_amount': Decimal('450'), 'category': 'food',
+        })
+
+    def test_ranking(self):
+        index = autocomplete.PrefixIndex()
+        index.extend([('Shwapno grocery run', date(2025, 1, 1), Decimal('450'), 'food')] * 6)
+        index.add('Shwapno mall', date(2025, 6, 1), Decimal('1200'), 'shopping')
+        index.add('Shwapno mall', date(2025, 6, 2), Decimal('1100'), 'shopping')
+        # Used more often
+        self.assertEqual(
+            [suggestion['description'] for suggestion in index.search('shw', today=date(2025, 1, 2))],
+            ['Shwapno grocery run', 'Shwapno mall'],
+        )
+        # Used more recently, 6 uses five months ago count less than 2 this week
+        self.assertEqual(
+            [suggestion['description'] for suggestion in index.search('shw', today=date(2025, 6, 2))],
+            ['Shwapno mall', 'Shwapno grocery run'],
+        )
+        self.assertEqual(len(index.search('shw', limit=1, today=date(2025, 6, 2))), 1)
+        # A use dated ahead counts as one today, not more
+        index.add('Shwapno tea stall', date(2025, 9, 1), Decimal('60'), 'food')
+        self.assertEqual(
+            [suggestion['description'] for suggestion in index.search('shw', today=date(2025, 6, 2))],
+            ['Shwapno mall', 'Shwapno grocery run', 'Shwapno tea stall'],
+        )
+        index.remove('Shwapno mall', Decimal('1200'), 'shopping')
+        index.remove('Shwapno mall', Decimal('1100'), 'shopping')
+        self.assertEqual(
+            [suggestion['description'] for suggestion in index.search('shw', today=date(2025, 6, 2))],
+            ['Shwapno grocery run', 'Shwapno tea stall'],
+        )
+
+    def test_broad_prefixes(self):
+        rows = [
+            (transaction.description, transaction.date, transaction.amount, transaction.category)
+            for transaction in build_sample_transactions(3000, seed=9)
+        ]
+        index = autocomplete.PrefixIndex()
+        index.extend(rows[:2000])
+        for row in rows[2000:]:
+            index.add(*row)
+        today = date(2026, 1, 1)
+        for prefix in ('s', 'h', '1', 'salary', 'shwapno grocery'):
+            with self.subTest(prefix):
+                # Walking the ranked descriptions finds what scoring every match would
+                matches = {
+                    normalize_description(row[0]) for row in rows
+                    if f' {normalize_description(row[0])}'.find(f' {prefix}') >= 0
+                }
+                entries = sorted(
+                    (index._entries[normalized] for normalized in matches),
+                    key=lambda entry: (-entry.score(today), entry.description),
+                )
+                self.assertEqual(
+                    [suggestion['description'] for suggestion in index.search(prefix, today=today)],
+                    [entry.description for entry in entries[:8]],
+                )
+
+    def test_follows_writes(self):
+        self.assertEqual(self.suggestions('late'), [])
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post('/api/transactions/', {
+                'date': '2025-06-01', 'description': 'Late night snacks', 'amount': '350.00', 'category': 'food',
+            }, format='json')
+        self.assertEqual(self.suggestions('late'), ['Late night snacks'])
+
+        transaction_id = self.user.transactions.get(description='Late night snacks').id
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.patch(f'/api/transactions/{transaction_id}/', {'description': 'Early breakfast'}, format='json')
+        self.assertEqual(self.suggestions('late'), [])
+        self.assertEqual(self.suggestions('early'), ['Early breakfast'])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.delete(f'/api/transactions/{transaction_id}/')
+        self.assertEqual(self.suggestions('early'), [])
+
+        # Nobody else's index learns the description
+        self.client.force_authenticate(self.other)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post('/api/transactions/', {
+                'date': '2025-06-01', 'description': 'Late night snacks', 'amount': '350.00', 'category': 'food',
+            }, format='json')
+        self.client.force_authenticate(self.user)
+        self.assertEqual(self.suggestions('late'), [])
+
+    def test_p99_latency(self):
+        rows = [
+            (transaction.description, transaction.date, transaction.amount, transaction.category)
+            for transaction in build_sample_transactions(20000, seed=9)
+        ]
+        index = autocomplete.PrefixIndex()
+        index.extend(rows)
+        prefixes = ['s', 'sh', 'h', 'house r', 'pathao', 'gr', 'd', 'salary', '1', '12', '199', 'star k']
+        timings = []
+        for attempt in range(300):
+            # Answers are cached until the next write, time the lookups that miss
+            index._results.clear()
+            started = time.perf_counter()
+            index.search(prefixes[attempt % len(prefixes)])
+            timings.append((time.perf_counter() - started) * 1000)
+        p99 = statistics.quantiles(timings, n=100)[98]
+        self.assertLess(p99, 5 * LATENCY_SCALE, f"p99 {p99:.2f}ms over {len(index)} descriptions")
+
+
+class AnomalyTests(APITestCase):
+    """
+    Detection on a fixed history: food charges of 400, 500, 500 and 600 a month and 2000 a
+    month of transport through 2024, so the food charges' median is 500 and their scaled MAD
+    148.26, and every monthly total's baseline is 2000.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('alice', 'alice@example.com', 'password')
+        rows = []
+        for month in range(1, 13):
+            for day, amount in zip((3, 10, 17, 24), (400, 500, 500, 600)):
+                rows.append((date(2024, month, day), 'Shwapno grocery run', amount, 'food'))
+            rows.append((date(2024, month, 5), 'Pathao ride to office', 2000, 'transport'))
+            rows.append((date(2024, month, 1), 'Salary payment', 50000, 'income'))
+        rows += [
+            # 3.44 and 3.51 MADs above the median, around the default threshold of 3.5
+            (date(2024, 11, 28), 'Shwapno big shop', 1010, 'food'),
+            (date(2024, 12, 28), 'Shwapno bigger shop', 1020, 'food'),
+            # Income is never judged
+            (date(2024, 12, 31), 'Bonus', 500000, 'income'),
+        ]
+        # The same charges as always, four times as many of them
+        rows += [(date(2025, 1, day), 'Pathao ride to office', 2000, 'transport') for day in (6, 7, 8, 9)]
+        cls.create(rows)
+        cls.unusual = cls.user.transactions.get(amount=1020).id
+
+    @classmethod
+    def create(cls, rows):
+        Transaction.objects.bulk_create([
+            Transaction(user=cls.user, date=day, description=description, amount=Decimal(amount), category=category)
+            for day, description, amount, category in rows
+        ])
+
+    def flags(self):
+        anomalies = SpendingAnomaly.objects.filter(user=self.user)
+        transactions = set(anomalies.filter(kind='transaction').values_list('transaction_id', flat=True))
+        spikes = set(anomalies.filter(kind='category_spike').values_list('category', 'date'))
+        return transactions, spikes
+
+    def test_flags_at_the_threshold(self):
+        self.assertEqual(anomalies.scan_users([self.user.id]), (self.user.transactions.exclude(category='income').count(), 4))
+        transactions, spikes = self.flags()
+        self.assertEqual(transactions, {self.unusual})
+        # Months with a flagged charge add up to 3010 and 3020 against 2000, January's transport to 8000
+        self.assertEqual(spikes, {('food', date(2024, 11, 1)), ('food', date(2024, 12, 1)), ('transport', date(2025, 1, 1))})
+        anomaly = SpendingAnomaly.objects.get(kind='transaction')
+        self.assertEqual((anomaly.amount, anomaly.baseline, anomaly.score), (Decimal('1020.00'), Decimal('500.00'), 3.51))
+
+        history = anomalies.load_history(self.user.id)
+        new = history['ids'] > 0
+        for threshold, expected in ((3.4, {'Shwapno big shop', 'Shwapno bigger shop'}), (3.5, {'Shwapno bigger shop'}), (3.6, set())):
+            with self.subTest(threshold):
+                found = anomalies.unusual_transactions(history, new, threshold)
+                self.assertEqual({anomaly.description for anomaly in found}, expected)
+
+        months = {2024 * 12 + 10, 2024 * 12 + 11}
+        # Scores 5.05 and 5.1
+        self.assertEqual(len(anomalies.category_spikes(history, months, 5)), 2)
+        self.assertEqual(len(anomalies.category_spikes(history, months, 5.08)), 1)
+        self.assertEqual(anomalies.category_spikes(history, months, 5.2), [])
+
+    def test_incremental_scan(self):
+        anomalies.scan_users([self.user.id])
+        self.assertEqual(anomalies.users_to_scan(incremental=True), [])
+        # Earlier charges are not judged again, their flag stays gone
+        SpendingAnomaly.objects.filter(kind='transaction').delete()
+        mark = AnomalyScan.objects.get(user=self.user).last_transaction_id
+        self.create([(date(2025, 2, 10), 'Shwapno party order', 5000, 'food')])
+        newest = self.user.transactions.latest('id').id
+        self.assertEqual(anomalies.users_to_scan(incremental=True), [self.user.id])
+
+        _, _, months, last_id = anomalies.detect_user(self.user.id, since_id=mark)
+        self.assertEqual((months, last_id), ({2025 * 12 + 1}, newest))
+
+        anomalies.scan_users([self.user.id], incremental=True)
+        transactions, spikes = self.flags()
+        self.assertEqual(transactions, {newest})
+        self.assertEqual(spikes, {
+            ('food', date(2024, 11, 1)), ('food', date(2024, 12, 1)), ('transport', date(2025, 1, 1)),
+            ('food', date(2025, 2, 1)),
+        })
+        self.assertEqual(AnomalyScan.objects.get(user=self.user).last_transaction_id, newest)
+        self.assertEqual(anomalies.users_to_scan(incremental=True), [])
+
+        anomalies.scan_users([self.user.id])
+        self.assertEqual(self.flags()[0], {self.unusual, newest})
+
+    def test_deleted_transactions_lose_their_flag(self):
+        anomalies.scan_users([self.user.id])
+        self.user.transactions.filter(id=self.unusual).update(description='Shwapno bigger shop, party')
+        self.assertEqual(self.flags()[0], {self.unusual})
+
+        self.client.force_authenticate(self.user)
+        self.assertEqual(self.client.delete(f'/api/transactions/{self.unusual}/').status_code, 204)
+        transactions, spikes = self.flags()
+        self.assertEqual(transactions, set())
+        self.assertEqual(len(spikes), 3)
+
+
+class ForecastTests(APITestCase):
+    """
+    Forecasts on a fixed history: half of the usual 600 of food is spent by mid-month, rent is a
+    monthly series due on the 20th.
+    """
+    TODAY = date(2025, 6, 15)
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('alice', 'alice@example.com', 'password')
+        rows = []
+        for month in (3, 4, 5):
+            rows += [
+                (date(2025, month, 1), 'Salary payment', 50000, 'income'),
+                (date(2025, month, 5), 'Shwapno grocery run', 300, 'food'),
+                (date(2025, month, 20), 'House rent - Dhanmondi flat', 25000, 'housing'),
+                (date(2025, month, 25), 'Shwapno grocery run', 300, 'food'),
+            ]
+        rows += [
+            (date(2025, 6, 1), 'Salary payment', 50000, 'income'),
+            (date(2025, 6, 3), 'Shwapno grocery run', 400, 'food'),
+            # Not spent yet
+            (date(2025, 6, 28), 'Shwapno grocery run', 900, 'food'),
+        ]
+        Transaction.objects.bulk_create([
+            Transaction(user=cls.user, date=day, description=description, amount=Decimal(amount), category=category)
+            for day, description, amount, category in rows
+        ])
+        RecurringSeries.objects.create(
+            user=cls.user, key=series_key('House rent - Dhanmondi flat'), description='House rent - Dhanmondi flat',
+            category='housing', period='monthly', interval_days=30.5, amount=Decimal('25000.00'),
+            amount_variation=0, occurrences=3, first_date=date(2025, 3, 20), last_date=date(2025, 5, 20),
+            next_date=date(2025, 6, 20), confidence=0.9,
+        )
+
+    def test_projected_totals(self):
+        forecast = compute_forecast(self.user.id, today=self.TODAY)
+        self.assertEqual((forecast.month, forecast.as_of, forecast.history_months), (date(2025, 6, 1), self.TODAY, 3))
+        self.assertEqual(forecast.categories, {
+            # 400 so far, twice the usual pace: the rest of the month is expected between the
+            # pace (400 more) and the average (300 more)
+            'food': {'to_date': '400.00', 'recurring': '0.00', 'projected': '750.00'},
+            # The series' rows are left out of the pace, its occurrence on the 20th is added instead
+            'housing': {'to_date': '0.00', 'recurring': '25000.00', 'projected': '25000.00'},
+            # Usually all in by the 15th
+            'income': {'to_date': '50000.00', 'recurring': '0.00', 'projected': '50000.00'},
+        })
+        self.assertEqual(forecast.expenses_to_date, Decimal('400.00'))
+        self.assertEqual(forecast.projected_expenses, Decimal('25750.00'))
+        self.assertEqual((forecast.income_to_date, forecast.projected_income), (Decimal('50000.00'), Decimal('50000.00')))
+
+        # After the 20th the rent is no longer upcoming: it was paid, or the series is late
+        self.assertEqual(compute_forecast(self.user.id, today=date(2025, 6, 21)).categories['housing']['recurring'], '0.00')
+
+    def test_writes_drop_the_stored_forecast(self):
+        today = timezone.localdate()
+        self.client.force_authenticate(self.user)
+        refresh_forecast(self.user.id)
+        stored = SpendingForecast.objects.filter(user=self.user, month=today.replace(day=1))
+        self.assertTrue(stored.exists())
+
+        # Earlier months do not change this month's forecast
+        last_month = months_before(today.replace(day=1), 1)
+        row = {'date': last_month.isoformat(), 'description': 'Star Kabab dinner', 'amount': '1200.00', 'category': 'food'}
+        self.assertEqual(self.client.post('/api/transactions/', row, format='json').status_code, 201)
+        self.assertTrue(stored.exists())
+
+        row = {**row, 'date': today.isoformat()}
+        self.assertEqual(self.client.post('/api/transactions/', row, format='json').status_code, 201)
+        self.assertFalse(stored.exists())
+        response = self.client.get('/api/forecast/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['categories']['food']['to_date'], '1200.00')
+        self.assertTrue(stored.exists())
+
+        # Moving a row out of the month changes it as well
+        transaction = self.user.transactions.get(date=today)
+        response = self.client.patch(f'/api/transactions/{transaction.id}/', {'date': last_month.isoformat()}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(stored.exists())
+
+
+class RecurringRefreshTests(QueryBudgetTestCase):
+    """Writes re-detect the series they touch through the (user, series_key) index."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('alice', 'alice@example.com', 'password')
+        seed_transactions(cls.user, 300, seed=4)
+
+    def test_series_follow_writes(self):
+        self.login(self.user)
+        ids = []
+        for month in (1, 2, 3):
+            with self.query_budget(12) as context:
+                response = self.client.post('/api/transactions/', {
+                    'date': f'2025-{month:02d}-05', 'description': f'Toffee TV invoice #{month}04',
+                    'amount': '299.00', 'category': 'entertainment',
+                }, format='json')
+            self.assertEqual(response.status_code, 201)
+            ids.append(self.user.transactions.latest('id').id)
+            self.assertFalse([query for query in context.captured_queries if 'LIKE' in query['sql']])
+        series = RecurringSeries.objects.get(user=self.user, key='toffee tv invoice')
+        self.assertEqual((series.period, series.occurrences), ('monthly', 3))
+
+        # Two occurrences left are no series
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.patch(f'/api/transactions/{ids[0]}/', {'description': 'Toffee TV refund'}, format='json')
+        self.assertFalse(RecurringSeries.objects.filter(user=self.user, key='toffee tv invoice').exists())
+
+
+class LiveEventTests(APITestCase):
+    """Events follow a commit on the primary, they are never built from a replica."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('alice', 'alice@example.com', 'password')
+        seed_transactions(cls.user, 50, seed=8)
+
+    def test_reads_from_primary(self):
+        changed = list(self.user.transactions.values_list('id', flat=True)[:3])
+        # A replica that is not even reachable, any routed read would fail
+        with mock.patch('core.routers.ReplicaRouter.db_for_read', return_value='replica_lagging'):
+            event, data = live.build_event({'user': self.user.id, 'changed': changed, 'deleted': []})
+            self.assertEqual(live.build_event({'user': self.user.id, 'reset': True})[0], 'reset')
+        self.assertEqual(event, 'changes')
+        self.assertEqual(sorted(row['id'] for row in data['changed']), sorted(changed))
+        self.assertEqual(data['totals']['total_transactions'], 50)
+
+
+class LiveTicketTests(APITestCase):
+    """The live stream is opened with a short lived ticket, never with an access token in the URL."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('alice', 'alice@example.com', 'password')
+
+    def ticket(self):
+        self.client.credentials(HTTP_AUTHORIZATION=f'JWT {AccessToken.for_user(self.user)}')
+        response = self.client.post('/api/transactions/live/ticket/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['expires_in'], settings.LIVE_UPDATES['TICKET_MAX_AGE'])
+        self.client.credentials()
+        return response.data['ticket']
+
+    def test_ticket_opens_the_stream(self):
+        response = self.client.get(f'/api/transactions/live/?ticket={self.ticket()}')
+        self.assertEqual(response.status_code, 200)
+        try:
+            self.assertIn(b'event: ready', next(iter(response.streaming_content)))
+        finally:
+            response.close()
+
+    def test_access_token_in_url_is_refused(self):
+        token = AccessToken.for_user(self.user)
+        self.assertEqual(self.client.get(f'/api/transactions/live/?access_token={token}').status_code, 401)
+        self.assertIsNone(live._websocket_user(f'access_token={token}'.encode()))
+
+    def test_invalid_tickets(self):
+        ticket = self.ticket()
+        # Signed for another purpose
+        profile_token = signing.dumps({'user': self.user.pk}, salt='core.profiling')
+        for value in (profile_token, ticket[:-2], str(AccessToken.for_user(self.user))):
+            with self.subTest(value):
+                self.assertEqual(self.client.get(f'/api/transactions/live/?ticket={value}').status_code, 401)
+        with override_settings(LIVE_UPDATES={**settings.LIVE_UPDATES, 'TICKET_MAX_AGE': -1}):
+            self.assertEqual(self.client.get(f'/api/transactions/live/?ticket={ticket}').status_code, 401)
+        self.user.is_active = False
+        self.user.save()
+        self.assertEqual(self.client.get(f'/api/transactions/live/?ticket={ticket}').status_code, 401)
+
+    def test_websocket_ticket(self):
+        self.assertEqual(live._websocket_user(f'ticket={self.ticket()}'.encode()), self.user)
+        self.assertIsNone(live._websocket_user(b''))
+
+
+class ProfilingTests(APITestCase):
+    """A request asking for cProfile is still served, and profiled, while cProfile is busy."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('staff', 'staff@example.com', 'password', is_staff=True)
+        seed_transactions(cls.user, 20, seed=9)
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        profiling_settings = override_settings(PROFILING={**settings.PROFILING, 'DIR': directory.name})
+        profiling_settings.enable()
+        self.addCleanup(profiling_settings.disable)
+        # The middleware decides before DRF authenticates, force_authenticate would not reach it
+        self.client.credentials(HTTP_AUTHORIZATION=f'JWT {AccessToken.for_user(self.user)}')
+
+    def profiled_meta(self):
+        response = self.client.get('/api/transactions/', HTTP_X_PROFILE='cprofile')
+        self.assertEqual(response.status_code, 200)
+        with zipfile.ZipFile(profiling.artifact_path(response.headers['X-Profile-Id'])) as archive:
+            return json.loads(archive.read('meta.json')), archive.namelist()
+
+    def test_concurrent_cprofile_is_sampled(self):
+        request = RequestFactory().get('/api/transactions/')
+        running = profiling.Capture('cprofile', request)
+        with ThreadPoolExecutor(1) as executor:
+            executor.submit(running.start).result()
+            try:
+                meta, names = self.profiled_meta()
+            finally:
+                executor.submit(running.stop).result()
+        self.assertEqual(meta['mode'], 'sample')
+        self.assertIn('fallback', meta)
+        self.assertIn('stacks.txt', names)
+        # Released once the other capture stops
+        meta, names = self.profiled_meta()
+        self.assertEqual(meta['mode'], 'cprofile')
+        self.assertIn('profile.prof', names)
+
+    def test_profiler_refused_by_interpreter(self):
+        # What Python 3.12+ raises when another profiler is active
+        profiler = mock.Mock(**{'enable.side_effect': ValueError("Another profiling tool is already active")})
+        with mock.patch.object(profiling.cProfile, 'Profile', return_value=profiler):
+            meta, names = self.profiled_meta()
+        self.assertEqual(meta['mode'], 'sample')
+        self.assertIn('stacks.txt', names)
+        self.assertTrue(profiling._cprofile_lock.acquire(blocking=False))
+        profiling._cprofile_lock.release()
+
+
+class StartupImportTests(SimpleTestCase):
+    """Workers boot without the heavy libraries, only the code paths that use them import them."""
+
+    def test_urlconf_does_not_import_heavy_modules(self):
+        # A fresh interpreter, this one has imported all of them already
+        script = (
+            "import json, sys, django\n"
+            "django.setup()\n"
+            f"import {settings.ROOT_URLCONF}\n"
+            "print(json.dumps([name for name in ('numpy', 'PIL', 'google.genai') if name in sys.modules]))\n"
+        )
+        env = {**os.environ, 'DJANGO_SETTINGS_MODULE': os.environ['DJANGO_SETTINGS_MODULE']}
+        result = subprocess.run(
+            [sys.executable, '-c', script], capture_output=True, text=True, env=env, cwd=settings.BASE_DIR,
+        )
+        self.assertEqual(result.returncode, 0, result.stderr)
+        self.assertEqual(json.loads(result.stdout.strip().splitlines()[-1]), [])
+
+
+@override_settings(GEMINI_BACKEND='fake', LLM_DAILY_TOKEN_BUDGET=0)
+class ReceiptTests(APITestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('alice', 'alice@example.com', 'password')
+        cls.other = User.objects.create_user('bob', 'bob@example.com', 'password')
+
+    def setUp(self):
+        clear_worker_caches()
+        self.thumbnail_pool = isolate_receipts(self)
+
+    def upload(self, data):
+        image = SimpleUploadedFile('IMG_0001.jpg', data, content_type='image/jpeg')
+        return self.client.post('/api/image-to-trasaction/', {'image': image}, format='multipart')
+
+    def test_identical_uploads_share_one_file(self):
+        self.client.force_authenticate(self.user)
+        data = receipt_image()
+        with self.captureOnCommitCallbacks(execute=True):
+            first = self.upload(data).data['receipt']
+            second = self.upload(data).data['receipt']
+        self.assertEqual(first['id'], second['id'])
+        receipt = TransactionImage.objects.get()
+        self.assertEqual((receipt.user, receipt.sha256, receipt.width), (self.user, first['sha256'], 1200))
+        self.assertTrue(receipt.image.name.startswith(f"{self.user.id}/{receipt.sha256[:2]}/"))
+        # Thumbnails of the first upload only
+        self.assertEqual([args for _, args in self.thumbnail_pool.jobs], [(receipt.id,)])
+
+        # The same bytes are another user's own receipt
+        self.client.force_authenticate(self.other)
+        self.assertNotEqual(self.upload(data).data['receipt']['id'], first['id'])
+
+    def test_invalid_image(self):
+        self.client.force_authenticate(self.user)
+        response = self.upload(b'\xff\xd8\xff\xe0' + b'0' * 2048)
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(TransactionImage.objects.exists())
+
+    def test_scoped_to_owner(self):
+        self.client.force_authenticate(self.user)
+        receipt = self.upload(receipt_image()).data['receipt']
+        self.assertEqual(self.client.get(f"/api/image-to-trasaction/{receipt['id']}/file/").status_code, 200)
+        self.client.force_authenticate(self.other)
+        self.assertEqual(self.client.get('/api/image-to-trasaction/').data['count'], 0)
+        self.assertEqual(self.client.get(f"/api/image-to-trasaction/{receipt['id']}/file/").status_code, 404)
+        self.assertEqual(self.client.delete(f"/api/image-to-trasaction/{receipt['id']}/").status_code, 404)
+
+    def test_signed_urls(self):
+        self.client.force_authenticate(self.user)
+        receipt = self.upload(receipt_image()).data['receipt']
+        self.client.force_authenticate(None)
+        response = self.client.get(receipt['url'])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'image/jpeg')
+        self.assertEqual(response['Cache-Control'], receipts.CACHE_CONTROL)
+        self.assertEqual(self.client.get(receipt['url'].replace('sig=', 'sig=x')).status_code, 403)
+        # A signature is only good for the size it was made for
+        self.assertEqual(self.client.get(receipt['url'] + '&size=320').status_code, 403)
+        self.assertEqual(self.client.get(f"/api/image-to-trasaction/{receipt['id']}/file/").status_code, 401)
+
+    def test_thumbnails(self):
+        from PIL import Image
+
+        self.client.force_authenticate(self.user)
+        receipt = self.upload(receipt_image(size=(1200, 1600))).data['receipt']
+        self.client.force_authenticate(None)
+        # Not made yet (the pool did not run), made on request
+        response = self.client.get(receipt['thumbnails']['320'])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'image/webp')
+        with Image.open(io.BytesIO(b''.join(response.streaming_content))) as thumbnail:
+            self.assertEqual(thumbnail.size, (240, 320))
+        self.assertEqual(set(TransactionImage.objects.get().thumbnails), {'320', '1024'})
+
+    def test_ranges_and_revalidation(self):
+        self.client.force_authenticate(self.user)
+        data = receipt_image()
+        receipt = self.upload(data).data['receipt']
+        path = f"/api/image-to-trasaction/{receipt['id']}/file/"
+
+        response = self.client.get(path, HTTP_RANGE='bytes=10-19')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response['Content-Range'], f"bytes 10-19/{len(data)}")
+        self.assertEqual(b''.join(response.streaming_content), data[10:20])
+        response = self.client.get(path, HTTP_RANGE='bytes=-5')
+        self.assertEqual(b''.join(response.streaming_content), data[-5:])
+        self.assertEqual(self.client.get(path, HTTP_RANGE=f"bytes={len(data)}-").status_code, 416)
+        # A range of another version of the file gets all of this one
+        self.assertEqual(self.client.get(path, HTTP_RANGE='bytes=0-9', HTTP_IF_RANGE='"stale"').status_code, 200)
+
+        etag = self.client.get(path)['ETag']
+        self.assertEqual(self.client.get(path, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+    def test_served_by_web_server(self):
+        self.client.force_authenticate(self.user)
+        receipt = self.upload(receipt_image()).data['receipt']
+        with self.settings(RECEIPTS={**settings.RECEIPTS, 'SENDFILE': 'x-accel-redirect'}):
+            response = self.client.get(f"/api/image-to-trasaction/{receipt['id']}/file/")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.content, b'')
+        stored = TransactionImage.objects.get()
+        self.assertEqual(response['X-Accel-Redirect'], f"/protected-receipts/{stored.image.name}")
+
+    def test_delete_removes_files(self):
+        self.client.force_authenticate(self.user)
+        receipt = self.upload(receipt_image()).data['receipt']
+        stored = TransactionImage.objects.get()
+        receipts.make_thumbnails(stored)
+        names = [stored.image.name, *stored.thumbnails.values()]
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(self.client.delete(f"/api/image-to-trasaction/{receipt['id']}/").status_code, 204)
+        self.assertFalse(any(stored.image.storage.exists(name) for name in names))
+
+
+class StaffAnalyticsTests(APITestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('alice', 'alice@example.com', 'password')
+        cls.other = User.objects.create_user('bob', 'bob@example.com', 'password')
+        cls.staff = User.objects.create_user('staff', 'staff@example.com', 'password', is_staff=True)
+        seed_transactions(cls.user, 300, seed=6)
+        seed_transactions(cls.other, 300, seed=7)
+
+    def setUp(self):
+        cache.clear()
+
+    def test_staff_only(self):
+        self.client.force_authenticate(self.user)
+        self.assertEqual(self.client.get('/api/stats/analytics/').status_code, 403)
+
+    def test_complete_sample_is_exact(self):
+        self.client.force_authenticate(self.staff)
+        response = self.client.get('/api/stats/analytics/?months=36')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['sample']['fraction'], 1.0)
+        exact = exact_analytics(36)
+        for name in ('totals', 'categories', 'distribution', 'growth'):
+            self.assertEqual(response.data[name], exact[name])
+        self.assertEqual(response.data['totals']['active_users'], {'value': 2, 'margin': 0})
+
+    @override_settings(STAFF_ANALYTICS={**settings.STAFF_ANALYTICS, 'SAMPLE_ROWS': 200, 'CACHE_SECONDS': 60})
+    def test_sample_has_margins(self):
+        self.client.force_authenticate(self.staff)
+        response = self.client.get('/api/stats/analytics/?months=36&seed=3')
+        self.assertEqual(response.status_code, 200)
+        self.assertLess(response.data['sample']['fraction'], 1)
+        # Cached for every dashboard asking for the same window and seed
+        self.assertEqual(self.client.get('/api/stats/analytics/?months=36&seed=3').data, response.data)
+        if response.data['sample']['users']:
+            self.assertGreater(response.data['totals']['transactions']['margin'], 0)
+
+    def test_invalid_months(self):
+        self.client.force_authenticate(self.staff)
+        self.assertEqual(self.client.get('/api/stats/analytics/?months=0').status_code, 400)
+        self.assertEqual(self.client.post('/api/stats/analytics/exact/', {'months': 99}).status_code, 400)
+
+    def test_exact_report(self):
+        self.client.force_authenticate(self.staff)
+        with self.captureOnCommitCallbacks() as callbacks:
+            response = self.client.post('/api/stats/analytics/exact/', {'months': 36}, format='json')
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(response.data['status'], 'queued')
+        self.assertEqual(len(callbacks), 1)
+        # Run here rather than on the background thread, which can not see the test's transaction
+        run_report(response.data['id'])
+        self.assertIsNone(run_report(response.data['id']))
+        report = self.client.get(f"/api/stats/analytics/exact/{response.data['id']}/").data
+        self.assertEqual(report['status'], 'done')
+        self.assertEqual(report['result']['totals']['transactions'], {'value': 600, 'margin': 0})
+        listed = self.client.get('/api/stats/analytics/exact/?months=36').data
+        self.assertEqual([row['id'] for row in listed], [response.data['id']])
+        self.assertNotIn('result', listed[0])
+
+    def test_abandoned_reports_are_reclaimed(self):
+        timeout = timedelta(seconds=settings.STAFF_ANALYTICS['RUNNING_TIMEOUT'])
+        abandoned = AnalyticsReport.objects.create(months=12, status='running', started_at=timezone.now() - 2 * timeout)
+        running = AnalyticsReport.objects.create(months=12, status='running', started_at=timezone.now())
+        queued = AnalyticsReport.objects.create(months=12)
+        call_command('compute_staff_analytics', '--queued', stdout=io.StringIO())
+        statuses = dict(AnalyticsReport.objects.values_list('id', 'status'))
+        self.assertEqual(
+            [statuses[abandoned.id], statuses[running.id], statuses[queued.id]], ['done', 'running', 'done']
+        )
+
+
+class LatencyBudgetTests(QueryBudgetTestCase):
+    """Coarse wall-time budgets on a larger dataset, they catch order-of-magnitude regressions."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('alice', 'alice@example.com', 'password')
+        cls.other = User.objects.create_user('bob', 'bob@example.com', 'password')
+        cls.staff = User.objects.create_user('staff', 'staff@example.com', 'password', is_staff=True)
+        seed_transactions(cls.user, 20000, seed=4)
+        seed_transactions(cls.other, 5000, seed=5)
+
+    def test_list(self):
+        self.login(self.user)
+        self.client.get('/api/transactions/')
+        with self.latency_budget(300):
+            response = self.client.get('/api/transactions/?page=50&ordering=-amount')
+        self.assertEqual(response.status_code, 200)
+
+    def test_list_searched(self):
+        self.login(self.user)
+        with self.latency_budget(300):
+            response = self.client.get('/api/transactions/?search=grocery&category=food')
+        self.assertEqual(response.status_code, 200)
+
+    def test_list_staff(self):
+        self.login(self.staff)
+        with self.latency_budget(500):
+            response = self.client.get('/api/transactions/?page=200&compact=1')
+        self.assertEqual(response.status_code, 200)
+
+    def test_create_bulk(self):
+        self.login(self.user)
+        rows = [
+            {'date': f'2025-{month:02d}-{day:02d}', 'description': f'Shwapno grocery run #{month}{day}',
+             'amount': '450.00', 'category': 'food'}
+            for month in range(1, 13) for day in range(1, 21)
+        ]
+        with self.latency_budget(3000):
+            response = self.client.post('/api/transactions/', rows, format='json')
+        self.assertEqual(response.status_code, 201)
+
+    def test_analysis(self):
+        self.login(self.user)
+        with self.latency_budget(1000):
+            response = self.client.get('/api/analysis/?year=2025&month=7')
+        self.assertEqual(response.status_code, 200)
+
+    def test_pdf(self):
+        self.login(self.user)
+        with self.latency_budget(5000):
+            response = self.client.get('/api/transactions/pdf/download/?year=2025&month=8')
+        self.assertEqual(response.status_code, 200)
+
+    def test_forecast(self):
+        self.login(self.user)
+        with self.latency_budget(1000):
+            response = self.client.get('/api/forecast/')
+        self.assertEqual(response.status_code, 200)
+
+    def test_changes(self):
+        self.login(self.user)
+        with self.latency_budget(1000):
+            response = self.client.get('/api/transactions/changes/?limit=1000')
+        self.assertEqual(response.status_code, 200)
+
+    def test_staff_analytics(self):
+        self.login(self.staff)
+        with self.latency_budget(1000):
+            response = self.client.get('/api/stats/analytics/?months=24')
+        self.assertEqual(response.status_code, 200)
+
+
+class ReplicaRoutingTests(SimpleTestCase):
+    """
+    ReplicaRouter with a second SQLite database as replica_0.
+
+    The replica has the tables but never receives the primary's writes, like one that lags
+    behind: whatever a read finds tells which database served it.
+    """
+    databases = {'default'}
+
+    @classmethod
+    def setUpClass(cls):
+        # Declared here, the test runner would try to create replica_0 as a test database
+        cls.databases = {'default', 'replica_0'}
+        directory = tempfile.TemporaryDirectory()
+        cls.addClassCleanup(directory.cleanup)
+        configured = connections.configure_settings({
+            **connections.settings,
+            'replica_0': {'ENGINE': 'django.db.backends.sqlite3', 'NAME': os.path.join(directory.name, 'replica.sqlite3')},
+        })
+        connections.settings['replica_0'] = configured['replica_0']
+        cls.addClassCleanup(connections.settings.pop, 'replica_0')
+        cls.addClassCleanup(connections.__delitem__, 'replica_0')
+        cls.addClassCleanup(lambda: connections['replica_0'].close())
+        with connections['replica_0'].schema_editor() as editor:
+            for model in [User, *apps.get_app_config('core').get_models()]:
+                editor.create_model(model)
+        super().setUpClass()
+
+    def setUp(self):
+        self.enterContext(mock.patch('core.routers.replica_aliases', return_value=['replica_0']))
+        cache.clear()
+        self.user = User.objects.create_user('alice', 'alice@example.com', 'password')
+        self.addCleanup(User.objects.filter(pk=self.user.pk).delete)
+        # The user made it to the replica, none of their transactions did
+        User.objects.using('replica_0').bulk_create([self.user])
+        self.addCleanup(self.clear_replica)
+        seed_transactions(self.user, 5, seed=17)
+
+    def clear_replica(self):
+        # Without the collector, which would look for tables only the primary has
+        with connections['replica_0'].cursor() as cursor:
+            for model in [*apps.get_app_config('core').get_models(), User]:
+                cursor.execute(f'DELETE FROM {model._meta.db_table}')
+
+    @contextmanager
+    def request(self, method='GET', key=None, recently_wrote=False):
+        start_request(key, method, recently_wrote)
+        try:
+            yield
+        finally:
+            self.pin_key = finish_request()
+
+    def visible(self):
+        return self.user.transactions.count()
+
+    def test_requests_read_from_replicas(self):
+        with self.request():
+            self.assertEqual(self.visible(), 0)
+            self.assertEqual(router.db_for_read(Transaction), 'replica_0')
+        self.assertIsNone(self.pin_key)
+
+    def test_writes_pin_the_request(self):
+        with self.request(key='db-pin:1'):
+            self.assertEqual(self.visible(), 0)
+            self.user.transactions.filter(category='food').update(is_recurring=True)
+            self.assertEqual(self.visible(), 5)
+        self.assertEqual(self.pin_key, 'db-pin:1')
+        for method in ('POST', 'PATCH', 'DELETE'):
+            with self.subTest(method), self.request(method):
+                self.assertEqual(self.visible(), 5)
+        with self.request(recently_wrote=True):
+            self.assertEqual(self.visible(), 5)
+
+    def test_atomic_blocks_read_from_the_primary(self):
+        with self.request():
+            with db_transaction.atomic():
+                self.assertEqual(self.visible(), 5)
+            self.assertEqual(self.visible(), 0)
+
+    def test_outside_requests_read_from_the_primary(self):
+        # Management commands and background jobs act on what they read
+        self.assertEqual(self.visible(), 5)
+        self.assertEqual(router.db_for_read(Transaction), 'default')
+        self.assertEqual(router.db_for_read(Transaction, stale_ok=True), 'replica_0')
+
+    def test_sticky_after_a_write(self):
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f'JWT {AccessToken.for_user(self.user)}')
+
+        def listed():
+            response = client.get('/api/transactions/')
+            self.assertEqual(response.status_code, 200)
+            return response.data['totals']['total_transactions']
+
+        self.assertEqual(listed(), 0)
+        row = {'date': '2025-06-01', 'description': 'Pathao ride home', 'amount': '180.00', 'category': 'transport'}
+        self.assertEqual(client.post('/api/transactions/', row, format='json').status_code, 201)
+        # Read from the primary until the pin expires
+        self.assertEqual(listed(), 6)
+        cache.delete(f'db-pin:{self.user.pk}')
+        self.assertEqual(listed(), 0)
+
+
+@override_settings(RESPONSE_COMPRESSION={**settings.RESPONSE_COMPRESSION, 'MIN_SIZE': 200})
+class CompressionMiddlewareTests(SimpleTestCase):
+    BODY = b'{"description": "Shwapno grocery run", "amount": 450.0}, ' * 20
+
+    def respond(self, response, accept_encoding='gzip'):
+        request = RequestFactory().get('/api/transactions/', HTTP_ACCEPT_ENCODING=accept_encoding)
+        return CompressionMiddleware(lambda request: response)(request)
+
+    def encoding(self, accept_encoding, encodings=('zstd', 'br', 'gzip')):
+        config = {**settings.RESPONSE_COMPRESSION, 'ENCODINGS': list(encodings)}
+        with override_settings(RESPONSE_COMPRESSION=config):
+            response = self.respond(HttpResponse(self.BODY), accept_encoding)
+        return response.get('Content-Encoding')
+
+    def test_negotiation(self):
+        cases = [
+            # Ties go to the server's order
+            ('gzip, deflate, br, zstd', ('zstd', 'br', 'gzip'), 'zstd'),
+            ('gzip, br', ('zstd', 'br', 'gzip'), 'br'),
+            ('gzip, br', ('gzip', 'br'), 'gzip'),
+            # The client's q-values come first
+            ('zstd;q=0.5, gzip;q=0.8, br; q=0.1', ('zstd', 'br', 'gzip'), 'gzip'),
+            ('GZIP', ('gzip',), 'gzip'),
+            ('*', ('br', 'gzip'), 'br'),
+            ('*;q=0.5, br;q=0', ('br', 'gzip'), 'gzip'),
+            # q=0 is a refusal, a q-value that does not parse is one too
+            ('gzip;q=0', ('gzip',), None),
+            ('gzip;q=0, *', ('gzip',), None),
+            ('gzip;q=high', ('gzip',), None),
+            ('identity', ('gzip',), None),
+            ('', ('gzip',), None),
+            ('br', ('gzip',), None),
+        ]
+        for accept_encoding, encodings, expected in cases:
+            if not {'br', 'zstd'}.isdisjoint(encodings) and (brotli is None or zstandard is None):
+                continue
+            with self.subTest(accept_encoding=accept_encoding, encodings=encodings):
+                self.assertEqual(self.encoding(accept_encoding, encodings), expected)
+
+    def test_compressed_body(self):
+        response = self.respond(HttpResponse(self.BODY))
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(gzip.decompress(response.content), self.BODY)
+        self.assertEqual(response['Content-Length'], str(len(response.content)))
+        self.assertEqual(response['Vary'], 'Accept-Encoding')
+
+    def test_left_alone(self):
+        pdf = HttpResponse(self.BODY, content_type='application/pdf')
+        image = HttpResponse(self.BODY, content_type='image/png')
+        events = HttpResponse(self.BODY, content_type='text/event-stream')
+        encoded = HttpResponse(gzip.compress(self.BODY), headers={'Content-Encoding': 'gzip'})
+        for name, response in {
+            'below MIN_SIZE': HttpResponse(self.BODY[:199]),
+            'pdf': pdf, 'image': image, 'event stream': events, 'already encoded': encoded,
+            'small stream': StreamingHttpResponse(iter([b'x' * 10]), headers={'Content-Length': '10'}),
+        }.items():
+            with self.subTest(name):
+                headers = dict(response.headers)
+                response = self.respond(response)
+                self.assertEqual(dict(response.headers), headers)
+        self.assertEqual(self.respond(HttpResponse(self.BODY[:200]))['Content-Encoding'], 'gzip')
+
+    def test_incompressible_body(self):
+        body = os.urandom(4096)
+        response = self.respond(HttpResponse(body))
+        self.assertFalse(response.has_header('Content-Encoding'))
+        self.assertEqual(response.content, body)
+        # The answer still depends on the header
+        self.assertEqual(response['Vary'], 'Accept-Encoding')
+
+    def test_streaming(self):
+        chunks = [self.BODY[index:index + 100] for index in range(0, len(self.BODY), 100)]
+        for headers in ({}, {'Content-Length': str(len(self.BODY))}):
+            with self.subTest(headers=headers):
+                response = self.respond(StreamingHttpResponse(iter(chunks), headers=headers))
+                self.assertEqual(response['Content-Encoding'], 'gzip')
+                self.assertFalse(response.has_header('Content-Length'))
+                parts = list(response.streaming_content)
+                # Every chunk is flushed as it is produced
+                self.assertGreaterEqual(len(parts), len(chunks))
+                self.assertEqual(gzip.decompress(b''.join(parts)), self.BODY)
+
+    def test_async_streaming(self):
+        async def stream():
+            for index in range(0, len(self.BODY), 100):
+                yield self.BODY[index:index + 100]
+
+        async def consume(response):
+            return b''.join([part async for part in response.streaming_content])
+
+        response = self.respond(StreamingHttpResponse(stream()))
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(gzip.decompress(async_to_sync(consume)(response)), self.BODY)
+
+    def test_vary_and_etag(self):
+        response = self.respond(HttpResponse(self.BODY, headers={'Vary': 'Cookie', 'ETag': '"abc"'}))
+        self.assertEqual(response['Vary'], 'Cookie, Accept-Encoding')
+        # The encoded bytes differ from what the strong ETag named
+        self.assertEqual(response['ETag'], 'W/"abc"')
+        response = self.respond(HttpResponse(self.BODY, headers={'ETag': 'W/"abc"'}))
+        self.assertEqual(response['ETag'], 'W/"abc"')
+        response = self.respond(HttpResponse(self.BODY, headers={'ETag': '"abc"'}), accept_encoding='identity')
+        self.assertEqual(response['ETag'], '"abc"')
+
+
+@unittest.skipIf(zstandard is None, "zstandard is not installed")
+class ZstdCompressionTests(SimpleTestCase):
+    """The middleware's encoders are shared by every request of a worker."""
+
+    def payload(self, number):
+        return b''.join(b'{"id": %d, "row": %d, "description": "Shwapno grocery"}' % (number, row) for row in range(300))
+
+    def test_concurrent_bodies(self):
+        encoder = ZstdEncoder(3)
+
+        def roundtrip(number):
+            # Decompressors are not thread safe either, each check has its own
+            decoded = zstandard.ZstdDecompressor().decompress(encoder.compress(self.payload(number)))
+            return decoded == self.payload(number)
+
+        with ThreadPoolExecutor(max_workers=8) as pool:
+            self.assertTrue(all(pool.map(roundtrip, range(400))))
+
+    def test_interleaved_streams(self):
+        encoder = ZstdEncoder(3)
+        chunks = {number: [self.payload(number)[i:i + 500] for i in range(0, 15000, 500)] for number in (1, 2)}
+        streams = {number: compress_stream(encoder, iter(chunks[number])) for number in chunks}
+        received = {number: [] for number in chunks}
+        # Chunks of both responses are produced alternately, as a threaded server does
+        while streams:
+            for number in list(streams):
+                try:
+                    received[number].append(next(streams[number]))
+                except StopIteration:
+                    del streams[number]
+        for number in chunks:
+            decoded = zstandard.ZstdDecompressor().decompressobj().decompress(b''.join(received[number]))
+            self.assertEqual(decoded, b''.join(chunks[number]))
+
+
+class SingleFlightTests(SimpleTestCase):
+    """Results are handed between workers through files in a shared directory."""
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.lock_dir = os.path.join(directory.name, 'singleflight')
+
+    def test_results_are_stored_as_json_or_bytes(self):
+        results = {'analysis': {'financial_score': 72, 'tips': ['Save $200']}, 'pdf': b'%PDF-1.4 \x00\xff'}
+        for key, value in results.items():
+            SingleFlight(self.lock_dir, 60).do(key, lambda: value)
+            with open(os.path.join(self.lock_dir, f"{key}.result"), 'rb') as result_file:
+                self.assertNotIn(b'\x80', result_file.read(2))
+            # Another worker blocked on the lock reads the stored result
+            self.assertEqual(SingleFlight(self.lock_dir, 60).do(key, lambda: self.fail("recomputed")), (value, True))
+
+    def test_directory_is_private(self):
+        single_flight = SingleFlight(self.lock_dir, 60)
+        self.assertIsNotNone(single_flight.lock_dir)
+        self.assertEqual(os.stat(self.lock_dir).st_mode & 0o777, 0o700)
+
+    def test_shared_directory_is_refused(self):
+        os.mkdir(self.lock_dir)
+        os.chmod(self.lock_dir, 0o777)
+        single_flight = SingleFlight(self.lock_dir, 60)
+        self.assertIsNone(single_flight.lock_dir)
+        # Still coalesces within the process
+        self.assertEqual(single_flight.do('analysis-1', lambda: 1), (1, False))
+        self.assertEqual(os.listdir(self.lock_dir), [])
+
+
+class RendererTests(SimpleTestCase):
+    """ORJSONRenderer and ORJSONParser against DRF's JSONRenderer and JSONParser."""
+
+    def render(self, data, renderer_class, strict=True):
+        renderer = renderer_class()
+        renderer.strict = strict
+        return renderer.render(data, 'application/json')
+
+    def assertSameOutput(self, data, strict=True):
+        self.assertEqual(self.render(data, ORJSONRenderer, strict), self.render(data, JSONRenderer, strict))
+
+    def test_same_bytes(self):
+        cases = {
+            'nested': ReturnDict([('results', ReturnList([{'id': 1, 'tags': ('a', 'b')}], serializer=None))], serializer=None),
+            'unicode': {'description': 'চা-নাস্তা, café ☕', 'empty': '', 'none': None},
+            'line separators': {'description': 'first\u2028second\u2029third'},
+            'dates': [date(2025, 6, 1), datetime(2025, 6, 1, 8, 30, 15, 123456)],
+            'utc': datetime(2025, 6, 1, 8, 30, tzinfo=dt_timezone.utc),
+            'offset': datetime(2025, 6, 1, 8, 30, tzinfo=dt_timezone(timedelta(hours=6))),
+            'times': [dt_time(8, 30, 15, 500), timedelta(days=1, seconds=30)],
+            'decimals': [Decimal('1250.50'), Decimal('0.10'), Decimal('-0.01'), Decimal('99999999.99')],
+            'floats': [0.1, -2.5, 0.001, 123456.789],
+            'keys': {1: 'int', 2.5: 'float', True: 'bool', None: 'null'},
+            'other': [uuid.UUID(int=1), b'bytes', gettext_lazy('Lazy'), {3}],
+        }
+        for name, data in cases.items():
+            with self.subTest(name):
+                self.assertSameOutput(data)
+        self.assertIn(b'\\u2028', self.render(cases['line separators'], ORJSONRenderer))
+
+    def test_decimals_go_through_float(self):
+        # Beyond a float's precision both lose the same digits, exponents are only spelled differently
+        for value in (Decimal('12345678901234567.89'), Decimal('0.1000000000000000055511151231257827'), Decimal('1E+20'), 1e-7):
+            with self.subTest(value):
+                rendered = json.loads(self.render([value], ORJSONRenderer))
+                self.assertEqual(rendered, json.loads(self.render([value], JSONRenderer)))
+                self.assertEqual(rendered, [float(value)])
+        self.assertNotEqual(Decimal(str(json.loads(self.render(Decimal('12345678901234567.89'), ORJSONRenderer)))), Decimal('12345678901234567.89'))
+
+    def test_non_finite_numbers(self):
+        for data in (float('nan'), [1, {'score': float('inf')}], {'amount': Decimal('NaN')}, {float('-inf'): 1}, Decimal('-Infinity')):
+            with self.subTest(repr(data)):
+                with self.assertRaises(ValueError):
+                    self.render(data, JSONRenderer)
+                with self.assertRaises(ValueError):
+                    self.render(data, ORJSONRenderer)
+                # Without STRICT_JSON both write NaN and Infinity
+                self.assertSameOutput(data, strict=False)
+        self.assertEqual(self.render({'score': None}, ORJSONRenderer), b'{"score":null}')
+
+    def test_indent(self):
+        data = {'results': [{'id': 1, 'amount': Decimal('10.50')}]}
+        renderer = ORJSONRenderer()
+        pretty = renderer.render(data, 'application/json; indent=4')
+        self.assertIn(b'\n  "results"', pretty)
+        self.assertEqual(json.loads(pretty), json.loads(JSONRenderer().render(data, 'application/json; indent=4')))
+
+    def test_parser_round_trip(self):
+        data = {
+            'description': 'চা-নাস্তা café', 'amount': 1250.5, 'count': 2 ** 53 + 1, 'nested': [None, True, [{}]],
+            'date': date(2025, 6, 1), 'decimal': Decimal('0.10'),
+        }
+        rendered = self.render(data, ORJSONRenderer)
+        parsed = ORJSONParser().parse(io.BytesIO(rendered))
+        self.assertEqual(parsed, JSONParser().parse(io.BytesIO(rendered)))
+        self.assertEqual(parsed, {**data, 'date': '2025-06-01', 'decimal': 0.1})
+
+    def test_parser_errors(self):
+        for body in (b'{"amount": }', b'[1, 2', b'{"amount": NaN}', b'{"amount": Infinity}', b'\xff\xfe'):
+            with self.subTest(body):
+                with self.assertRaises(ParseError):
+                    JSONParser().parse(io.BytesIO(body))
+                with self.assertRaises(ParseError):
+                    ORJSONParser().parse(io.BytesIO(body))
@@ -1,11 +1,23 @@
+from django.conf import settings
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
 
 from .views import (
     TransactionViewSet, 
+    BudgetViewSet,
+    SpendingAnomalyViewSet,
     ImageToTransactionViewSet,
     AnalysisView,
     TransactionPDFView,
+    CoalescingStatsView,
+    LLMUsageReportView,
+    ProfileListView,
+    ProfileDownloadView,
+    RecurringSeriesView,
+    ForecastView,
+    StaffAnalyticsView,
+    AnalyticsReportView,
+    AnalyticsReportDetailView,
 
     #function based views
     user_update,
@@ -13,6 +25,8 @@ from .views import (
 
 router = DefaultRouter()
 router.register(r'transactions', TransactionViewSet, basename='transaction')
+router.register(r'budgets', BudgetViewSet, basename='budget')
+router.register(r'anomalies', SpendingAnomalyViewSet, basename='anomaly')
 router.register(r'image-to-trasaction', ImageToTransactionViewSet, basename='image-to-text')
 
 urlpatterns = [
@@ -20,4 +34,23 @@ urlpatterns = [
     path('analysis/', AnalysisView.as_view(), name='analysis'),
     path('user/update/', user_update, name='user-update'),
     path('transactions/pdf/download/', TransactionPDFView.as_view(), name='transaction-pdf'),
-] 
\ No newline at end of file
+    path('forecast/', ForecastView.as_view(), name='forecast'),
+    path('recurring/', RecurringSeriesView.as_view(), name='recurring-series'),
+    path('stats/coalescing/', CoalescingStatsView.as_view(), name='coalescing-stats'),
+    path('stats/llm/', LLMUsageReportView.as_view(), name='llm-usage-report'),
+    path('stats/analytics/', StaffAnalyticsView.as_view(), name='staff-analytics'),
+    path('stats/analytics/exact/', AnalyticsReportView.as_view(), name='analytics-report-list'),
+    path('stats/analytics/exact/<int:pk>/', AnalyticsReportDetailView.as_view(), name='analytics-report-detail'),
+    path('profiles/', ProfileListView.as_view(), name='profile-list'),
+    path('profiles/<str:name>/', ProfileDownloadView.as_view(), name='profile-download'),
+]
+
+if settings.ASYNC_TRANSACTION_VIEWS:
+    from .async_views import AsyncTransactionView
+
+    # Native async CRUD under ASGI, the router keeps serving the transaction actions and
+    # non-numeric ids (which it answers with 404)
+    urlpatterns = [
+        path('transactions/', AsyncTransactionView.as_view(), name='transaction-list'),
+        path('transactions/<int:pk>/', AsyncTransactionView.as_view(detail=True), name='transaction-detail'),
+    ] + urlpatterns
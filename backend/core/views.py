@@ -1,12 +1,16 @@
-from datetime import date as dt, datetime
+import os
+from datetime import date as dt, datetime, timedelta
 from django.utils import timezone
 from django.http import HttpResponse
 
 from django.shortcuts import render
+from django.db import transaction as db_transaction
 from django.db.models import Sum, Count, Q
 from django.conf import settings
+from django.core.cache import cache
 from django.contrib.auth.models import User
-from django.http import FileResponse
+from django.http import FileResponse, Http404, StreamingHttpResponse
+from django.core.handlers.asgi import ASGIRequest
 
 from rest_framework import viewsets
 from rest_framework import status
@@ -14,30 +18,74 @@ from rest_framework.views import APIView
 from rest_framework.permissions import IsAuthenticated,IsAdminUser
 from rest_framework.filters import SearchFilter, OrderingFilter
 from rest_framework.response import Response
+from rest_framework.exceptions import NotAuthenticated, PermissionDenied, ValidationError
 from rest_framework.decorators import action,api_view, permission_classes
+from rest_framework.settings import api_settings
 
 
 from django_filters.rest_framework import DjangoFilterBackend
 
 
 
-from .models import Transaction, TransactionImage
+from .models import AnalyticsReport, Budget, RecurringSeries, SpendingAnomaly, Transaction, TransactionImage
 from .serializers import (
     TransactionSerializer ,
     TransactionViewSerializer, 
+    TransactionCompactViewSerializer,
     TransactionCreateSerializer,
     TransactionUpdateSerializer,
     TransactionImageSerializer,
+    TransactionBatchSerializer,
+    UserViewSerializer,
+    TransactionSyncSerializer,
+    RecurringSeriesSerializer,
+    BudgetSerializer,
+    SpendingAnomalySerializer,
+    SpendingForecastSerializer,
+    AnalyticsReportSerializer,
+    AnalyticsReportDetailSerializer,
     CustomUserUpdateSerializer
 )
-from .filters import TransactionFilters
+from .filters import SpendingAnomalyFilters, TransactionFilters
 from .pagination import DefaultPagination
+from .batch import apply_batch_operations
+from .duplicates import MODES as DUPLICATE_MODES, find_duplicates
+from .category_memo import correct_category, suggest_category
+from .autocomplete import user_index
+from .budgets import current_status as budget_status
+from .forecast import forecast_for
+from .receipts import InvalidReceipt, delete_files, serve_file, store_receipt, valid_signature
+from .staff_analytics import MAX_MONTHS as ANALYTICS_MAX_MONTHS, approximate_analytics, queue_report
+from .live import LiveTicketAuthentication, astream_events, make_ticket, stream_events
+from .archive import ArchivedTransactions, HotColdRows, archived_month, archives_for
+from .sync import ExpiredSyncToken, InvalidSyncToken, changes_since
 from . image_to_transaction import image_to_transaction
-from .analysis import transaction_analysis
-from .transaction_to_pdf import create_transaction_pdf
+from .analysis import AnalysisError, stream_transaction_analysis, transaction_analysis
+from .renderers import EventStreamRenderer, sse_event
+from .singleflight import coalescing_key, get_single_flight
+from .telemetry import MAX_REPORT_DAYS, MAX_REPORT_TOP, llm_report, over_token_budget
+from .profiling import artifact_path, list_artifacts
 
 # Create your views here.
 
+# Totals of the filtered rows, sent next to every page of the transaction list
+TRANSACTION_TOTALS = {
+    'total_income': Sum('amount', filter=Q(category='income')),
+    'total_expenses': Sum('amount', filter=~Q(category='income')),
+    'total_amount': Sum('amount'),
+    'transaction_count': Count('id'),
+}
+
+
+def totals_envelope(totals):
+    return {
+        'total_income': float(totals['total_income'] or 0),
+        'total_expenses': float(totals['total_expenses'] or 0),
+        'net_amount': float((totals['total_income'] or 0) - (totals['total_expenses'] or 0)),
+        'total_transactions': totals['transaction_count']
+    }
+
+
 class TransactionViewSet(viewsets.ModelViewSet):
     http_method_names = ['get', 'post', 'patch', 'delete']
     filter_backends = [DjangoFilterBackend,SearchFilter, OrderingFilter]
@@ -52,9 +100,16 @@ class TransactionViewSet(viewsets.ModelViewSet):
         if self.request.method == 'POST':
             return TransactionCreateSerializer
         elif self.request.method == 'GET':
+            if self.is_compact():
+                return TransactionCompactViewSerializer
             return TransactionViewSerializer
         elif self.request.method == 'PATCH':
             return TransactionUpdateSerializer
+
+    def get_serializer(self, *args, **kwargs):
+        if self.action in ('list', 'retrieve'):
+            kwargs.setdefault('fields', self.get_sparse_fields())
+        return super().get_serializer(*args, **kwargs)
         
     def get_permissions(self):
         if self.request.method in ['GET','POST', 'PATCH','DELETE']:
@@ -63,62 +118,263 @@ class TransactionViewSet(viewsets.ModelViewSet):
     def get_queryset(self):
         user = self.request.user
         if user.is_staff:
-            return Transaction.objects.all()
+            queryset = Transaction.objects.all()
         elif user.is_authenticated:
-            return Transaction.objects.filter(user=user)
+            queryset = Transaction.objects.filter(user=user)
+
+        if self.action in ('list', 'retrieve'):
+            # Only select the columns the response is going to contain
+            fields = self.get_sparse_fields()
+            columns = [field for field in fields if field not in ('id', 'user')]
+            if 'user' in fields and not self.is_compact():
+                queryset = queryset.select_related('user')
+                columns += ['user__' + field for field in UserViewSerializer.Meta.fields]
+            elif 'user' in fields:
+                columns.append('user')
+            if self.action == 'list':
+                # Ordering across hot and archived rows compares these
+                columns += ['date', 'amount']
+            queryset = queryset.only(*columns)
+        return queryset
+
+    def is_compact(self):
+        return self.request.query_params.get('compact', '').lower() in ('1', 'true', 'yes')
+
+    def get_sparse_fields(self):
+        """Returns the row fields requested with ?fields=a,b and/or ?omit=c, in serializer order."""
+        if hasattr(self, '_sparse_fields'):
+            return self._sparse_fields
+
+        available = TransactionViewSerializer.Meta.fields
+        params = self.request.query_params
+        requested = [name.strip() for name in params.get('fields', '').split(',') if name.strip()]
+        omitted = [name.strip() for name in params.get('omit', '').split(',') if name.strip()]
+        unknown = sorted(set(requested + omitted) - set(available))
+        if unknown:
+            raise ValidationError({"fields": f"Unknown fields: {', '.join(unknown)}"})
+
+        self._sparse_fields = [
+            field for field in available
+            if (not requested or field in requested) and field not in omitted
+        ]
+        return self._sparse_fields
     
     def list(self, request, *args, **kwargs):
         # Get the filtered queryset (before pagination)
         queryset = self.filter_queryset(self.get_queryset())
         
         # Calculate totals for the filtered data
-        totals = queryset.aggregate(
-            total_income=Sum('amount', filter=Q(category='income')),
-            total_expenses=Sum('amount', filter=~Q(category='income')),
-            total_amount=Sum('amount'),
-            transaction_count=Count('id')
-        )
+        totals = queryset.aggregate(**TRANSACTION_TOTALS)
         
+        # Transactions moved to the archive by archive_transactions are read back transparently
+        archived = self.get_archived(queryset)
+        rows = queryset
+        if archived:
+            for name, value in archived.totals().items():
+                totals[name] = (totals[name] or 0) + value
+            rows = HotColdRows(queryset, archived, queryset.query.order_by or Transaction._meta.ordering)
+
         # Apply pagination
-        page = self.paginate_queryset(queryset)
+        page = self.paginate_queryset(rows)
         if page is not None:
             serializer = self.get_serializer(page, many=True)
             response = self.get_paginated_response(serializer.data)
             
             # Add totals to the response
-            response.data['totals'] = {
-                'total_income': float(totals['total_income'] or 0),
-                'total_expenses': float(totals['total_expenses'] or 0),
-                'net_amount': float((totals['total_income'] or 0) - (totals['total_expenses'] or 0)),
-                'total_transactions': totals['transaction_count']
-            }
+            response.data['totals'] = totals_envelope(totals)
+
+            # Compact mode: rows only carry the user id, every user on the page is sent once here
+            if self.sends_page_users():
+                response.data['users'] = UserViewSerializer(self.get_page_users(page), many=True).data
             return response
         
-        serializer = self.get_serializer(queryset, many=True)
+        serializer = self.get_serializer(rows, many=True)
         return Response(serializer.data)
+
+    def sends_page_users(self):
+        return self.is_compact() and 'user' in self.get_sparse_fields()
+
+    def get_page_users(self, page):
+        if self.request.user.is_staff:
+            return User.objects.filter(id__in={transaction.user_id for transaction in page})
+        return [self.request.user] if page else []
+
+    def get_archived(self, queryset):
+        """Archived rows matching the request's filters, or None if nothing archived matches."""
+        filterset = DjangoFilterBackend().get_filterset(self.request, queryset, self)
+        if filterset is None or not filterset.is_valid():
+            return None
+        search_terms = SearchFilter().get_search_terms(self.request)
+        archived = ArchivedTransactions(archives_for(self.request.user), filterset.form.cleaned_data, search_terms)
+        return archived or None
     
     # Create a new transaction or multiple transactions
     # If a list of transactions is provided, it will create all of them
+    # Lists go through duplicate detection, ?duplicates=allow|skip|flag|merge overrides the default mode
     def create(self, request, *args, **kwargs):
         is_many = isinstance(request.data, list)
 
         serializer = self.get_serializer(
             data=request.data,
             many=is_many,
-            context={'request': request}
+            context={'request': request, 'duplicates': self.get_duplicates_mode()}
         )
         serializer.is_valid(raise_exception=True)
         self.perform_create(serializer)
-        return Response(serializer.data, status=status.HTTP_201_CREATED)
+        response = Response(serializer.data, status=status.HTTP_201_CREATED)
+        if is_many:
+            response['X-Duplicate-Count'] = len(serializer.duplicates)
+        return response
+
+    def get_duplicates_mode(self):
+        mode = self.request.query_params.get('duplicates', settings.DUPLICATE_TRANSACTION_MODE)
+        if mode not in DUPLICATE_MODES:
+            raise ValidationError({"duplicates": f"Must be one of: {', '.join(DUPLICATE_MODES)}"})
+        return mode
     
     # perform_create method is used to save the transaction with the user
     def perform_create(self, serializer):
         serializer.save()
+
+    # Apply a list of mixed create/update/delete operations in one round trip
+    # "atomic": true (default) applies all or nothing, false applies every valid operation
+    @action(detail=False, methods=['post'], url_path='batch')
+    def batch(self, request, *args, **kwargs):
+        serializer = TransactionBatchSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        atomic = serializer.validated_data['atomic']
+
+        results, applied = apply_batch_operations(
+            self.get_queryset(),
+            request,
+            serializer.validated_data['operations'],
+            atomic=atomic,
+            duplicates=self.get_duplicates_mode(),
+        )
+        failed = sum(1 for result in results if 'errors' in result)
+        response_status = status.HTTP_400_BAD_REQUEST if atomic and failed else status.HTTP_200_OK
+        return Response({
+            'atomic': atomic,
+            'applied': applied,
+            'succeeded': len(results) - failed if applied else 0,
+            'failed': failed,
+            'results': results,
+        }, status=response_status)
+
+    # Category for a description from the user's history (then everyone's), no LLM involved
+    @action(detail=False, methods=['get'], url_path='suggest-category')
+    def suggest_category(self, request, *args, **kwargs):
+        description = request.query_params.get('description', '').strip()
+        if not description:
+            return Response({"error": "description parameter is required"}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(suggest_category(request.user.pk, description).as_dict())
+
+    # Descriptions the user typed before that match ?q=, with their typical amount and category
+    @action(detail=False, methods=['get'], url_path='autocomplete')
+    def autocomplete(self, request, *args, **kwargs):
+        query = request.query_params.get('q', '').strip()
+        if not query:
+            return Response({"error": "q parameter is required"}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            limit = min(int(request.query_params.get('limit', 8)), 20)
+        except ValueError:
+            return Response({"error": "Invalid limit parameter"}, status=status.HTTP_400_BAD_REQUEST)
+        return Response({'results': user_index(request.user.pk).search(query, limit=max(limit, 1))})
+
+    # A short lived ticket opening the live stream, for clients that can not send headers
+    @action(detail=False, methods=['post'], url_path='live/ticket')
+    def live_ticket(self, request, *args, **kwargs):
+        return Response({
+            'ticket': make_ticket(request.user),
+            'expires_in': settings.LIVE_UPDATES['TICKET_MAX_AGE'],
+        })
+
+    # Server-sent events with the user's own changed rows and new totals (core.live), instead of polling
+    # EventSource can not send headers, it passes a ticket from live/ticket/ as ?ticket=
+    @action(
+        detail=False, methods=['get'], url_path='live', renderer_classes=[EventStreamRenderer],
+        authentication_classes=[*api_settings.DEFAULT_AUTHENTICATION_CLASSES, LiveTicketAuthentication],
+    )
+    def live(self, request, *args, **kwargs):
+        if isinstance(request._request, ASGIRequest):
+            # Waits on the event loop instead of holding a thread per client
+            events = astream_events(request.user.pk)
+        else:
+            events = stream_events(request.user.pk)
+        response = StreamingHttpResponse(events, content_type='text/event-stream')
+        response['Cache-Control'] = 'no-cache'
+        # Stop nginx from buffering the stream
+        response['X-Accel-Buffering'] = 'no'
+        return response
+
+    # Delta sync of the user's own rows: created, updated or deleted after ?since=<token>, oldest first
+    # Keep calling with next_token while has_more is true; without a token everything is returned
+    @action(detail=False, methods=['get'], url_path='changes')
+    def changes(self, request, *args, **kwargs):
+        try:
+            limit = min(int(request.query_params.get('limit', 500)), 1000)
+        except ValueError:
+            return Response({"error": "Invalid limit parameter"}, status=status.HTTP_400_BAD_REQUEST)
+        if limit < 1:
+            return Response({"error": "Invalid limit parameter"}, status=status.HTTP_400_BAD_REQUEST)
+
+        # Sequence numbers are per user, so staff sync their own rows like everyone else
+        try:
+            changed, deleted, next_token, has_more = changes_since(
+                request.user, self.get_queryset().filter(user=request.user), request.query_params.get('since'), limit
+            )
+        except ExpiredSyncToken as e:
+            # Deletions after the token were pruned, the client has to start over
+            return Response({"error": str(e), "reset": True}, status=status.HTTP_410_GONE)
+        except InvalidSyncToken as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        return Response({
+            'changed': TransactionSyncSerializer(changed, many=True).data,
+            'deleted': deleted,
+            'next_token': next_token,
+            'has_more': has_more,
+        })
     
 class ImageToTransactionViewSet(viewsets.ModelViewSet):
-    queryset = TransactionImage.objects.all()
+    # The user's receipt images (staff: everyone's), POST stores one and extracts its transactions
+    http_method_names = ['get', 'post', 'delete']
     serializer_class = TransactionImageSerializer
     permission_classes = [IsAuthenticated]
+    pagination_class = DefaultPagination
+
+    def get_queryset(self):
+        if self.request.user.is_staff:
+            return TransactionImage.objects.all()
+        return TransactionImage.objects.filter(user=self.request.user)
+
+    def get_permissions(self):
+        if self.action == 'file':
+            # A signed URL or the owner's token, checked in file()
+            return []
+        return super().get_permissions()
+
+    def perform_destroy(self, instance):
+        instance.delete()
+        db_transaction.on_commit(lambda: delete_files(instance))
+
+    @action(detail=True, url_path='file', url_name='file')
+    def file(self, request, pk=None):
+        # The image or a thumbnail (?size=), sent by the web server when RECEIPT_SENDFILE is set
+        size = request.GET.get('size')
+        if size is not None and size not in {str(allowed) for allowed in settings.RECEIPTS['THUMBNAIL_SIZES']}:
+            return Response({"error": "Invalid size parameter"}, status=status.HTTP_400_BAD_REQUEST)
+        signature = request.GET.get('sig')
+        if signature is not None:
+            if not valid_signature(pk, size, request.GET.get('day'), signature):
+                raise PermissionDenied("Invalid or expired link")
+            receipt = TransactionImage.objects.filter(pk=pk).first()
+        elif request.user.is_authenticated:
+            receipt = self.get_queryset().filter(pk=pk).first()
+        else:
+            raise NotAuthenticated()
+        if receipt is None:
+            raise Http404("No such receipt")
+        return serve_file(request, receipt, int(size) if size else None)
 
     def create(self, request, *args, **kwargs):
         image_file = request.FILES.get('image')
@@ -128,10 +384,19 @@ class ImageToTransactionViewSet(viewsets.ModelViewSet):
         # Check file size limit (5MB)
         if image_file.size > 5 * 1024 * 1024:
             return Response({"error": "Image file size exceeds 5MB limit."}, status=status.HTTP_400_BAD_REQUEST)
+        if over_token_budget(request.user):
+            return Response(
+                {"error": "Daily AI usage limit reached, try again tomorrow."},
+                status=status.HTTP_429_TOO_MANY_REQUESTS
+            )
+        image_bytes = image_file.read()
+        try:
+            receipt, _ = store_receipt(request.user, image_bytes)
+        except InvalidReceipt as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
         api_key = settings.GEMINI_API_KEY
         try:
-            image_bytes = image_file.read()
-            transactions_data = image_to_transaction(image_bytes, api_key)
+            transactions_data = image_to_transaction(image_bytes, api_key, user=request.user)
         except Exception as e:
             return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
         if not transactions_data:
@@ -145,7 +410,8 @@ class ImageToTransactionViewSet(viewsets.ModelViewSet):
                 description = transaction_data.get('description', 'Unknown transaction')
                 amount = transaction_data.get('amount', 0)
                 date = transaction_data.get('date', dt.today())
-                category = transaction_data.get('category', 'miscellaneous')
+                # The user's own history knows their merchants better than the model
+                category = correct_category(request.user.pk, description, transaction_data.get('category'))
                 
                 
                 # Create Transaction instance without saving to database
@@ -162,17 +428,30 @@ class ImageToTransactionViewSet(viewsets.ModelViewSet):
                 print(f"Error creating transaction: {e}")
                 continue
 
+        # Point out receipts that were already entered, the client decides whether to save them
+        try:
+            duplicates = find_duplicates(transactions)
+        except (ValueError, ArithmeticError):
+            # Malformed dates or amounts from the model, nothing to compare
+            duplicates = [None] * len(transactions)
+        for transaction, duplicate in zip(transactions, duplicates):
+            if duplicate is not None:
+                transaction.duplicate_of = duplicate.transaction_id
+
         # Serialize the transactions for JSON response
         serializer = TransactionViewSerializer(transactions, many=True)
         return Response({
             "success": True,
             "message": f"Extracted {len(transactions)} transactions from image",
-            "transactions": serializer.data
+            "transactions": serializer.data,
+            "receipt": TransactionImageSerializer(receipt, context={'request': request}).data,
         }, status=status.HTTP_200_OK)
     
 
 class AnalysisView(APIView):
     permission_classes = [IsAuthenticated]
+    # text/event-stream (or ?format=sse) streams each section as soon as Gemini has written it
+    renderer_classes = [*api_settings.DEFAULT_RENDERER_CLASSES, EventStreamRenderer]
 
     def get(self, request, *args, **kwargs):
         # Get month and year from query parameters, default to current month/year if not provided
@@ -204,11 +483,42 @@ class AnalysisView(APIView):
             transaction['date'] = transaction['date'].strftime('%Y-%m-%d')
         
         api_key = settings.GEMINI_API_KEY
+
+        if over_token_budget(request.user):
+            return Response(
+                {"error": "Daily AI usage limit reached, try again tomorrow."},
+                status=status.HTTP_429_TOO_MANY_REQUESTS
+            )
+
+        if request.accepted_renderer.format == EventStreamRenderer.format:
+            events = stream_transaction_analysis(
+                api_key, current_transactions, previous_transactions, user=request.user
+            )
+            response = StreamingHttpResponse(
+                (sse_event(event, data) for event, data in events),
+                content_type='text/event-stream'
+            )
+            response['Cache-Control'] = 'no-cache'
+            # Stop nginx from buffering the stream
+            response['X-Accel-Buffering'] = 'no'
+            return response
         
         try:
-            analysis_result = transaction_analysis(api_key, current_transactions, previous_transactions)
+            # Identical concurrent requests (double clicks, several devices) share one Gemini call
+            key = coalescing_key(
+                request.user.pk, 'analysis', {'year': year, 'month': month},
+                current_transactions, previous_transactions
+            )
+            analysis_result, _ = get_single_flight().do(
+                key, lambda: transaction_analysis(
+                    api_key, current_transactions, previous_transactions, user=request.user
+                )
+            )
             # Add metadata to the response
             return Response(analysis_result, status=status.HTTP_200_OK)
+        except AnalysisError as e:
+            # Gemini failed, each coalesced caller gets the error and the next request retries
+            return Response({"error": str(e)}, status=status.HTTP_502_BAD_GATEWAY)
         except Exception as e:
             return Response({"error": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
@@ -243,6 +553,10 @@ class TransactionPDFView(APIView):
             transactions = list(transactions_qs.values(
                 'date', 'description', 'amount', 'category'
             ))
+            # Months moved to the archive are exported from there
+            archived = archived_month(request.user, year, month)
+            if archived:
+                transactions = sorted(transactions + archived, key=lambda transaction: transaction['date'])
 
             # Check if transactions exist
             if not transactions:
@@ -255,8 +569,10 @@ class TransactionPDFView(APIView):
             for transaction in transactions:
                 transaction['date'] = transaction['date'].strftime('%Y-%m-%d')
 
-            # Create PDF
-            pdf_data = create_transaction_pdf(transactions)
+            # Create PDF (fpdf is only imported by workers that actually render one)
+            from .transaction_to_pdf import create_transaction_pdf
+            key = coalescing_key(request.user.pk, 'pdf', {'year': year, 'month': month}, transactions)
+            pdf_data, _ = get_single_flight().do(key, lambda: create_transaction_pdf(transactions))
 
             # Verify PDF data
             if not pdf_data or not isinstance(pdf_data, bytes):
@@ -280,4 +596,171 @@ class TransactionPDFView(APIView):
             return Response(
                 {"error": f"Failed to generate PDF: {str(e)}"}, 
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR
-            )
\ No newline at end of file
+            )
+
+
+class BudgetViewSet(viewsets.ModelViewSet):
+    http_method_names = ['get', 'post', 'patch', 'delete']
+    serializer_class = BudgetSerializer
+    permission_classes = [IsAuthenticated]
+
+    def get_queryset(self):
+        return Budget.objects.filter(user=self.request.user)
+
+    def perform_create(self, serializer):
+        serializer.save(user=self.request.user)
+
+    # Spent, remaining and state of every budget in its current period, read from the counters
+    @action(detail=False, methods=['get'], url_path='status')
+    def current_status(self, request, *args, **kwargs):
+        today = timezone.localdate()
+        return Response({'results': [budget_status(budget, today) for budget in self.get_queryset()]})
+
+
+class SpendingAnomalyViewSet(viewsets.ReadOnlyModelViewSet):
+    # Unusual charges and category spikes flagged by detect_anomalies, newest first
+    serializer_class = SpendingAnomalySerializer
+    permission_classes = [IsAuthenticated]
+    filter_backends = [DjangoFilterBackend, OrderingFilter]
+    filterset_class = SpendingAnomalyFilters
+    ordering_fields = ['date', 'score']
+    pagination_class = DefaultPagination
+
+    def get_queryset(self):
+        return SpendingAnomaly.objects.filter(user=self.request.user)
+
+
+class ForecastView(APIView):
+    # Projected end-of-month totals per category, precomputed by precompute_forecasts
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, *args, **kwargs):
+        return Response(SpendingForecastSerializer(forecast_for(request.user.pk)).data)
+
+
+class RecurringSeriesView(APIView):
+    # Recurring payments and income detected in the user's history, next expected first
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, *args, **kwargs):
+        series = RecurringSeries.objects.filter(user=request.user)
+        period = request.GET.get('period')
+        if period:
+            series = series.filter(period=period)
+        upcoming_days = request.GET.get('upcoming_days')
+        if upcoming_days is not None:
+            try:
+                days = int(upcoming_days)
+            except ValueError:
+                return Response({"error": "Invalid upcoming_days parameter"}, status=status.HTTP_400_BAD_REQUEST)
+            today = timezone.localdate()
+            series = series.filter(next_date__gte=today, next_date__lte=today + timedelta(days=days))
+        return Response(RecurringSeriesSerializer(series, many=True).data)
+
+
+class CoalescingStatsView(APIView):
+    # Staff only: how many analysis/PDF requests this worker served from a shared computation
+    permission_classes = [IsAdminUser]
+
+    def get(self, request, *args, **kwargs):
+        return Response({
+            'pid': os.getpid(),
+            'operations': get_single_flight().stats(),
+        })
+
+
+class LLMUsageReportView(APIView):
+    # Staff only: Gemini call counts, latency percentiles, token usage and top consumers
+    permission_classes = [IsAdminUser]
+
+    def get(self, request, *args, **kwargs):
+        try:
+            days = int(request.GET.get('days', 7))
+            top = int(request.GET.get('top', 10))
+        except ValueError:
+            return Response({"error": "Invalid days or top parameter"}, status=status.HTTP_400_BAD_REQUEST)
+        if not 1 <= days <= MAX_REPORT_DAYS or not 1 <= top <= MAX_REPORT_TOP:
+            return Response(
+                {"error": f"days must be from 1 to {MAX_REPORT_DAYS} and top from 1 to {MAX_REPORT_TOP}"},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        return Response(llm_report(days=days, top=top))
+
+
+class ProfileListView(APIView):
+    # Staff only: the stored request profiles of core.middleware.ProfilingMiddleware, newest first
+    permission_classes = [IsAdminUser]
+
+    def get(self, request, *args, **kwargs):
+        return Response(list_artifacts())
+
+
+class ProfileDownloadView(APIView):
+    # Staff only: one profile as a zip (meta.json, sql.json and profile.prof/profile.txt or stacks.txt)
+    permission_classes = [IsAdminUser]
+
+    def get(self, request, name, *args, **kwargs):
+        path = artifact_path(name)
+        if path is None:
+            raise Http404("No such profile")
+        return FileResponse(path.open('rb'), as_attachment=True, filename=path.name, content_type='application/zip')
+
+
+def _analytics_months(value):
+    try:
+        months = int(value)
+    except (TypeError, ValueError):
+        months = 0
+    if not 1 <= months <= ANALYTICS_MAX_MONTHS:
+        raise ValidationError({"months": f"Must be a number of months from 1 to {ANALYTICS_MAX_MONTHS}"})
+    return months
+
+
+class StaffAnalyticsView(APIView):
+    # Staff only: active users, spend per category, amount distributions and growth per month,
+    # estimated from a sample of users with 95% margins (see core.staff_analytics)
+    permission_classes = [IsAdminUser]
+
+    def get(self, request, *args, **kwargs):
+        months = _analytics_months(request.GET.get('months', 12))
+        try:
+            seed = int(request.GET.get('seed', timezone.localdate().toordinal()))
+        except ValueError:
+            return Response({"error": "Invalid seed parameter"}, status=status.HTTP_400_BAD_REQUEST)
+        key = f"staff-analytics:{months}:{seed}"
+        result = cache.get(key)
+        if result is None:
+            # Dashboards opened together share one sample
+            result, _ = get_single_flight().do(
+                coalescing_key(None, 'staff-analytics', {'months': months, 'seed': seed}),
+                lambda: approximate_analytics(months, seed),
+            )
+            cache.set(key, result, settings.STAFF_ANALYTICS['CACHE_SECONDS'])
+        return Response(result)
+
+
+class AnalyticsReportView(APIView):
+    # Staff only: exact analytics over every transaction, computed in the background.
+    # GET lists the latest reports (?months= filters them), POST queues one
+    permission_classes = [IsAdminUser]
+
+    def get(self, request, *args, **kwargs):
+        reports = AnalyticsReport.objects.select_related('requested_by')
+        if 'months' in request.GET:
+            reports = reports.filter(months=_analytics_months(request.GET['months']))
+        return Response(AnalyticsReportSerializer(reports.defer('result')[:20], many=True).data)
+
+    def post(self, request, *args, **kwargs):
+        report = queue_report(_analytics_months(request.data.get('months', 12)), request.user)
+        return Response(AnalyticsReportSerializer(report).data, status=status.HTTP_202_ACCEPTED)
+
+
+class AnalyticsReportDetailView(APIView):
+    # Staff only: one exact report, its result once the status is "done"
+    permission_classes = [IsAdminUser]
+
+    def get(self, request, pk, *args, **kwargs):
+        report = AnalyticsReport.objects.select_related('requested_by').filter(pk=pk).first()
+        if report is None:
+            raise Http404("No such report")
+        return Response(AnalyticsReportDetailSerializer(report).data)
@@ -38,6 +38,7 @@ const Transactions = () => {
     amountMin,
     amountMax,
     totals,
+    live,
     fetchTransactions,
     handleSearchChange,
     handleSearchSubmit,
@@ -68,12 +69,13 @@ const Transactions = () => {
     setSelectedTransaction(null);
   };
 
+  // While the live stream is connected the change is pushed to the list, no refresh needed
   const handleTransactionUpdate = () => {
-    fetchTransactions(); // Refresh the transactions list
+    if (!live) fetchTransactions(); // Refresh the transactions list
   };
 
   const handleTransactionDelete = () => {
-    fetchTransactions(); // Refresh the transactions list
+    if (!live) fetchTransactions(); // Refresh the transactions list
   };
 
   const handleDownloadClick = () => {
@@ -113,6 +113,62 @@ export const transactionsAPI = {
     return response.data;
   },
 
+  // Apply several create/update/delete operations in one request
+  // operations: [{ op: 'create' | 'update' | 'delete', id?, data? }]
+  batchTransactions: async (operations, atomic = true) => {
+    const response = await api.post('/api/transactions/batch/', { operations, atomic });
+    return response.data;
+  },
+
+  // Live changes of the user's transactions and totals, pushed by the server (server-sent events)
+  // onEvent(type, data) receives 'ready', 'changes', 'reset' and 'closed'; returns a function closing the stream
+  subscribeToChanges: (onEvent) => {
+    let source = null;
+    let retry = null;
+    let closed = false;
+
+    const connect = async () => {
+      let ticket;
+      try {
+        // EventSource can not send an Authorization header, the URL carries a short lived stream ticket
+        ({ ticket } = (await api.post('/api/transactions/live/ticket/')).data);
+      } catch (error) {
+        reconnect();
+        return;
+      }
+      if (closed) {
+        return;
+      }
+      const url = new URL('/api/transactions/live/', api.defaults.baseURL);
+      url.searchParams.set('ticket', ticket);
+      source = new EventSource(url);
+      ['ready', 'changes', 'reset'].forEach((type) => {
+        source.addEventListener(type, (event) => onEvent(type, JSON.parse(event.data)));
+      });
+      // Fired on every lost connection, the ticket may have expired so reconnect with a new one
+      source.addEventListener('error', () => {
+        source.close();
+        reconnect();
+      });
+    };
+
+    const reconnect = () => {
+      onEvent('closed', null);
+      if (!closed) {
+        retry = setTimeout(connect, 3000);
+      }
+    };
+
+    connect();
+    return () => {
+      closed = true;
+      clearTimeout(retry);
+      if (source) {
+        source.close();
+      }
+    };
+  },
+
   // Parse transactions from image
   parseTransactionsFromImage: async (imageFile) => {
     const formData = new FormData();
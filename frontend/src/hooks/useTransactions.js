@@ -1,4 +1,4 @@
-import { useState, useEffect } from 'react';
+import { useState, useEffect, useRef } from 'react';
 import { transactionsAPI } from '../api';
 
 export const useTransactions = (isAuthenticated) => {
@@ -89,6 +89,58 @@ export const useTransactions = (isAuthenticated) => {
     }
   }, [isAuthenticated, searchTerm, categoryFilter, sortBy, sortOrder, currentPage, dateFrom, dateTo, amountMin, amountMax]);
 
+  // Pushed changes replace re-fetching the list after every write, here and on the user's other devices
+  const [live, setLive] = useState(false);
+  const connectedBefore = useRef(false);
+  const filtersActive = Boolean(searchTerm || categoryFilter || dateFrom || dateTo || amountMin || amountMax);
+
+  const handleLiveEvent = (type, data) => {
+    if (type === 'closed') {
+      setLive(false);
+      return;
+    }
+    if (type === 'ready') {
+      setLive(true);
+      // Changes made while reconnecting were missed
+      if (connectedBefore.current) {
+        fetchTransactions();
+      } else if (!filtersActive) {
+        setTotals(data.totals);
+      }
+      connectedBefore.current = true;
+      return;
+    }
+
+    const shown = new Set(transactions.map((transaction) => transaction.id));
+    const reshapesPage = type === 'reset'
+      || data.changed.some((transaction) => !shown.has(transaction.id))
+      || data.deleted.some((id) => shown.has(id));
+    // Filtered totals, new rows and removed rows need the server's filtering and ordering
+    if (filtersActive || reshapesPage) {
+      fetchTransactions();
+      return;
+    }
+    const changed = new Map(data.changed.map((transaction) => [transaction.id, transaction]));
+    setTransactions((rows) => rows.map((transaction) => changed.get(transaction.id) || transaction));
+    setTotals(data.totals);
+  };
+
+  // The stream outlives renders, it always calls the latest handler
+  const liveHandler = useRef(handleLiveEvent);
+  liveHandler.current = handleLiveEvent;
+
+  useEffect(() => {
+    if (!isAuthenticated) {
+      return undefined;
+    }
+    connectedBefore.current = false;
+    const close = transactionsAPI.subscribeToChanges((type, data) => liveHandler.current(type, data));
+    return () => {
+      close();
+      setLive(false);
+    };
+  }, [isAuthenticated]);
+
   const handleSearchChange = (e) => {
     setSearchInput(e.target.value);
   };
@@ -154,6 +206,7 @@ export const useTransactions = (isAuthenticated) => {
     amountMin,
     amountMax,
     totals,
+    live,
     
     // Actions
     fetchTransactions,